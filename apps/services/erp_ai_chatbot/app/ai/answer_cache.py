@@ -0,0 +1,258 @@
+# app/ai/answer_cache.py
+from __future__ import annotations
+
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app.ai.module_registry import get_tool
+
+# =========================================================
+# Cache câu trả lời cho câu hỏi lặp lại (cùng câu, cùng role, cùng phạm vi user)
+# - Key: message chuẩn hoá + module yêu cầu (auto/...) + role + scope + ngày + compose
+#   scope = user_id nếu module inject auth (dữ liệu theo user), "*" nếu dùng chung theo role
+# - TTL = min TTL của các tool trong plan (ToolSpec.cache_ttl_s: TTL_STOCK / TTL_STATUS ở tooling.py,
+#   hoặc mặc định theo module)
+# - Plan có tool ghi (read_only=False) / hỏi lại / step lỗi -> không cache
+# - Invalidate: version dữ liệu theo module; tool ghi chạy xong -> bump_data_version(module)
+# Hit: bỏ qua detect + plan + SQL + compose
+# =========================================================
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "120"))
+
+# TTL mặc định theo module (env: ANSWER_CACHE_TTL_<MODULE>); tồn kho / đơn hàng đổi nhanh hơn
+_MODULE_TTL_DEFAULTS = {
+    "hrm": 300.0,
+    "finance_accounting": 300.0,
+    "sale_crm": 60.0,
+    "supply_chain": 60.0,
+}
+MODULE_TTL_SECONDS: Dict[str, float] = {
+    m: float(os.getenv(f"ANSWER_CACHE_TTL_{m.upper()}", str(d)))
+    for m, d in _MODULE_TTL_DEFAULTS.items()
+}
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    return _SPACES.sub(" ", (message or "").strip().lower()).rstrip("?.!").strip()
+
+
+# =========================================================
+# Version dữ liệu theo module
+# =========================================================
+_VERSION_LOCK = threading.Lock()
+_DATA_VERSIONS: Dict[str, int] = {}
+
+
+def data_version(module: str) -> int:
+    return _DATA_VERSIONS.get(module, 0)
+
+
+def bump_data_version(module: str) -> int:
+    """Gọi sau khi dữ liệu của module thay đổi (tool ghi, webhook ERP...)."""
+    with _VERSION_LOCK:
+        v = _DATA_VERSIONS.get(module, 0) + 1
+        _DATA_VERSIONS[module] = v
+    return v
+
+
+def data_versions() -> Dict[str, int]:
+    with _VERSION_LOCK:
+        return dict(_DATA_VERSIONS)
+
+
+# =========================================================
+# LRU + TTL store
+# =========================================================
+@dataclass
+class _Entry:
+    result: Dict[str, Any]      # output executor (trước finalize_chat_result)
+    selected_module: str
+    confidence: float
+    detector: Optional[Dict[str, Any]]
+    versions: Tuple[Tuple[str, int], ...]
+    created_at: float
+    expires_at: float
+
+
+@dataclass(frozen=True)
+class AnswerLookup:
+    """Kết quả lookup; versions chụp lúc miss để store không ghi đè dữ liệu đã đổi giữa chừng."""
+    key: str
+    versions: Tuple[Tuple[str, int], ...]
+    hit: Optional[_Entry] = None
+
+    @property
+    def age_s(self) -> Optional[float]:
+        return round(time.monotonic() - self.hit.created_at, 3) if self.hit else None
+
+
+_LOCK = threading.Lock()
+_ENTRIES: "OrderedDict[str, _Entry]" = OrderedDict()
+_STATS: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "uncacheable": 0,
+    "evictions": 0,
+    "expired": 0,
+    "stale": 0,
+}
+
+
+def _bump(name: str, n: int = 1):
+    _STATS[name] = _STATS.get(name, 0) + n
+
+
+def _base_key(module: str, message: str, role: Optional[str], compose_enabled: bool) -> str:
+    today = datetime.now(ZoneInfo("Asia/Bangkok")).strftime("%Y-%m-%d")
+    return "|".join([module, str(role or ""), today, "c1" if compose_enabled else "c0", normalize_message(message)])
+
+
+def _scoped(base: str, scope: str) -> str:
+    return hashlib.sha1(f"{base}|{scope}".encode("utf-8")).hexdigest()
+
+
+def _versions(modules: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+    return tuple((m, data_version(m)) for m in sorted(set(modules)))
+
+
+def lookup_answer(
+    module: str,
+    message: str,
+    role: Optional[str],
+    user_id: Optional[int],
+    compose_enabled: bool = True,
+) -> Optional[AnswerLookup]:
+    """None = cache tắt; AnswerLookup.hit None = miss (giữ lại để store)."""
+    if not ANSWER_CACHE_ENABLED or not normalize_message(message):
+        return None
+
+    base = _base_key(module, message, role, compose_enabled)
+    # tất cả module (module=auto có thể ra bất kỳ module nào)
+    versions = _versions(MODULE_TTL_SECONDS)
+    now = time.monotonic()
+
+    with _LOCK:
+        # ưu tiên entry theo user, sau đó entry dùng chung theo role
+        for scope in (f"u:{user_id}", "*"):
+            key = _scoped(base, scope)
+            entry = _ENTRIES.get(key)
+            if entry is None:
+                continue
+            if now > entry.expires_at:
+                _ENTRIES.pop(key, None)
+                _bump("expired")
+                continue
+            if any(data_version(m) != v for m, v in entry.versions):
+                _ENTRIES.pop(key, None)
+                _bump("stale")
+                continue
+            _ENTRIES.move_to_end(key)
+            _bump("hits")
+            return AnswerLookup(key=key, versions=versions, hit=entry)
+        _bump("misses")
+    return AnswerLookup(key=base, versions=versions)
+
+
+def cached_result(lookup: AnswerLookup) -> Dict[str, Any]:
+    # copy nông: pipeline chỉ gắn thêm key cấp 1 (finalize_chat_result), không sửa data lồng
+    return dict(lookup.hit.result)
+
+
+def _plan_ttl(module: str, plan: Dict[str, Any]) -> Optional[float]:
+    """TTL cho kết quả của plan; None = không cache được."""
+    ttl = MODULE_TTL_SECONDS.get(module, ANSWER_CACHE_TTL_SECONDS)
+    for st in plan.get("steps") or []:
+        tool = get_tool(module, st.get("tool"))
+        if tool is None or not tool.read_only:
+            return None
+        if tool.cache_ttl_s is not None:
+            ttl = min(ttl, tool.cache_ttl_s)
+    return ttl if ttl > 0 else None
+
+
+def _cacheable_result(res: Dict[str, Any]) -> bool:
+    plan = res.get("plan") or {}
+    if plan.get("needs_clarification") or not plan.get("steps") or res.get("candidates"):
+        return False
+    if not res.get("answer"):
+        return False
+    data = res.get("data") or {}
+    # step lỗi (ok=False) thường là lỗi tạm thời / thiếu quyền -> không giữ
+    return all(not (isinstance(v, dict) and v.get("ok") is False) for v in data.values())
+
+
+def store_answer(
+    lookup: Optional[AnswerLookup],
+    user_id: Optional[int],
+    user_scoped: bool,
+    selected_module: str,
+    confidence: float,
+    detector: Optional[Dict[str, Any]],
+    res: Dict[str, Any],
+) -> bool:
+    if lookup is None or lookup.hit is not None:
+        return False
+
+    ttl = _plan_ttl(selected_module, res.get("plan") or {}) if _cacheable_result(res) else None
+    if ttl is None:
+        with _LOCK:
+            _bump("uncacheable")
+        return False
+    key = _scoped(lookup.key, f"u:{user_id}" if user_scoped else "*")
+    now = time.monotonic()
+    entry = _Entry(
+        result=copy.deepcopy(res),
+        selected_module=selected_module,
+        confidence=confidence,
+        detector=detector,
+        versions=tuple((m, v) for m, v in lookup.versions if m == selected_module),
+        created_at=now,
+        expires_at=now + ttl,
+    )
+    with _LOCK:
+        # dữ liệu đã đổi trong lúc tính -> kết quả có thể cũ
+        if any(data_version(m) != v for m, v in entry.versions):
+            _bump("stale")
+            return False
+        _ENTRIES[key] = entry
+        _ENTRIES.move_to_end(key)
+        _bump("stores")
+        while len(_ENTRIES) > ANSWER_CACHE_MAX_ENTRIES:
+            _ENTRIES.popitem(last=False)
+            _bump("evictions")
+    return True
+
+
+def invalidate_answer_cache(module: Optional[str] = None) -> int:
+    """module != None: bump version (entry của module thành stale, xoá lười)."""
+    if module is not None:
+        bump_data_version(module)
+        return 0
+    with _LOCK:
+        n = len(_ENTRIES)
+        _ENTRIES.clear()
+    return n
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    with _LOCK:
+        out: Dict[str, Any] = dict(_STATS)
+        out["size"] = len(_ENTRIES)
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+    out["data_versions"] = data_versions()
+    return out
@@ -1,17 +1,12 @@
 from __future__ import annotations
 
 import json
-import os
-from typing import Any, Dict, List
+from contextlib import aclosing, closing
+from typing import Any, Callable, Dict, List, Optional
 import re
-from dotenv import load_dotenv
-from google import genai
 
-load_dotenv()
-
-_GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-_GEMINI_COMPOSE_MODEL = os.getenv("GEMINI_COMPOSE_MODEL", os.getenv("GEMINI_MODEL"))
-_client = genai.Client(api_key=_GOOGLE_API_KEY) if _GOOGLE_API_KEY else genai.Client()
+from app.ai import llm_gateway
+from app.core.telemetry import span
 
 import re
 
@@ -21,7 +16,7 @@ _NUM_TOKEN = re.compile(r"\b\d{1,3}(?:[.,]\d{3})+\b|\b\d{4,}\b")
 _CODE_RE = re.compile(r"\b[A-Z]{2,}-\d+\b")
 
 def is_llm_available() -> bool:
-    return _client is not None
+    return llm_gateway.is_available()
 
 def _norm_digits(s: str) -> str:
     return re.sub(r"\D", "", s or "")
@@ -65,7 +60,7 @@ def compose_safe_enough(answer: str, payload_text: str | None = None, max_len: i
 
     return True
 
-def compose_answer_with_llm(module: str, question: str, step_infos: List[Dict[str, Any]]) -> str:
+def _compose_request(module: str, question: str, step_infos: List[Dict[str, Any]]) -> Dict[str, Any]:
     # ✅ gửi full data/result (không preview)
     payload = {
         "module": module,
@@ -109,12 +104,57 @@ def compose_answer_with_llm(module: str, question: str, step_infos: List[Dict[st
 
     contents = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
 
-    resp = _client.models.generate_content(
-        model= _GEMINI_COMPOSE_MODEL,
-        contents=contents,
-        config={
+    return {
+        "model": llm_gateway.model_for("compose"),
+        "contents": contents,
+        "config": {
             "system_instruction": sys,
-            "temperature": 0.0, 
+            "temperature": 0.0,
         },
-    )
-    return (resp.text or "").strip()
\ No newline at end of file
+    }
+
+def compose_answer_with_llm(
+    module: str,
+    question: str,
+    step_infos: List[Dict[str, Any]],
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> str:
+    """on_delta != None => dùng generate_content_stream, đẩy từng đoạn text ra ngoài (SSE)."""
+    req = _compose_request(module, question, step_infos)
+
+    with span("compose", module=module):
+        if on_delta is not None:
+            chunks: List[str] = []
+            # on_delta có thể raise (client ngắt kết nối) -> closing trả slot LLM + đóng stream ngay
+            with closing(llm_gateway.generate_stream("compose", **req)) as stream:
+                for chunk in stream:
+                    text = chunk.text or ""
+                    if text:
+                        chunks.append(text)
+                        on_delta(text)
+            return "".join(chunks).strip()
+
+        resp = llm_gateway.generate("compose", **req)
+        return (resp.text or "").strip()
+
+async def compose_answer_with_llm_async(
+    module: str,
+    question: str,
+    step_infos: List[Dict[str, Any]],
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> str:
+    req = _compose_request(module, question, step_infos)
+
+    with span("compose", module=module):
+        if on_delta is not None:
+            chunks: List[str] = []
+            async with aclosing(llm_gateway.agenerate_stream("compose", **req)) as stream:
+                async for chunk in stream:
+                    text = chunk.text or ""
+                    if text:
+                        chunks.append(text)
+                        on_delta(text)
+            return "".join(chunks).strip()
+
+        resp = await llm_gateway.agenerate("compose", **req)
+        return (resp.text or "").strip()
\ No newline at end of file
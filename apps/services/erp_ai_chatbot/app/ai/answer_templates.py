@@ -0,0 +1,275 @@
+# app/ai/answer_templates.py
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from app.ai.answer_composer import compose_safe_enough
+
+# =========================================================
+# Câu trả lời deterministic theo tool (không gọi LLM compose)
+# - Chỉ áp dụng khi plan có ĐÚNG 1 step trả lời (sau khi lọc context-only)
+# - Ưu tiên result["answer"] do tool tự dựng (vd: ar_no / ap_no)
+# - Sau đó tới template đăng ký theo tên tool
+# - Mọi câu template đều phải qua compose_safe_enough(answer, payload)
+# Multi-step / free-form => vẫn để compose_answer_with_llm xử lý.
+# =========================================================
+
+ANSWER_TEMPLATES_ENABLED = os.getenv("ANSWER_TEMPLATES_ENABLED", "1") == "1"
+
+# (question, args, data) -> câu trả lời hoặc None (None => để LLM compose)
+AnswerTemplate = Callable[[str, Dict[str, Any], Any], Optional[str]]
+
+ANSWER_TEMPLATES: Dict[str, AnswerTemplate] = {}
+
+
+def answer_template(*tools: str):
+    def deco(fn: AnswerTemplate) -> AnswerTemplate:
+        for t in tools:
+            ANSWER_TEMPLATES[t] = fn
+        return fn
+    return deco
+
+
+# ---------- format helpers ----------
+STATUS_VI: Dict[str, str] = {
+    "DRAFT": "nháp",
+    "PENDING": "đang chờ xử lý",
+    "SUBMITTED": "đã gửi",
+    "APPROVED": "đã duyệt",
+    "REJECTED": "bị từ chối",
+    "CANCELLED": "đã huỷ",
+    "CANCELED": "đã huỷ",
+    "COMPLETED": "đã hoàn tất",
+    "CONFIRMED": "đã xác nhận",
+    "PARTIAL_RECEIVED": "đã nhận một phần",
+    "RECEIVED": "đã nhận đủ",
+    "POSTED": "đã ghi sổ",
+    "OPEN": "đang mở",
+    "CLOSED": "đã đóng",
+    "PAID": "đã thanh toán",
+    "UNPAID": "chưa thanh toán",
+    "PARTIALLY_PAID": "thanh toán một phần",
+    "OVERDUE": "quá hạn",
+    "SUCCESS": "thành công",
+    "FAILED": "thất bại",
+    "ERROR": "lỗi",
+    "SHIPPING": "đang giao",
+    "DELIVERED": "đã giao",
+}
+
+
+def _status(v: Any) -> str:
+    s = str(v or "").strip()
+    return STATUS_VI.get(s.upper(), s) if s else "không rõ"
+
+
+def _num(v: Any) -> str:
+    # 1500000.0 -> 1.500.000 ; 12.5 -> 12,5
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return str(v)
+    if f.is_integer():
+        return f"{int(f):,}".replace(",", ".")
+    return f"{f:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _date(v: Any) -> Optional[str]:
+    s = str(v or "")[:10]
+    m = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", s)
+    return f"{m.group(3)}/{m.group(2)}/{m.group(1)}" if m else None
+
+
+def _asked(question: str, fields: Dict[str, str]) -> List[str]:
+    """Chọn field được hỏi theo keyword (regex) trong câu hỏi, giữ thứ tự khai báo."""
+    q = (question or "").lower()
+    return [f for f, rx in fields.items() if re.search(rx, q)]
+
+
+# ---------- supply_chain ----------
+@answer_template("so_luong_kha_dung")
+def _tpl_kha_dung(question, args, data):
+    return f"Sản phẩm {data['product_name']} ({data['sku']}) hiện còn {_num(data['available'])} khả dụng."
+
+
+@answer_template("so_luong_dang_giu")
+def _tpl_dang_giu(question, args, data):
+    return f"Sản phẩm {data['product_name']} ({data['sku']}) đang được giữ {_num(data['allocated'])}."
+
+
+@answer_template("kiem_tra_du_hang")
+def _tpl_du_hang(question, args, data):
+    verdict = "đủ hàng" if data.get("is_enough") else "không đủ hàng"
+    return (
+        f"Sản phẩm {data['product_name']} ({data['sku']}) {verdict}: cần {_num(data['required_qty'])}, "
+        f"khả dụng {_num(data['available_qty'])}."
+    )
+
+
+@answer_template("tra_ton_kho_theo_tu_khoa")
+def _tpl_ton_tu_khoa(question, args, data):
+    # nhiều dòng => để LLM gộp/lọc theo câu hỏi
+    if not isinstance(data, list) or len(data) != 1:
+        return None
+    r = data[0]
+    return (
+        f"Sản phẩm {r['product_name']} ({r['sku']}) tồn {_num(r['total_on_hand'])}, "
+        f"đang giữ {_num(r['total_allocated'])}, khả dụng {_num(r['total_available'])}."
+    )
+
+
+_PO_FIELDS = {
+    "status": r"trạng thái|tình trạng",
+    "expected_delivery_date": r"giao|etd|dự kiến|khi nào",
+    "supplier_name": r"nhà cung cấp|ncc",
+    "total_amount": r"tổng tiền|giá trị|bao nhiêu tiền",
+}
+
+
+@answer_template("tra_cuu_trang_thai_don_mua")
+def _tpl_po(question, args, data):
+    parts = []
+    for f in _asked(question, _PO_FIELDS) or ["status"]:
+        if f == "status":
+            parts.append(f"trạng thái {_status(data.get('status'))}")
+        elif f == "expected_delivery_date":
+            d = _date(data.get("expected_delivery_date"))
+            parts.append(f"dự kiến giao {d}" if d else "chưa có ngày dự kiến giao")
+        elif f == "supplier_name" and data.get("supplier_name"):
+            parts.append(f"nhà cung cấp {data['supplier_name']}")
+        elif f == "total_amount" and data.get("total_amount") is not None:
+            parts.append(f"tổng tiền {_num(data['total_amount'])}")
+    return f"Đơn mua {data['po_code']}: " + ", ".join(parts) + "."
+
+
+@answer_template("tra_cuu_trang_thai_pr")
+def _tpl_pr(question, args, data):
+    return f"Yêu cầu mua {data['pr_code']} đang ở trạng thái {_status(data.get('status'))}."
+
+
+@answer_template("tra_cuu_trang_thai_phieu_nhap")
+def _tpl_gr(question, args, data):
+    d = _date(data.get("receipt_date"))
+    tail = f", ngày nhập {d}" if d else ""
+    return f"Phiếu nhập {data['gr_code']} đang ở trạng thái {_status(data.get('status'))}{tail}."
+
+
+@answer_template("tra_cuu_trang_thai_phieu_xuat")
+def _tpl_gi(question, args, data):
+    d = _date(data.get("issue_date"))
+    tail = f", ngày xuất {d}" if d else ""
+    return f"Phiếu xuất {data['gi_code']} đang ở trạng thái {_status(data.get('status'))}{tail}."
+
+
+# ---------- finance_accounting ----------
+_INVOICE_FIELDS = {
+    "status": r"trạng thái|tình trạng",
+    "due_date": r"hạn|đến hạn|due",
+    "total_amount": r"tổng tiền|giá trị|bao nhiêu",
+    "paid_amount": r"đã (trả|thanh toán)|còn (nợ|lại)",
+}
+
+
+@answer_template("tra_cuu_trang_thai_hoa_don")
+def _tpl_invoice(question, args, data):
+    parts = []
+    for f in _asked(question, _INVOICE_FIELDS) or ["status"]:
+        if f == "status":
+            parts.append(f"trạng thái {_status(data.get('status'))}")
+        elif f == "due_date":
+            d = _date(data.get("due_date"))
+            parts.append(f"hạn thanh toán {d}" if d else "chưa có hạn thanh toán")
+        elif f == "total_amount" and data.get("total_amount") is not None:
+            parts.append(f"tổng tiền {_num(data['total_amount'])}")
+        elif f == "paid_amount" and data.get("paid_amount") is not None:
+            parts.append(f"đã thanh toán {_num(data['paid_amount'])}")
+    return f"Hóa đơn {data['invoice_code']}: " + ", ".join(parts) + "."
+
+
+@answer_template("ky_hien_tai")
+def _tpl_ky_hien_tai(question, args, data):
+    start, end = _date(data.get("start_date")), _date(data.get("end_date"))
+    if not start or not end:
+        return None
+    return (
+        f"Kỳ kế toán hiện tại là {data['period_name']} "
+        f"(từ {start} đến {end}), trạng thái {_status(data.get('status'))}."
+    )
+
+
+# ---------- sale_crm ----------
+@answer_template("tra_cuu_trang_thai_don_hang")
+def _tpl_order(question, args, data):
+    if not data:
+        return None
+    pay = data.get("payment") or {}
+    text = f"Đơn hàng {data['order_id']} đang ở trạng thái {_status(data.get('order_status'))}"
+    if pay and re.search(r"thanh toán|trả tiền", (question or "").lower()):
+        text += f", thanh toán {_status(pay.get('payment_status'))}"
+    return text + "."
+
+
+@answer_template("trang_thai_thanh_toan_theo_don")
+def _tpl_order_payment(question, args, data):
+    if not data:
+        return None
+    pay = data.get("payment")
+    if not pay:
+        return f"Đơn hàng {data['order_id']} chưa có bản ghi thanh toán."
+    return (
+        f"Thanh toán của đơn hàng {data['order_id']}: {_status(pay.get('payment_status'))}, "
+        f"số tiền {_num(pay.get('amount'))}."
+    )
+
+
+# ---------- hrm ----------
+# người hỏi tự xưng -> câu hỏi về chính họ
+_SELF_RE = re.compile(r"\b(tôi|mình|em|tớ)\b")
+
+
+@answer_template("trang_thai_face_data")
+def _tpl_face(question, args, data):
+    if _SELF_RE.search((question or "").lower()):
+        subject = "Bạn"
+    else:
+        subject = f"Nhân viên có ID {data['employee_id']}"
+    if data.get("has_active_face_data"):
+        return f"{subject} đã đăng ký dữ liệu khuôn mặt."
+    return f"{subject} chưa đăng ký dữ liệu khuôn mặt."
+
+
+def _payload_text(result: Dict[str, Any]) -> str:
+    return json.dumps(result, ensure_ascii=False, default=str)
+
+
+def render_template_answer(question: str, step_infos: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Trả câu trả lời deterministic nếu có thể, ngược lại None (=> compose bằng LLM).
+    step_infos: đã lọc context-only (step_infos_for_answer).
+    """
+    if not ANSWER_TEMPLATES_ENABLED or len(step_infos) != 1:
+        return None
+
+    si = step_infos[0]
+    result = si.get("result")
+    if not isinstance(result, dict) or result.get("ok") is not True:
+        return None
+
+    answer = result.get("answer")
+    if not answer:
+        tpl = ANSWER_TEMPLATES.get(si.get("tool") or "")
+        data = result.get("data")
+        if tpl is None or data in (None, {}, []):
+            return None
+        try:
+            answer = tpl(question, si.get("args") or {}, data)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # data thiếu field => để LLM compose
+            return None
+
+    if not answer or not compose_safe_enough(answer, payload_text=_payload_text(result)):
+        return None
+    return answer
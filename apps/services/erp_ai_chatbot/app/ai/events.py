@@ -0,0 +1,53 @@
+# app/ai/events.py
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Optional
+
+# =========================================================
+# Sự kiện tiến trình của 1 lượt chat (dùng cho SSE /chat/stream)
+# event: module | plan | tool_result | answer_delta | answer_reset
+# Sink None => không làm gì (đường JSON thường).
+# Sink raise ChatCancelled (client đã ngắt) => pipeline dừng ở lần emit kế tiếp.
+# =========================================================
+
+ChatEventSink = Callable[[str, Dict[str, Any]], None]
+
+
+class ChatCancelled(BaseException):
+    """Client SSE đã ngắt kết nối. BaseException (như asyncio.CancelledError) để không bị
+    các `except Exception` dọc pipeline (compose fallback, ...) nuốt mất."""
+
+
+def emit(sink: Optional[ChatEventSink], event: str, payload: Dict[str, Any]) -> None:
+    if sink is None:
+        return
+    try:
+        sink(event, payload)
+    except Exception:
+        # client ngắt kết nối / sink lỗi không được làm hỏng pipeline
+        pass
+
+
+class AnswerDeltas:
+    """
+    on_delta cho các lần compose của 1 lượt. Module có thể compose lại (vd. finance: bản đầu
+    không qua compose_safe_enough) -> trước lần compose mới gửi answer_reset để client
+    xoá bản nháp cũ thay vì nối 2 câu trả lời.
+    """
+
+    def __init__(self, sink: Optional[ChatEventSink]):
+        self.sink = sink
+        self.sent = False
+
+    def start(self) -> Optional[Callable[[str], None]]:
+        """Gọi trước mỗi lần compose; trả callback on_delta (None nếu không có sink)."""
+        if self.sink is None:
+            return None
+        if self.sent:
+            emit(self.sink, "answer_reset", {})
+            self.sent = False
+        return self._delta
+
+    def _delta(self, text: str) -> None:
+        self.sent = True
+        emit(self.sink, "answer_delta", {"text": text})
@@ -0,0 +1,218 @@
+# app/ai/executor/executor_async.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from app.core.audit_log import audit
+from app.core.errors import ToolExecutionError
+from app.core.telemetry import set_trace_module, span, traced_request
+from app.ai.module_detector import detect_module_async
+from app.ai.router import plan_route_async
+from app.ai.plan_schema import PlanStep
+from app.ai.tooling import ToolSpec
+from app.ai.answer_cache import bump_data_version, lookup_answer
+from app.ai.tool_cache import cached_call_async
+from app.ai.events import ChatEventSink, emit
+from app.ai.executor.executor_chat import (
+    VALID_MODULES,
+    _answer_from_cache,
+    _as_float,
+    _store_in_cache,
+    _needs_module_clarification,
+    _module_clarification,
+    _invalid_module,
+    finalize_chat_result,
+)
+from app.ai.executor.executor_hrm import HRM_HOOKS
+from app.ai.executor.executor_supply_chain import SUPPLY_CHAIN_HOOKS
+from app.ai.executor.executor_sale_crm import SALE_CRM_HOOKS
+from app.ai.executor.executor_finance_accounting import FINANCE_HOOKS
+from app.ai.executor.plan_engine import (
+    PLAN_SESSION_REUSE,
+    ModuleHooks,
+    PlanRun,
+    StepJob,
+    StepOutcome,
+    StepSchedule,
+    build_answer_async,
+    check_module_role,
+    start_run,
+)
+from app.db.async_database import get_async_session_factory
+from app.db.unit_of_work import AsyncReadOnlyUnitOfWork
+
+# =========================================================
+# Đường async (song song với execute_chat_unified sync):
+# - Gemini qua client.aio (detect / plan / compose)
+# - DB qua AsyncSession (asyncpg); tool handler sync chạy bằng session.run_sync,
+#   step đọc dùng chung AsyncReadOnlyUnitOfWork của lượt chat
+# - Vòng lặp tầng, bookkeeping step, resolver tham chiếu + ModuleHooks dùng chung
+#   với plan_engine; ở đây chỉ có cách gọi tool (AsyncToolCaller)
+# =========================================================
+
+
+async def _call_tool_async(session: Any, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        parsed = tool.args_model.model_validate(args)
+        kwargs = parsed.model_dump()
+        return await session.run_sync(lambda s: tool.handler(session=s, **kwargs))
+    except Exception as e:
+        raise ToolExecutionError(str(e))
+
+
+async def _execute_tool_async(module: str, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+    factory = get_async_session_factory(module)
+    async with factory() as session:
+        return await _call_tool_async(session, tool, args)
+
+
+class AsyncToolCaller:
+    """
+    Cách gọi tool của PlanRun.run_steps_async: step cùng tầng chạy bằng asyncio.gather.
+    normalize_args của module là hàm sync (HRM tra mã NV qua run.execute_tool) -> chạy trong thread;
+    lookup trong đó quay lại event loop bằng run_coroutine_threadsafe.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def open(self, run: PlanRun, sched: StepSchedule) -> None:
+        self._loop = asyncio.get_running_loop()
+        if PLAN_SESSION_REUSE:
+            run.uow = AsyncReadOnlyUnitOfWork(share_snapshot=sched.parallel)
+
+    async def close(self, run: PlanRun) -> None:
+        if run.uow is not None:
+            await run.uow.close()
+            run.uow = None
+        self._loop = None
+
+    def execute(self, run: PlanRun, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        # chỉ gọi từ thread của normalize_args; gọi từ event loop sẽ tự chặn chính nó
+        return asyncio.run_coroutine_threadsafe(self.execute_async(run, tool, args), self._loop).result()
+
+    async def execute_async(self, run: PlanRun, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        module = run.hooks.module
+        if not tool.read_only:
+            try:
+                return await _execute_tool_async(module, tool, args)
+            finally:
+                bump_data_version(module)
+                # snapshot cũ không thấy dữ liệu vừa ghi (step ghi luôn đứng 1 mình 1 tầng)
+                if run.uow is not None:
+                    run.uow = await run.uow.renew()
+        return await cached_call_async(tool, args, lambda: self._execute_read(run, tool, args))
+
+    async def _execute_read(self, run: PlanRun, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        if run.uow is None:
+            return await _execute_tool_async(run.hooks.module, tool, args)
+        # 1 unit of work read-only / DB cho cả lượt, như đường sync
+        async with run.uow.session(get_async_session_factory(run.hooks.module)) as session:
+            return await _call_tool_async(session, tool, args)
+
+    async def prepare_args(self, run: PlanRun, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        if run.hooks.normalize_args is not None:
+            args = await asyncio.to_thread(run.normalize_args, tool, args)
+        return run.inject_auth(tool, args)
+
+    async def call(self, run: PlanRun, i: int, step: PlanStep, tool: ToolSpec, args: Dict[str, Any]) -> StepOutcome:
+        # gather chạy mỗi coroutine trong Task riêng (copy context) -> bộ đếm SQL không lẫn giữa các step
+        with run.tool_call(i, step, tool):
+            args = await self.prepare_args(run, tool, args)
+            audit({"event": "tool_call", "module": run.plan.module, "tool": step.tool, "args": args})
+            result = await self.execute_async(run, tool, args)
+            audit({"event": "tool_result", "module": run.plan.module, "tool": step.tool, "result": result})
+        return args, result
+
+    async def run_jobs(self, run: PlanRun, jobs: List[StepJob]) -> List[StepOutcome]:
+        tasks = [asyncio.ensure_future(self.call(run, *job)) for job in jobs]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            # 1 step lỗi: huỷ các step cùng tầng và chờ chúng dừng hẳn -> close() không rollback
+            # AsyncSession mà step khác còn đang await
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+# ModuleHooks dùng chung với executor sync
+_MODULE_HOOKS: Dict[str, ModuleHooks] = {
+    h.module: h for h in (HRM_HOOKS, SUPPLY_CHAIN_HOOKS, SALE_CRM_HOOKS, FINANCE_HOOKS)
+}
+
+
+async def execute_module_async(
+    module: str,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    compose_enabled: bool = True,
+    on_event: Optional[ChatEventSink] = None,
+) -> Dict[str, Any]:
+    check_module_role(module, role)
+
+    hooks = _MODULE_HOOKS[module]
+    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
+    with span("plan", module=module):
+        plan = await plan_route_async(module=module, message=message, auth=auth)
+
+    run = start_run(hooks, user_id, role, message, plan, on_event=on_event, caller=AsyncToolCaller())
+    if run.early_result is None:
+        await run.run_steps_async()
+    if run.early_result is not None:
+        return run.early_result
+
+    # template / compose / fallback riêng từng module (ModuleHooks.answer), như đường sync
+    return await build_answer_async(run, compose_enabled)
+
+
+@traced_request
+async def execute_chat_unified_async(
+    module: str,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    compose_enabled: bool = True,
+    debug: bool = False,
+    on_event: Optional[ChatEventSink] = None,
+) -> Dict[str, Any]:
+    """Cùng input/output với execute_chat_unified, nhưng không chiếm worker thread khi chờ I/O."""
+    module = (module or "auto").strip()
+    msg = (message or "").strip()
+
+    det: Optional[Dict[str, Any]] = None
+
+    lookup = lookup_answer(module, msg, role, user_id, compose_enabled)
+    if lookup is not None and lookup.hit is not None:
+        return _answer_from_cache(lookup, debug, on_event)
+
+    if module == "auto":
+        det = await detect_module_async(message=msg, role=role)
+        selected_module = det.get("selected_module")
+        confidence = _as_float(det.get("confidence"), 0.0)
+        emit(on_event, "module", {"selected_module": selected_module, "confidence": confidence, "method": det.get("method")})
+
+        if _needs_module_clarification(det, selected_module, confidence):
+            return _module_clarification(det, selected_module, confidence, debug)
+    else:
+        selected_module = module
+        confidence = 1.0
+        emit(on_event, "module", {"selected_module": selected_module, "confidence": confidence, "method": "user"})
+
+    if selected_module not in VALID_MODULES:
+        return _invalid_module(det, debug)
+    set_trace_module(selected_module)
+
+    res = await execute_module_async(
+        module=selected_module,
+        user_id=user_id,
+        role=role,
+        message=msg,
+        compose_enabled=compose_enabled,
+        on_event=on_event,
+    )
+    cache = _store_in_cache(lookup, user_id, selected_module, confidence, det, res)
+    return finalize_chat_result(res, selected_module, confidence, debug, det, cache=cache)
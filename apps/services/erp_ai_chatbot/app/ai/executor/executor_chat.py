@@ -1,20 +1,52 @@
 # app/ai/executor/executor_chat.py
 from __future__ import annotations
 
+import contextvars
 import os
-from typing import Any, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Any, Dict, List, Optional, Tuple
 
-from app.ai.module_detector import detect_module_llm
+from app.core.audit_log import audit
+from app.core.rbac import MODULE_ALLOWED_ROLES
+from app.core.telemetry import set_trace_module, span, trace_summary, traced_request
+from app.ai.module_classifier import classify_module_local, rank_modules_local
+from app.ai.module_detector import detect_module, MODULE_DETECT_THRESHOLD
+from app.ai.answer_cache import AnswerLookup, lookup_answer, cached_result, store_answer
+from app.ai.plan_schema import Plan
+from app.ai.events import ChatEventSink, emit
+from app.ai.router import plan_route
+from app.ai.routers.common import build_system_instruction
 
 # import các executor module bạn đã có sẵn
-from app.ai.executor.executor_hrm import execute_chat_hrm
-from app.ai.executor.executor_supply_chain import execute_chat_supply_chain
-from app.ai.executor.executor_sale_crm import execute_chat_sale_crm
-from app.ai.executor.executor_finance_accounting import execute_chat_finance_accounting
+from app.ai.executor.executor_hrm import HRM_HOOKS, execute_chat_hrm
+from app.ai.executor.executor_supply_chain import SUPPLY_CHAIN_HOOKS, execute_chat_supply_chain
+from app.ai.executor.executor_sale_crm import SALE_CRM_HOOKS, execute_chat_sale_crm
+from app.ai.executor.executor_finance_accounting import FINANCE_HOOKS, execute_chat_finance_accounting
 
 
 VALID_MODULES = {"hrm", "supply_chain", "sale_crm", "finance_accounting"}
-MODULE_DETECT_THRESHOLD = float(os.getenv("MODULE_DETECT_THRESHOLD", "0.60"))
+
+# answer cache: module có inject auth trả dữ liệu theo user -> cache theo user_id,
+# module còn lại (supply_chain) dùng chung trong cùng role
+USER_SCOPED_MODULES = {
+    h.module for h in (HRM_HOOKS, SUPPLY_CHAIN_HOOKS, SALE_CRM_HOOKS, FINANCE_HOOKS) if h.inject_auth
+}
+
+# ===== Speculative planning (module="auto") =====
+# Lập plan cho 1-2 module khả dĩ NGAY trong lúc detector đang chạy,
+# detector xong thì giữ plan khớp module, bỏ các plan còn lại.
+SPECULATIVE_PLANNING = os.getenv("SPECULATIVE_PLANNING", "0") == "1"
+SPECULATIVE_TOP_K = max(1, min(int(os.getenv("SPECULATIVE_TOP_K", "2")), 2))
+# abandon: detector xong là trả lời ngay, plan thừa chạy nốt ở background và bị bỏ
+# drain:   chờ plan thừa chạy xong rồi mới trả lời (không để LLM call "mồ côi")
+SPECULATIVE_CANCEL_RULE = os.getenv("SPECULATIVE_CANCEL_RULE", "abandon").strip().lower()
+# ngân sách token (ước lượng) cho các planner call chạy trước, tính trên mỗi request
+SPECULATIVE_TOKEN_BUDGET = int(os.getenv("SPECULATIVE_TOKEN_BUDGET", "20000"))
+
+_SPEC_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPECULATIVE_POOL_SIZE", "8")),
+    thread_name_prefix="spec-plan",
+)
 
 
 def _as_float(x, default=0.0) -> float:
@@ -24,6 +56,219 @@ def _as_float(x, default=0.0) -> float:
         return default
 
 
+def _speculative_plan(module: str, message: str, auth: dict) -> Plan:
+    with span("plan", module=module, speculative=True):
+        return plan_route(module=module, message=message, auth=auth)
+
+
+def _estimate_plan_tokens(module: str, auth: dict, message: str) -> int:
+    # ước lượng thô: ~4 ký tự / token cho system instruction + message
+    return (len(build_system_instruction(module, auth)) + len(message)) // 4
+
+
+def _speculative_candidates(message: str, auth: dict) -> Tuple[List[str], int]:
+    """
+    Chọn tối đa SPECULATIVE_TOP_K module để lập plan trước, xếp theo điểm lexical.
+    Chỉ xét module mà role được phép dùng (executor sẽ chặn các module khác).
+    """
+    role = auth.get("role")
+    ranked = rank_modules_local(message)
+    allowed = [m for m in ranked if role in MODULE_ALLOWED_ROLES.get(m, set())]
+
+    picked: List[str] = []
+    spent = 0
+    for m in allowed[:SPECULATIVE_TOP_K]:
+        cost = _estimate_plan_tokens(m, auth, message)
+        if spent + cost > SPECULATIVE_TOKEN_BUDGET:
+            break
+        picked.append(m)
+        spent += cost
+    return picked, spent
+
+
+def _detect_with_speculative_plans(
+    message: str,
+    user_id: int | None,
+    role: str | None,
+) -> Tuple[Dict[str, Any], Optional[Plan], Dict[str, Any]]:
+    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
+    candidates, est_tokens = _speculative_candidates(message, auth)
+
+    futures: Dict[str, Future] = {
+        m: _SPEC_POOL.submit(contextvars.copy_context().run, _speculative_plan, m, message, auth)
+        for m in candidates
+    }
+
+    # detector chạy trên thread hiện tại, song song với các planner call
+    det = detect_module(message=message, role=role)
+    selected = det.get("selected_module")
+    confident = (
+        bool(selected)
+        and not det.get("needs_clarification")
+        and _as_float(det.get("confidence"), 0.0) >= MODULE_DETECT_THRESHOLD
+    )
+
+    losers = [f for m, f in futures.items() if not (confident and m == selected)]
+    for f in losers:
+        f.cancel()  # chỉ huỷ được task chưa bắt đầu; task đang chạy sẽ bị bỏ kết quả
+
+    plan: Optional[Plan] = None
+    if confident and selected in futures:
+        try:
+            plan = futures[selected].result()
+        except Exception as e:
+            audit({"event": "speculative_plan_failed", "module": selected, "error": str(e)})
+            plan = None
+
+    if SPECULATIVE_CANCEL_RULE == "drain" and losers:
+        wait(losers)
+
+    info = {
+        "candidates": candidates,
+        "estimated_tokens": est_tokens,
+        "hit": plan is not None,
+        "cancel_rule": SPECULATIVE_CANCEL_RULE,
+    }
+    audit({"event": "speculative_plan", "selected_module": selected, **info})
+    return det, plan, info
+
+
+def _needs_module_clarification(det: Dict[str, Any], selected_module: Optional[str], confidence: float) -> bool:
+    return (not selected_module) or bool(det.get("needs_clarification")) or (confidence < MODULE_DETECT_THRESHOLD)
+
+
+def _module_clarification(
+    det: Dict[str, Any],
+    selected_module: Optional[str],
+    confidence: float,
+    debug: bool,
+    speculative: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    q = det.get("clarifying_question") or "Bạn muốn hỏi thuộc module nào: hrm / supply_chain / sale_crm / finance_accounting?"
+    # trả về y như bạn đang làm: chỉ hỏi chọn module, KHÔNG chạy tools
+    out = {
+        "answer": q,
+        "selected_module": selected_module,
+        "confidence": confidence,
+        "needs_clarification": True,
+        "clarifying_question": q,
+        "plan": {
+            "module": selected_module or "auto",
+            "intent": "chon_module",
+            "needs_clarification": True,
+            "clarifying_question": q,
+            "steps": [],
+            "final_response_template": None,
+        },
+    }
+    if debug:
+        out["detector"] = det
+        if speculative:
+            out["speculative"] = speculative
+        out["trace"] = trace_summary()
+    return out
+
+
+def _invalid_module(det: Optional[Dict[str, Any]], debug: bool) -> Dict[str, Any]:
+    q = "Module không hợp lệ. Chọn: hrm / supply_chain / sale_crm / finance_accounting."
+    out = {
+        "answer": q,
+        "selected_module": None,
+        "confidence": 0.0,
+        "needs_clarification": True,
+        "clarifying_question": q,
+        "plan": {
+            "module": "auto",
+            "intent": "module_khong_hop_le",
+            "needs_clarification": True,
+            "clarifying_question": q,
+            "steps": [],
+            "final_response_template": None,
+        },
+    }
+    if debug:
+        if det:
+            out["detector"] = det
+        out["trace"] = trace_summary()
+    return out
+
+
+def finalize_chat_result(
+    res: Optional[Dict[str, Any]],
+    selected_module: Optional[str],
+    confidence: float,
+    debug: bool,
+    det: Optional[Dict[str, Any]] = None,
+    speculative: Optional[Dict[str, Any]] = None,
+    cache: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    # gắn metadata (để debug detector + module)
+    res = dict(res or {})
+
+    # ✅ đảm bảo schema đồng nhất giữa các module
+    res.setdefault("composed_used", False)
+    res.setdefault("compose_error", None)
+    res.setdefault("answer_source", None)
+    res.setdefault("data", {})
+    res.setdefault("plan", {})
+
+    res["selected_module"] = selected_module
+    res["confidence"] = confidence
+
+    # ✅ debug=True => trả FULL (plan + data + composed_used + compose_error ...)
+    if debug:
+        if det:
+            res["detector"] = det
+        if speculative:
+            res["speculative"] = speculative
+        if cache:
+            res["cache"] = cache
+        # thời gian / token / chi phí theo pha (detect, plan, validate, tool, compose)
+        res["trace"] = trace_summary()
+        # đảm bảo key tồn tại (tránh module nào đó quên set)
+        res.setdefault("plan", None)
+        res.setdefault("data", {})
+        return res
+
+    # debug=False => trả gọn, nhưng vẫn giữ plan (nếu bạn muốn xem steps)
+    out = {
+        "answer": res.get("answer"),
+        "selected_module": selected_module,
+        "confidence": confidence,
+        "plan": res.get("plan"),   # ✅ giữ plan để nhìn steps
+    }
+    if "candidates" in res:
+        out["candidates"] = res["candidates"]
+    return out
+
+
+def _answer_from_cache(lookup: AnswerLookup, debug: bool, on_event: Optional[ChatEventSink]) -> Dict[str, Any]:
+    hit = lookup.hit
+    set_trace_module(hit.selected_module)
+    emit(on_event, "module", {"selected_module": hit.selected_module, "confidence": hit.confidence, "method": "cache"})
+    return finalize_chat_result(
+        cached_result(lookup), hit.selected_module, hit.confidence, debug, hit.detector,
+        cache={"hit": True, "age_s": lookup.age_s},
+    )
+
+
+def _store_in_cache(
+    lookup: Optional[AnswerLookup],
+    user_id: int | None,
+    selected_module: str,
+    confidence: float,
+    det: Optional[Dict[str, Any]],
+    res: Optional[Dict[str, Any]],
+) -> Optional[Dict[str, Any]]:
+    if lookup is None:
+        return None
+    stored = store_answer(
+        lookup, user_id, selected_module in USER_SCOPED_MODULES, selected_module, confidence, det, res or {},
+    )
+    return {"hit": False, "stored": stored}
+
+
+@traced_request
 def execute_chat_unified(
     module: str,
     user_id: int | None,
@@ -32,6 +277,7 @@ def execute_chat_unified(
     paraphrase_enabled: bool = True,
     compose_enabled: bool = True,
     debug: bool = False,
+    on_event: Optional[ChatEventSink] = None,
 ) -> Dict[str, Any]:
     module = (module or "auto").strip()
     msg = (message or "").strip()
@@ -39,37 +285,34 @@ def execute_chat_unified(
     det: Optional[Dict[str, Any]] = None
     selected_module: Optional[str] = None
     confidence: float = 0.0
+    plan: Optional[Plan] = None
+    speculative: Optional[Dict[str, Any]] = None
+
+    # câu hỏi lặp lại (cùng role / phạm vi user) -> trả ngay, bỏ qua detect/plan/SQL/compose
+    lookup = lookup_answer(module, msg, role, user_id, compose_enabled)
+    if lookup is not None and lookup.hit is not None:
+        return _answer_from_cache(lookup, debug, on_event)
 
     # =========================
     # PHA A — Detect module (LLM #1)
     # =========================
     if module == "auto":
-        det = detect_module_llm(message=msg, role=role)
+        local = classify_module_local(msg) if (SPECULATIVE_PLANNING and msg) else None
+        if local and local.get("confidence", 0.0) < MODULE_DETECT_THRESHOLD:
+            # chỉ speculative khi chắc chắn phải chờ LLM detector
+            det, plan, speculative = _detect_with_speculative_plans(msg, user_id, role)
+        else:
+            det = detect_module(message=msg, role=role)
         selected_module = det.get("selected_module")
         confidence = _as_float(det.get("confidence"), 0.0)
+        emit(on_event, "module", {
+            "selected_module": selected_module,
+            "confidence": confidence,
+            "method": det.get("method"),
+        })
 
-        needs_clar = bool(det.get("needs_clarification"))
-        if (not selected_module) or needs_clar or (confidence < MODULE_DETECT_THRESHOLD):
-            q = det.get("clarifying_question") or "Bạn muốn hỏi thuộc module nào: hrm / supply_chain / sale_crm / finance_accounting?"
-            # trả về y như bạn đang làm: chỉ hỏi chọn module, KHÔNG chạy tools
-            out = {
-                "answer": q,
-                "selected_module": selected_module,
-                "confidence": confidence,
-                "needs_clarification": True,
-                "clarifying_question": q,
-                "plan": {
-                    "module": selected_module or "auto",
-                    "intent": "chon_module",
-                    "needs_clarification": True,
-                    "clarifying_question": q,
-                    "steps": [],
-                    "final_response_template": None,
-                },
-            }
-            if debug:
-                out["detector"] = det
-            return out
+        if _needs_module_clarification(det, selected_module, confidence):
+            return _module_clarification(det, selected_module, confidence, debug, speculative)
 
         # sanitize: nếu đã đủ chắc thì ép clear
         # (tránh trường hợp LLM lỡ set needs_clarification=true dù confidence cao)
@@ -79,27 +322,11 @@ def execute_chat_unified(
         # user chỉ định module cụ thể
         selected_module = module
         confidence = 1.0
+        emit(on_event, "module", {"selected_module": selected_module, "confidence": confidence, "method": "user"})
 
     if selected_module not in VALID_MODULES:
-        q = "Module không hợp lệ. Chọn: hrm / supply_chain / sale_crm / finance_accounting."
-        out = {
-            "answer": q,
-            "selected_module": None,
-            "confidence": 0.0,
-            "needs_clarification": True,
-            "clarifying_question": q,
-            "plan": {
-                "module": "auto",
-                "intent": "module_khong_hop_le",
-                "needs_clarification": True,
-                "clarifying_question": q,
-                "steps": [],
-                "final_response_template": None,
-            },
-        }
-        if debug and det:
-            out["detector"] = det
-        return out
+        return _invalid_module(det, debug)
+    set_trace_module(selected_module)
 
     # =========================
     # PHA B + C — Delegate sang executor module
@@ -113,6 +340,8 @@ def execute_chat_unified(
             message=msg,
             paraphrase_enabled=paraphrase_enabled,
             compose_enabled=compose_enabled,
+            on_event=on_event,
+            plan=plan,
         )
     elif selected_module == "supply_chain":
         res = execute_chat_supply_chain(
@@ -122,6 +351,8 @@ def execute_chat_unified(
             message=msg,
             paraphrase_enabled=paraphrase_enabled,
             compose_enabled=compose_enabled,
+            on_event=on_event,
+            plan=plan,
         )
     elif selected_module == "sale_crm":
         res = execute_chat_sale_crm(
@@ -131,6 +362,8 @@ def execute_chat_unified(
             message=msg,
             paraphrase_enabled=paraphrase_enabled,
             compose_enabled=compose_enabled,
+            on_event=on_event,
+            plan=plan,
         )
     else:  # finance_accounting
         res = execute_chat_finance_accounting(
@@ -140,37 +373,9 @@ def execute_chat_unified(
             message=msg,
             paraphrase_enabled=paraphrase_enabled,
             compose_enabled=compose_enabled,
+            on_event=on_event,
+            plan=plan,
         )
 
-    # gắn metadata (để debug detector + module)
-    res = dict(res or {})
-    res = dict(res or {})
-
-    # ✅ đảm bảo schema đồng nhất giữa các module
-    res.setdefault("composed_used", False)
-    res.setdefault("compose_error", None)
-    res.setdefault("data", {})
-    res.setdefault("plan", {})
-
-    res["selected_module"] = selected_module
-    res["confidence"] = confidence
-
-    # ✅ debug=True => trả FULL (plan + data + composed_used + compose_error ...)
-    if debug:
-        if det:
-            res["detector"] = det
-        # đảm bảo key tồn tại (tránh module nào đó quên set)
-        res.setdefault("plan", None)
-        res.setdefault("data", {})
-        return res
-
-    # debug=False => trả gọn, nhưng vẫn giữ plan (nếu bạn muốn xem steps)
-    out = {
-        "answer": res.get("answer"),
-        "selected_module": selected_module,
-        "confidence": confidence,
-        "plan": res.get("plan"),   # ✅ giữ plan để nhìn steps
-    }
-    if "candidates" in res:
-        out["candidates"] = res["candidates"]
-    return out
+    cache = _store_in_cache(lookup, user_id, selected_module, confidence, det, res)
+    return finalize_chat_result(res, selected_module, confidence, debug, det, speculative, cache=cache)
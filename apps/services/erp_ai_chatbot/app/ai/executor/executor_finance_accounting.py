@@ -5,16 +5,14 @@ import json
 from typing import Any, Dict, Optional, List, get_args, get_origin
 from datetime import date, datetime
 
-from app.core.rbac import check_role
 from app.core.audit_log import audit
-from app.core.errors import PermissionDenied, ToolExecutionError
 
-from app.ai.answer_composer import compose_answer_with_llm, compose_safe_enough
-from app.ai.router import plan_route
-from app.ai.plan_validator import validate_plan
-from app.ai.module_registry import get_tool
+from app.ai.answer_composer import compose_safe_enough
+from app.ai.answer_templates import render_template_answer
+from app.ai.events import ChatEventSink
+from app.ai.plan_schema import Plan
 from app.ai.tooling import ToolSpec
-from app.ai.executor.context_injection import inject_auth_into_args
+from app.ai.executor.plan_engine import AnswerSteps, ModuleHooks, PlanRun, build_answer, run_plan
 
 from app.db.finance_database import FinanceSessionLocal
 
@@ -137,12 +135,6 @@ def _normalize_args_for_tool(tool: ToolSpec, args: Dict[str, Any]) -> Dict[str,
     return out
 
 
-def _args_has_target_user_id_field(tool) -> bool:
-    m = getattr(tool, "args_model", None)
-    fields = getattr(m, "model_fields", None)
-    return bool(fields) and ("target_user_id" in fields)
-
-
 # =========================================================
 # Context-only tool suppression (tránh lan man)
 # =========================================================
@@ -186,136 +178,6 @@ def _filter_step_infos_for_answer(module: str, message: str, step_infos: list[di
     return _filter_step_infos_for_compose(module, message, step_infos)
 
 
-# =========================================================
-# Placeholder resolving (giống HRM)
-# =========================================================
-FULL_TPL_RE = re.compile(r"^\s*\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}\s*$")
-VAR_DBL_RE  = re.compile(r"\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}")
-
-class UnresolvedRefError(Exception):
-    pass
-
-def _get_path(store: dict, path: str):
-    cur: Any = store
-    for part in path.split("."):
-        m = re.match(r"^([a-zA-Z0-9_]+)(\[[0-9]+\])?$", part)
-        if not m:
-            raise KeyError(path)
-
-        key = m.group(1)
-        idx = int(m.group(2)[1:-1]) if m.group(2) else None
-
-        # 1) cur là dict => truy cập key bình thường
-        if isinstance(cur, dict):
-            cur = cur[key]
-
-        # 2) cur là list nhưng LLM lỡ viết ".data[0]" (trong khi save_as là list)
-        elif isinstance(cur, list):
-            if key in ("data", "items", "rows", "results"):
-                # coi ".data" như identity của list
-                pass
-            else:
-                raise KeyError(f"{path} (cannot access key '{key}' on list)")
-
-        else:
-            raise KeyError(f"{path} (unexpected type {type(cur).__name__})")
-
-        # apply index nếu có
-        if idx is not None:
-            if not isinstance(cur, list):
-                raise KeyError(f"{path} (index on non-list)")
-            if idx < 0 or idx >= len(cur):
-                raise IndexError(f"{path} (index {idx} out of range; len={len(cur)})")
-            cur = cur[idx]
-
-    return cur
-
-def _render_value(tpl: str, store: dict):
-    tpl = tpl or ""
-
-    m = FULL_TPL_RE.match(tpl)
-    if m:
-        path = m.group(1)
-        try:
-            return _get_path(store, path)
-        except Exception:
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                return _get_path(store, f"{step_id}.data.{rest}")
-            raise
-
-    def repl(mm):
-        path = mm.group(1)
-        try:
-            val = _get_path(store, path)
-            return "" if val is None else str(val)
-        except Exception:
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                val = _get_path(store, f"{step_id}.data.{rest}")
-                return "" if val is None else str(val)
-            return mm.group(0)
-
-    return VAR_DBL_RE.sub(repl, tpl)
-
-def _normalize_ref(s: str) -> str:
-    s = (s or "").strip()
-
-    m = re.fullmatch(r"\$\{\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    m = re.fullmatch(r"\{\s*\$\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    if s.startswith("$."):
-        return "{{" + s[2:] + "}}"
-
-    if s.startswith("$") and not s.startswith("$."):
-        if re.fullmatch(r"\$[A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*", s):
-            return "{{" + s[1:] + "}}"
-
-    return s
-
-def _resolve_args(args: Dict[str, Any], store: dict) -> Dict[str, Any]:
-    out = {}
-    for k, v in (args or {}).items():
-        if isinstance(v, str):
-            v2 = _normalize_ref(v)
-            try:
-                rendered = _render_value(v2, store)
-            except Exception as e:
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} ({e})")
-            if isinstance(rendered, str) and ("{{" in rendered or "}}" in rendered):
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} -> {rendered}")
-            out[k] = rendered
-        else:
-            out[k] = v
-    return out
-
-
-# =========================================================
-# Execute tool (Finance session)
-# =========================================================
-def _execute_tool(module: str, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
-    if module != "finance_accounting":
-        raise ToolExecutionError(f"Executor finance chỉ hỗ trợ module '{module}'? (expected finance_accounting)")
-
-    session = FinanceSessionLocal()
-    try:
-        parsed = tool.args_model.model_validate(args)
-        return tool.handler(session=session, **parsed.model_dump())
-    except Exception as e:
-        raise ToolExecutionError(str(e))
-    finally:
-        session.close()
-
-
 def _is_empty_data(x: Any) -> bool:
     if not isinstance(x, dict):
         return True
@@ -327,75 +189,14 @@ def _is_empty_data(x: Any) -> bool:
     return False
 
 
-# =========================================================
-# MAIN
-# =========================================================
-def execute_chat_finance_accounting(
-    module: str,
-    user_id: int | None,
-    role: str | None,
-    message: str,
-    paraphrase_enabled: bool = True,
-    compose_enabled: bool = True,
-):
-    if not check_role(module, role):
-        raise PermissionDenied(f"Role '{role}' không được phép dùng chatbot module '{module}'.")
-
-    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
-    plan = plan_route(module=module, message=message, auth=auth)
-    audit({"event": "plan_created", "module": module, "plan": plan.model_dump()})
-
-    if plan.needs_clarification:
-        return {"answer": plan.clarifying_question, "plan": plan.model_dump()}
-
-    validate_plan(plan)
-
-    store: Dict[str, Any] = {}
-    step_infos: list[dict] = []
-
-    # --- run tools ---
-    for idx, step in enumerate(plan.steps, start=1):
-        tool = get_tool(plan.module, step.tool)
-        if tool is None:
-            raise ToolExecutionError(f"Không tìm thấy tool '{step.tool}' trong module '{plan.module}'.")
-
-        try:
-            resolved_args = _resolve_args(step.args, store)
-        except UnresolvedRefError as e:
-            audit({"event": "arg_unresolved_stop", "error": str(e), "step": step.model_dump()})
-            break
-
-        resolved_args = inject_auth_into_args(
-            auth_user_id=user_id,
-            tool_args=resolved_args,
-            has_target_user_id_field=_args_has_target_user_id_field(tool),
-        )
-
-        # ✅ tối thiểu: normalize args theo schema để tránh fail validate
-        resolved_args = _normalize_args_for_tool(tool, resolved_args)
-
-        audit({"event": "tool_call", "module": plan.module, "tool": step.tool, "args": resolved_args})
-        result = _execute_tool(plan.module, tool, resolved_args)
-        audit({"event": "tool_result", "module": plan.module, "tool": step.tool, "result": result})
-
-        step_infos.append({"id": step.id, "tool": step.tool, "args": resolved_args, "result": result})
-
-        if isinstance(result, dict) and result.get("needs_clarification"):
-            return {"answer": result.get("question"), "candidates": result.get("candidates"), "plan": plan.model_dump()}
-
-        store[step.id] = result
-        store[f"s{idx}"] = result
+def _answer_finance(run: PlanRun, compose_enabled: bool) -> AnswerSteps:
+    message, store, plan = run.message, run.store, run.plan
 
-        if getattr(step, "save_as", None):
-            if isinstance(result, dict) and "data" in result:
-                store[step.save_as] = result.get("data")
-                store[f"{step.save_as}__raw"] = result
-            else:
-                store[step.save_as] = result
-
-    step_infos_for_answer = _filter_step_infos_for_answer(plan.module, message, step_infos)
+    step_infos_for_answer = run.step_infos_for_answer()
 
-    answer = None
+    # 1) Tool có answer sẵn (ar_no/ap_no...) hoặc template theo tool -> không cần LLM
+    answer = render_template_answer(message, step_infos_for_answer)
+    answer_source = "template" if answer else None
     composed_used = False
     compose_error: str | None = None
 
@@ -408,12 +209,13 @@ def execute_chat_finance_accounting(
     )
 
     # Ưu tiên compose khi có data
-    if compose_enabled and has_real_data:
+    if compose_enabled and has_real_data and not answer:
         try:
-            composed = compose_answer_with_llm(plan.module, message, step_infos_for_answer)
+            composed = yield step_infos_for_answer
             if composed and compose_safe_enough(composed):
                 answer = composed
                 composed_used = True
+                answer_source = "llm"
         except Exception as e:
             compose_error = str(e)
             audit({"event": "compose_failed", "error": compose_error})
@@ -421,15 +223,17 @@ def execute_chat_finance_accounting(
     # 2) Nếu tool không có answer -> mới compose bằng LLM (và qua safety)
     if (not answer) and compose_enabled:
         try:
-            composed = compose_answer_with_llm(plan.module, message, step_infos_for_answer)
+            composed = yield step_infos_for_answer
             if composed and compose_safe_enough(composed):
                 answer = composed
                 composed_used = True
+                answer_source = "llm"
         except Exception as e:
             audit({"event": "compose_failed", "error": str(e)})
 
     # Nếu vẫn chưa có answer -> STRICT (không fallback format)
     if not answer:
+        answer_source = "fallback"
         last = step_infos_for_answer[-1]["result"] if step_infos_for_answer else None
         if isinstance(last, dict):
             data = last.get("data")
@@ -442,8 +246,39 @@ def execute_chat_finance_accounting(
 
     return {
         "answer": answer,
+        "answer_source": answer_source,
         "composed_used": composed_used,
         "compose_error": compose_error,
         "data": store,
         "plan": plan.model_dump(),
-    }
\ No newline at end of file
+    }
+
+
+FINANCE_HOOKS = ModuleHooks(
+    module="finance_accounting",
+    session_factory=FinanceSessionLocal,
+    # tối thiểu: normalize args theo schema để tránh fail validate
+    normalize_args=lambda run, tool, args: _normalize_args_for_tool(tool, args),
+    filter_for_answer=_filter_step_infos_for_answer,
+    answer=_answer_finance,
+)
+
+
+
+# =========================================================
+# MAIN
+# =========================================================
+def execute_chat_finance_accounting(
+    module: str,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    paraphrase_enabled: bool = True,
+    compose_enabled: bool = True,
+    plan: Optional[Plan] = None,
+    on_event: Optional[ChatEventSink] = None,
+):
+    run = run_plan(FINANCE_HOOKS, user_id, role, message, plan=plan, on_event=on_event)
+    if run.early_result is not None:
+        return run.early_result
+    return build_answer(run, compose_enabled)
@@ -3,28 +3,19 @@ import re
 from typing import Any, Dict, Optional, List
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from app.core.rbac import check_role
 from app.core.audit_log import audit
-from app.core.errors import PermissionDenied, ToolExecutionError
-from app.ai.router import plan_route
-from app.ai.plan_validator import validate_plan
+from app.ai.plan_schema import Plan
 from app.ai.module_registry import get_tool
 from app.ai.tooling import ToolSpec
-from app.ai.answer_composer import compose_answer_with_llm, compose_safe_enough
+from app.ai.answer_templates import render_template_answer
+from app.ai.events import ChatEventSink
 
 from app.db.hrm_database import HrmSessionLocal
 
 import json
 import os
-from google import genai
 
-from app.ai.executor.context_injection import inject_auth_into_args
-
-def _args_has_target_user_id_field(tool) -> bool:
-    # tool.args_model là Pydantic model class
-    m = getattr(tool, "args_model", None)
-    fields = getattr(m, "model_fields", None)
-    return bool(fields) and ("target_user_id" in fields)
+from app.ai.executor.plan_engine import AnswerSteps, ModuleHooks, PlanRun, build_answer, run_plan
 
 # Fix để câu trả lời chỉ bám câu hỏi (không lôi thông tin NV)
 # Tool chỉ để lấy context (không nên đưa vào câu trả lời cuối)
@@ -84,7 +75,7 @@ def _is_int_like(s: str) -> bool:
     s = (s or "").strip()
     return s.isdigit()
 
-def _auto_resolve_hrm_employee_id(args: Dict[str, Any]) -> Dict[str, Any]:
+def _auto_resolve_hrm_employee_id(run: PlanRun, args: Dict[str, Any]) -> Dict[str, Any]:
     """
     Nếu args.employee_id đang là mã NV (VD: 'NV001') thay vì int,
     thì tự gọi tool 'thong_tin_nhan_vien' (fallback 'tim_nhan_vien') để lấy employee_id int.
@@ -110,8 +101,8 @@ def _auto_resolve_hrm_employee_id(args: Dict[str, Any]) -> Dict[str, Any]:
     if not tool:
         return args
 
-    lookup_args = {"employee_code": raw} if tool.name == "thong_tin_nhan_vien" else {"tu_khoa": raw}
-    lookup_res = _execute_tool("hrm", tool, lookup_args)
+    lookup_args = {"employee_code": raw} if tool.ten_tool == "thong_tin_nhan_vien" else {"tu_khoa": raw}
+    lookup_res = run.execute_tool(tool, lookup_args)
 
     data = (lookup_res or {}).get("data") if isinstance(lookup_res, dict) else None
     emp_id = data.get("employee_id") if isinstance(data, dict) else None
@@ -122,171 +113,14 @@ def _auto_resolve_hrm_employee_id(args: Dict[str, Any]) -> Dict[str, Any]:
 
     return args
 
-_NUM_RE = re.compile(r"\d+")
-_CODE_RE = re.compile(r"\b[A-Z]{2,}-\d+\b")  # PO-20250001, GR-..., PR-...
-
-def _extract_numbers(text: str) -> set[str]:
-    return set(_NUM_RE.findall(text or ""))
-
-def _extract_codes(text: str) -> set[str]:
-    return set(_CODE_RE.findall(text or ""))
-
-def _compose_safe_enough(answer: str, payload_text: str) -> bool:
-    if not answer:
-        return False
-    if len(answer) > 800:
-        return False
-    if "..." in answer:
-        return False
-    if "{{" in answer or "}}" in answer:
-        return False
-
-    # không sinh số/mã mới ngoài payload
-    an = _extract_numbers(answer)
-    pn = _extract_numbers(payload_text)
-    if not an.issubset(pn):
-        return False
-
-    ac = _extract_codes(answer)
-    pc = _extract_codes(payload_text)
-    if not ac.issubset(pc):
-        return False
-
-    return True
-
-VAR_SGL_RE = re.compile(r"\{\s*(s[0-9]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}")
-FULL_TPL_RE = re.compile(r"^\s*\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}\s*$")
-VAR_DBL_RE = re.compile(r"\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}")
-
-class UnresolvedRefError(Exception):
-    pass
-
-
-def _get_path(store: dict, path: str):
-    cur: Any = store
-    for part in path.split("."):
-        m = re.match(r"^([a-zA-Z0-9_]+)(\[[0-9]+\])?$", part)
-        if not m:
-            raise KeyError(path)
-
-        key = m.group(1)
-        idx = int(m.group(2)[1:-1]) if m.group(2) else None
-
-        # 1) cur là dict => truy cập key bình thường
-        if isinstance(cur, dict):
-            cur = cur[key]
-
-        # 2) cur là list nhưng LLM lỡ viết ".data[0]" (trong khi save_as là list)
-        elif isinstance(cur, list):
-            if key in ("data", "items", "rows", "results"):
-                # coi ".data" như identity của list
-                pass
-            else:
-                raise KeyError(f"{path} (cannot access key '{key}' on list)")
-
-        else:
-            raise KeyError(f"{path} (unexpected type {type(cur).__name__})")
-
-        # apply index nếu có
-        if idx is not None:
-            if not isinstance(cur, list):
-                raise KeyError(f"{path} (index on non-list)")
-            if idx < 0 or idx >= len(cur):
-                raise IndexError(f"{path} (index {idx} out of range; len={len(cur)})")
-            cur = cur[idx]
-
-    return cur
-
-def _render_value(tpl: str, store: dict):
-    tpl = tpl or ""
-
-    # full placeholder => trả đúng type
-    m = FULL_TPL_RE.match(tpl)
-    if m:
-        path = m.group(1)
-        try:
-            return _get_path(store, path)
-        except Exception:
-            # fallback: s1.xxx -> s1.data.xxx (nếu store s1 là wrapper có data)
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                return _get_path(store, f"{step_id}.data.{rest}")
-            raise
-
-    # partial replace => string
-    def repl(mm):
-        path = mm.group(1)
-        try:
-            val = _get_path(store, path)
-            return "" if val is None else str(val)
-        except Exception:
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                val = _get_path(store, f"{step_id}.data.{rest}")
-                return "" if val is None else str(val)
-            return mm.group(0)
-
-    return VAR_DBL_RE.sub(repl, tpl)
-
-
-def _normalize_ref(s: str) -> str:
-    s = (s or "").strip()
-
-    # NEW: hỗ trợ ${var.path}
-    m = re.fullmatch(r"\$\{\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    # NEW: hỗ trợ {$var.path}
-    m = re.fullmatch(r"\{\s*\$\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    # 1) JSONPath dạng $.a.b -> {{a.b}}
-    if s.startswith("$."):
-        return "{{" + s[2:] + "}}"
-
-    # 2) Biến dạng $nv_info.id hoặc $partial_pos[0].po_code -> {{nv_info.id}} / {{partial_pos[0].po_code}}
-    if s.startswith("$") and not s.startswith("$."):
-        if re.fullmatch(r"\$[A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*", s):
-            return "{{" + s[1:] + "}}"
+def _normalize_hrm_args(run: PlanRun, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+    if tool.ten_tool in {"ngay_thieu_checkout", "tong_hop_cham_cong_thang"}:
+        if re.search(r"\btháng này\b", (run.message or "").lower()):
+            now = datetime.now(ZoneInfo("Asia/Bangkok"))
+            args["month"] = now.month
+            args["year"] = now.year
 
-    return s
-
-
-def _resolve_args(args: Dict[str, Any], store: dict) -> Dict[str, Any]:
-    out = {}
-    for k, v in (args or {}).items():
-        if isinstance(v, str):
-            v2 = _normalize_ref(v)
-            try:
-                rendered = _render_value(v2, store)
-            except Exception as e:
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} ({e})")
-            # nếu vẫn còn {{ }} => unresolved
-            if isinstance(rendered, str) and ("{{" in rendered or "}}" in rendered):
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} -> {rendered}")
-            out[k] = rendered
-        else:
-            out[k] = v
-    return out
-
-def _execute_tool(module: str, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
-    if module == "hrm":
-        session = HrmSessionLocal()
-        try:
-            parsed = tool.args_model.model_validate(args)
-            return tool.handler(session=session, **parsed.model_dump())
-        except Exception as e:
-            raise ToolExecutionError(str(e))
-        finally:
-            session.close()
-
-    raise ToolExecutionError(f"Chưa hỗ trợ executor cho module '{module}'.")
+    return _auto_resolve_hrm_employee_id(run, args)
 
 
 def _s(v, default="N/A"):
@@ -629,13 +463,6 @@ def _fmt_money(v: Any) -> str:
 def _drop_none(d: Dict[str, Any]) -> Dict[str, Any]:
     return {k: v for k, v in d.items() if v is not None}
 
-def _is_bad_answer(answer: str) -> bool:
-    if not answer: return True
-    if "..." in answer: return True
-    if "{{" in answer or "}}" in answer: return True
-    if "{s" in answer: return True
-    return False
-
 # Các field nhạy cảm HRM: mặc định không đưa vào payload preview/LLM
 _HRM_SENSITIVE_KEYS = {
     "phone", "phone_number",
@@ -928,107 +755,31 @@ def _strip_sensitive(d: Dict[str, Any]) -> Dict[str, Any]:
 #     )
 #     return (resp.text or "").strip()
 
-# =========================
-# Main
-# =========================
-def execute_chat_hrm(
-    module: str,
-    user_id: int | None,
-    role: str | None,
-    message: str,
-    paraphrase_enabled: bool = True,
-    compose_enabled: bool = True,
-):
-    if not check_role(module, role):
-        raise PermissionDenied(f"Role '{role}' không được phép dùng chatbot module '{module}'.")
-
-    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
-    plan = plan_route(module=module, message=message, auth=auth)
-    audit({"event": "plan_created", "module": module, "plan": plan.model_dump()})
-
-    if plan.needs_clarification:
-        return {"answer": plan.clarifying_question, "plan": plan.model_dump()}
-
-    validate_plan(plan)
-
-    store: Dict[str, Any] = {}
-    step_infos: list[dict] = []
-
-    # --- run tools ---
-    for idx, step in enumerate(plan.steps, start=1):
-        tool = get_tool(plan.module, step.tool)
-        if tool is None:
-            raise ToolExecutionError(f"Không tìm thấy tool '{step.tool}' trong module '{plan.module}'.")
-
-        try:
-            resolved_args = _resolve_args(step.args, store)
-
-            def _now_bkk():
-                return datetime.now(ZoneInfo("Asia/Bangkok"))
-
-            text = (message or "").lower()
-
-            if step.tool in {"ngay_thieu_checkout", "tong_hop_cham_cong_thang"}:
-                if re.search(r"\btháng này\b", text):
-                    now = _now_bkk()
-                    resolved_args["month"] = now.month
-                    resolved_args["year"] = now.year
-
-            if plan.module == "hrm":
-                resolved_args = _auto_resolve_hrm_employee_id(resolved_args)
-
-                audit({"event": "tool_call", "module": plan.module, "tool": step.tool, "args": resolved_args})
-                result = _execute_tool(plan.module, tool, resolved_args)
-
-        except UnresolvedRefError as e:
-            audit({"event": "arg_unresolved_stop", "error": str(e), "step": step.model_dump()})
-            break
-
-        resolved_args = inject_auth_into_args(
-            message=message,
-            role=role,
-            auth_user_id=user_id,
-            tool_args=resolved_args,
-            has_target_user_id_field=_args_has_target_user_id_field(tool),
-        )
-
-        audit({"event": "tool_call", "module": plan.module, "tool": step.tool, "args": resolved_args})
-        result = _execute_tool(plan.module, tool, resolved_args)
-        audit({"event": "tool_result", "module": plan.module, "tool": step.tool, "result": result})
-
-        step_infos.append({"id": step.id, "tool": step.tool, "args": resolved_args, "result": result})
-
-        if isinstance(result, dict) and result.get("needs_clarification"):
-            return {"answer": result.get("question"), "candidates": result.get("candidates"), "plan": plan.model_dump()}
-
-        store[step.id] = result
-        store[f"s{idx}"] = result
-
-        if getattr(step, "save_as", None):
-            if isinstance(result, dict) and "data" in result:
-                store[step.save_as] = result.get("data")
-                store[f"{step.save_as}__raw"] = result
-            else:
-                store[step.save_as] = result
+def _answer_hrm(run: PlanRun, compose_enabled: bool) -> AnswerSteps:
+    message, plan, store, step_infos = run.message, run.plan, run.store, run.step_infos
 
     # --- FILTER context-only tool outputs trước khi LLM compose ---
-    step_infos_for_answer = _filter_step_infos_for_answer(plan.module, message, step_infos)
+    step_infos_for_answer = run.step_infos_for_answer()
 
-    # ===== Compose answer bằng LLM (cho mọi module) =====
-    answer = None
+    # ===== Template deterministic (1 step tra cứu đơn giản) -> bỏ qua LLM compose =====
+    answer = render_template_answer(message, step_infos_for_answer)
+    answer_source = "template" if answer else None
     composed_used = False
 
-    if compose_enabled:
+    # ===== Compose answer bằng LLM (multi-step / free-form) =====
+    if compose_enabled and not answer:
         try:
-            composed = compose_answer_with_llm(plan.module, message, step_infos)
+            composed = yield step_infos
             if composed:
                 answer = composed
                 composed_used = True
+                answer_source = "llm"
         except Exception as e:
             audit({"event": "compose_failed", "error": str(e)})
 
     # ===== Fallback deterministic nếu LLM fail =====
     if not answer:
+        answer_source = "fallback"
         # parts = []
         # suppress = CONTEXT_ONLY_TOOLS_BY_MODULE.get(plan.module, set())
         # skip_employee = (plan.module == "hrm" and not _wants_employee_profile(message))
@@ -1054,4 +805,39 @@ def execute_chat_hrm(
     # else:
     #     answer_final = answer
 
-    return {"answer": answer, "data": store, "plan": plan.model_dump()}
\ No newline at end of file
+    return {
+        "answer": answer,
+        "answer_source": answer_source,
+        "composed_used": composed_used,
+        "tool_calls": run.tool_call_count,
+        "data": store,
+        "plan": plan.model_dump(),
+    }
+
+
+HRM_HOOKS = ModuleHooks(
+    module="hrm",
+    session_factory=HrmSessionLocal,
+    normalize_args=_normalize_hrm_args,
+    filter_for_answer=_filter_step_infos_for_answer,
+    answer=_answer_hrm,
+)
+
+# =========================
+# Main
+# =========================
+def execute_chat_hrm(
+    module: str,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    paraphrase_enabled: bool = True,
+    compose_enabled: bool = True,
+    plan: Optional[Plan] = None,
+    on_event: Optional[ChatEventSink] = None,
+):
+    run = run_plan(HRM_HOOKS, user_id, role, message, plan=plan, on_event=on_event)
+    if run.early_result is not None:
+        return run.early_result
+
+    return build_answer(run, compose_enabled)
@@ -3,19 +3,14 @@ from __future__ import annotations
 import re
 from typing import Any, Dict, Optional, List
 
-from app.core.rbac import check_role
 from app.core.audit_log import audit
-from app.core.errors import PermissionDenied, ToolExecutionError
-from app.ai.router import plan_route
-from app.ai.plan_validator import validate_plan
-from app.ai.module_registry import get_tool
-from app.ai.tooling import ToolSpec
-from app.ai.answer_composer import compose_answer_with_llm, compose_safe_enough
+from app.ai.plan_schema import Plan
+from app.ai.answer_templates import render_template_answer
+from app.ai.events import ChatEventSink
+from app.ai.executor.plan_engine import AnswerSteps, ModuleHooks, PlanRun, build_answer, run_plan
 
 from app.db.sale_crm_database import SaleCrmSessionLocal
 
-from app.ai.executor.context_injection import inject_auth_into_args
-
 from typing import Any, Dict
 
 def _fmt_money(v: Any) -> str:
@@ -97,12 +92,6 @@ def _fmt_money(v: Any) -> str:
 #     return None
 # =========================
 
-def _args_has_target_user_id_field(tool) -> bool:
-    # tool.args_model là Pydantic model class
-    m = getattr(tool, "args_model", None)
-    fields = getattr(m, "model_fields", None)
-    return bool(fields) and ("target_user_id" in fields)
-
 # =========================
 # Filter tool outputs gửi cho LLM (để không lôi PII/không lan man)
 # =========================
@@ -130,148 +119,6 @@ def _filter_step_infos_for_answer(module: str, message: str, step_infos: list[di
         return [si for si in step_infos if si.get("tool") not in suppress]
     return step_infos
 
-# =========================
-# Placeholder/Template utils (giữ giống executor_hrm)
-# =========================
-FULL_TPL_RE = re.compile(r"^\s*\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}\s*$")
-VAR_DBL_RE = re.compile(r"\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}")
-
-class UnresolvedRefError(Exception):
-    pass
-
-def _get_path(store: dict, path: str):
-    cur: Any = store
-    for part in path.split("."):
-        m = re.match(r"^([a-zA-Z0-9_]+)(\[[0-9]+\])?$", part)
-        if not m:
-            raise KeyError(path)
-
-        key = m.group(1)
-        idx = int(m.group(2)[1:-1]) if m.group(2) else None
-
-        # 1) cur là dict => truy cập key bình thường
-        if isinstance(cur, dict):
-            cur = cur[key]
-
-        # 2) cur là list nhưng LLM lỡ viết ".data[0]" (trong khi save_as là list)
-        elif isinstance(cur, list):
-            if key in ("data", "items", "rows", "results"):
-                # coi ".data" như identity của list
-                pass
-            else:
-                raise KeyError(f"{path} (cannot access key '{key}' on list)")
-
-        else:
-            raise KeyError(f"{path} (unexpected type {type(cur).__name__})")
-
-        # apply index nếu có
-        if idx is not None:
-            if not isinstance(cur, list):
-                raise KeyError(f"{path} (index on non-list)")
-            if idx < 0 or idx >= len(cur):
-                raise IndexError(f"{path} (index {idx} out of range; len={len(cur)})")
-            cur = cur[idx]
-
-    return cur
-
-def _render_value(tpl: str, store: dict):
-    tpl = tpl or ""
-
-    m = FULL_TPL_RE.match(tpl)
-    if m:
-        path = m.group(1)
-        try:
-            return _get_path(store, path)
-        except Exception:
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                return _get_path(store, f"{step_id}.data.{rest}")
-            raise
-
-    def repl(mm):
-        path = mm.group(1)
-        try:
-            val = _get_path(store, path)
-            return "" if val is None else str(val)
-        except Exception:
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                val = _get_path(store, f"{step_id}.data.{rest}")
-                return "" if val is None else str(val)
-            return mm.group(0)
-
-    return VAR_DBL_RE.sub(repl, tpl)
-
-def _normalize_ref(s: str) -> str:
-    s = (s or "").strip()
-
-    # ${var.path}
-    m = re.fullmatch(r"\$\{\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    # {$var.path}
-    m = re.fullmatch(r"\{\s*\$\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    # $.a.b -> {{a.b}}
-    if s.startswith("$."):
-        return "{{" + s[2:] + "}}"
-
-    # $var.path -> {{var.path}}
-    if s.startswith("$") and not s.startswith("$."):
-        if re.fullmatch(r"\$[A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*", s):
-            return "{{" + s[1:] + "}}"
-
-    return s
-
-def _resolve_args(args: Dict[str, Any], store: dict) -> Dict[str, Any]:
-    out = {}
-    for k, v in (args or {}).items():
-        if isinstance(v, str):
-            v2 = _normalize_ref(v)
-            try:
-                rendered = _render_value(v2, store)
-            except Exception as e:
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} ({e})")
-            if isinstance(rendered, str) and ("{{" in rendered or "}}" in rendered):
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} -> {rendered}")
-            out[k] = rendered
-        else:
-            out[k] = v
-    return out
-
-from app.ai.executor.context_injection import inject_auth_into_args
-
-def _args_has_target_user_id_field(tool) -> bool:
-    # tool.args_model là Pydantic model
-    try:
-        fields = getattr(tool.args_model, "model_fields", {})  # pydantic v2
-        return "target_user_id" in fields
-    except Exception:
-        return False
-
-# =========================
-# Execute tool
-# =========================
-def _execute_tool(module: str, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
-    if module != "sale_crm":
-        raise ToolExecutionError(f"executor_sale_crm chỉ hỗ trợ module 'sale_crm' (nhận '{module}').")
-
-    session = SaleCrmSessionLocal()
-    try:
-        parsed = tool.args_model.model_validate(args)
-        return tool.handler(session=session, **parsed.model_dump())
-    except Exception as e:
-        raise ToolExecutionError(str(e))
-    finally:
-        session.close()
-
 # =========================
 # Fallback deterministic (khi compose fail)
 # =========================
@@ -321,72 +168,12 @@ def _fallback_from_result(result: Any) -> Optional[str]:
 
     return msg or None
 
-# =========================
-# Main
-# =========================
-def execute_chat_sale_crm(
-    module: str,
-    user_id: int | None,
-    role: str | None,
-    message: str,
-    paraphrase_enabled: bool = True,
-    compose_enabled: bool = True,
-):
-    if not check_role(module, role):
-        raise PermissionDenied(f"Role '{role}' không được phép dùng chatbot module '{module}'.")
-
-    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
-    plan = plan_route(module=module, message=message, auth=auth)
-    audit({"event": "plan_created", "module": module, "plan": plan.model_dump()})
-
-    if plan.needs_clarification:
-        return {"answer": plan.clarifying_question, "plan": plan.model_dump()}
-
-    validate_plan(plan)
-
-    store: Dict[str, Any] = {}
-    step_infos: list[dict] = []
-
-    for idx, step in enumerate(plan.steps, start=1):
-        tool = get_tool(plan.module, step.tool)
-        if tool is None:
-            raise ToolExecutionError(f"Không tìm thấy tool '{step.tool}' trong module '{plan.module}'.")
-
-        try:
-            resolved_args = _resolve_args(step.args, store)
-        except UnresolvedRefError as e:
-            audit({"event": "arg_unresolved_stop", "error": str(e), "step": step.model_dump()})
-            break
-
-        resolved_args = inject_auth_into_args(
-            auth_user_id=user_id,
-            tool_args=resolved_args,
-            has_target_user_id_field=_args_has_target_user_id_field(tool),
-        )
-
-
-        audit({"event": "tool_call", "module": plan.module, "tool": step.tool, "args": resolved_args})
-        result = _execute_tool(plan.module, tool, resolved_args)
-        audit({"event": "tool_result", "module": plan.module, "tool": step.tool, "result": result})
-
-        step_infos.append({"id": step.id, "tool": step.tool, "args": resolved_args, "result": result})
-
-        if isinstance(result, dict) and result.get("needs_clarification"):
-            return {"answer": result.get("question"), "candidates": result.get("candidates"), "plan": plan.model_dump()}
-
-        store[step.id] = result
-        store[f"s{idx}"] = result
-
-        if getattr(step, "save_as", None):
-            if isinstance(result, dict) and "data" in result:
-                store[step.save_as] = result.get("data")
-                store[f"{step.save_as}__raw"] = result
-            else:
-                store[step.save_as] = result
+def _answer_sale_crm(run: PlanRun, compose_enabled: bool) -> AnswerSteps:
+    message, plan, store, step_infos = run.message, run.plan, run.store, run.step_infos
 
     # FILTER context-only tool outputs trước khi compose/answer
     step_infos_for_compose = _filter_step_infos_for_compose(plan.module, message, step_infos)
-    step_infos_for_answer = _filter_step_infos_for_answer(plan.module, message, step_infos)
+    step_infos_for_answer = run.step_infos_for_answer()
 
     has_real_data = any(
         (si.get("result") or {}).get("ok") is True
@@ -395,14 +182,16 @@ def execute_chat_sale_crm(
     )
 
 
-    # ===== Compose answer bằng LLM =====
-    answer = None
+    # ===== Template deterministic (1 step tra cứu đơn giản) -> bỏ qua LLM compose =====
+    answer = render_template_answer(message, step_infos_for_answer)
+    answer_source = "template" if answer else None
     composed_used = False
     compose_error = None
 
-    if compose_enabled:
+    # ===== Compose answer bằng LLM (multi-step / free-form) =====
+    if compose_enabled and not answer:
         try:
-            composed = compose_answer_with_llm(plan.module, message, step_infos_for_compose)
+            composed = yield step_infos_for_compose
             if composed:
                 # nếu tool có dữ liệu mà LLM nói "không có dữ liệu" -> coi như compose sai
                 if has_real_data and "không có dữ liệu" in composed.lower():
@@ -411,6 +200,7 @@ def execute_chat_sale_crm(
                 else:
                     answer = composed
                     composed_used = True
+                    answer_source = "llm"
         except Exception as e:
             compose_error = str(e)
             audit({"event": "compose_failed", "error": compose_error})
@@ -431,27 +221,49 @@ def execute_chat_sale_crm(
                 compose_error = "LLM trả lời sai; fallback deterministic."
 
     # ===== Fallback deterministic nếu LLM fail / không dùng =====
-    if not composed_used:
-
-        det = build_answer_sale_crm(plan.intent, store)
-
-        if det:
-            answer = det
-        else:
-            # fallback mềm: dùng step_infos (KHÔNG dùng step_infos_for_answer vì có thể bị filter mất)
-            parts: list[str] = []
-            for si in step_infos[::-1]:
-                fb = _fallback_from_result(si.get("result"))
-                if fb and fb not in parts:
-                    parts.append(fb)
-                if len(parts) >= 2:
-                    break
-            answer = "\n".join(parts) if parts else "Không có dữ liệu."
+    if not answer:
+        answer_source = "fallback"
+        # fallback mềm: dùng step_infos (KHÔNG dùng step_infos_for_answer vì có thể bị filter mất)
+        parts: list[str] = []
+        for si in step_infos[::-1]:
+            fb = _fallback_from_result(si.get("result"))
+            if fb and fb not in parts:
+                parts.append(fb)
+            if len(parts) >= 2:
+                break
+        answer = "\n".join(parts) if parts else "Không có dữ liệu."
 
     return {
         "answer": answer,
+        "answer_source": answer_source,
         "composed_used": composed_used,
         "compose_error": compose_error,
         "data": store,
         "plan": plan.model_dump(),
-    }
\ No newline at end of file
+    }
+
+
+SALE_CRM_HOOKS = ModuleHooks(
+    module="sale_crm",
+    session_factory=SaleCrmSessionLocal,
+    filter_for_answer=_filter_step_infos_for_answer,
+    answer=_answer_sale_crm,
+)
+
+# =========================
+# Main
+# =========================
+def execute_chat_sale_crm(
+    module: str,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    paraphrase_enabled: bool = True,
+    compose_enabled: bool = True,
+    plan: Optional[Plan] = None,
+    on_event: Optional[ChatEventSink] = None,
+):
+    run = run_plan(SALE_CRM_HOOKS, user_id, role, message, plan=plan, on_event=on_event)
+    if run.early_result is not None:
+        return run.early_result
+    return build_answer(run, compose_enabled)
@@ -1,29 +1,15 @@
 from __future__ import annotations
-import re
 import json
-from typing import Any, Dict, Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
-from app.core.rbac import check_role
 from app.core.audit_log import audit
-from app.core.errors import PermissionDenied, ToolExecutionError
-from app.ai.router import plan_route
-from app.ai.plan_validator import validate_plan
-from app.ai.module_registry import get_tool
-from app.ai.tooling import ToolSpec
-from app.ai.answer_composer import compose_answer_with_llm, compose_safe_enough
+from app.ai.plan_schema import Plan
+from app.ai.answer_templates import render_template_answer
+from app.ai.events import ChatEventSink
+from app.ai.executor.plan_engine import AnswerSteps, ModuleHooks, PlanRun, build_answer, run_plan
 
 from app.db.supply_chain_database import SupplyChainSessionLocal
 
-import os
-from dotenv import load_dotenv
-from google import genai
-
-load_dotenv()
-
-_GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-_GEMINI_COMPOSE_MODEL = os.getenv("GEMINI_COMPOSE_MODEL", os.getenv("GEMINI_MODEL_1", "gemini-2.5-flash"))
-_client = genai.Client(api_key=_GEMINI_API_KEY) if _GEMINI_API_KEY else genai.Client()
-
 def _s(v, default="N/A"):
     if v is None: return default
     if isinstance(v, str) and not v.strip(): return default
@@ -53,136 +39,6 @@ def _clip_data(data: Any, list_n: int = 12, nested_n: int = 12) -> Any:
     # fallback
     return str(data)
 
-class UnresolvedRefError(Exception):
-    pass
-
-def _get_path(store: dict, path: str):
-    cur: Any = store
-    for part in path.split("."):
-        m = re.match(r"^([a-zA-Z0-9_]+)(\[[0-9]+\])?$", part)
-        if not m:
-            raise KeyError(path)
-
-        key = m.group(1)
-        idx = int(m.group(2)[1:-1]) if m.group(2) else None
-
-        # 1) cur là dict => truy cập key bình thường
-        if isinstance(cur, dict):
-            cur = cur[key]
-
-        # 2) cur là list nhưng LLM lỡ viết ".data[0]" (trong khi save_as là list)
-        elif isinstance(cur, list):
-            if key in ("data", "items", "rows", "results"):
-                # coi ".data" như identity của list
-                pass
-            else:
-                raise KeyError(f"{path} (cannot access key '{key}' on list)")
-
-        else:
-            raise KeyError(f"{path} (unexpected type {type(cur).__name__})")
-
-        # apply index nếu có
-        if idx is not None:
-            if not isinstance(cur, list):
-                raise KeyError(f"{path} (index on non-list)")
-            if idx < 0 or idx >= len(cur):
-                raise IndexError(f"{path} (index {idx} out of range; len={len(cur)})")
-            cur = cur[idx]
-
-    return cur
-
-
-FULL_TPL_RE = re.compile(r"^\s*\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}\s*$")
-VAR_DBL_RE = re.compile(r"\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}")
-
-def _render_value(tpl: str, store: dict):
-    tpl = tpl or ""
-
-    # full placeholder => trả đúng type
-    m = FULL_TPL_RE.match(tpl)
-    if m:
-        path = m.group(1)
-        try:
-            return _get_path(store, path)
-        except Exception:
-            # fallback: s1.xxx -> s1.data.xxx (nếu store s1 là wrapper có data)
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                return _get_path(store, f"{step_id}.data.{rest}")
-            raise
-
-    # partial replace => string
-    def repl(mm):
-        path = mm.group(1)
-        try:
-            val = _get_path(store, path)
-            return "" if val is None else str(val)
-        except Exception:
-            m2 = re.match(r"^(s[0-9]+)\.(.+)$", path)
-            if m2:
-                step_id = m2.group(1)
-                rest = m2.group(2)
-                val = _get_path(store, f"{step_id}.data.{rest}")
-                return "" if val is None else str(val)
-            return mm.group(0)
-
-    return VAR_DBL_RE.sub(repl, tpl)
-
-def _normalize_ref(s: str) -> str:
-    s = (s or "").strip()
-
-    # NEW: hỗ trợ ${var.path}
-    m = re.fullmatch(r"\$\{\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    # NEW: hỗ trợ {$var.path}
-    m = re.fullmatch(r"\{\s*\$\s*([A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*)\s*\}", s)
-    if m:
-        return "{{" + m.group(1) + "}}"
-
-    # 1) JSONPath dạng $.a.b -> {{a.b}}
-    if s.startswith("$."):
-        return "{{" + s[2:] + "}}"
-
-    # 2) Biến dạng $nv_info.id hoặc $partial_pos[0].po_code -> {{nv_info.id}} / {{partial_pos[0].po_code}}
-    if s.startswith("$") and not s.startswith("$."):
-        if re.fullmatch(r"\$[A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*", s):
-            return "{{" + s[1:] + "}}"
-
-    return s
-
-def _resolve_args(args: Dict[str, Any], store: dict) -> Dict[str, Any]:
-    out = {}
-    for k, v in (args or {}).items():
-        if isinstance(v, str):
-            v2 = _normalize_ref(v)
-            try:
-                rendered = _render_value(v2, store)
-            except Exception as e:
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} ({e})")
-            # nếu vẫn còn {{ }} => unresolved
-            if isinstance(rendered, str) and ("{{" in rendered or "}}" in rendered):
-                raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {v} -> {rendered}")
-            out[k] = rendered
-        else:
-            out[k] = v
-    return out
-
-def _execute_tool(module: str, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
-    if module == "supply_chain":
-        session = SupplyChainSessionLocal()
-        try:
-            parsed = tool.args_model.model_validate(args)
-            return tool.handler(session=session, **parsed.model_dump())
-        except Exception as e:
-            raise ToolExecutionError(str(e))
-        finally:
-            session.close()
-    raise ToolExecutionError(f"Chưa hỗ trợ executor cho module '{module}'.")
-
 # def _preview_data(data: Any, list_n: int = 6, nested_n: int = 6) -> Dict[str, Any]:
 #     # list output
 #     if isinstance(data, list):
@@ -630,77 +486,23 @@ def _execute_tool(module: str, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str
 #     # primitive
 #     return {"type": type(data).__name__, "value": data}
 
-# =========================
-# Main
-# =========================
-def execute_chat_supply_chain(
-    module: str,
-    user_id: int | None,
-    role: str | None,
-    message: str,
-    paraphrase_enabled: bool = True,
-    compose_enabled: bool = True,
-):
-    if not check_role(module, role):
-        raise PermissionDenied(f"Role '{role}' không được phép dùng chatbot module '{module}'.")
-
-    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
-    plan = plan_route(module=module, message=message, auth=auth)
-    audit({"event": "plan_created", "module": module, "plan": plan.model_dump()})
-
-    if plan.needs_clarification:
-        return {"answer": plan.clarifying_question, "plan": plan.model_dump()}
-
-    validate_plan(plan)
 
-    store: Dict[str, Any] = {}
-    step_infos: list[dict] = []
+def _answer_supply_chain(run: PlanRun, compose_enabled: bool) -> AnswerSteps:
+    message, plan, store, step_infos = run.message, run.plan, run.store, run.step_infos
 
-    # --- run tools ---
-    for idx, step in enumerate(plan.steps, start=1):
-        tool = get_tool(plan.module, step.tool)
-        if tool is None:
-            raise ToolExecutionError(f"Không tìm thấy tool '{step.tool}' trong module '{plan.module}'.")
-
-        try:
-            resolved_args = _resolve_args(step.args, store)
-        except UnresolvedRefError as e:
-            audit({"event": "arg_unresolved_stop", "error": str(e), "step": step.model_dump()})
-            break
-
-        audit({"event": "tool_call", "module": plan.module, "tool": step.tool, "args": resolved_args})
-        result = _execute_tool(plan.module, tool, resolved_args)
-        audit({"event": "tool_result", "module": plan.module, "tool": step.tool, "result": result})
-
-        step_infos.append({"id": step.id, "tool": step.tool, "args": resolved_args, "result": result})
-
-        if isinstance(result, dict) and result.get("needs_clarification"):
-            return {
-                "answer": result.get("question"),
-                "candidates": result.get("candidates"),
-                "plan": plan.model_dump()
-            }
-
-        store[step.id] = result
-        store[f"s{idx}"] = result
-
-        if getattr(step, "save_as", None):
-            if isinstance(result, dict) and "data" in result:
-                store[step.save_as] = result.get("data")
-                store[f"{step.save_as}__raw"] = result
-            else:
-                store[step.save_as] = result
-
-    # ===== Compose answer bằng LLM (cho mọi module) =====
-    answer = None
+    # ===== Template deterministic (1 step tra cứu đơn giản) -> bỏ qua LLM compose =====
+    answer = render_template_answer(message, run.step_infos_for_answer())
+    answer_source = "template" if answer else None
     composed_used = False
 
-    if compose_enabled:
+    # ===== Compose answer bằng LLM (multi-step / free-form) =====
+    if compose_enabled and not answer:
         try:
-            composed = compose_answer_with_llm(plan.module, message, step_infos)
+            composed = yield step_infos
             if composed:
                 answer = composed
                 composed_used = True
+                answer_source = "llm"
         except Exception as e:
             audit({"event": "compose_failed", "error": str(e)})
 
@@ -720,4 +522,31 @@ def execute_chat_supply_chain(
     #                     parts.append(fb)
     #         answer = "\n\n".join(parts[:2]) if parts else "Đã tra cứu xong."
 
-    return {"answer": answer, "data": store, "plan": plan.model_dump()}
\ No newline at end of file
+    return {"answer": answer, "answer_source": answer_source, "composed_used": composed_used, "data": store, "plan": plan.model_dump()}
+
+
+SUPPLY_CHAIN_HOOKS = ModuleHooks(
+    module="supply_chain",
+    session_factory=SupplyChainSessionLocal,
+    inject_auth=False,
+    answer=_answer_supply_chain,
+)
+
+# =========================
+# Main
+# =========================
+def execute_chat_supply_chain(
+    module: str,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    paraphrase_enabled: bool = True,
+    compose_enabled: bool = True,
+    plan: Optional[Plan] = None,
+    on_event: Optional[ChatEventSink] = None,
+):
+    run = run_plan(SUPPLY_CHAIN_HOOKS, user_id, role, message, plan=plan, on_event=on_event)
+    if run.early_result is not None:
+        return run.early_result
+
+    return build_answer(run, compose_enabled)
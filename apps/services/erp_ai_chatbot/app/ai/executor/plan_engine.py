@@ -0,0 +1,786 @@
+# app/ai/executor/plan_engine.py
+from __future__ import annotations
+
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Set, Tuple
+
+from app.core.rbac import check_role
+from app.core.audit_log import audit
+from app.core.errors import PermissionDenied, ToolExecutionError
+from app.core.telemetry import record_tool_sql, span
+from app.ai.router import plan_route
+from app.ai.answer_cache import bump_data_version
+from app.ai.tool_cache import cached_call
+from app.ai.plan_schema import Plan, PlanStep
+from app.ai.plan_validator import validate_plan
+from app.ai.module_registry import get_tool
+from app.ai.tooling import ToolSpec
+from app.ai.answer_composer import compose_answer_with_llm, compose_answer_with_llm_async
+from app.ai.answer_templates import render_template_answer
+from app.ai.events import AnswerDeltas, ChatEventSink, emit
+from app.ai.executor.context_injection import inject_auth_into_args
+from app.db.query_stats import QueryStats, track_queries
+from app.db.unit_of_work import ReadOnlyUnitOfWork
+
+# =========================================================
+# Engine chạy plan dùng chung cho 4 module (hrm / supply_chain / sale_crm / finance).
+# - Resolver tham chiếu ({{s1.data.x}}, $var.path, ${var}, {$var}) compile 1 lần / plan
+# - Phần riêng từng module đi qua ModuleHooks:
+#   session_factory, normalize_args, inject_auth, filter_for_answer, answer
+# - Phần trả lời (template / compose / fallback) là hook `answer` của từng module,
+#   đường sync / async chạy cùng hook qua build_answer / build_answer_async.
+# - Vòng lặp tầng + bookkeeping step dùng chung sync / async; chỉ cách gọi tool
+#   (ToolCaller / AsyncToolCaller) khác nhau.
+# - Step không tham chiếu lẫn nhau chạy song song (mỗi step đang chạy giữ 1 session),
+#   kết quả gộp vào store theo đúng thứ tự step. Step gọi tool ghi là rào chắn:
+#   chỉ chạy khi mọi step trước đã commit (không làm rõ / lỗi / ref hỏng).
+# - Step đọc dùng chung session read-only của lượt chat (app/db/unit_of_work.py);
+#   sau step ghi đổi sang unit of work mới để step đọc sau thấy dữ liệu vừa ghi.
+# - Mỗi lần gọi tool đếm câu SQL / thời gian DB / mẫu N+1 (app/db/query_stats.py),
+#   gắn vào step_infos[*]["sql"] và span "tool" của trace.
+# =========================================================
+
+PLAN_PARALLEL_STEPS = os.getenv("PLAN_PARALLEL_STEPS", "1") == "1"
+# 1 session read-only / DB cho cả lượt chat thay vì mở session mới mỗi step
+PLAN_SESSION_REUSE = os.getenv("PLAN_SESSION_REUSE", "1") == "1"
+# ngân sách câu SQL mặc định / lần gọi tool (ToolSpec.max_queries ghi đè); 0 = không giới hạn
+TOOL_QUERY_BUDGET = int(os.getenv("TOOL_QUERY_BUDGET", "0"))
+
+_STEP_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PLAN_STEP_WORKERS", "4")),
+    thread_name_prefix="plan-step",
+)
+
+
+class UnresolvedRefError(Exception):
+    pass
+
+
+# ---------- chuẩn hoá tham chiếu về dạng {{path}} ----------
+FULL_TPL_RE = re.compile(r"^\s*\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}\s*$")
+VAR_DBL_RE = re.compile(r"\{\{\s*([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+|\[[0-9]+\])*)\s*\}\}")
+
+_REF_PATH = r"[A-Za-z_]\w*(?:\[[0-9]+\]|\.[A-Za-z_]\w*)*"
+_DOLLAR_BRACE_RE = re.compile(r"\$\{\s*(" + _REF_PATH + r")\s*\}")     # ${var.path}
+_BRACE_DOLLAR_RE = re.compile(r"\{\s*\$\s*(" + _REF_PATH + r")\s*\}")  # {$var.path}
+_DOLLAR_VAR_RE = re.compile(r"\$" + _REF_PATH)                          # $var.path / $a[0].b
+
+_PART_RE = re.compile(r"^([a-zA-Z0-9_]+)(\[[0-9]+\])?$")
+_STEP_PATH_RE = re.compile(r"^(s[0-9]+)\.(.+)$")
+
+# LLM hay viết ".data[0]" trên save_as đã là list -> coi các key này như identity của list
+_LIST_ALIAS_KEYS = frozenset({"data", "items", "rows", "results"})
+
+
+def normalize_ref(s: str) -> str:
+    s = (s or "").strip()
+
+    m = _DOLLAR_BRACE_RE.fullmatch(s)
+    if m:
+        return "{{" + m.group(1) + "}}"
+
+    m = _BRACE_DOLLAR_RE.fullmatch(s)
+    if m:
+        return "{{" + m.group(1) + "}}"
+
+    # JSONPath dạng $.a.b -> {{a.b}}
+    if s.startswith("$."):
+        return "{{" + s[2:] + "}}"
+
+    # $nv_info.id / $partial_pos[0].po_code -> {{nv_info.id}} / {{partial_pos[0].po_code}}
+    if s.startswith("$") and _DOLLAR_VAR_RE.fullmatch(s):
+        return "{{" + s[1:] + "}}"
+
+    return s
+
+
+class _Path:
+    """Đường dẫn trong store đã tách sẵn thành (key, index); sN.x có fallback sN.data.x."""
+
+    __slots__ = ("text", "root", "parts", "fallback")
+
+    def __init__(self, text: str, with_fallback: bool = True):
+        self.text = text
+        self.root = re.split(r"[.\[]", text, maxsplit=1)[0]
+        self.parts = _split_path(text)
+        self.fallback: Optional[_Path] = None
+        if with_fallback:
+            m = _STEP_PATH_RE.match(text)
+            if m:
+                self.fallback = _Path(f"{m.group(1)}.data.{m.group(2)}", with_fallback=False)
+
+    def get(self, store: dict) -> Any:
+        if self.parts is None:
+            raise KeyError(self.text)
+
+        cur: Any = store
+        for key, idx in self.parts:
+            if isinstance(cur, dict):
+                cur = cur[key]
+            elif isinstance(cur, list):
+                if key not in _LIST_ALIAS_KEYS:
+                    raise KeyError(f"{self.text} (cannot access key '{key}' on list)")
+            else:
+                raise KeyError(f"{self.text} (unexpected type {type(cur).__name__})")
+
+            if idx is not None:
+                if not isinstance(cur, list):
+                    raise KeyError(f"{self.text} (index on non-list)")
+                if idx < 0 or idx >= len(cur):
+                    raise IndexError(f"{self.text} (index {idx} out of range; len={len(cur)})")
+                cur = cur[idx]
+        return cur
+
+
+def _split_path(text: str) -> Optional[Tuple[Tuple[str, Optional[int]], ...]]:
+    parts = []
+    for part in text.split("."):
+        m = _PART_RE.match(part)
+        if not m:
+            return None
+        parts.append((m.group(1), int(m.group(2)[1:-1]) if m.group(2) else None))
+    return tuple(parts)
+
+
+_CONST, _FULL, _PARTIAL = 0, 1, 2
+
+
+class CompiledArg:
+    """
+    1 giá trị args của step sau khi compile:
+    - _CONST:   hằng (không tham chiếu)
+    - _FULL:    "{{path}}" nguyên khối -> trả đúng kiểu dữ liệu trong store
+    - _PARTIAL: chuỗi có chèn {{path}} -> luôn trả str
+    """
+
+    __slots__ = ("raw", "kind", "value", "pieces")
+
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.kind = _CONST
+        self.value: Any = raw
+        self.pieces: List[Any] = []
+
+        if not isinstance(raw, str):
+            return
+
+        tpl = normalize_ref(raw)
+        self.value = tpl
+
+        m = FULL_TPL_RE.match(tpl)
+        if m:
+            self.kind = _FULL
+            self.value = _Path(m.group(1))
+            return
+
+        pos = 0
+        for mm in VAR_DBL_RE.finditer(tpl):
+            if mm.start() > pos:
+                self.pieces.append(tpl[pos:mm.start()])
+            self.pieces.append((_Path(mm.group(1)), mm.group(0)))
+            pos = mm.end()
+        if self.pieces:
+            if pos < len(tpl):
+                self.pieces.append(tpl[pos:])
+            self.kind = _PARTIAL
+
+    def roots(self) -> Set[str]:
+        """Tên gốc trong store mà giá trị này tham chiếu (s1, nv_info, ...)."""
+        if self.kind == _FULL:
+            return {self.value.root}
+        if self.kind == _PARTIAL:
+            return {p[0].root for p in self.pieces if not isinstance(p, str)}
+        return set()
+
+    def render(self, store: dict) -> Any:
+        if self.kind == _CONST:
+            return self.value
+
+        if self.kind == _FULL:
+            path: _Path = self.value
+            try:
+                return path.get(store)
+            except Exception:
+                if path.fallback is None:
+                    raise
+                return path.fallback.get(store)
+
+        out: List[str] = []
+        for piece in self.pieces:
+            if isinstance(piece, str):
+                out.append(piece)
+                continue
+            path, original = piece
+            try:
+                val = path.get(store)
+            except Exception:
+                if path.fallback is None:
+                    out.append(original)
+                    continue
+                val = path.fallback.get(store)
+            out.append("" if val is None else str(val))
+        return "".join(out)
+
+
+def compile_args(args: Optional[Dict[str, Any]]) -> Dict[str, CompiledArg]:
+    return {k: CompiledArg(v) for k, v in (args or {}).items()}
+
+
+def render_args(compiled: Dict[str, CompiledArg], store: dict) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for k, c in compiled.items():
+        if c.kind == _CONST and not isinstance(c.raw, str):
+            out[k] = c.raw
+            continue
+        try:
+            rendered = c.render(store)
+        except Exception as e:
+            raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {c.raw} ({e})")
+        # nếu vẫn còn {{ }} => unresolved
+        if isinstance(rendered, str) and ("{{" in rendered or "}}" in rendered):
+            raise UnresolvedRefError(f"Không resolve được biến cho arg '{k}': {c.raw} -> {rendered}")
+        out[k] = rendered
+    return out
+
+
+def resolve_args(args: Dict[str, Any], store: dict) -> Dict[str, Any]:
+    """Resolve 1 lần (không giữ bản compile) – dùng cho chỗ ngoài step loop."""
+    return render_args(compile_args(args), store)
+
+
+def compile_plan(plan: Plan) -> List[Dict[str, CompiledArg]]:
+    return [compile_args(step.args) for step in plan.steps]
+
+
+def _step_outputs(step: PlanStep, idx: int) -> Set[str]:
+    names = {step.id, f"s{idx}"}
+    if getattr(step, "save_as", None):
+        names.update({step.save_as, f"{step.save_as}__raw"})
+    return names
+
+
+def plan_levels(
+    plan: Plan, compiled: List[Dict[str, CompiledArg]], writes: Optional[Set[int]] = None
+) -> List[List[int]]:
+    """
+    Chia step (index 0-based) thành các tầng theo tham chiếu trong args:
+    step chỉ phụ thuộc step TRƯỚC nó có ghi vào tên mà nó tham chiếu.
+    Các step cùng tầng không phụ thuộc nhau -> chạy song song được.
+    Step ghi (index trong `writes`) là rào chắn: đứng 1 mình 1 tầng, sau mọi step trước nó;
+    mọi step sau nó nằm ở tầng sau.
+    """
+    writes = writes or set()
+    outputs = [_step_outputs(step, i + 1) for i, step in enumerate(plan.steps)]
+    level_of: List[int] = []
+    floor = 0  # tầng thấp nhất còn được dùng (sau rào chắn gần nhất)
+    for i, cargs in enumerate(compiled):
+        if i in writes:
+            lv = 1 + max(level_of, default=-1)
+            floor = lv + 1
+        else:
+            roots: Set[str] = set()
+            for c in cargs.values():
+                roots |= c.roots()
+            deps = [j for j in range(i) if outputs[j] & roots]
+            lv = max(floor, 1 + max((level_of[j] for j in deps), default=-1))
+        level_of.append(lv)
+
+    levels: List[List[int]] = [[] for _ in range(max(level_of, default=-1) + 1)]
+    for i, lv in enumerate(level_of):
+        levels[lv].append(i)
+    return [level for level in levels if level]
+
+
+def store_step_result(store: Dict[str, Any], step: PlanStep, idx: int, result: Any) -> None:
+    store[step.id] = result
+    store[f"s{idx}"] = result
+
+    if getattr(step, "save_as", None):
+        if isinstance(result, dict) and "data" in result:
+            store[step.save_as] = result.get("data")
+            store[f"{step.save_as}__raw"] = result
+        else:
+            store[step.save_as] = result
+
+
+# ---------- lịch chạy step (dùng chung sync / async) ----------
+StepJob = Tuple[int, PlanStep, ToolSpec, Dict[str, Any]]
+
+
+def is_clarification(result: Any) -> bool:
+    return isinstance(result, dict) and bool(result.get("needs_clarification"))
+
+
+def _is_write_step(module: str, step: PlanStep) -> bool:
+    tool = get_tool(module, step.tool)
+    return tool is not None and not tool.read_only
+
+
+class StepSchedule:
+    """
+    Chạy plan theo tầng (plan_levels), nhưng kết quả nhìn từ ngoài giống hệt chạy tuần tự:
+    - step i chỉ thấy kết quả các step đứng trước nó
+    - step_infos / event gộp theo thứ tự step (commit)
+    - ref không resolve được ở step k, hoặc step k cần làm rõ => bỏ mọi step sau k
+    - tool ghi (read_only=False) chỉ chạy khi mọi step trước nó đã commit
+    """
+
+    def __init__(self, plan: Plan):
+        self.plan = plan
+        self.compiled = compile_plan(plan)
+        if PLAN_PARALLEL_STEPS:
+            writes = {i for i, step in enumerate(plan.steps) if _is_write_step(plan.module, step)}
+            self.levels = plan_levels(plan, self.compiled, writes)
+        else:
+            self.levels = [[i] for i in range(len(plan.steps))]
+        self.parallel = any(len(level) > 1 for level in self.levels)
+        self.done: Dict[int, Tuple[Dict[str, Any], Any]] = {}
+        self.cutoff = len(plan.steps)  # step >= cutoff: không chạy / bỏ kết quả
+        self.committed = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.committed >= self.cutoff
+
+    def store(self, upto: Optional[int] = None) -> Dict[str, Any]:
+        upto = self.committed if upto is None else upto
+        store: Dict[str, Any] = {}
+        for j in sorted(self.done):
+            if j >= upto:
+                break
+            store_step_result(store, self.plan.steps[j], j + 1, self.done[j][1])
+        return store
+
+    def jobs(self, level: List[int]) -> List[StepJob]:
+        """Resolve args cho các step của tầng (theo thứ tự step)."""
+        plan = self.plan
+        out: List[StepJob] = []
+        for i in level:
+            if i >= self.cutoff:
+                break
+            step = plan.steps[i]
+            tool = get_tool(plan.module, step.tool)
+            if tool is None:
+                raise ToolExecutionError(f"Không tìm thấy tool '{step.tool}' trong module '{plan.module}'.")
+            if not tool.read_only and self.committed < i:
+                # step trước chưa xong / đã dừng (làm rõ, lỗi) -> không được ghi
+                audit({"event": "write_step_blocked", "step": step.model_dump(), "committed": self.committed})
+                self.cutoff = i
+                break
+            try:
+                resolved_args = render_args(self.compiled[i], self.store(upto=i))
+            except UnresolvedRefError as e:
+                audit({"event": "arg_unresolved_stop", "error": str(e), "step": step.model_dump()})
+                self.cutoff = i
+                break
+            out.append((i, step, tool, resolved_args))
+        return out
+
+    def record(self, i: int, resolved_args: Dict[str, Any], result: Any) -> None:
+        self.done[i] = (resolved_args, result)
+        if is_clarification(result):
+            self.cutoff = min(self.cutoff, i + 1)
+
+    def commit(self) -> List[Tuple[PlanStep, Dict[str, Any], Any]]:
+        """Các step mới hoàn tất liên tiếp tính từ đầu plan, theo thứ tự step."""
+        out = []
+        while self.committed < self.cutoff and self.committed in self.done:
+            resolved_args, result = self.done[self.committed]
+            out.append((self.plan.steps[self.committed], resolved_args, result))
+            self.committed += 1
+        return out
+
+
+# ---------- hooks theo module ----------
+def args_has_field(tool: ToolSpec, name: str) -> bool:
+    # tool.args_model là Pydantic model class
+    m = getattr(tool, "args_model", None)
+    fields = getattr(m, "model_fields", None)
+    return bool(fields) and (name in fields)
+
+
+def _no_filter(module: str, message: str, step_infos: List[dict]) -> List[dict]:
+    return step_infos
+
+
+# Bước trả lời sau khi chạy xong step: generator yield step_infos cần LLM compose,
+# nhận lại câu compose (hoặc exception ném vào chỗ yield), return dict kết quả của executor.
+# build_answer (sync) / build_answer_async chạy cùng 1 generator -> 2 đường dùng chung logic;
+# compose lần 2 trong 1 lượt được báo trước bằng event answer_reset (AnswerDeltas).
+AnswerSteps = Generator[List[dict], Optional[str], Dict[str, Any]]
+
+
+def default_answer(run: "PlanRun", compose_enabled: bool) -> AnswerSteps:
+    """Template -> LLM compose -> "Đã tra cứu xong."."""
+    step_infos_for_answer = run.step_infos_for_answer()
+
+    answer = render_template_answer(run.message, step_infos_for_answer)
+    answer_source = "template" if answer else None
+    composed_used = False
+    compose_error: Optional[str] = None
+
+    if compose_enabled and not answer:
+        try:
+            composed = yield step_infos_for_answer
+            if composed:
+                answer = composed
+                composed_used = True
+                answer_source = "llm"
+        except Exception as e:
+            compose_error = str(e)
+            audit({"event": "compose_failed", "error": compose_error})
+
+    if not answer:
+        answer = "Đã tra cứu xong."
+        answer_source = "fallback"
+
+    return {
+        "answer": answer,
+        "answer_source": answer_source,
+        "composed_used": composed_used,
+        "compose_error": compose_error,
+        "data": run.store,
+        "plan": run.plan.model_dump(),
+    }
+
+
+@dataclass(frozen=True)
+class ModuleHooks:
+    module: str
+    session_factory: Callable[[], Any]
+    # (run, tool, args) -> args; chạy trước inject_auth
+    normalize_args: Optional[Callable[["PlanRun", ToolSpec, Dict[str, Any]], Dict[str, Any]]] = None
+    inject_auth: bool = True
+    # (module, message, step_infos) -> step_infos dùng cho template/compose
+    filter_for_answer: Callable[[str, str, List[dict]], List[dict]] = _no_filter
+    # (run, compose_enabled) -> AnswerSteps: template / compose / fallback riêng của module
+    answer: Callable[["PlanRun", bool], AnswerSteps] = default_answer
+
+
+def build_answer(run: "PlanRun", compose_enabled: bool = True) -> Dict[str, Any]:
+    steps = run.hooks.answer(run, compose_enabled)
+    deltas = AnswerDeltas(run.on_event)
+    try:
+        step_infos = next(steps)
+        while True:
+            try:
+                composed = compose_answer_with_llm(run.plan.module, run.message, step_infos, on_delta=deltas.start())
+            except Exception as e:
+                step_infos = steps.throw(e)
+            else:
+                step_infos = steps.send(composed)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def build_answer_async(run: "PlanRun", compose_enabled: bool = True) -> Dict[str, Any]:
+    steps = run.hooks.answer(run, compose_enabled)
+    deltas = AnswerDeltas(run.on_event)
+    try:
+        step_infos = next(steps)
+        while True:
+            try:
+                composed = await compose_answer_with_llm_async(
+                    run.plan.module, run.message, step_infos, on_delta=deltas.start()
+                )
+            except Exception as e:
+                step_infos = steps.throw(e)
+            else:
+                step_infos = steps.send(composed)
+    except StopIteration as stop:
+        return stop.value
+
+
+def call_tool(session: Any, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        parsed = tool.args_model.model_validate(args)
+        return tool.handler(session=session, **parsed.model_dump())
+    except Exception as e:
+        raise ToolExecutionError(str(e))
+
+
+def report_tool_queries(module: str, tool: ToolSpec, stats: QueryStats) -> Dict[str, Any]:
+    """Tóm tắt SQL của 1 lần gọi tool; ghi metrics + audit khi nghi N+1 / vượt ngân sách."""
+    sql = stats.summary()
+    n_plus_one = sql.get("n_plus_one")
+    record_tool_sql(module, tool.ten_tool, stats.statements, stats.db_s, bool(n_plus_one))
+    if n_plus_one:
+        audit({"event": "tool_n_plus_one", "module": module, "tool": tool.ten_tool, **sql}, level="warning")
+
+    budget = tool.max_queries if tool.max_queries is not None else TOOL_QUERY_BUDGET
+    if budget and stats.statements > budget:
+        sql["over_budget"] = budget
+        audit({
+            "event": "tool_query_budget_exceeded",
+            "module": module,
+            "tool": tool.ten_tool,
+            "budget": budget,
+            "statements": stats.statements,
+        }, level="warning")
+    return sql
+
+
+def execute_tool(session_factory: Callable[[], Any], tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+    session = session_factory()
+    try:
+        return call_tool(session, tool, args)
+    finally:
+        session.close()
+
+
+def check_module_role(module: str, role: Optional[str]) -> None:
+    if not check_role(module, role):
+        raise PermissionDenied(f"Role '{role}' không được phép dùng chatbot module '{module}'.")
+
+
+# ---------- cách gọi tool (sync / async) ----------
+StepOutcome = Tuple[Dict[str, Any], Any]
+
+
+class ToolCaller:
+    """
+    Cách gọi tool của đường sync (PlanRun.run_steps): Session thường, step song song chạy trên _STEP_POOL.
+    Đường async dùng AsyncToolCaller (executor_async.py) với cùng các hàm, bản coroutine
+    (open / close / run_jobs); vòng lặp tầng và bookkeeping step nằm ở PlanRun, dùng chung.
+    """
+
+    def open(self, run: "PlanRun", sched: StepSchedule) -> None:
+        if PLAN_SESSION_REUSE:
+            run.uow = ReadOnlyUnitOfWork(share_snapshot=sched.parallel)
+
+    def close(self, run: "PlanRun") -> None:
+        if run.uow is not None:
+            run.uow.close()
+            run.uow = None
+
+    def execute(self, run: "PlanRun", tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        hooks = run.hooks
+        if not tool.read_only:
+            # tool ghi luôn dùng session riêng, tự commit; dữ liệu module đã đổi -> answer cache cũ
+            try:
+                return execute_tool(hooks.session_factory, tool, args)
+            finally:
+                bump_data_version(hooks.module)
+                # snapshot cũ không thấy dữ liệu vừa ghi (step ghi luôn đứng 1 mình 1 tầng)
+                if run.uow is not None:
+                    run.uow = run.uow.renew()
+        # tool danh mục có ToolSpec.cache -> kết quả dùng chung giữa các lượt (app/ai/tool_cache.py)
+        return cached_call(tool, args, lambda: self._execute_read(run, tool, args))
+
+    def _execute_read(self, run: "PlanRun", tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        if run.uow is None:
+            return execute_tool(run.hooks.session_factory, tool, args)
+        with run.uow.session(run.hooks.session_factory) as session:
+            return call_tool(session, tool, args)
+
+    def call(self, run: "PlanRun", i: int, step: PlanStep, tool: ToolSpec, args: Dict[str, Any]) -> StepOutcome:
+        with run.tool_call(i, step, tool):
+            args = run.prepare_args(tool, args)
+            audit({"event": "tool_call", "module": run.plan.module, "tool": step.tool, "args": args})
+            result = self.execute(run, tool, args)
+            audit({"event": "tool_result", "module": run.plan.module, "tool": step.tool, "result": result})
+        return args, result
+
+    def run_jobs(self, run: "PlanRun", jobs: List[StepJob]) -> List[StepOutcome]:
+        if len(jobs) <= 1:
+            return [self.call(run, *job) for job in jobs]
+        # copy_context: span của step song song vẫn gắn vào trace của request
+        futures = [_STEP_POOL.submit(contextvars.copy_context().run, self.call, run, *job) for job in jobs]
+        # 1 step lỗi: chờ cả tầng xong rồi mới ném lỗi -> close() không rollback session step khác đang dùng
+        wait(futures)
+        return [f.result() for f in futures]
+
+
+@dataclass
+class PlanRun:
+    hooks: ModuleHooks
+    plan: Plan
+    message: str
+    user_id: Optional[int]
+    role: Optional[str]
+    on_event: Optional[ChatEventSink] = None
+    store: Dict[str, Any] = field(default_factory=dict)
+    step_infos: List[dict] = field(default_factory=list)
+    # != None => dừng sớm (plan/tool cần làm rõ), executor trả thẳng dict này
+    early_result: Optional[Dict[str, Any]] = None
+    # số lần gọi tool theo index step (không tính lookup phụ trong normalize_args)
+    tool_calls: Dict[int, int] = field(default_factory=dict)
+    _calls_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    # ToolCaller (sync) hoặc AsyncToolCaller (executor_async)
+    caller: Any = field(default_factory=ToolCaller, repr=False)
+    # unit of work read-only dùng chung cho cả lượt (caller mở / đóng)
+    uow: Any = field(default=None, init=False, repr=False)
+    # thống kê SQL theo step id (report_tool_queries)
+    sql_stats: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def tool_call_count(self) -> int:
+        return sum(self.tool_calls.values())
+
+    def execute_tool(self, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Gọi tool chặn tới khi xong (normalize_args dùng để tra cứu phụ)."""
+        return self.caller.execute(self, tool, args)
+
+    def normalize_args(self, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        if self.hooks.normalize_args is None:
+            return args
+        return self.hooks.normalize_args(self, tool, args)
+
+    def inject_auth(self, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.hooks.inject_auth:
+            return args
+        return inject_auth_into_args(
+            auth_user_id=self.user_id,
+            tool_args=args,
+            has_target_user_id_field=args_has_field(tool, "target_user_id"),
+        )
+
+    def prepare_args(self, tool: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+        return self.inject_auth(tool, self.normalize_args(tool, args))
+
+    def step_infos_for_answer(self) -> List[dict]:
+        return self.hooks.filter_for_answer(self.plan.module, self.message, self.step_infos)
+
+    @contextmanager
+    def tool_call(self, i: int, step: PlanStep, tool: ToolSpec) -> Iterator[None]:
+        """Bookkeeping 1 lần gọi tool của step i (sync / async): đếm lượt gọi, span, thống kê SQL."""
+        with self._calls_lock:
+            self.tool_calls[i] = self.tool_calls.get(i, 0) + 1
+        with span("tool", module=self.plan.module, tool=step.tool, step=step.id) as s, track_queries() as q:
+            yield
+            s.attrs["sql"] = self.sql_stats[step.id] = report_tool_queries(self.plan.module, tool, q)
+
+    def check_tool_calls(self, sched: StepSchedule) -> bool:
+        """Regression: mỗi step đã chạy gọi tool đúng 1 lần (vd. HRM từng chạy 2 lần / step)."""
+        ok = all(self.tool_calls.get(i) == 1 for i in sched.done) and set(self.tool_calls) == set(sched.done)
+        if not ok:
+            audit({
+                "event": "tool_call_count_mismatch",
+                "module": self.plan.module,
+                "steps_executed": len(sched.done),
+                "tool_calls": {self.plan.steps[i].id: n for i, n in self.tool_calls.items()},
+            })
+        return ok
+
+    def run_steps(self) -> None:
+        sched = StepSchedule(self.plan)
+        self.caller.open(self, sched)
+        try:
+            levels = self._levels(sched)
+            outcomes = None
+            while True:
+                try:
+                    jobs = levels.send(outcomes)
+                except StopIteration:
+                    break
+                outcomes = self.caller.run_jobs(self, jobs)
+        finally:
+            self.caller.close(self)
+        self.check_tool_calls(sched)
+
+    async def run_steps_async(self) -> None:
+        sched = StepSchedule(self.plan)
+        await self.caller.open(self, sched)
+        try:
+            levels = self._levels(sched)
+            outcomes = None
+            while True:
+                try:
+                    jobs = levels.send(outcomes)
+                except StopIteration:
+                    break
+                outcomes = await self.caller.run_jobs(self, jobs)
+        finally:
+            await self.caller.close(self)
+        self.check_tool_calls(sched)
+
+    def _levels(self, sched: StepSchedule) -> Generator[List[StepJob], List[StepOutcome], None]:
+        """
+        Vòng lặp tầng dùng chung sync / async: yield các job của 1 tầng,
+        nhận lại (args, result) theo đúng thứ tự job, rồi ghi nhận / commit theo thứ tự step.
+        """
+        for level in sched.levels:
+            jobs = sched.jobs(level)
+            outcomes = yield jobs
+            for (i, _, _, _), (resolved_args, result) in zip(jobs, outcomes):
+                sched.record(i, resolved_args, result)
+
+            for step, resolved_args, result in sched.commit():
+                self.step_infos.append({
+                    "id": step.id, "tool": step.tool, "args": resolved_args, "result": result,
+                    "sql": self.sql_stats.get(step.id),
+                })
+                emit(self.on_event, "tool_result", self.step_infos[-1])
+
+                if is_clarification(result):
+                    self.early_result = {
+                        "answer": result.get("question"),
+                        "candidates": result.get("candidates"),
+                        "plan": self.plan.model_dump(),
+                    }
+                    return
+
+            if sched.finished:
+                break
+
+        self.store = sched.store()
+
+
+def start_run(
+    hooks: ModuleHooks,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    plan: Plan,
+    on_event: Optional[ChatEventSink] = None,
+    caller: Optional[Any] = None,
+) -> PlanRun:
+    """Ghi nhận plan đã lập -> validate; PlanRun chưa chạy step (early_result nếu plan cần làm rõ)."""
+    module = hooks.module
+    audit({"event": "plan_created", "module": module, "plan": plan.model_dump()})
+    emit(on_event, "plan", plan.model_dump())
+
+    run = PlanRun(hooks=hooks, plan=plan, message=message, user_id=user_id, role=role, on_event=on_event)
+    if caller is not None:
+        run.caller = caller
+
+    if plan.needs_clarification:
+        run.early_result = {"answer": plan.clarifying_question, "plan": plan.model_dump()}
+        return run
+
+    with span("validate", module=module):
+        validate_plan(plan)
+    return run
+
+
+def run_plan(
+    hooks: ModuleHooks,
+    user_id: int | None,
+    role: str | None,
+    message: str,
+    plan: Optional[Plan] = None,
+    on_event: Optional[ChatEventSink] = None,
+) -> PlanRun:
+    """
+    Kiểm quyền -> lập plan (nếu chưa có) -> validate -> chạy các step.
+    Kết quả: PlanRun (store, step_infos, early_result).
+    """
+    module = hooks.module
+    check_module_role(module, role)
+
+    auth = {"user_id": user_id, "role": role, "is_authenticated": True}
+    # plan có thể được lập sẵn (speculative planning ở executor_chat)
+    if plan is None:
+        with span("plan", module=module):
+            plan = plan_route(module=module, message=message, auth=auth)
+
+    run = start_run(hooks, user_id, role, message, plan, on_event=on_event)
+    if run.early_result is None:
+        run.run_steps()
+    return run
@@ -0,0 +1,339 @@
+# app/ai/llm_gateway.py
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from app.core.audit_log import audit
+from app.core.errors import LlmTimeout
+from app.core.services import genai_client
+from app.core.telemetry import record_llm
+
+# =========================================================
+# Gateway duy nhất cho mọi call Gemini (detect / plan / compose):
+# - 1 genai.Client dùng chung (httpx keep-alive), tạo lười
+# - deadline theo từng call: tính cả thời gian chờ slot + retry
+# - retry exponential backoff + jitter cho 429 / 5xx / lỗi mạng (tôn trọng Retry-After)
+# - giới hạn số call đồng thời: burst thì xếp hàng thay vì bắn đồng loạt rồi timeout dây chuyền
+#   (slot được trả lại trong lúc backoff); đường sync (thread) và async (event loop) có limiter riêng
+# - model chọn theo mục đích: GEMINI_DETECT_MODEL / GEMINI_PLAN_MODEL / GEMINI_COMPOSE_MODEL
+# - mỗi call thành công ghi latency + token (usage_metadata) vào app/core/telemetry.py
+# =========================================================
+
+_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+_DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+MODELS: Dict[str, str] = {
+    "detect": os.getenv("GEMINI_DETECT_MODEL") or _DEFAULT_MODEL,
+    "plan": os.getenv("GEMINI_PLAN_MODEL") or _DEFAULT_MODEL,
+    # GEMINI_MODEL_1: tên env cũ của compose supply_chain
+    "compose": os.getenv("GEMINI_COMPOSE_MODEL") or os.getenv("GEMINI_MODEL_1") or _DEFAULT_MODEL,
+}
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY_ASYNC = int(os.getenv("LLM_MAX_CONCURRENCY_ASYNC", str(LLM_MAX_CONCURRENCY)))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "8"))
+LLM_KEEPALIVE_S = float(os.getenv("LLM_KEEPALIVE_S", "60"))
+
+# deadline mặc định (giây) theo mục đích; LLM_TIMEOUT_S áp cho mục đích khác
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+DEADLINES_S: Dict[str, float] = {
+    "detect": float(os.getenv("LLM_DETECT_TIMEOUT_S", "10")),
+    "plan": float(os.getenv("LLM_PLAN_TIMEOUT_S", str(LLM_TIMEOUT_S))),
+    "compose": float(os.getenv("LLM_COMPOSE_TIMEOUT_S", "45")),
+}
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+_SLOTS = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+# asyncio.Semaphore gắn với 1 event loop -> mỗi loop 1 limiter
+_ASYNC_SLOTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def model_for(purpose: str) -> str:
+    return MODELS.get(purpose) or _DEFAULT_MODEL
+
+
+def client():
+    import httpx
+    return genai_client(_API_KEY, http_options={
+        "timeout": int(LLM_TIMEOUT_S * 1000),
+        "client_args": {"limits": httpx.Limits(
+            max_connections=LLM_MAX_CONCURRENCY * 2,
+            max_keepalive_connections=LLM_MAX_CONCURRENCY,
+            keepalive_expiry=LLM_KEEPALIVE_S,
+        )},
+    })
+
+
+def is_available() -> bool:
+    try:
+        return client() is not None
+    except Exception:
+        return False
+
+
+# ---------- deadline / retry ----------
+class _Deadline:
+    def __init__(self, purpose: str, timeout_s: Optional[float]):
+        self.purpose = purpose
+        self.timeout_s = timeout_s if timeout_s is not None else DEADLINES_S.get(purpose, LLM_TIMEOUT_S)
+        self.t0 = time.monotonic()
+        self.at = self.t0 + self.timeout_s
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def record(self, model: str, usage: Any) -> None:
+        record_llm(self.purpose, model, usage, time.monotonic() - self.t0)
+
+    def expired(self, stage: str) -> LlmTimeout:
+        return LlmTimeout(f"LLM {self.purpose}: quá deadline {self.timeout_s:.1f}s ({stage})")
+
+    def config(self, config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        # timeout HTTP của lần thử = phần deadline còn lại
+        cfg = dict(config or {})
+        http = dict(cfg.get("http_options") or {})
+        http["timeout"] = max(1, int(self.remaining() * 1000))
+        cfg["http_options"] = http
+        return cfg
+
+
+def _is_retryable(e: BaseException) -> bool:
+    code = getattr(e, "code", None)
+    if isinstance(code, int):
+        return code in _RETRY_STATUS
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(e, httpx.TransportError)
+
+
+def _backoff_s(attempt: int, e: BaseException) -> float:
+    response = getattr(e, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), LLM_BACKOFF_MAX_S)
+    except (TypeError, ValueError):
+        pass
+    delay = min(LLM_BACKOFF_BASE_S * (2 ** attempt), LLM_BACKOFF_MAX_S)
+    return delay * (0.5 + random.random() / 2)
+
+
+def _should_retry(dl: _Deadline, attempt: int, e: BaseException) -> Optional[float]:
+    """Số giây cần chờ trước lần thử kế tiếp, None = không retry."""
+    if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+        return None
+    delay = _backoff_s(attempt, e)
+    if delay >= dl.remaining():
+        return None
+    audit({
+        "event": "llm_retry",
+        "purpose": dl.purpose,
+        "attempt": attempt + 1,
+        "delay_s": round(delay, 3),
+        "error": f"{type(e).__name__}:{e}",
+    })
+    return delay
+
+
+# ---------- slot: sync = threading.BoundedSemaphore, async = asyncio.Semaphore theo loop ----------
+@contextmanager
+def _slot(dl: _Deadline) -> Iterator[None]:
+    if not _SLOTS.acquire(timeout=max(0.0, dl.remaining())):
+        raise dl.expired("chờ slot")
+    try:
+        yield
+    finally:
+        _SLOTS.release()
+
+
+def _async_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _ASYNC_SLOTS.get(loop)
+    if sem is None:
+        sem = _ASYNC_SLOTS[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY_ASYNC)
+    return sem
+
+
+@asynccontextmanager
+async def _aslot(dl: _Deadline) -> AsyncIterator[None]:
+    # chờ trên event loop (không poll), được đánh thức ngay khi có slot trả về
+    sem = _async_slots()
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout=max(0.0, dl.remaining()))
+    except asyncio.TimeoutError:
+        raise dl.expired("chờ slot")
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+def _close_stream(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+
+
+async def _aclose_stream(stream: Any) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+# ---------- API ----------
+def generate(
+    purpose: str,
+    contents: Any,
+    config: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    timeout_s: Optional[float] = None,
+):
+    dl = _Deadline(purpose, timeout_s)
+    model = model or model_for(purpose)
+    attempt = 0
+    while True:
+        try:
+            with _slot(dl):
+                resp = client().models.generate_content(model=model, contents=contents, config=dl.config(config))
+            dl.record(model, getattr(resp, "usage_metadata", None))
+            return resp
+        except LlmTimeout:
+            raise
+        except Exception as e:
+            delay = _should_retry(dl, attempt, e)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+async def agenerate(
+    purpose: str,
+    contents: Any,
+    config: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    timeout_s: Optional[float] = None,
+):
+    dl = _Deadline(purpose, timeout_s)
+    model = model or model_for(purpose)
+    attempt = 0
+    while True:
+        try:
+            async with _aslot(dl):
+                resp = await asyncio.wait_for(
+                    client().aio.models.generate_content(model=model, contents=contents, config=dl.config(config)),
+                    timeout=max(0.001, dl.remaining()),
+                )
+            dl.record(model, getattr(resp, "usage_metadata", None))
+            return resp
+        except LlmTimeout:
+            raise
+        except asyncio.TimeoutError:
+            raise dl.expired("gọi model")
+        except Exception as e:
+            delay = _should_retry(dl, attempt, e)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def generate_stream(
+    purpose: str,
+    contents: Any,
+    config: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    timeout_s: Optional[float] = None,
+) -> Iterator[Any]:
+    """Stream chunk; chỉ retry khi lỗi xảy ra trước chunk đầu tiên (chưa đẩy gì ra ngoài).
+
+    Slot giữ tới khi stream kết thúc hoặc generator bị close: caller dừng sớm phải close()
+    (contextlib.closing) để trả slot và đóng stream upstream ngay.
+    """
+    dl = _Deadline(purpose, timeout_s)
+    model = model or model_for(purpose)
+    attempt = 0
+    while True:
+        started = False
+        usage = None
+        try:
+            with _slot(dl):
+                stream = client().models.generate_content_stream(
+                    model=model, contents=contents, config=dl.config(config),
+                )
+                try:
+                    for chunk in stream:
+                        started = True
+                        # usage_metadata đầy đủ nằm ở chunk cuối
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        yield chunk
+                finally:
+                    _close_stream(stream)
+            dl.record(model, usage)
+            return
+        except LlmTimeout:
+            raise
+        except Exception as e:
+            delay = None if started else _should_retry(dl, attempt, e)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+async def agenerate_stream(
+    purpose: str,
+    contents: Any,
+    config: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    timeout_s: Optional[float] = None,
+) -> AsyncIterator[Any]:
+    dl = _Deadline(purpose, timeout_s)
+    model = model or model_for(purpose)
+    attempt = 0
+    while True:
+        started = False
+        usage = None
+        try:
+            async with _aslot(dl):
+                stream = await asyncio.wait_for(
+                    client().aio.models.generate_content_stream(model=model, contents=contents, config=dl.config(config)),
+                    timeout=max(0.001, dl.remaining()),
+                )
+                try:
+                    async for chunk in stream:
+                        started = True
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        yield chunk
+                finally:
+                    await _aclose_stream(stream)
+            dl.record(model, usage)
+            return
+        except LlmTimeout:
+            raise
+        except asyncio.TimeoutError:
+            raise dl.expired("mở stream")
+        except Exception as e:
+            delay = None if started else _should_retry(dl, attempt, e)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def create_cache(purpose: str, config: Dict[str, Any], model: Optional[str] = None):
+    dl = _Deadline(purpose, None)
+    with _slot(dl):
+        return client().caches.create(model=model or model_for(purpose), config=config)
@@ -0,0 +1,257 @@
+# app/ai/module_classifier.py
+from __future__ import annotations
+
+import os
+import pickle
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# =========================================================
+# Bộ phân loại module LOCAL (chạy trước detect_module_llm)
+# - Lexical: keyword/regex rút từ MODULE_DESC (module_detector.py)
+# - Model (tuỳ chọn): pipeline sklearn nhỏ (predict_proba) load từ file pickle
+# Chỉ khi confidence local < MODULE_DETECT_THRESHOLD mới gọi LLM.
+# =========================================================
+
+MODULES = ["hrm", "supply_chain", "sale_crm", "finance_accounting"]
+
+# Đường dẫn model on-CPU (vd: TfidfVectorizer + LogisticRegression đã pickle) — chỉ file tin cậy, xem _load_model
+MODULE_CLASSIFIER_MODEL_PATH = os.getenv("MODULE_CLASSIFIER_MODEL_PATH", "").strip()
+
+# Điểm để confidence đạt 1.0 (1 dấu hiệu mạnh = 3 điểm).
+# Chưa tới mức này (không có dấu hiệu mạnh) thì confidence tối đa 0.5 -> luôn để LLM xác nhận
+_SATURATION = 3.0
+_UNSATURATED_MAX = 0.5
+
+# (pattern, weight) — pattern viết KHÔNG dấu, message được bỏ dấu trước khi match
+_STRONG = 3.0
+_MEDIUM = 2.0
+_WEAK = 1.0
+
+_SIGNALS: Dict[str, List[Tuple[str, float]]] = {
+    "hrm": [
+        (r"\bnv\d+\b", _STRONG),
+        (r"\bcham cong\b", _STRONG),
+        (r"\bbang cong\b", _STRONG),
+        (r"\bnghi phep\b", _STRONG),
+        (r"\bbang luong\b", _STRONG),
+        (r"\bphieu luong\b", _STRONG),
+        (r"\bpayslip\b", _STRONG),
+        (r"\btang ca\b", _MEDIUM),
+        (r"\bdi (tre|muon)\b", _MEDIUM),
+        (r"\bve som\b", _MEDIUM),
+        (r"\bthieu (cong|checkout|check-out)\b", _MEDIUM),
+        (r"\bca lam\b", _MEDIUM),
+        (r"\bhop dong lao dong\b", _STRONG),
+        (r"\bhop dong\b", _WEAK),
+        (r"\bnhan vien\b", _MEDIUM),
+        (r"\bnhan su\b", _MEDIUM),
+        (r"\bphong ban\b", _MEDIUM),
+        (r"\bchuc vu\b", _MEDIUM),
+        (r"\bluong\b", _WEAK),
+        (r"\bphu cap\b", _WEAK),
+        (r"\b(?:bhxh|bhyt)\b", _MEDIUM),
+        (r"\bot\b", _WEAK),
+        (r"\bngay vao lam\b", _MEDIUM),
+        (r"\bduyet nghi\b", _MEDIUM),
+    ],
+    "supply_chain": [
+        (r"\b(po|pr|gr|gi)-\w+", _STRONG),
+        (r"\bton kho\b", _STRONG),
+        (r"\bnhap kho\b", _STRONG),
+        (r"\bxuat kho\b", _STRONG),
+        (r"\bkiem ke\b", _STRONG),
+        (r"\bdon mua\b", _STRONG),
+        (r"\bdon dat mua\b", _STRONG),
+        (r"\bphieu (nhap|xuat)\b", _STRONG),
+        (r"\byeu cau mua\b", _MEDIUM),
+        (r"\bmua hang\b", _MEDIUM),
+        (r"\bnha cung cap\b", _MEDIUM),
+        (r"\bncc\b", _MEDIUM),
+        (r"\bdieu chuyen kho\b", _STRONG),
+        (r"\bsap het\b", _MEDIUM),
+        (r"\bsku\b", _MEDIUM),
+        (r"\bkha dung\b", _STRONG),
+        (r"\bkho\b", _WEAK),
+        (r"\bhan giao\b", _MEDIUM),
+        (r"\blead time\b", _MEDIUM),
+        (r"\b(po|pr|gr|gi)\b", _WEAK),
+    ],
+    "sale_crm": [
+        (r"\bso-\w+", _STRONG),
+        (r"\bdon ban\b", _STRONG),
+        (r"\bvoucher\b", _STRONG),
+        (r"\bkhuyen mai\b", _STRONG),
+        (r"\bgio hang\b", _STRONG),
+        (r"\bdoanh so\b", _STRONG),
+        (r"\bbao gia\b", _MEDIUM),
+        (r"\bcskh\b", _MEDIUM),
+        (r"\bkhach hang\b", _MEDIUM),
+        (r"\bdon hang\b", _MEDIUM),
+        (r"\bsan pham\b", _MEDIUM),
+        (r"\bban chay\b", _MEDIUM),
+        (r"\bdia chi (mua hang|mac dinh|giao hang)\b", _STRONG),
+        (r"\blich su mua\b", _MEDIUM),
+        (r"\bdanh gia\b", _WEAK),
+        (r"\btai khoan cua toi\b", _MEDIUM),
+    ],
+    "finance_accounting": [
+        # "hóa đơn / công nợ / bút toán..." luôn ưu tiên finance (CASE GIAO THOA 1)
+        (r"\bhoa don\b", _STRONG + 1.0),
+        (r"\bcong no\b", _STRONG + 1.0),
+        (r"\bbut toan\b", _STRONG + 1.0),
+        (r"\bdinh khoan\b", _STRONG + 1.0),
+        (r"\bso nhat ky\b", _STRONG + 1.0),
+        (r"\bthu chi\b", _STRONG + 1.0),
+        (r"\bdong tien\b", _STRONG + 1.0),
+        (r"\bky ke toan\b", _STRONG),
+        (r"\b(ar|ap)\b", _MEDIUM),
+        (r"\bphai (thu|tra)\b", _STRONG),
+        (r"\bcon no\b", _STRONG),
+        (r"\bphieu (thu|chi)\b", _STRONG),
+        (r"\bchuyen khoan\b", _MEDIUM),
+        (r"\btien mat\b", _MEDIUM),
+        (r"\bgiao dich\b", _MEDIUM),
+        (r"\bso du\b", _MEDIUM),
+        (r"\bnhat ky\b", _MEDIUM),
+        (r"\bjournal\b", _MEDIUM),
+        (r"\bevent_code\b", _STRONG),
+        (r"\bposting rule\b", _STRONG),
+        (r"\b(tk|tai khoan) ?(111|112|131|331|511|632)\b", _STRONG),
+        (r"\bthanh toan\b", _WEAK),
+        (r"\bke toan\b", _MEDIUM),
+    ],
+}
+
+# pattern CÓ dấu, match trên message giữ dấu: từ mà bỏ dấu sẽ trùng từ khác
+# ("hãng" -> "hang" trùng "hạng", "hằng", "hàng")
+_ACCENTED_SIGNALS: Dict[str, List[Tuple[str, float]]] = {
+    "sale_crm": [
+        (r"\bhãng\b", _WEAK),
+    ],
+}
+
+# CASE GIAO THOA 1 (MODULE_DESC): trọng tâm là tiền/kế toán -> finance_accounting, kể cả có nhắc PO/SO
+_PRIORITY_MODULE = "finance_accounting"
+_PRIORITY_RE = re.compile(
+    r"\b(hoa don|cong no|thu chi|dong tien|giao dich|but toan|nhat ky|so du|dinh khoan)\b"
+)
+
+_COMPILED: Dict[str, List[Tuple[re.Pattern, float]]] = {
+    m: [(re.compile(p), w) for p, w in sigs] for m, sigs in _SIGNALS.items()
+}
+_COMPILED_ACCENTED: Dict[str, List[Tuple[re.Pattern, float]]] = {
+    m: [(re.compile(p), w) for p, w in sigs] for m, sigs in _ACCENTED_SIGNALS.items()
+}
+
+
+def _fold(text: str) -> str:
+    # bỏ dấu tiếng Việt + lower để match được cả câu gõ không dấu
+    s = (text or "").lower().replace("đ", "d")
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+
+
+def lexical_scores(message: str) -> Dict[str, float]:
+    folded = _fold(message)
+    accented = unicodedata.normalize("NFC", (message or "").lower())
+    scores: Dict[str, float] = {}
+    for module, sigs in _COMPILED.items():
+        score = 0.0
+        for rx, w in sigs:
+            if rx.search(folded):
+                score += w
+        for rx, w in _COMPILED_ACCENTED.get(module, ()):
+            if rx.search(accented):
+                score += w
+        scores[module] = score
+    return scores
+
+
+def _confidence(scores: Dict[str, float], prefer: Optional[str] = None) -> Tuple[Optional[str], float]:
+    """
+    prefer: module thắng theo luật ưu tiên dù điểm thấp hơn; margin âm tính là 0
+    -> confidence <= 0.5, tín hiệu trái chiều vẫn để LLM xác nhận.
+    Chỉ có tín hiệu vừa/yếu (top < _SATURATION) cũng bị chặn ở 0.5: 1 từ "khách hàng" / "sản phẩm"
+    không đủ để bỏ qua LLM.
+    """
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    top_mod, top = ranked[0]
+    second = ranked[1][1] if len(ranked) > 1 else 0.0
+    if prefer and scores.get(prefer, 0.0) > 0:
+        top_mod, top = prefer, scores[prefer]
+        second = max((v for m, v in scores.items() if m != prefer), default=0.0)
+    if top <= 0:
+        return None, 0.0
+
+    margin = max(0.0, (top - second) / top)
+    saturation = min(1.0, top / _SATURATION)
+    conf = saturation * (0.5 + 0.5 * margin)
+    if top < _SATURATION:
+        conf = min(conf, _UNSATURATED_MAX)
+    return top_mod, round(conf, 4)
+
+
+@lru_cache(maxsize=1)
+def _load_model() -> Any:
+    if not MODULE_CLASSIFIER_MODEL_PATH or not os.path.exists(MODULE_CLASSIFIER_MODEL_PATH):
+        return None
+    try:
+        # pickle.load chạy được code tuỳ ý trong file: MODULE_CLASSIFIER_MODEL_PATH chỉ được trỏ tới
+        # model do team tự train (artifact build/deploy, quyền ghi như code), không nhận file từ người dùng.
+        with open(MODULE_CLASSIFIER_MODEL_PATH, "rb") as f:
+            model = pickle.load(f)
+        # chỉ nhận model có predict_proba + classes_ (sklearn)
+        if not hasattr(model, "predict_proba") or not hasattr(model, "classes_"):
+            return None
+        return model
+    except Exception:
+        return None
+
+
+def _model_predict(message: str) -> Optional[Tuple[str, float]]:
+    model = _load_model()
+    if model is None:
+        return None
+    try:
+        proba = model.predict_proba([_fold(message)])[0]
+        best = max(range(len(proba)), key=lambda i: proba[i])
+        module = str(model.classes_[best])
+        if module not in MODULES:
+            return None
+        return module, float(proba[best])
+    except Exception:
+        return None
+
+
+def classify_module_local(message: str) -> Dict[str, Any]:
+    """
+    Phân loại module tại chỗ (không gọi mạng).
+    Trả về cùng shape với detect_module_llm + 'method' và 'scores'.
+    """
+    scores = lexical_scores(message)
+    prefer = _PRIORITY_MODULE if _PRIORITY_RE.search(_fold(message)) else None
+    module, conf = _confidence(scores, prefer)
+    method = "lexical"
+
+    pred = _model_predict(message)
+    if pred is not None and pred[1] > conf:
+        module, conf = pred
+        method = "model"
+
+    return {
+        "selected_module": module,
+        "confidence": conf,
+        "needs_clarification": module is None,
+        "clarifying_question": None,
+        "method": method,
+        "scores": scores,
+    }
+
+
+def rank_modules_local(message: str) -> List[str]:
+    """Thứ tự module theo điểm lexical giảm dần (module 0 điểm xếp cuối, giữ thứ tự gốc)."""
+    scores = lexical_scores(message)
+    return sorted(MODULES, key=lambda m: -scores.get(m, 0.0))
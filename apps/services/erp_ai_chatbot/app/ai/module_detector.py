@@ -5,17 +5,17 @@ import json
 import os
 from typing import Optional, Literal, Dict, Any
 
-from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from google import genai
 
-load_dotenv()
+from app.ai.module_classifier import classify_module_local
+from app.ai import llm_gateway
+from app.core.telemetry import span
 
 # ====== config ======
-_GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-_GEMINI_DETECT_MODEL = os.getenv("GEMINI_DETECT_MODEL", os.getenv("GEMINI_MODEL", "gemini-2.5-flash"))
+MODULE_DETECT_THRESHOLD = float(os.getenv("MODULE_DETECT_THRESHOLD", "0.60"))
+# tắt bộ phân loại local (luôn gọi LLM) bằng MODULE_LOCAL_CLASSIFIER=0
+MODULE_LOCAL_CLASSIFIER = os.getenv("MODULE_LOCAL_CLASSIFIER", "1") == "1"
 
-_client = genai.Client(api_key=_GEMINI_API_KEY) if _GEMINI_API_KEY else genai.Client()
 
 MODULES = ["hrm", "supply_chain", "sale_crm", "finance_accounting"]
 ModuleName = Literal["hrm", "supply_chain", "sale_crm", "finance_accounting"]
@@ -195,49 +195,122 @@ OUTPUT
 """
 
 
+_EMPTY_MESSAGE_DETECT = {
+    "selected_module": None,
+    "confidence": 0.0,
+    "needs_clarification": True,
+    "clarifying_question": "Bạn muốn hỏi thuộc module nào: hrm / supply_chain / sale_crm / finance_accounting?",
+    "error": "empty_message",
+}
+
+
+def _detect_request(msg: str, role: str | None) -> dict:
+    return {
+        "model": llm_gateway.model_for("detect"),
+        "contents": f"USER_MESSAGE:\n{msg}\nROLE:\n{role or ''}",
+        "config": {
+            "system_instruction": MODULE_DESC,
+            "temperature": 0.0,
+            "response_mime_type": "application/json",
+            "response_json_schema": MODULE_DETECT_JSON_SCHEMA,
+        },
+    }
+
+
+def _parse_detect_response(resp) -> dict:
+    text = (resp.text or "").strip()
+    data = json.loads(text) if text else {}
+    out = ModuleDetectOut.model_validate(data)
+
+    # nếu LLM trả needs_clarification=false nhưng module null -> ép hỏi
+    if (not out.needs_clarification) and (out.selected_module is None):
+        out = out.model_copy(update={
+            "needs_clarification": True,
+            "clarifying_question": "Bạn muốn hỏi thuộc module nào: hrm / supply_chain / sale_crm / finance_accounting?",
+            "confidence": 0.0,
+        })
+
+    return {**out.model_dump(), "error": None}
+
+
+def _detect_failed(e: Exception) -> dict:
+    # không “map keyword” ở đây; chỉ trả câu hỏi chọn module khi LLM fail
+    return {
+        "selected_module": None,
+        "confidence": 0.0,
+        "needs_clarification": True,
+        "clarifying_question": "Bộ phân loại module đang bận. Bạn chọn module: hrm / supply_chain / sale_crm / finance_accounting?",
+        "error": f"detector_exception:{type(e).__name__}:{e}",
+    }
+
+
 def detect_module_llm(message: str, role: str | None = None) -> dict:
     msg = (message or "").strip()
     if not msg:
-        return {
-            "selected_module": None,
-            "confidence": 0.0,
-            "needs_clarification": True,
-            "clarifying_question": "Bạn muốn hỏi thuộc module nào: hrm / supply_chain / sale_crm / finance_accounting?",
-            "error": "empty_message",
-        }
+        return dict(_EMPTY_MESSAGE_DETECT)
 
     try:
-        resp = _client.models.generate_content(
-            model=_GEMINI_DETECT_MODEL,
-            contents=f"USER_MESSAGE:\n{msg}\nROLE:\n{role or ''}",
-            config={
-                "system_instruction": MODULE_DESC,
-                "temperature": 0.0,
-                "response_mime_type": "application/json",
-                "response_json_schema": MODULE_DETECT_JSON_SCHEMA,  
-            },
-        )
-
-        text = (resp.text or "").strip()
-        data = json.loads(text) if text else {}
-        out = ModuleDetectOut.model_validate(data)
-
-        # nếu LLM trả needs_clarification=false nhưng module null -> ép hỏi
-        if (not out.needs_clarification) and (out.selected_module is None):
-            out = out.model_copy(update={
-                "needs_clarification": True,
-                "clarifying_question": "Bạn muốn hỏi thuộc module nào: hrm / supply_chain / sale_crm / finance_accounting?",
-                "confidence": 0.0,
-            })
-
-        return {**out.model_dump(), "error": None}
+        resp = llm_gateway.generate("detect", **_detect_request(msg, role))
+        return _parse_detect_response(resp)
+    except Exception as e:
+        return _detect_failed(e)
 
+
+async def detect_module_llm_async(message: str, role: str | None = None) -> dict:
+    msg = (message or "").strip()
+    if not msg:
+        return dict(_EMPTY_MESSAGE_DETECT)
+
+    try:
+        resp = await llm_gateway.agenerate("detect", **_detect_request(msg, role))
+        return _parse_detect_response(resp)
     except Exception as e:
-        # không “map keyword” ở đây; chỉ trả câu hỏi chọn module khi LLM fail
+        return _detect_failed(e)
+
+
+def _detect_local(msg: str) -> tuple[dict | None, dict | None]:
+    """(kết quả nếu local đủ chắc, tóm tắt local để gắn vào kết quả LLM)"""
+    if not (msg and MODULE_LOCAL_CLASSIFIER):
+        return None, None
+    local = classify_module_local(msg)
+    if local.get("selected_module") and local.get("confidence", 0.0) >= MODULE_DETECT_THRESHOLD:
         return {
-            "selected_module": None,
-            "confidence": 0.0,
-            "needs_clarification": True,
-            "clarifying_question": "Bộ phân loại module đang bận. Bạn chọn module: hrm / supply_chain / sale_crm / finance_accounting?",
-            "error": f"detector_exception:{type(e).__name__}:{e}",
-        }
+            "selected_module": local["selected_module"],
+            "confidence": local["confidence"],
+            "needs_clarification": False,
+            "clarifying_question": None,
+            "error": None,
+            "method": local["method"],
+        }, None
+    return None, {k: local[k] for k in ("selected_module", "confidence", "method")}
+
+
+def detect_module(message: str, role: str | None = None) -> dict:
+    """
+    Detect 2 tầng:
+    1) classify_module_local (keyword/regex + model tuỳ chọn) — vài micro giây
+    2) detect_module_llm — chỉ khi confidence local < MODULE_DETECT_THRESHOLD
+    """
+    msg = (message or "").strip()
+    with span("detect") as s:
+        hit, local = _detect_local(msg)
+        if hit is not None:
+            s.attrs["method"] = hit["method"]
+            return hit
+
+        s.attrs["method"] = "llm"
+        det = detect_module_llm(message=msg, role=role)
+    return {**det, "method": "llm", **({"local": local} if local else {})}
+
+
+async def detect_module_async(message: str, role: str | None = None) -> dict:
+    msg = (message or "").strip()
+    with span("detect") as s:
+        hit, local = _detect_local(msg)
+        if hit is not None:
+            s.attrs["method"] = hit["method"]
+            return hit
+
+        s.attrs["method"] = "llm"
+        det = await detect_module_llm_async(message=msg, role=role)
+    return {**det, "method": "llm", **({"local": local} if local else {})}
@@ -11,11 +11,15 @@ _MODULE_TOOLS: Dict[str, Dict[str, ToolSpec]] = {
 
 _LOADED: set[str] = set()
 
+# tăng mỗi khi tool catalog của module thay đổi (cache plan/prompt dựa vào đây để invalidate)
+_VERSIONS: Dict[str, int] = {}
+
 def register_tools(module: str, tools: list[ToolSpec]):
     if module not in _MODULE_TOOLS:
         _MODULE_TOOLS[module] = {}
     for t in tools:
         _MODULE_TOOLS[module][t.ten_tool] = t
+    _VERSIONS[module] = _VERSIONS.get(module, 0) + 1
 
 def ensure_loaded(module: str):
     if module in _LOADED:
@@ -46,3 +50,7 @@ def get_tool(module: str, ten_tool: str) -> Optional[ToolSpec]:
 def list_tools(module: str) -> list[ToolSpec]:
     ensure_loaded(module)
     return list(_MODULE_TOOLS.get(module, {}).values())
+
+def registry_version(module: str) -> int:
+    ensure_loaded(module)
+    return _VERSIONS.get(module, 0)
@@ -0,0 +1,386 @@
+# app/ai/plan_cache.py
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app.ai.plan_schema import Plan
+from app.ai.module_registry import registry_version
+
+# =========================================================
+# Plan cache theo "mẫu câu" (template) cho gemini_fallback
+# - Chuẩn hoá message: mã / ngày / số / tên -> slot
+# - Lưu Plan đã validate + binding (arg nào lấy từ slot nào)
+# - Hit: thay giá trị slot mới vào plan, KHÔNG gọi planner LLM
+# =========================================================
+
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "1") == "1"
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "2000"))
+PLAN_CACHE_TTL_SECONDS = float(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600"))
+
+# thứ tự ưu tiên khi các pattern chồng lên nhau
+_DATE_DMY = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+_DATE_YMD = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_CODE = re.compile(r"\b(?=[A-Za-z0-9_-]*\d)(?=[A-Za-z0-9_-]*[A-Za-z])[A-Za-z0-9]+(?:[-_][A-Za-z0-9]+)*\b")
+_NUM = re.compile(r"\b\d{1,3}(?:[.,]\d{3})+\b|\b\d+(?:[.,]\d+)?\b")
+_QUOTED = re.compile(r"[\"“']([^\"”']{2,80})[\"”']")
+_WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+# slot chỉ được bind dạng "chuỗi con" khi đủ dài (tránh thay nhầm số 1-2 ký tự)
+_SUBSTR_KINDS = {"CODE", "DATE", "NAME"}
+
+
+@dataclass(frozen=True)
+class Slot:
+    kind: str   # CODE | DATE | NUM | NAME
+    raw: str
+
+    def variants(self) -> Dict[str, Any]:
+        """Các dạng mà planner có thể đã dùng cho slot này trong args."""
+        out: Dict[str, Any] = {"raw": self.raw}
+        if self.kind == "CODE":
+            out["upper"] = self.raw.upper()
+            out["lower"] = self.raw.lower()
+        elif self.kind == "DATE":
+            iso = _date_iso(self.raw)
+            if iso:
+                out["iso"] = iso
+        elif self.kind == "NUM":
+            num = _num_value(self.raw)
+            if num is not None:
+                out["num"] = num
+        return out
+
+
+def _date_iso(raw: str) -> Optional[str]:
+    m = _DATE_DMY.fullmatch(raw)
+    if m:
+        d, mo, y = m.groups()
+        return f"{y}-{int(mo):02d}-{int(d):02d}"
+    if _DATE_YMD.fullmatch(raw):
+        return raw
+    return None
+
+
+def _num_value(raw: str) -> Optional[float]:
+    s = raw.strip()
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", s):
+        return float(re.sub(r"\D", "", s))
+    try:
+        return float(s.replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _name_spans(text: str) -> List[Tuple[int, int]]:
+    # chuỗi >= 2 từ viết hoa chữ cái đầu liên tiếp (VD: Nguyễn Văn An)
+    spans: List[Tuple[int, int]] = []
+    run: List[re.Match] = []
+
+    def flush():
+        if len(run) >= 2:
+            spans.append((run[0].start(), run[-1].end()))
+
+    prev_end = None
+    for m in _WORD.finditer(text):
+        w = m.group(0)
+        is_cap = w[0].isupper() and (len(w) == 1 or w[1:].islower())
+        adjacent = prev_end is not None and text[prev_end:m.start()].strip() == ""
+        if is_cap and (not run or adjacent):
+            run.append(m)
+        else:
+            flush()
+            run = [m] if is_cap else []
+        prev_end = m.end()
+    flush()
+    return spans
+
+
+def templatize(message: str) -> Tuple[str, List[Slot]]:
+    """
+    'Tồn kho SKU ABC-01 ngày 01/03/2025' -> ('tồn kho sku {CODE} ngày {DATE}', [Slot(CODE), Slot(DATE)])
+    """
+    text = (message or "").strip()
+    found: List[Tuple[int, int, str]] = []
+
+    def take(start: int, end: int, kind: str):
+        for s, e, _ in found:
+            if start < e and s < end:
+                return
+        found.append((start, end, kind))
+
+    for m in _QUOTED.finditer(text):
+        take(m.start(1), m.end(1), "NAME")
+    for rx in (_DATE_DMY, _DATE_YMD):
+        for m in rx.finditer(text):
+            take(m.start(), m.end(), "DATE")
+    for m in _CODE.finditer(text):
+        take(m.start(), m.end(), "CODE")
+    for m in _NUM.finditer(text):
+        take(m.start(), m.end(), "NUM")
+    for s, e in _name_spans(text):
+        take(s, e, "NAME")
+
+    found.sort()
+    parts: List[str] = []
+    slots: List[Slot] = []
+    pos = 0
+    for s, e, kind in found:
+        parts.append(text[pos:s].lower())
+        parts.append("{" + kind + "}")
+        slots.append(Slot(kind, text[s:e]))
+        pos = e
+    parts.append(text[pos:].lower())
+
+    tpl = re.sub(r"\s+", " ", "".join(parts)).strip().rstrip("?.!").strip()
+    return tpl, slots
+
+
+# =========================================================
+# Binding: đánh dấu giá trị nào trong plan đến từ slot nào
+# =========================================================
+@dataclass(frozen=True)
+class _Bound:
+    slot: int
+    variant: str
+    as_type: str  # int | float | str
+
+
+@dataclass(frozen=True)
+class _BoundStr:
+    # chuỗi có chứa 1 hoặc nhiều slot: [("lit", "..."), ("slot", (idx, variant)), ...]
+    pieces: Tuple[Tuple[str, Any], ...]
+
+
+def _match_exact(v: Any, slots: List[Slot]) -> Optional[_Bound]:
+    for i, sl in enumerate(slots):
+        for name, val in sl.variants().items():
+            if name == "num":
+                if isinstance(v, (int, float)) and not isinstance(v, bool) and float(v) == val:
+                    return _Bound(i, "num", "int" if isinstance(v, int) else "float")
+            elif isinstance(v, str) and v.strip() == val:
+                return _Bound(i, name, "str")
+    return None
+
+
+def _match_substr(v: str, slots: List[Slot]) -> Optional[_BoundStr]:
+    candidates: List[Tuple[int, int, int, str]] = []
+    for i, sl in enumerate(slots):
+        if sl.kind not in _SUBSTR_KINDS or len(sl.raw) < 3:
+            continue
+        for name, val in sl.variants().items():
+            if not isinstance(val, str):
+                continue
+            start = v.find(val)
+            while start != -1:
+                candidates.append((start, start + len(val), i, name))
+                start = v.find(val, start + len(val))
+    if not candidates:
+        return None
+
+    candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+    pieces: List[Tuple[str, Any]] = []
+    pos = 0
+    for s, e, i, name in candidates:
+        if s < pos:
+            continue
+        if s > pos:
+            pieces.append(("lit", v[pos:s]))
+        pieces.append(("slot", (i, name)))
+        pos = e
+    if pos < len(v):
+        pieces.append(("lit", v[pos:]))
+    return _BoundStr(tuple(pieces))
+
+
+def _bind(obj: Any, slots: List[Slot], used: set) -> Any:
+    if isinstance(obj, dict):
+        return {k: _bind(v, slots, used) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_bind(x, slots, used) for x in obj]
+
+    b = _match_exact(obj, slots)
+    if b is not None:
+        used.add(b.slot)
+        return b
+    if isinstance(obj, str):
+        bs = _match_substr(obj, slots)
+        if bs is not None:
+            used.update(p[1][0] for p in bs.pieces if p[0] == "slot")
+            return bs
+    return obj
+
+
+def _render_variant(slot: Slot, variant: str, as_type: str = "str") -> Any:
+    val = slot.variants().get(variant)
+    if val is None:
+        raise KeyError(variant)
+    if variant == "num":
+        return int(val) if as_type == "int" else float(val)
+    return val
+
+
+def _unbind(obj: Any, slots: List[Slot]) -> Any:
+    if isinstance(obj, _Bound):
+        return _render_variant(slots[obj.slot], obj.variant, obj.as_type)
+    if isinstance(obj, _BoundStr):
+        out = []
+        for kind, val in obj.pieces:
+            if kind == "lit":
+                out.append(val)
+            else:
+                idx, variant = val
+                out.append(str(_render_variant(slots[idx], variant)))
+        return "".join(out)
+    if isinstance(obj, dict):
+        return {k: _unbind(v, slots) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_unbind(x, slots) for x in obj]
+    return obj
+
+
+# =========================================================
+# LRU + TTL store
+# =========================================================
+@dataclass
+class _Entry:
+    plan: Dict[str, Any]       # plan.model_dump() với giá trị đã bind
+    slot_kinds: Tuple[str, ...]
+    created_at: float
+
+
+_LOCK = threading.Lock()
+_ENTRIES: "OrderedDict[str, _Entry]" = OrderedDict()
+_STATS: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "uncacheable": 0,
+    "evictions": 0,
+    "expired": 0,
+    "replay_errors": 0,
+}
+
+
+def _key(module: str, template: str, auth: dict, extra_hints: Optional[List[str]]) -> str:
+    today = datetime.now(ZoneInfo("Asia/Bangkok")).strftime("%Y-%m-%d")
+    hints = "\n".join(extra_hints or [])
+    raw = "|".join([
+        module,
+        str(registry_version(module)),
+        today,                      # plan có thể chứa "hôm nay/tháng này" đã quy đổi
+        str(auth.get("role") or ""),
+        hashlib.sha1(hints.encode("utf-8")).hexdigest(),
+        template,
+    ])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _bump(name: str, n: int = 1):
+    _STATS[name] = _STATS.get(name, 0) + n
+
+
+def lookup_plan(module: str, message: str, auth: dict, extra_hints: Optional[List[str]] = None) -> Optional[Plan]:
+    if not PLAN_CACHE_ENABLED:
+        return None
+
+    template, slots = templatize(message)
+    key = _key(module, template, auth, extra_hints)
+    now = time.monotonic()
+
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None:
+            _bump("misses")
+            return None
+        if now - entry.created_at > PLAN_CACHE_TTL_SECONDS:
+            _ENTRIES.pop(key, None)
+            _bump("expired")
+            _bump("misses")
+            return None
+        _ENTRIES.move_to_end(key)
+        bound = entry.plan
+        kinds = entry.slot_kinds
+
+    if tuple(s.kind for s in slots) != kinds:
+        with _LOCK:
+            _bump("misses")
+        return None
+
+    try:
+        plan = Plan.model_validate(_unbind(bound, slots))
+    except Exception:
+        with _LOCK:
+            _bump("replay_errors")
+            _bump("misses")
+        return None
+
+    with _LOCK:
+        _bump("hits")
+    return plan
+
+
+def store_plan(module: str, message: str, auth: dict, extra_hints: Optional[List[str]], plan: Plan) -> bool:
+    """
+    Chỉ cache plan "an toàn để replay":
+    - không hỏi lại, có steps
+    - mọi slot đều xuất hiện trong args (nếu không, plan có thể phụ thuộc slot theo cách ta không thấy)
+    - không có 2 slot trùng giá trị (không biết arg nào ứng với slot nào)
+    """
+    if not PLAN_CACHE_ENABLED:
+        return False
+
+    template, slots = templatize(message)
+
+    def uncacheable() -> bool:
+        with _LOCK:
+            _bump("uncacheable")
+        return False
+
+    if plan.needs_clarification or not plan.steps:
+        return uncacheable()
+    if len({s.raw.lower() for s in slots}) != len(slots):
+        return uncacheable()
+
+    used: set = set()
+    data = plan.model_dump()
+    data["steps"] = [
+        {**st, "args": _bind(st.get("args") or {}, slots, used)}
+        for st in data.get("steps") or []
+    ]
+    if used != set(range(len(slots))):
+        return uncacheable()
+
+    key = _key(module, template, auth, extra_hints)
+    with _LOCK:
+        _ENTRIES[key] = _Entry(plan=data, slot_kinds=tuple(s.kind for s in slots), created_at=time.monotonic())
+        _ENTRIES.move_to_end(key)
+        _bump("stores")
+        while len(_ENTRIES) > PLAN_CACHE_MAX_ENTRIES:
+            _ENTRIES.popitem(last=False)
+            _bump("evictions")
+    return True
+
+
+def invalidate_plan_cache() -> int:
+    with _LOCK:
+        n = len(_ENTRIES)
+        _ENTRIES.clear()
+    return n
+
+
+def plan_cache_stats() -> Dict[str, Any]:
+    with _LOCK:
+        out: Dict[str, Any] = dict(_STATS)
+        out["size"] = len(_ENTRIES)
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+    return out
@@ -37,3 +37,16 @@ def plan_route(module: str, message: str, auth: dict) -> Plan:
     # không tới đây
     from app.ai.routers.common import gemini_fallback
     return gemini_fallback(module, msg, auth)
+
+async def plan_route_async(module: str, message: str, auth: dict) -> Plan:
+    """
+    Bản async của plan_route: luật rule-based của router chạy như cũ,
+    chỉ lời gọi Gemini (gemini_fallback) được await qua client.aio.
+    """
+    from app.ai.routers.common import FallbackDeferred, defer_gemini_fallback, gemini_fallback_async
+
+    try:
+        with defer_gemini_fallback():
+            return plan_route(module, message, auth)
+    except FallbackDeferred as d:
+        return await gemini_fallback_async(d.module, d.message, d.auth, extra_hints=d.extra_hints)
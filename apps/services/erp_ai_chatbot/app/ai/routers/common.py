@@ -1,25 +1,28 @@
 # app/ai/routers/common.py
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from copy import deepcopy
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from dotenv import load_dotenv
-from google import genai
-
+from app.ai import llm_gateway
 from app.ai.plan_schema import Plan
-from app.ai.module_registry import list_tools
-from app.ai.prompts.planner_registry import get_planner_guide
-
-load_dotenv()
+from app.ai.plan_validator import validate_plan
+from app.ai.plan_cache import lookup_plan, store_plan
+from app.ai.module_registry import list_tools, registry_version
+from app.ai.prompts.planner_registry import get_planner_guide, MODULE_PLANNER_GUIDE_BUILDERS
+from app.core.audit_log import audit
+from app.core.errors import InvalidPlan
 
-_GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-_GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-_client = genai.Client(api_key=_GEMINI_API_KEY) if _GEMINI_API_KEY else genai.Client()
 
 PLAN_JSON_SCHEMA_BASE: Dict[str, Any] = {
     "type": "object",
@@ -46,14 +49,14 @@ PLAN_JSON_SCHEMA_BASE: Dict[str, Any] = {
     },
 }
 
-def schema_for_module(module: str) -> Dict[str, Any]:
+def _build_schema(module: str) -> Dict[str, Any]:
     schema = deepcopy(PLAN_JSON_SCHEMA_BASE)
     schema["properties"]["module"]["enum"] = [module]
     tool_names = [t.ten_tool for t in list_tools(module)]
     schema["properties"]["steps"]["items"]["properties"]["tool"]["enum"] = tool_names
     return schema
 
-def tool_catalog(module: str) -> str:
+def _build_catalog(module: str) -> str:
     tools = list_tools(module)
     if not tools:
         return "(module chưa có tools)"
@@ -67,16 +70,14 @@ def tool_catalog(module: str) -> str:
         lines.append(f"- {t.ten_tool}: {t.mo_ta} | args: {', '.join(fields)}")
     return "\n".join(lines)
 
-def build_system_instruction(module: str, auth: dict, extra_hints: Optional[List[str]] = None) -> str:
-    now = datetime.now(ZoneInfo("Asia/Bangkok")).strftime("%Y-%m-%d")
-
+def _build_static_prefix(module: str, today: str, catalog: str) -> str:
+    # Phần KHÔNG phụ thuộc request (chỉ đổi theo ngày / registry) -> dùng được cho context caching
     parts: List[str] = []
     parts.append("Bạn là Router/Planner cho chatbot ERP. Bạn KHÔNG trả lời người dùng trực tiếp.")
     parts.append("Bạn CHỈ xuất 1 PLAN JSON theo schema (response_json_schema). Không thêm text ngoài JSON.")
     parts.append("")
-    parts.append(f"Ngày hệ thống: {now} (Asia/Bangkok). Dùng để hiểu 'hôm nay/tháng này'.")
+    parts.append(f"Ngày hệ thống: {today} (Asia/Bangkok). Dùng để hiểu 'hôm nay/tháng này'.")
     parts.append(f"Module hiện tại: {module}")
-    parts.append(f"Role: {auth.get('role')}")
     parts.append("")
 
     parts.append("Quy tắc bắt buộc:")
@@ -93,31 +94,166 @@ def build_system_instruction(module: str, auth: dict, extra_hints: Optional[List
         parts.append(guide)
         parts.append("")
 
+    parts.append("Tools khả dụng:")
+    parts.append(catalog)
+    return "\n".join(parts)
+
+# =========================================================
+# Prompt artifacts per module (build 1 lần, rebuild khi đổi ngày / registry)
+# =========================================================
+@dataclass(frozen=True)
+class PromptArtifacts:
+    module: str
+    today: str
+    registry_version: int
+    static_prefix: str
+    catalog: str
+    schema: Dict[str, Any]  # dùng chung giữa các request -> KHÔNG sửa trực tiếp
+
+_ARTIFACTS: Dict[str, PromptArtifacts] = {}
+_ARTIFACTS_LOCK = threading.Lock()
+
+def _today() -> str:
+    return datetime.now(ZoneInfo("Asia/Bangkok")).strftime("%Y-%m-%d")
+
+def get_prompt_artifacts(module: str) -> PromptArtifacts:
+    today = _today()
+    version = registry_version(module)
+    art = _ARTIFACTS.get(module)
+    if art is not None and art.today == today and art.registry_version == version:
+        return art
+
+    with _ARTIFACTS_LOCK:
+        art = _ARTIFACTS.get(module)
+        if art is not None and art.today == today and art.registry_version == version:
+            return art
+        catalog = _build_catalog(module)
+        art = PromptArtifacts(
+            module=module,
+            today=today,
+            registry_version=version,
+            static_prefix=_build_static_prefix(module, today, catalog),
+            catalog=catalog,
+            schema=_build_schema(module),
+        )
+        _ARTIFACTS[module] = art
+        return art
+
+def warmup_prompt_artifacts(modules: Optional[List[str]] = None) -> Dict[str, int]:
+    """Gọi lúc startup: load tools + build prompt/schema cho từng module. Trả về độ dài prefix."""
+    out: Dict[str, int] = {}
+    for m in modules or list(MODULE_PLANNER_GUIDE_BUILDERS.keys()):
+        out[m] = len(get_prompt_artifacts(m).static_prefix)
+    return out
+
+def schema_for_module(module: str) -> Dict[str, Any]:
+    return get_prompt_artifacts(module).schema
+
+def tool_catalog(module: str) -> str:
+    return get_prompt_artifacts(module).catalog
+
+def _dynamic_suffix(auth: dict, extra_hints: Optional[List[str]] = None) -> str:
+    # Phần phụ thuộc request: đặt SAU static prefix để prefix giữ nguyên giữa các request
+    parts: List[str] = ["", f"Role: {auth.get('role')}"]
     if extra_hints:
+        parts.append("")
         parts.append("Gợi ý bổ sung (extra_hints):")
         parts.extend([f"- {h}" for h in extra_hints])
-        parts.append("")
-
-    parts.append("Tools khả dụng:")
-    parts.append(tool_catalog(module))
     return "\n".join(parts)
 
-def gemini_fallback(module: str, message: str, auth: dict, extra_hints: Optional[List[str]] = None) -> Plan:
-    msg = (message or "").strip()
-    sys = build_system_instruction(module, auth, extra_hints=extra_hints)
-    schema = schema_for_module(module)
-
-    resp = _client.models.generate_content(
-        model=_GEMINI_MODEL,
-        contents=f"USER_MESSAGE:\n{msg}",
-        config={
-            "system_instruction": sys,
-            "temperature": 0.0,
-            "response_mime_type": "application/json",
-            "response_json_schema": schema,
-        },
-    )
+def build_system_instruction(module: str, auth: dict, extra_hints: Optional[List[str]] = None) -> str:
+    return get_prompt_artifacts(module).static_prefix + "\n" + _dynamic_suffix(auth, extra_hints)
+
+# =========================================================
+# Gemini context caching cho static prefix (tuỳ chọn)
+# - Cache theo (module, ngày, registry_version); hết hạn/lỗi -> gọi thường
+# =========================================================
+PLANNER_CONTEXT_CACHE = os.getenv("PLANNER_CONTEXT_CACHE", "0") == "1"
+PLANNER_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("PLANNER_CONTEXT_CACHE_TTL_SECONDS", "3600"))
 
+_CONTEXT_CACHES: Dict[tuple, tuple] = {}  # key -> (cache_name | None, expires_at)
+
+def _context_cache_name(art: PromptArtifacts) -> Optional[str]:
+    if not PLANNER_CONTEXT_CACHE:
+        return None
+    key = (art.module, art.today, art.registry_version)
+    now = time.time()
+    hit = _CONTEXT_CACHES.get(key)
+    # chừa 60s để không dùng cache sắp hết hạn
+    if hit is not None and hit[1] - 60 > now:
+        return hit[0]
+
+    with _ARTIFACTS_LOCK:
+        hit = _CONTEXT_CACHES.get(key)
+        if hit is not None and hit[1] - 60 > now:
+            return hit[0]
+        try:
+            cache = llm_gateway.create_cache(
+                "plan",
+                config={
+                    "display_name": f"planner-{art.module}-{art.today}-v{art.registry_version}",
+                    "system_instruction": art.static_prefix,
+                    "ttl": f"{PLANNER_CONTEXT_CACHE_TTL_SECONDS}s",
+                },
+            )
+        except Exception as e:
+            # prefix ngắn hơn ngưỡng tối thiểu / model không hỗ trợ -> nhớ kết quả, gọi thường
+            audit({"event": "planner_context_cache_failed", "module": art.module, "error": str(e)})
+            _CONTEXT_CACHES[key] = (None, now + PLANNER_CONTEXT_CACHE_TTL_SECONDS)
+            return None
+        _CONTEXT_CACHES[key] = (cache.name, now + PLANNER_CONTEXT_CACHE_TTL_SECONDS)
+        return cache.name
+
+def _plan_requests(module: str, msg: str, auth: dict, extra_hints: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Các request generate_content theo thứ tự thử: [cached_content (nếu có), system_instruction thường]."""
+    art = get_prompt_artifacts(module)
+    base_config = {
+        "temperature": 0.0,
+        "response_mime_type": "application/json",
+        "response_json_schema": art.schema,
+    }
+    reqs: List[Dict[str, Any]] = []
+
+    cache_name = _context_cache_name(art)
+    if cache_name:
+        # static prefix nằm trong cached content; phần động đi kèm message
+        reqs.append({
+            "model": llm_gateway.model_for("plan"),
+            "contents": f"{_dynamic_suffix(auth, extra_hints).strip()}\n\nUSER_MESSAGE:\n{msg}",
+            "config": {**base_config, "cached_content": cache_name},
+        })
+    reqs.append({
+        "model": llm_gateway.model_for("plan"),
+        "contents": f"USER_MESSAGE:\n{msg}",
+        "config": {**base_config, "system_instruction": build_system_instruction(module, auth, extra_hints=extra_hints)},
+    })
+    return reqs
+
+def _context_cache_failed(module: str, e: Exception):
+    audit({"event": "planner_context_cache_miss", "module": module, "error": str(e)})
+    art = get_prompt_artifacts(module)
+    _CONTEXT_CACHES.pop((art.module, art.today, art.registry_version), None)
+
+def _generate_plan_response(module: str, msg: str, auth: dict, extra_hints: Optional[List[str]]):
+    reqs = _plan_requests(module, msg, auth, extra_hints)
+    for req in reqs[:-1]:
+        try:
+            return llm_gateway.generate("plan", **req)
+        except Exception as e:
+            _context_cache_failed(module, e)
+    return llm_gateway.generate("plan", **reqs[-1])
+
+async def _generate_plan_response_async(module: str, msg: str, auth: dict, extra_hints: Optional[List[str]]):
+    # tạo cached content (nếu bật) là call sync hiếm (1 lần/ngày/module) -> đẩy ra thread
+    reqs = await asyncio.to_thread(_plan_requests, module, msg, auth, extra_hints)
+    for req in reqs[:-1]:
+        try:
+            return await llm_gateway.agenerate("plan", **req)
+        except Exception as e:
+            _context_cache_failed(module, e)
+    return await llm_gateway.agenerate("plan", **reqs[-1])
+
+def _plan_from_response(module: str, msg: str, auth: dict, extra_hints: Optional[List[str]], resp) -> Plan:
     text = (resp.text or "").strip()
     if not text:
         return Plan(
@@ -153,4 +289,64 @@ def gemini_fallback(module: str, message: str, auth: dict, extra_hints: Optional
     if plan.needs_clarification:
         plan = plan.model_copy(update={"steps": []})
 
+    if not plan.needs_clarification:
+        try:
+            validate_plan(plan)
+            store_plan(module, msg, auth, extra_hints, plan)
+        except InvalidPlan:
+            pass
+
     return plan
+
+def _cached_plan(module: str, msg: str, auth: dict, extra_hints: Optional[List[str]]) -> Optional[Plan]:
+    # plan cache theo template (mã/ngày/số/tên đã thay bằng slot) -> bỏ qua LLM
+    cached = lookup_plan(module, msg, auth, extra_hints)
+    if cached is not None:
+        audit({"event": "plan_cache_hit", "module": module, "intent": cached.intent, "steps": len(cached.steps)})
+    return cached
+
+# =========================================================
+# Async: router rule-based chạy y nguyên (CPU, không I/O); riêng bước gemini_fallback
+# được "hoãn" lại để await bằng client.aio (xem app/ai/router.plan_route_async)
+# =========================================================
+_DEFER_FALLBACK: ContextVar[bool] = ContextVar("_DEFER_FALLBACK", default=False)
+
+class FallbackDeferred(Exception):
+    def __init__(self, module: str, message: str, auth: dict, extra_hints: Optional[List[str]]):
+        super().__init__(module)
+        self.module = module
+        self.message = message
+        self.auth = auth
+        self.extra_hints = extra_hints
+
+@contextmanager
+def defer_gemini_fallback():
+    token = _DEFER_FALLBACK.set(True)
+    try:
+        yield
+    finally:
+        _DEFER_FALLBACK.reset(token)
+
+def gemini_fallback(module: str, message: str, auth: dict, extra_hints: Optional[List[str]] = None) -> Plan:
+    msg = (message or "").strip()
+
+    cached = _cached_plan(module, msg, auth, extra_hints)
+    if cached is not None:
+        return cached
+
+    if _DEFER_FALLBACK.get():
+        # router luôn "return gemini_fallback(...)" ở cuối -> an toàn khi thoát bằng exception
+        raise FallbackDeferred(module, msg, auth, extra_hints)
+
+    resp = _generate_plan_response(module, msg, auth, extra_hints)
+    return _plan_from_response(module, msg, auth, extra_hints, resp)
+
+async def gemini_fallback_async(module: str, message: str, auth: dict, extra_hints: Optional[List[str]] = None) -> Plan:
+    msg = (message or "").strip()
+
+    cached = _cached_plan(module, msg, auth, extra_hints)
+    if cached is not None:
+        return cached
+
+    resp = await _generate_plan_response_async(module, msg, auth, extra_hints)
+    return _plan_from_response(module, msg, auth, extra_hints, resp)
@@ -0,0 +1,147 @@
+# app/ai/tool_cache.py
+from __future__ import annotations
+
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.ai.answer_cache import data_version
+from app.ai.tooling import ToolSpec
+
+# =========================================================
+# Cache kết quả tool read-only theo ToolSpec.cache (ToolCachePolicy)
+# - Key: args sau validate (có default) -> chỉ lấy key_fields; chuỗi chỉ strip() như handler
+#   (giữ khoảng trắng bên trong: ilike "a  b" khác "a b"), casefold nếu khai báo casefold_fields
+#   + version dữ liệu module (tool ghi chạy xong -> key cũ không còn khớp)
+# - Chỉ cache kết quả ok=True (không cache "không tìm thấy" / hỏi lại)
+# - LRU + TTL riêng từng tool, thống kê hit rate theo tool
+# - Flush: POST /api/v1/admin/tool-cache/flush
+# =========================================================
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "1") == "1"
+
+
+class _ToolCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+
+_LOCK = threading.Lock()
+_CACHES: Dict[Tuple[str, str], _ToolCache] = {}
+_MISS = object()
+
+
+def _cache_for(tool: ToolSpec) -> _ToolCache:
+    name = (tool.module, tool.ten_tool)
+    c = _CACHES.get(name)
+    if c is None:
+        c = _CACHES[name] = _ToolCache(tool.cache.max_entries)
+    return c
+
+
+def _norm(v: Any, casefold: bool) -> Any:
+    if isinstance(v, str):
+        v = v.strip()
+        return v.casefold() if casefold else v
+    return v
+
+
+def cache_key(tool: ToolSpec, args: Dict[str, Any]) -> Optional[str]:
+    """None = args không hợp lệ (để tool tự báo lỗi, không cache)."""
+    policy = tool.cache
+    try:
+        parsed = tool.args_model.model_validate(args).model_dump(mode="json")
+    except Exception:
+        return None
+    fields = policy.key_fields if policy.key_fields is not None else sorted(parsed)
+    key_args = {f: _norm(parsed.get(f), f in policy.casefold_fields) for f in fields}
+    return json.dumps([data_version(tool.module), key_args], sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _cacheable(tool: ToolSpec) -> bool:
+    return TOOL_CACHE_ENABLED and tool.cache is not None and tool.read_only and tool.cache.ttl_s > 0
+
+
+def get(tool: ToolSpec, key: str) -> Any:
+    now = time.monotonic()
+    with _LOCK:
+        c = _cache_for(tool)
+        hit = c.entries.get(key)
+        if hit is not None and hit[0] < now:
+            c.entries.pop(key, None)
+            c.stats["expired"] += 1
+            hit = None
+        if hit is None:
+            c.stats["misses"] += 1
+            return _MISS
+        c.entries.move_to_end(key)
+        c.stats["hits"] += 1
+        value = hit[1]
+    # kết quả có thể bị sửa ở step sau (store / normalize) -> trả bản sao
+    return copy.deepcopy(value)
+
+
+def put(tool: ToolSpec, key: str, result: Any) -> None:
+    if not (isinstance(result, dict) and result.get("ok") is True):
+        return
+    value = copy.deepcopy(result)
+    with _LOCK:
+        c = _cache_for(tool)
+        c.entries[key] = (time.monotonic() + tool.cache.ttl_s, value)
+        c.entries.move_to_end(key)
+        c.stats["stores"] += 1
+        while len(c.entries) > c.max_entries:
+            c.entries.popitem(last=False)
+            c.stats["evictions"] += 1
+
+
+def cached_call(tool: ToolSpec, args: Dict[str, Any], call: Callable[[], Any]) -> Any:
+    key = cache_key(tool, args) if _cacheable(tool) else None
+    if key is None:
+        return call()
+    hit = get(tool, key)
+    if hit is not _MISS:
+        return hit
+    result = call()
+    put(tool, key, result)
+    return result
+
+
+async def cached_call_async(tool: ToolSpec, args: Dict[str, Any], call: Callable[[], Awaitable[Any]]) -> Any:
+    key = cache_key(tool, args) if _cacheable(tool) else None
+    if key is None:
+        return await call()
+    hit = get(tool, key)
+    if hit is not _MISS:
+        return hit
+    result = await call()
+    put(tool, key, result)
+    return result
+
+
+def flush_tool_cache(module: Optional[str] = None, tool: Optional[str] = None) -> int:
+    n = 0
+    with _LOCK:
+        for (m, t), c in _CACHES.items():
+            if (module is None or m == module) and (tool is None or t == tool):
+                n += len(c.entries)
+                c.entries.clear()
+    return n
+
+
+def tool_cache_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    with _LOCK:
+        for (m, t), c in sorted(_CACHES.items()):
+            s: Dict[str, Any] = dict(c.stats)
+            s["size"] = len(c.entries)
+            lookups = s["hits"] + s["misses"]
+            s["hit_rate"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+            out[f"{m}.{t}"] = s
+    return out
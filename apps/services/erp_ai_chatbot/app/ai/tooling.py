@@ -1,8 +1,21 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Callable, Type, Any, Dict, Optional
+from typing import Callable, Type, Any, Dict, Optional, Tuple
 from pydantic import BaseModel
 
+# Lớp TTL cache câu trả lời (ToolSpec.cache_ttl_s) cho tool đọc dữ liệu đổi nhanh;
+# tool không gán lớp nào dùng TTL mặc định của module (answer_cache.MODULE_TTL_SECONDS)
+TTL_STOCK = 15.0     # tồn kho / số lượng khả dụng: đổi theo từng phiếu nhập/xuất, đơn giữ hàng
+TTL_STATUS = 30.0    # trạng thái đơn / thanh toán / chứng từ, số dư công nợ
+
+@dataclass(frozen=True)
+class ToolCachePolicy:
+    """Cache kết quả tool read-only (xem app/ai/tool_cache.py)."""
+    ttl_s: float
+    key_fields: Optional[Tuple[str, ...]] = None   # None = mọi arg (sau validate + default)
+    max_entries: int = 256
+    casefold_fields: Tuple[str, ...] = ()          # arg tra cứu không phân biệt hoa/thường (ilike)
+
 @dataclass(frozen=True)
 class ToolSpec:
     ten_tool: str                     
@@ -11,6 +24,12 @@ class ToolSpec:
     handler: Callable[..., Dict[str, Any]]
     module: str                       
     read_only: bool = True
+    # TTL cache câu trả lời (giây); None = mặc định theo module, 0 = không cache
+    cache_ttl_s: Optional[float] = None
+    # cache kết quả tool (chỉ áp cho read_only=True)
+    cache: Optional[ToolCachePolicy] = None
+    # ngân sách số câu SQL / lần gọi (app/db/query_stats.py); None = TOOL_QUERY_BUDGET
+    max_queries: Optional[int] = None
 
 def ok(data=None, thong_diep: str = "", answer: str | None = None, **extra):
     out = {"ok": True, "data": data, "thong_diep": thong_diep}
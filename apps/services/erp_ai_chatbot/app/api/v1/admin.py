@@ -0,0 +1,47 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.ai.answer_cache import bump_data_version
+from app.ai.router import VALID_MODULES
+from app.ai.tool_cache import flush_tool_cache, tool_cache_stats
+
+# ADMIN_TOKEN đặt -> bắt buộc header X-Admin-Token khớp; không đặt -> tắt endpoint admin (404)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+router = APIRouter()
+
+
+def _check_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # so sánh thời gian hằng, không lộ độ dài prefix khớp qua timing
+    if not token or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="admin token không hợp lệ")
+
+
+class FlushToolCacheRequest(BaseModel):
+    module: Optional[str] = None
+    tool: Optional[str] = None
+
+
+@router.get("/admin/tool-cache")
+def tool_cache(x_admin_token: Optional[str] = Header(default=None)):
+    # hit rate / size cache kết quả theo từng tool danh mục
+    _check_admin(x_admin_token)
+    return JSONResponse(content={"tools": tool_cache_stats()}, media_type="application/json; charset=utf-8")
+
+
+@router.post("/admin/tool-cache/flush")
+def tool_cache_flush(req: FlushToolCacheRequest, x_admin_token: Optional[str] = Header(default=None)):
+    # xoá cache sau khi sửa danh mục trực tiếp trên ERP (ngoài chatbot)
+    _check_admin(x_admin_token)
+    removed = flush_tool_cache(module=req.module, tool=req.tool)
+    # dữ liệu đã đổi ngoài chatbot -> answer/plan cache dựng trên kết quả cũ cũng phải bỏ
+    for module in [req.module] if req.module else sorted(VALID_MODULES):
+        bump_data_version(module)
+    return JSONResponse(content={"removed": removed}, media_type="application/json; charset=utf-8")
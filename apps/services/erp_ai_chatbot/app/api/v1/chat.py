@@ -1,10 +1,17 @@
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import queue
+import threading
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 
 from app.ai.executor.executor_chat import execute_chat_unified
-from app.ai.module_detector import detect_module_llm
+from app.ai.executor.executor_async import execute_chat_unified_async
+from app.ai.events import ChatCancelled
+from app.ai.module_detector import detect_module, detect_module_async
 
 router = APIRouter()
 
@@ -23,7 +30,7 @@ class ChatRequest(BaseModel):
 def chat(req: ChatRequest):
     # ✅ chỉ chạy detector, không chạy executor/tools/compose
     if req.detect_only:
-        det = detect_module_llm(message=req.message, role=req.role)
+        det = detect_module(message=req.message, role=req.role)
         return JSONResponse(content=jsonable_encoder(det), media_type="application/json; charset=utf-8")
 
     result = execute_chat_unified(
@@ -36,3 +43,90 @@ def chat(req: ChatRequest):
         debug=req.debug,
     )
     return JSONResponse(content=jsonable_encoder(result), media_type="application/json; charset=utf-8")
+
+
+@router.post("/chat/async")
+async def chat_async(req: ChatRequest):
+    # cùng contract với /chat nhưng chạy trên event loop (Gemini aio + AsyncSession)
+    if req.detect_only:
+        det = await detect_module_async(message=req.message, role=req.role)
+        return JSONResponse(content=jsonable_encoder(det), media_type="application/json; charset=utf-8")
+
+    result = await execute_chat_unified_async(
+        module=req.module,
+        user_id=req.user_id,
+        role=req.role,
+        message=req.message,
+        compose_enabled=req.compose,
+        debug=req.debug,
+    )
+    return JSONResponse(content=jsonable_encoder(result), media_type="application/json; charset=utf-8")
+
+_STREAM_DONE = object()
+# chu kỳ kiểm tra client còn kết nối khi chưa có event mới
+_STREAM_POLL_S = 0.5
+
+def _sse(event: str, payload) -> str:
+    data = json.dumps(jsonable_encoder(payload), ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """
+    SSE: module -> plan -> tool_result (mỗi step) -> answer_delta (token composer) -> done.
+    answer_delta chỉ là bản nháp đang sinh; answer chuẩn (sau safety check) nằm trong event done.
+    answer_reset: composer chạy lại -> client xoá các answer_delta đã nhận.
+    Client ngắt kết nối -> worker dừng ở lần emit kế tiếp (ChatCancelled), không sinh tiếp token.
+    """
+    events: "queue.Queue" = queue.Queue()
+    cancelled = threading.Event()
+
+    def sink(event: str, payload):
+        if cancelled.is_set():
+            raise ChatCancelled()
+        events.put((event, payload))
+
+    def run():
+        try:
+            result = execute_chat_unified(
+                module=req.module,
+                user_id=req.user_id,
+                role=req.role,
+                message=req.message,
+                paraphrase_enabled=req.paraphrase,
+                compose_enabled=req.compose,
+                debug=req.debug,
+                on_event=sink,
+            )
+            events.put(("done", result))
+        except ChatCancelled:
+            pass
+        except Exception as e:
+            events.put(("error", {"error": type(e).__name__, "message": str(e)}))
+        finally:
+            events.put(_STREAM_DONE)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    async def gen():
+        try:
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    item = await asyncio.to_thread(events.get, True, _STREAM_POLL_S)
+                except queue.Empty:
+                    continue
+                if item is _STREAM_DONE:
+                    break
+                event, payload = item
+                yield _sse(event, payload)
+        finally:
+            # ngắt giữa chừng (is_disconnected / server huỷ generator) -> báo worker dừng
+            cancelled.set()
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,8 +1,39 @@
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.ai.answer_cache import answer_cache_stats
+from app.ai.plan_cache import plan_cache_stats
+from app.ai.tool_cache import tool_cache_stats
+from app.core.telemetry import render_metrics
+from app.db.common import pool_stats
 
 router = APIRouter()
 
 @router.get("/health")
 def health():
     return JSONResponse(content={"status": "ok"}, media_type="application/json; charset=utf-8")
+
+
+@router.get("/health/db")
+def health_db():
+    # metrics pool connection theo DB: chờ checkout, số connection đang dùng, overflow...
+    return JSONResponse(content={"pools": pool_stats()}, media_type="application/json; charset=utf-8")
+
+
+@router.get("/health/cache")
+def health_cache():
+    # hit rate / size của answer cache (câu trả lời), plan cache (plan theo mẫu câu), tool cache (danh mục)
+    return JSONResponse(
+        content={
+            "answer_cache": answer_cache_stats(),
+            "plan_cache": plan_cache_stats(),
+            "tool_cache": tool_cache_stats(),
+        },
+        media_type="application/json; charset=utf-8",
+    )
+
+
+@router.get("/metrics")
+def metrics():
+    # Prometheus text format: histogram thời gian theo pha / call Gemini, token + chi phí ước lượng
+    return PlainTextResponse(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
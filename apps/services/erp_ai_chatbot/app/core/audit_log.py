@@ -1,8 +1,301 @@
+# app/core/audit_log.py
+from __future__ import annotations
+
+import atexit
 import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# =========================================================
+# Audit log bất đồng bộ:
+# - audit() trên request path chụp snapshot event (copy nông + copy giới hạn các field dict/list lớn),
+#   gắn ts + level rồi đẩy vào queue (không json.dumps, không I/O)
+# - thread nền gom batch (AUDIT_BATCH_SIZE / AUDIT_FLUSH_INTERVAL_S), serialize, cắt payload lớn
+#   rồi ghi ra sink: stdout | file (JSONL) | db (bảng chatbot_audit_log)
+# - queue đầy -> bỏ event + đếm dropped (audit không bao giờ chặn request)
+# - level theo event: tool_call/tool_result/plan_created = debug, *_failed/*_mismatch = warning
+# =========================================================
+
+AUDIT_SINK = os.getenv("AUDIT_SINK", "stdout").strip().lower()
+AUDIT_FILE = os.getenv("AUDIT_FILE", "audit.log.jsonl")
+AUDIT_DATABASE_URL = os.getenv("AUDIT_DATABASE_URL")
+AUDIT_LEVEL = os.getenv("AUDIT_LEVEL", "debug").strip().lower()
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL_S = float(os.getenv("AUDIT_FLUSH_INTERVAL_S", "0.5"))
+# field (args/result/plan...) serialize dài hơn ngưỡng -> thay bằng preview + kích thước
+AUDIT_MAX_FIELD_CHARS = int(os.getenv("AUDIT_MAX_FIELD_CHARS", "4000"))
+AUDIT_PREVIEW_CHARS = int(os.getenv("AUDIT_PREVIEW_CHARS", "500"))
+# tỉ lệ giữ lại event có payload lớn (1.0 = giữ hết, đã cắt)
+AUDIT_LARGE_SAMPLE_RATE = float(os.getenv("AUDIT_LARGE_SAMPLE_RATE", "1.0"))
+# snapshot lúc enqueue: tối đa bấy nhiêu phần tử dict/list được copy / event, phần còn lại bị cắt
+AUDIT_SNAPSHOT_MAX_ITEMS = int(os.getenv("AUDIT_SNAPSHOT_MAX_ITEMS", "2000"))
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+_EVENT_LEVELS = {
+    "tool_call": "debug",
+    "tool_result": "debug",
+    "plan_created": "debug",
+    "plan_cache_hit": "debug",
+}
+
+
+def event_level(event: Dict[str, Any]) -> str:
+    name = str(event.get("event") or "")
+    if name in _EVENT_LEVELS:
+        return _EVENT_LEVELS[name]
+    if name.endswith(("_failed", "_mismatch", "_error")):
+        return "warning"
+    return "info"
+
+
+# ---------- sink ----------
+class AuditSink:
+    """Nhận 1 batch dòng JSON đã serialize (chạy trên thread nền)."""
+
+    def write_batch(self, records: List[Dict[str, Any]], lines: List[str]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class StdoutSink(AuditSink):
+    def write_batch(self, records, lines):
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
+class FileSink(AuditSink):
+    def __init__(self, path: str):
+        self._f = open(path, "a", encoding="utf-8")
+
+    def write_batch(self, records, lines):
+        self._f.write("\n".join(lines) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class DbSink(AuditSink):
+    """INSERT nhiều dòng / batch vào bảng chatbot_audit_log (tự tạo nếu chưa có)."""
+
+    def __init__(self, db_url: str):
+        from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, create_engine
+
+        # chỉ thread writer dùng -> 1 connection là đủ
+        kwargs = {} if db_url.startswith("sqlite") else {"pool_pre_ping": True, "pool_size": 1, "max_overflow": 0}
+        self._engine = create_engine(db_url, **kwargs)
+        meta = MetaData()
+        self._table = Table(
+            "chatbot_audit_log", meta,
+            Column("id", Integer, primary_key=True, autoincrement=True),
+            Column("ts", DateTime, nullable=False),
+            Column("event", String(100), index=True),
+            Column("level", String(10)),
+            Column("payload", Text),
+        )
+        meta.create_all(self._engine, checkfirst=True)
+
+    def write_batch(self, records, lines):
+        rows = [
+            {
+                "ts": datetime.fromisoformat(r["ts"]),
+                "event": str(r.get("event") or "")[:100],
+                "level": r.get("level"),
+                "payload": line,
+            }
+            for r, line in zip(records, lines)
+        ]
+        with self._engine.begin() as conn:
+            conn.execute(self._table.insert(), rows)
+
+    def close(self):
+        self._engine.dispose()
+
+
+def _make_sink() -> AuditSink:
+    if AUDIT_SINK == "file":
+        return FileSink(AUDIT_FILE)
+    if AUDIT_SINK == "db" and AUDIT_DATABASE_URL:
+        return DbSink(AUDIT_DATABASE_URL)
+    return StdoutSink()
+
 
-def audit(event: dict):
-    # MVP: print; production: ghi DB/log system
+# ---------- serialize + cắt payload lớn ----------
+def _dumps(v: Any) -> str:
+    return json.dumps(v, ensure_ascii=False, default=str)
+
+
+def serialize_event(event: Dict[str, Any]) -> Optional[str]:
+    """JSON 1 dòng; field quá AUDIT_MAX_FIELD_CHARS bị thay bằng preview. None = bị sample bỏ."""
+    out: Dict[str, Any] = {}
+    truncated = False
+    for k, v in event.items():
+        if isinstance(v, (dict, list, tuple, str)):
+            raw = v if isinstance(v, str) else _dumps(v)
+            if len(raw) > AUDIT_MAX_FIELD_CHARS:
+                truncated = True
+                out[k] = {"_truncated": True, "chars": len(raw), "preview": raw[:AUDIT_PREVIEW_CHARS]}
+                continue
+        out[k] = v
+
+    if truncated:
+        if AUDIT_LARGE_SAMPLE_RATE < 1.0 and random.random() >= AUDIT_LARGE_SAMPLE_RATE:
+            return None
+        out["truncated"] = True
+    return _dumps(out)
+
+
+# ---------- snapshot lúc enqueue ----------
+def _snapshot(v: Any, budget: List[int]) -> Any:
+    # thread nền serialize sau: request có thể sửa tiếp args/result/plan/step_infos -> copy container,
+    # giá trị lá giữ nguyên; hết budget -> marker thay cho phần còn lại
+    if not isinstance(v, (dict, list, tuple)):
+        return v
+    items = list(v.items()) if isinstance(v, dict) else list(v)
+    keep = max(0, min(len(items), budget[0]))
+    budget[0] -= keep
+    more = len(items) - keep
+    if isinstance(v, dict):
+        out = {k: _snapshot(x, budget) for k, x in items[:keep]}
+        if more:
+            out["_more_items"] = more
+        return out
+    lst = [_snapshot(x, budget) for x in items[:keep]]
+    if more:
+        lst.append({"_more_items": more})
+    return lst
+
+
+def snapshot_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    budget = [AUDIT_SNAPSHOT_MAX_ITEMS]
+    return {k: _snapshot(v, budget) for k, v in event.items()}
+
+
+# ---------- writer nền ----------
+class AuditWriter:
+    def __init__(self, sink_factory=_make_sink, maxsize: int = AUDIT_QUEUE_SIZE):
+        self._sink_factory = sink_factory
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._sink: Optional[AuditSink] = None
+        self.dropped = 0
+        self.written = 0
+        self.sampled_out = 0
+
+    def submit(self, event: Dict[str, Any]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Chờ ghi hết các event đã nhận (shutdown / test)."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put({"_flush": done}, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                t = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                t.start()
+                self._thread = t
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL_S
+            while len(batch) < AUDIT_BATCH_SIZE and "_flush" not in batch[-1]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        records: List[Dict[str, Any]] = []
+        lines: List[str] = []
+        flushes = []
+        for ev in batch:
+            if "_flush" in ev:
+                flushes.append(ev["_flush"])
+                continue
+            try:
+                line = serialize_event(ev)
+            except Exception as e:
+                line = _dumps({"event": "audit_serialize_failed", "ts": ev.get("ts"), "error": str(e)})
+            if line is None:
+                self.sampled_out += 1
+                continue
+            records.append(ev)
+            lines.append(line)
+
+        if lines:
+            try:
+                if self._sink is None:
+                    self._sink = self._sink_factory()
+                self._sink.write_batch(records, lines)
+                self.written += len(lines)
+            except Exception as e:
+                # sink lỗi (DB down...) -> ghi stderr, không làm chết writer
+                sys.stderr.write(f"audit sink error: {e}; dropped {len(lines)} events\n")
+                with self._lock:
+                    self.dropped += len(lines)
+        for done in flushes:
+            done.set()
+
+
+_WRITER = AuditWriter()
+
+
+def audit(event: dict, level: Optional[str] = None):
+    level = (level or event_level(event)).lower()
+    if LEVELS.get(level, 20) < LEVELS.get(AUDIT_LEVEL, 10):
+        return
+    event = snapshot_event(event)
     event["ts"] = datetime.utcnow().isoformat()
-    print(json.dumps(event, ensure_ascii=False, default=str))
+    event["level"] = level
+    _WRITER.submit(event)
+
+
+def flush_audit(timeout: float = 5.0) -> None:
+    _WRITER.flush(timeout)
+
+
+def audit_stats() -> Dict[str, Any]:
+    return _WRITER.stats()
+
 
+atexit.register(flush_audit, 2.0)
@@ -1,4 +1,5 @@
 import os
+from dataclasses import dataclass
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -6,12 +7,48 @@ from dotenv import load_dotenv
 ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
 load_dotenv(dotenv_path=ENV_PATH, override=True)
 
+@dataclass(frozen=True)
+class DbPoolSettings:
+    size: int = 5
+    max_overflow: int = 10
+    recycle_s: int = 1800
+    timeout_s: float = 30.0
+    statement_timeout_ms: int = 0   # 0 = không giới hạn
+    warmup: int = 2                 # số connection mở sẵn lúc startup (chỉ DB trong WARMUP_MODULES)
+
+def _env(prefix: str, key: str, default):
+    # HRM_DB_POOL_SIZE > DB_POOL_SIZE > mặc định
+    raw = os.getenv(f"{prefix}_{key}", os.getenv(key))
+    if raw is None or not raw.strip():
+        return default
+    return type(default)(raw)
+
+def _db_pool(prefix: str) -> DbPoolSettings:
+    d = DbPoolSettings()
+    return DbPoolSettings(
+        size=_env(prefix, "DB_POOL_SIZE", d.size),
+        max_overflow=_env(prefix, "DB_POOL_MAX_OVERFLOW", d.max_overflow),
+        recycle_s=_env(prefix, "DB_POOL_RECYCLE_S", d.recycle_s),
+        timeout_s=_env(prefix, "DB_POOL_TIMEOUT_S", d.timeout_s),
+        statement_timeout_ms=_env(prefix, "DB_STATEMENT_TIMEOUT_MS", d.statement_timeout_ms),
+        warmup=_env(prefix, "DB_POOL_WARMUP", d.warmup),
+    )
+
 class Settings:
     HRM_DATABASE_URL = os.getenv("HRM_DATABASE_URL")
     SALE_CRM_DATABASE_URL = os.getenv("SALE_CRM_DATABASE_URL")
     FINANCE_DATABASE_URL = os.getenv("FINANCE_DATABASE_URL")
     SUPPLY_CHAIN_DATABASE_URL = os.getenv("SUPPLY_CHAIN_DATABASE_URL")
 
+    # Pool theo từng DB (env: <PREFIX>_DB_POOL_SIZE, ... hoặc DB_POOL_SIZE dùng chung)
+    HRM_DB_POOL = _db_pool("HRM")
+    SALE_CRM_DB_POOL = _db_pool("SALE_CRM")
+    FINANCE_DB_POOL = _db_pool("FINANCE")
+    SUPPLY_CHAIN_DB_POOL = _db_pool("SUPPLY_CHAIN")
+
+    # DB tạo engine + mở sẵn connection lúc startup (vd "hrm,sale_crm"); mặc định rỗng = tất cả lười
+    WARMUP_MODULES = [m.strip() for m in os.getenv("WARMUP_MODULES", "").split(",") if m.strip()]
+
     # Gemini
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
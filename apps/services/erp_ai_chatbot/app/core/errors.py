@@ -6,3 +6,6 @@ class InvalidPlan(Exception):
 
 class ToolExecutionError(Exception):
     pass
+
+class LlmTimeout(Exception):
+    pass
@@ -0,0 +1,50 @@
+# app/core/services.py
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import app.core.config  # noqa: F401  (load .env 1 lần trước khi các module đọc os.getenv)
+
+# =========================================================
+# Service container: tài nguyên nặng được tạo lười ở lần dùng đầu
+# - genai.Client (import google.genai cũng chậm -> import muộn)
+# - engine / session factory sync cho từng DB ERP (app/db/common.py)
+# Import app.ai.* không còn mở engine hay tạo client; worker chỉ phục vụ
+# 1 module thì không bao giờ chạm tới DB / client của module khác.
+# =========================================================
+
+_LOCK = threading.RLock()
+_INSTANCES: Dict[Hashable, Any] = {}
+
+
+def get_or_create(key: Hashable, build: Callable[[], Any]) -> Any:
+    inst = _INSTANCES.get(key)
+    if inst is not None:
+        return inst
+
+    with _LOCK:
+        inst = _INSTANCES.get(key)
+        if inst is None:
+            inst = build()
+            _INSTANCES[key] = inst
+        return inst
+
+
+def created(kind: Optional[str] = None) -> List[Hashable]:
+    """Các key đã được tạo (kind = phần tử đầu của key, vd "genai", "engine")."""
+    with _LOCK:
+        keys = list(_INSTANCES)
+    if kind is None:
+        return keys
+    return [k for k in keys if isinstance(k, tuple) and k and k[0] == kind]
+
+
+def genai_client(api_key: Optional[str] = None, http_options: Optional[Dict[str, Any]] = None):
+    # 1 client / api key: giữ httpx client (keep-alive) dùng chung cho mọi call
+    def _build():
+        from google import genai
+        kwargs: Dict[str, Any] = {"http_options": http_options} if http_options else {}
+        return genai.Client(api_key=api_key, **kwargs) if api_key else genai.Client(**kwargs)
+
+    return get_or_create(("genai", api_key), _build)
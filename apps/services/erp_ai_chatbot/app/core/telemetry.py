@@ -0,0 +1,336 @@
+# app/core/telemetry.py
+from __future__ import annotations
+
+import asyncio
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# =========================================================
+# Đo thời gian + token theo pha của 1 lượt chat:
+# - span(phase): detect / plan / validate / tool / compose (+ request bao ngoài)
+# - record_llm(): token từ usage_metadata của Gemini + ước lượng chi phí (USD),
+#   cộng vào span trong cùng nhất đang mở
+# - Trace theo request (ContextVar): trả trong payload debug (key "trace")
+# - Histogram / counter kiểu Prometheus: GET /api/v1/metrics
+# - Số câu SQL / thời gian DB / N+1 theo tool (app/db/query_stats.py)
+# Thread pool không tự mang ContextVar -> submit qua contextvars.copy_context().run
+# =========================================================
+
+# USD / 1M token: (input, output, cached input); ghi đè bằng LLM_PRICES_JSON
+# vd. {"gemini-2.5-flash": [0.3, 2.5, 0.075]}
+_DEFAULT_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gemini-2.5-pro": (1.25, 10.0, 0.31),
+    "gemini-2.5-flash-lite": (0.10, 0.40, 0.025),
+    "gemini-2.5-flash": (0.30, 2.50, 0.075),
+    "gemini-2.0-flash-lite": (0.075, 0.30, 0.019),
+    "gemini-2.0-flash": (0.10, 0.40, 0.025),
+}
+
+
+def _load_prices() -> Dict[str, Tuple[float, float, float]]:
+    prices = dict(_DEFAULT_PRICES)
+    raw = os.getenv("LLM_PRICES_JSON")
+    if raw:
+        try:
+            prices.update({k: tuple(float(x) for x in v) for k, v in json.loads(raw).items()})
+        except Exception:
+            pass
+    return prices
+
+
+LLM_PRICES = _load_prices()
+
+_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_TOKEN_KINDS = ("prompt", "cached", "output", "thoughts")
+
+
+# ---------- Prometheus-style metrics ----------
+class _Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=_DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [counts theo bucket..., count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            for k in range(idx, len(self.buckets)):
+                s[k] += 1
+            s[-2] += 1
+            s[-1] += value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for values, s in sorted(series.items()):
+            base = _labels(self.labels, values)
+            for le, n in zip(self.buckets, s):
+                out.append(f'{self.name}_bucket{_labels(self.labels + ("le",), values + (_num(le),))} {_num(n)}')
+            out.append(f'{self.name}_bucket{_labels(self.labels + ("le",), values + ("+Inf",))} {_num(s[-2])}')
+            out.append(f"{self.name}_count{base} {_num(s[-2])}")
+            out.append(f"{self.name}_sum{base} {_num(s[-1])}")
+        return out
+
+
+class _Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float, *label_values: str) -> None:
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for values, v in sorted(series.items()):
+            out.append(f"{self.name}{_labels(self.labels, values)} {_num(v)}")
+        return out
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+PHASE_SECONDS = _Histogram("chatbot_phase_duration_seconds", "Thời gian từng pha của lượt chat.", ("phase", "module"))
+LLM_SECONDS = _Histogram("chatbot_llm_call_duration_seconds", "Thời gian 1 call Gemini (gồm chờ slot + retry).", ("purpose", "model"))
+LLM_TOKENS = _Counter("chatbot_llm_tokens_total", "Token Gemini theo loại.", ("purpose", "model", "kind"))
+LLM_COST = _Counter("chatbot_llm_cost_usd_total", "Chi phí Gemini ước lượng (USD).", ("purpose", "model"))
+TOOL_SQL_STATEMENTS = _Histogram(
+    "chatbot_tool_sql_statements", "Số câu SQL / lần gọi tool.", ("module", "tool"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+TOOL_DB_SECONDS = _Histogram("chatbot_tool_db_seconds", "Thời gian DB / lần gọi tool.", ("module", "tool"))
+TOOL_N_PLUS_ONE = _Counter("chatbot_tool_n_plus_one_total", "Số lần gọi tool có câu SQL lặp kiểu N+1.", ("module", "tool"))
+
+_METRICS = (PHASE_SECONDS, LLM_SECONDS, LLM_TOKENS, LLM_COST, TOOL_SQL_STATEMENTS, TOOL_DB_SECONDS, TOOL_N_PLUS_ONE)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for m in _METRICS:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- chi phí ----------
+def usage_tokens(usage: Any) -> Dict[str, int]:
+    """usage_metadata (Gemini) -> {prompt, cached, output, thoughts, total}."""
+    def _get(name: str) -> int:
+        return int(getattr(usage, name, None) or 0)
+
+    tokens = {
+        "prompt": _get("prompt_token_count"),
+        "cached": _get("cached_content_token_count"),
+        "output": _get("candidates_token_count"),
+        "thoughts": _get("thoughts_token_count"),
+    }
+    tokens["total"] = _get("total_token_count") or (tokens["prompt"] + tokens["output"] + tokens["thoughts"])
+    return tokens
+
+
+def estimate_cost_usd(model: str, tokens: Dict[str, int]) -> float:
+    # khớp theo prefix dài nhất (gemini-2.5-flash-lite trước gemini-2.5-flash)
+    key = max((k for k in LLM_PRICES if (model or "").startswith(k)), key=len, default=None)
+    if key is None:
+        return 0.0
+    p_in, p_out, p_cached = LLM_PRICES[key]
+    fresh = max(0, tokens.get("prompt", 0) - tokens.get("cached", 0))
+    cost = (
+        fresh * p_in
+        + tokens.get("cached", 0) * p_cached
+        + (tokens.get("output", 0) + tokens.get("thoughts", 0)) * p_out
+    )
+    return cost / 1_000_000
+
+
+# ---------- trace theo request ----------
+class Span:
+    __slots__ = ("phase", "attrs", "start", "duration_ms", "tokens", "cost_usd", "llm_calls", "error")
+
+    def __init__(self, phase: str, attrs: Dict[str, Any]):
+        self.phase = phase
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.tokens: Dict[str, int] = {}
+        self.cost_usd = 0.0
+        self.llm_calls = 0
+        self.error: Optional[str] = None
+
+    def add_llm(self, tokens: Dict[str, int], cost_usd: float) -> None:
+        self.llm_calls += 1
+        self.cost_usd += cost_usd
+        for k, v in tokens.items():
+            self.tokens[k] = self.tokens.get(k, 0) + v
+
+    def to_dict(self, t0: float) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "phase": self.phase,
+            **self.attrs,
+            "start_ms": round((self.start - t0) * 1000, 2),
+            "duration_ms": self.duration_ms,
+        }
+        if self.llm_calls:
+            out.update(llm_calls=self.llm_calls, tokens=dict(self.tokens), cost_usd=round(self.cost_usd, 6))
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class Trace:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.module: Optional[str] = None
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [s for s in self.spans if s.duration_ms is not None]
+        phases: Dict[str, Dict[str, Any]] = {}
+        tokens: Dict[str, int] = {}
+        cost = 0.0
+        for s in spans:
+            p = phases.setdefault(s.phase, {"count": 0, "ms": 0.0, "tokens": 0, "cost_usd": 0.0})
+            p["count"] += 1
+            p["ms"] = round(p["ms"] + s.duration_ms, 2)
+            p["tokens"] += s.tokens.get("total", 0)
+            p["cost_usd"] = round(p["cost_usd"] + s.cost_usd, 6)
+            cost += s.cost_usd
+            for k, v in s.tokens.items():
+                tokens[k] = tokens.get(k, 0) + v
+        return {
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 2),
+            "phases": phases,
+            "tokens": tokens,
+            "cost_usd": round(cost, 6),
+            "spans": [s.to_dict(self.t0) for s in sorted(spans, key=lambda s: s.start)],
+        }
+
+
+_TRACE: ContextVar[Optional[Trace]] = ContextVar("chat_trace", default=None)
+_SPAN: ContextVar[Optional[Span]] = ContextVar("chat_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _TRACE.get()
+
+
+def trace_summary() -> Optional[Dict[str, Any]]:
+    tr = _TRACE.get()
+    return tr.summary() if tr is not None else None
+
+
+def set_trace_module(module: Optional[str]) -> None:
+    tr = _TRACE.get()
+    if tr is not None and module:
+        tr.module = module
+
+
+@contextmanager
+def span(phase: str, module: Optional[str] = None, **attrs: Any) -> Iterator[Span]:
+    """Đo 1 pha; luôn ghi histogram, chỉ gắn vào trace nếu đang trong request có trace."""
+    tr = _TRACE.get()
+    if module:
+        attrs["module"] = module
+    s = Span(phase, attrs)
+    token = _SPAN.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        _SPAN.reset(token)
+        elapsed = time.perf_counter() - s.start
+        s.duration_ms = round(elapsed * 1000, 2)
+        PHASE_SECONDS.observe(elapsed, phase, module or (tr.module if tr else None) or "-")
+        if tr is not None:
+            tr.add(s)
+
+
+def record_llm(purpose: str, model: str, usage: Any, duration_s: float) -> None:
+    LLM_SECONDS.observe(duration_s, purpose, model)
+    if usage is None:
+        return
+    tokens = usage_tokens(usage)
+    cost = estimate_cost_usd(model, tokens)
+    for kind in _TOKEN_KINDS:
+        if tokens[kind]:
+            LLM_TOKENS.inc(tokens[kind], purpose, model, kind)
+    LLM_COST.inc(cost, purpose, model)
+
+    s = _SPAN.get()
+    if s is not None:
+        s.add_llm(tokens, cost)
+
+
+def record_tool_sql(module: str, tool: str, statements: int, db_s: float, n_plus_one: bool) -> None:
+    TOOL_SQL_STATEMENTS.observe(statements, module, tool)
+    TOOL_DB_SECONDS.observe(db_s, module, tool)
+    if n_plus_one:
+        TOOL_N_PLUS_ONE.inc(1, module, tool)
+
+
+def traced_request(fn):
+    """Bọc entrypoint 1 lượt chat (sync/async): mở Trace + span "request" nếu chưa có."""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def _async(*args, **kwargs):
+            if _TRACE.get() is not None:
+                return await fn(*args, **kwargs)
+            token = _TRACE.set(Trace())
+            try:
+                with span("request"):
+                    return await fn(*args, **kwargs)
+            finally:
+                _TRACE.reset(token)
+        return _async
+
+    @functools.wraps(fn)
+    def _sync(*args, **kwargs):
+        if _TRACE.get() is not None:
+            return fn(*args, **kwargs)
+        token = _TRACE.set(Trace())
+        try:
+            with span("request"):
+                return fn(*args, **kwargs)
+        finally:
+            _TRACE.reset(token)
+    return _sync
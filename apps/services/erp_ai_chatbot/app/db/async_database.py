@@ -0,0 +1,48 @@
+# app/db/async_database.py
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Tuple
+
+from app.core.config import DbPoolSettings, settings
+from app.db.common import make_async_engine, make_async_session_factory
+
+# Engine async theo từng DB ERP, tạo lười (lần đầu module được gọi qua đường async)
+# cùng pool settings với engine sync của DB đó
+_DATABASES: Dict[str, Tuple[str | None, DbPoolSettings]] = {
+    "hrm": (settings.HRM_DATABASE_URL, settings.HRM_DB_POOL),
+    "sale_crm": (settings.SALE_CRM_DATABASE_URL, settings.SALE_CRM_DB_POOL),
+    "finance_accounting": (settings.FINANCE_DATABASE_URL, settings.FINANCE_DB_POOL),
+    "supply_chain": (settings.SUPPLY_CHAIN_DATABASE_URL, settings.SUPPLY_CHAIN_DB_POOL),
+}
+
+_ENGINES: Dict[str, Any] = {}
+_FACTORIES: Dict[str, Any] = {}
+_LOCK = threading.Lock()
+
+
+def get_async_session_factory(module: str):
+    factory = _FACTORIES.get(module)
+    if factory is not None:
+        return factory
+
+    with _LOCK:
+        factory = _FACTORIES.get(module)
+        if factory is not None:
+            return factory
+        url, pool = _DATABASES.get(module, (None, None))
+        if not url:
+            raise RuntimeError(f"Chưa cấu hình database URL cho module '{module}'.")
+        engine = make_async_engine(url, pool, name=module)
+        _ENGINES[module] = engine
+        _FACTORIES[module] = factory = make_async_session_factory(engine)
+        return factory
+
+
+async def dispose_async_engines():
+    with _LOCK:
+        engines = list(_ENGINES.values())
+        _ENGINES.clear()
+        _FACTORIES.clear()
+    for engine in engines:
+        await engine.dispose()
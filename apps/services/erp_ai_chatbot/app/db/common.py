@@ -1,8 +1,148 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Optional
+
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+from app.core.config import DbPoolSettings, settings
+from app.core.services import get_or_create
+from app.db.pool_metrics import MeteredAsyncQueuePool, MeteredQueuePool, attach_pool_metrics
+from app.db.query_stats import instrument_engine
+
+# engine sync đã tạo, theo tên DB: name -> (engine, pool settings, metrics)
+_ENGINES: Dict[str, tuple] = {}
+# engine async đã tạo (app/db/async_database.py): name -> (engine, pool settings, metrics)
+_ASYNC_ENGINES: Dict[str, tuple] = {}
+# session factory lười đã khai báo, theo tên DB (engine chưa chắc đã tạo)
+_LAZY_FACTORIES: Dict[str, "LazySessionFactory"] = {}
+
+def make_engine(db_url: str, pool: Optional[DbPoolSettings] = None, name: Optional[str] = None):
+    pool = pool or DbPoolSettings()
+    kwargs: Dict[str, Any] = {"pool_pre_ping": True}
+    backend = make_url(db_url).get_backend_name()
+
+    # sqlite (test/dev) không dùng QueuePool
+    if backend != "sqlite":
+        kwargs.update(
+            poolclass=MeteredQueuePool,
+            pool_size=pool.size,
+            max_overflow=pool.max_overflow,
+            pool_recycle=pool.recycle_s,
+            pool_timeout=pool.timeout_s,
+        )
+        if pool.statement_timeout_ms > 0 and backend == "postgresql":
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={pool.statement_timeout_ms}"}
 
-def make_engine(db_url: str):
-    return create_engine(db_url, pool_pre_ping=True)
+    engine = create_engine(db_url, **kwargs)
+    instrument_engine(engine)
+    if name:
+        _ENGINES[name] = (engine, pool, attach_pool_metrics(engine, name))
+    return engine
+
+def warmup_engines(modules: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Mở sẵn `warmup` connection cho engine của các DB trong `modules` (mặc định
+    settings.WARMUP_MODULES, rỗng) rồi trả về pool (chạy lúc startup).
+
+    DB không được liệt kê, hoặc có `*_DB_POOL_WARMUP=0`, giữ nguyên lười: engine chỉ được tạo ở request đầu tiên.
+    """
+    names = set(settings.WARMUP_MODULES if modules is None else modules)
+    for name, factory in list(_LAZY_FACTORIES.items()):
+        if name in names and factory.pool.warmup > 0 and name not in _ENGINES:
+            factory.engine
+
+    out: Dict[str, Any] = {}
+    for name, (engine, pool, _) in list(_ENGINES.items()):
+        if name not in names:
+            continue
+        n = min(pool.warmup, pool.size)
+        conns = []
+        try:
+            for _ in range(n):
+                conns.append(engine.connect())
+            out[name] = len(conns)
+        except Exception as e:
+            out[name] = f"error: {e}"
+        finally:
+            for c in conns:
+                c.close()
+    return out
+
+def pool_stats() -> Dict[str, Any]:
+    out = {name: metrics.snapshot(engine.pool) for name, (engine, _, metrics) in _ENGINES.items()}
+    for name, (engine, _, metrics) in _ASYNC_ENGINES.items():
+        out[f"{name}.async"] = metrics.snapshot(engine.sync_engine.pool)
+    return out
 
 def make_session_factory(engine):
     return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class LazySessionFactory:
+    """Dùng như sessionmaker (`SessionLocal()`), nhưng engine chỉ được tạo ở lần gọi đầu.
+
+    Object cố định theo DB nên vẫn dùng được làm key (unit of work, ModuleHooks).
+    """
+
+    def __init__(self, name: str, db_url: Optional[str], pool: Optional[DbPoolSettings] = None):
+        self.name = name
+        self.db_url = db_url
+        self.pool = pool or DbPoolSettings()
+        _LAZY_FACTORIES[name] = self
+
+    def _build(self):
+        if not self.db_url:
+            raise RuntimeError(f"Chưa cấu hình database URL cho '{self.name}'.")
+        return make_session_factory(make_engine(self.db_url, self.pool, name=self.name))
+
+    @property
+    def factory(self):
+        return get_or_create(("engine", self.name), self._build)
+
+    @property
+    def engine(self):
+        return self.factory.kw["bind"]
+
+    def __call__(self, **kwargs):
+        return self.factory(**kwargs)
+
+    def __repr__(self) -> str:
+        return f"LazySessionFactory({self.name!r})"
+
+def to_async_url(db_url: str) -> str:
+    # postgresql:// | postgresql+psycopg2:// -> postgresql+asyncpg://
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if db_url.startswith(prefix):
+            return "postgresql+asyncpg://" + db_url[len(prefix):]
+    return db_url
+
+def make_async_engine(db_url: str, pool: Optional[DbPoolSettings] = None, name: Optional[str] = None):
+    """Như make_engine, cho đường async: cùng DbPoolSettings của DB (pool async là pool riêng)."""
+    # import muộn: chỉ cần asyncpg khi đường async thực sự được dùng
+    from sqlalchemy.ext.asyncio import create_async_engine
+    pool = pool or DbPoolSettings()
+    url = to_async_url(db_url)
+    kwargs: Dict[str, Any] = {"pool_pre_ping": True}
+    backend = make_url(url).get_backend_name()
+
+    if backend != "sqlite":
+        kwargs.update(
+            poolclass=MeteredAsyncQueuePool,
+            pool_size=pool.size,
+            max_overflow=pool.max_overflow,
+            pool_recycle=pool.recycle_s,
+            pool_timeout=pool.timeout_s,
+        )
+        # asyncpg không nhận "options" như psycopg2 -> đặt qua server_settings
+        if pool.statement_timeout_ms > 0 and backend == "postgresql":
+            kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(pool.statement_timeout_ms)}}
+
+    engine = create_async_engine(url, **kwargs)
+    instrument_engine(engine.sync_engine)
+    if name:
+        _ASYNC_ENGINES[name] = (engine, pool, attach_pool_metrics(engine, name))
+    return engine
+
+def make_async_session_factory(engine):
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
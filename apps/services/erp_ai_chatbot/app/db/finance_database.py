@@ -1,8 +1,15 @@
 # app/db/finance_database.py
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
-from app.db.common import make_engine, make_session_factory
+from app.db.common import LazySessionFactory
 
 FinanceBase = declarative_base()
-engine = make_engine(settings.FINANCE_DATABASE_URL)
-FinanceSessionLocal = make_session_factory(engine)
+# engine tạo lười ở lần mở session đầu tiên (xem app/core/services.py)
+FinanceSessionLocal = LazySessionFactory("finance_accounting", settings.FINANCE_DATABASE_URL, settings.FINANCE_DB_POOL)
+
+
+def __getattr__(attr: str):
+    # tương thích code cũ dùng `finance_database.engine`
+    if attr == "engine":
+        return FinanceSessionLocal.engine
+    raise AttributeError(attr)
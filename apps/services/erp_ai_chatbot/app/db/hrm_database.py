@@ -1,7 +1,14 @@
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
-from app.db.common import make_engine, make_session_factory
+from app.db.common import LazySessionFactory
 
 HrmBase = declarative_base()
-engine = make_engine(settings.HRM_DATABASE_URL)
-HrmSessionLocal = make_session_factory(engine)
+# engine tạo lười ở lần mở session đầu tiên (xem app/core/services.py)
+HrmSessionLocal = LazySessionFactory("hrm", settings.HRM_DATABASE_URL, settings.HRM_DB_POOL)
+
+
+def __getattr__(attr: str):
+    # tương thích code cũ dùng `hrm_database.engine`
+    if attr == "engine":
+        return HrmSessionLocal.engine
+    raise AttributeError(attr)
@@ -0,0 +1,112 @@
+# app/db/pool_metrics.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# =========================================================
+# Metrics pool connection cho từng engine ERP:
+# - thời gian chờ checkout (tổng / max / số lần), số lần timeout
+# - checkout / checkin / connect mới
+# - trạng thái hiện tại của pool (size, checked out, overflow)
+# Xem qua GET /api/v1/health/db
+# =========================================================
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def observe_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_total_s += seconds
+            if seconds > self.wait_max_s:
+                self.wait_max_s = seconds
+            if timed_out:
+                self.timeouts += 1
+
+    def incr(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self, pool: Any = None) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total_s * 1000, 2),
+                "wait_avg_ms": round(self.wait_total_s * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_s * 1000, 2),
+            }
+        if isinstance(pool, QueuePool):
+            out.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return out
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool đo thời gian chờ lấy connection (gồm cả lúc phải mở connection mới)."""
+
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.observe_wait(time.perf_counter() - t0, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe_wait(time.perf_counter() - t0)
+        return conn
+
+    def recreate(self):
+        # pool mới sau dispose()/invalidate vẫn giữ metrics cũ
+        new = super().recreate()
+        new.metrics = self.metrics
+        return new
+
+
+class MeteredAsyncQueuePool(MeteredQueuePool, AsyncAdaptedQueuePool):
+    """MeteredQueuePool cho engine async (hàng đợi asyncio-aware của AsyncAdaptedQueuePool)."""
+
+
+def attach_pool_metrics(engine, name: str) -> PoolMetrics:
+    # AsyncEngine: pool và event nằm trên sync_engine
+    engine = getattr(engine, "sync_engine", engine)
+    metrics = PoolMetrics(name)
+    if isinstance(engine.pool, MeteredQueuePool):
+        engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        metrics.incr("checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        metrics.incr("checkins")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        metrics.incr("connects")
+
+    return metrics
@@ -0,0 +1,100 @@
+# app/db/query_stats.py
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+
+# =========================================================
+# Đếm câu SQL theo lần gọi tool (event before/after_cursor_execute của engine):
+# - track_queries(): mở bộ đếm cho đoạn code hiện tại (ContextVar -> step song song đếm riêng)
+# - mỗi câu: +1 statement, cộng thời gian DB, gom theo "shape" (bỏ literal, gộp IN (...))
+# - shape lặp >= QUERY_N_PLUS_ONE_THRESHOLD lần trong 1 lần gọi tool = nghi N+1
+# Ngoài track_queries() listener chỉ đọc ContextVar rồi thoát (gần như không tốn gì).
+# =========================================================
+
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "1") == "1"
+QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_N_PLUS_ONE_THRESHOLD", "3"))
+_SHAPE_MAX_CHARS = 300
+
+_CURRENT: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# IN (?, ?, ?) / IN (%(p_1)s, ...) / IN ($1, $2) -> IN (?+)
+_PARAM_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+|:\w+))+\s*\)")
+_PARAM = re.compile(r"%\(\w+\)s|\$\d+|:\w+")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(sql: str) -> str:
+    s = _STRING.sub("?", sql)
+    s = _PARAM_LIST.sub("(?+)", s)
+    s = _PARAM.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    return _SPACES.sub(" ", s).strip()
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.db_s = 0.0
+        self.shapes: Dict[str, int] = {}
+
+    def add(self, sql: str, elapsed_s: float) -> None:
+        shape = statement_shape(sql)
+        with self._lock:
+            self.statements += 1
+            self.db_s += elapsed_s
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, threshold: int = QUERY_N_PLUS_ONE_THRESHOLD) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(s, n) for s, n in self.shapes.items() if n >= threshold]
+        return [{"sql": s[:_SHAPE_MAX_CHARS], "count": n} for s, n in sorted(items, key=lambda x: -x[1])]
+
+    def summary(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"statements": self.statements, "db_ms": round(self.db_s * 1000, 2)}
+        repeated = self.repeated()
+        if repeated:
+            out["n_plus_one"] = repeated
+        return out
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _CURRENT.set(stats)
+    try:
+        yield stats
+    finally:
+        _CURRENT.reset(token)
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    # thời điểm bắt đầu gắn vào execution context (sống theo 1 câu lệnh): câu lỗi không để lại gì trên connection
+    if _CURRENT.get() is not None and context is not None:
+        context._query_stats_t0 = time.perf_counter()
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    stats = _CURRENT.get()
+    t0 = getattr(context, "_query_stats_t0", None)
+    if stats is None or t0 is None:
+        return
+    stats.add(statement, time.perf_counter() - t0)
+
+
+def instrument_engine(engine) -> None:
+    """Gắn listener cho engine sync (engine async: truyền engine.sync_engine)."""
+    if not QUERY_STATS_ENABLED:
+        return
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
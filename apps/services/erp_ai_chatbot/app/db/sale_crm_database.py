@@ -1,7 +1,14 @@
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
-from app.db.common import make_engine, make_session_factory
+from app.db.common import LazySessionFactory
 
 SaleCrmBase = declarative_base()
-engine = make_engine(settings.SALE_CRM_DATABASE_URL)
-SaleCrmSessionLocal = make_session_factory(engine)
+# engine tạo lười ở lần mở session đầu tiên (xem app/core/services.py)
+SaleCrmSessionLocal = LazySessionFactory("sale_crm", settings.SALE_CRM_DATABASE_URL, settings.SALE_CRM_DB_POOL)
+
+
+def __getattr__(attr: str):
+    # tương thích code cũ dùng `sale_crm_database.engine`
+    if attr == "engine":
+        return SaleCrmSessionLocal.engine
+    raise AttributeError(attr)
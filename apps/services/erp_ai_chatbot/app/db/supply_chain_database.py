@@ -1,7 +1,14 @@
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
-from app.db.common import make_engine, make_session_factory
+from app.db.common import LazySessionFactory
 
 SupplyChainBase = declarative_base()
-engine = make_engine(settings.SUPPLY_CHAIN_DATABASE_URL)
-SupplyChainSessionLocal = make_session_factory(engine)
+# engine tạo lười ở lần mở session đầu tiên (xem app/core/services.py)
+SupplyChainSessionLocal = LazySessionFactory("supply_chain", settings.SUPPLY_CHAIN_DATABASE_URL, settings.SUPPLY_CHAIN_DB_POOL)
+
+
+def __getattr__(attr: str):
+    # tương thích code cũ dùng `supply_chain_database.engine`
+    if attr == "engine":
+        return SupplyChainSessionLocal.engine
+    raise AttributeError(attr)
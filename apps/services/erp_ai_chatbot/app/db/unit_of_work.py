@@ -0,0 +1,245 @@
+# app/db/unit_of_work.py
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# =========================================================
+# Unit of work read-only cho 1 lượt chat:
+# - mỗi DB ERP (theo session factory) mở lười 1 session, các step dùng chung
+# - Postgres: transaction REPEATABLE READ + READ ONLY => các step đọc cùng 1 snapshot
+# - step chạy song song cần thêm session: session phụ import snapshot của session đầu
+#   (pg_export_snapshot) nên vẫn nhất quán; session rảnh được dùng lại cho step sau
+# - close() ở cuối lượt: rollback + trả connection về pool
+# - sau 1 step ghi (session riêng, đã commit) executor thay unit of work mới (renew())
+#   để step đọc sau thấy dữ liệu vừa ghi
+# - AsyncReadOnlyUnitOfWork: bản AsyncSession cho đường async, cùng cách làm
+# =========================================================
+
+_SNAPSHOT_ID_RE = re.compile(r"^[0-9A-Fa-f-]+$")
+_SNAPSHOT_WAIT_S = 5.0
+
+
+class ReadOnlyUnitOfWork:
+    def __init__(self, share_snapshot: bool = False):
+        # share_snapshot=True khi có step chạy song song (cần >1 session / DB)
+        self.share_snapshot = share_snapshot
+        self._lock = threading.Lock()
+        self._idle: Dict[Any, List[Session]] = {}
+        self._opened: List[Session] = []
+        self._snapshots: Dict[Any, Optional[str]] = {}
+        self._snapshot_ready: Dict[Any, threading.Event] = {}
+        self._closed = False
+
+    def __enter__(self) -> "ReadOnlyUnitOfWork":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @contextmanager
+    def session(self, factory: Callable[[], Session]) -> Iterator[Session]:
+        session = self._acquire(factory)
+        try:
+            yield session
+        except Exception:
+            # transaction có thể đã hỏng (Postgres: aborted) -> không dùng lại
+            self._discard(factory, session)
+            raise
+        else:
+            self._release(factory, session)
+
+    def renew(self) -> "ReadOnlyUnitOfWork":
+        """Đóng snapshot hiện tại, trả unit of work mới (cùng cấu hình)."""
+        self.close()
+        return ReadOnlyUnitOfWork(share_snapshot=self.share_snapshot)
+
+    def close(self) -> None:
+        with self._lock:
+            sessions = list(self._opened)
+            self._opened.clear()
+            self._idle.clear()
+            self._snapshots.clear()
+            self._snapshot_ready.clear()
+            self._closed = True
+        for s in sessions:
+            try:
+                s.rollback()
+            finally:
+                s.close()
+
+    # ---------- nội bộ ----------
+    def _acquire(self, factory: Callable[[], Session]) -> Session:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Unit of work đã đóng.")
+            idle = self._idle.get(factory)
+            if idle:
+                return idle.pop()
+            ready = self._snapshot_ready.get(factory)
+            exported: Optional[threading.Event] = None
+            if self.share_snapshot and ready is None:
+                # session đầu tiên export snapshot; session mở sau chờ rồi import
+                exported = self._snapshot_ready[factory] = threading.Event()
+
+        snapshot = None
+        if ready is not None:
+            ready.wait(timeout=_SNAPSHOT_WAIT_S)
+            snapshot = self._snapshots.get(factory)
+
+        session = self._begin(factory, snapshot, exported)
+        with self._lock:
+            self._opened.append(session)
+        return session
+
+    def _begin(
+        self, factory: Callable[[], Session], snapshot: Optional[str], exported: Optional[threading.Event]
+    ) -> Session:
+        # exported: Event do _acquire tạo (giữ tham chiếu riêng vì close()/renew() có thể đã xoá dict)
+        session = factory()
+        if session.get_bind().dialect.name != "postgresql":
+            if exported is not None:
+                exported.set()
+            return session
+
+        try:
+            session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            if snapshot and _SNAPSHOT_ID_RE.fullmatch(snapshot):
+                # phải chạy trước mọi query của transaction
+                session.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+            session.execute(text("SET TRANSACTION READ ONLY"))
+            if exported is not None:
+                snapshot_id = session.execute(text("SELECT pg_export_snapshot()")).scalar()
+                with self._lock:
+                    if not self._closed:
+                        self._snapshots[factory] = snapshot_id
+        except Exception:
+            # không bật được read-only/snapshot (quyền, pooler...) -> session thường
+            session.rollback()
+        finally:
+            if exported is not None:
+                exported.set()
+        return session
+
+    def _release(self, factory: Callable[[], Session], session: Session) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._idle.setdefault(factory, []).append(session)
+
+    def _discard(self, factory: Callable[[], Session], session: Session) -> None:
+        with self._lock:
+            if session in self._opened:
+                self._opened.remove(session)
+        try:
+            session.rollback()
+        finally:
+            session.close()
+
+
+class AsyncReadOnlyUnitOfWork:
+    """ReadOnlyUnitOfWork cho AsyncSession; chỉ dùng trong 1 event loop nên không cần khoá."""
+
+    def __init__(self, share_snapshot: bool = False):
+        self.share_snapshot = share_snapshot
+        self._idle: Dict[Any, List[Any]] = {}
+        self._opened: List[Any] = []
+        self._snapshots: Dict[Any, Optional[str]] = {}
+        self._snapshot_ready: Dict[Any, asyncio.Event] = {}
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncReadOnlyUnitOfWork":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    @asynccontextmanager
+    async def session(self, factory: Callable[[], Any]) -> AsyncIterator[Any]:
+        session = await self._acquire(factory)
+        try:
+            yield session
+        except Exception:
+            await self._discard(session)
+            raise
+        else:
+            if not self._closed:
+                self._idle.setdefault(factory, []).append(session)
+
+    async def renew(self) -> "AsyncReadOnlyUnitOfWork":
+        await self.close()
+        return AsyncReadOnlyUnitOfWork(share_snapshot=self.share_snapshot)
+
+    async def close(self) -> None:
+        sessions = list(self._opened)
+        self._opened.clear()
+        self._idle.clear()
+        self._snapshots.clear()
+        self._snapshot_ready.clear()
+        self._closed = True
+        for s in sessions:
+            try:
+                await s.rollback()
+            finally:
+                await s.close()
+
+    # ---------- nội bộ ----------
+    async def _acquire(self, factory: Callable[[], Any]) -> Any:
+        if self._closed:
+            raise RuntimeError("Unit of work đã đóng.")
+        idle = self._idle.get(factory)
+        if idle:
+            return idle.pop()
+        ready = self._snapshot_ready.get(factory)
+        exported: Optional[asyncio.Event] = None
+        if self.share_snapshot and ready is None:
+            exported = self._snapshot_ready[factory] = asyncio.Event()
+
+        snapshot = None
+        if ready is not None:
+            try:
+                await asyncio.wait_for(ready.wait(), timeout=_SNAPSHOT_WAIT_S)
+            except asyncio.TimeoutError:
+                pass
+            snapshot = self._snapshots.get(factory)
+
+        session = await self._begin(factory, snapshot, exported)
+        self._opened.append(session)
+        return session
+
+    async def _begin(self, factory: Callable[[], Any], snapshot: Optional[str], exported: Optional[asyncio.Event]) -> Any:
+        session = factory()
+        if session.get_bind().dialect.name != "postgresql":
+            if exported is not None:
+                exported.set()
+            return session
+
+        try:
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            if snapshot and _SNAPSHOT_ID_RE.fullmatch(snapshot):
+                await session.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+            await session.execute(text("SET TRANSACTION READ ONLY"))
+            if exported is not None:
+                snapshot_id = (await session.execute(text("SELECT pg_export_snapshot()"))).scalar()
+                if not self._closed:
+                    self._snapshots[factory] = snapshot_id
+        except Exception:
+            await session.rollback()
+        finally:
+            if exported is not None:
+                exported.set()
+        return session
+
+    async def _discard(self, session: Any) -> None:
+        if session in self._opened:
+            self._opened.remove(session)
+        try:
+            await session.rollback()
+        finally:
+            await session.close()
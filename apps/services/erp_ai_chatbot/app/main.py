@@ -1,8 +1,38 @@
 from fastapi import FastAPI
 from app.api.v1.health import router as health_router
 from app.api.v1.chat import router as chat_router
+from app.api.v1.admin import router as admin_router
+from app.ai.routers.common import warmup_prompt_artifacts
+from app.db.async_database import dispose_async_engines
+from app.db.common import warmup_engines
+from app.core.audit_log import audit, flush_audit
 
 app = FastAPI(title="ERP AI Chatbot")
 
 app.include_router(health_router, prefix="/api/v1")
 app.include_router(chat_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
+
+
+@app.on_event("startup")
+def _warmup_planner_prompts():
+    # build sẵn system instruction + schema cho từng module (tránh request đầu phải import tools + render guide)
+    audit({"event": "planner_prompt_warmup", "prefix_chars": warmup_prompt_artifacts()})
+
+
+@app.on_event("startup")
+def _warmup_db_pools():
+    # chỉ DB trong WARMUP_MODULES (mặc định không có) được tạo engine + mở sẵn connection;
+    # DB khác giữ lười tới request đầu
+    audit({"event": "db_pool_warmup", "opened": warmup_engines()})
+
+
+@app.on_event("shutdown")
+async def _close_async_engines():
+    await dispose_async_engines()
+
+
+@app.on_event("shutdown")
+def _flush_audit_log():
+    # ghi nốt các event audit còn trong queue trước khi tắt process
+    flush_audit()
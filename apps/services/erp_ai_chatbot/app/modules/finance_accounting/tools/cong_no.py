@@ -6,7 +6,7 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok, can_lam_ro
 from app.modules.finance_accounting.models import ARInvoice, APInvoice, BusinessPartner
 
 def _iso(d): return d.isoformat() if d else None
@@ -154,6 +154,6 @@ def ap_no(session: Session, external_id: Optional[str] = None, as_of: Optional[d
 
 
 CONG_NO_TOOLS = [
-    ToolSpec("ar_no", "Tổng hợp công nợ phải thu (AR).", ARCongNoArgs, ar_no, "finance_accounting"),
-    ToolSpec("ap_no", "Tổng hợp công nợ phải trả (AP).", APCongNoArgs, ap_no, "finance_accounting"),
+    ToolSpec("ar_no", "Tổng hợp công nợ phải thu (AR).", ARCongNoArgs, ar_no, "finance_accounting", cache_ttl_s=TTL_STATUS),
+    ToolSpec("ap_no", "Tổng hợp công nợ phải trả (AP).", APCongNoArgs, ap_no, "finance_accounting", cache_ttl_s=TTL_STATUS),
 ]
@@ -6,7 +6,7 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import ToolCachePolicy, ToolSpec, ok, can_lam_ro
 from app.modules.finance_accounting.models import ChartOfAccounts, FiscalPeriod
 
 
@@ -124,7 +124,9 @@ def ds_ky(session: Session, status: Optional[str] = None, limit: int = 24):
 
 
 DANH_MUC_TOOLS = [
-    ToolSpec("tai_khoan", "Tra cứu danh mục tài khoản (COA).", TaiKhoanArgs, tai_khoan, "finance_accounting"),
+    ToolSpec("tai_khoan", "Tra cứu danh mục tài khoản (COA).", TaiKhoanArgs, tai_khoan, "finance_accounting",
+             cache=ToolCachePolicy(ttl_s=600, casefold_fields=("tu_khoa",))),
     ToolSpec("ky_hien_tai", "Lấy kỳ kế toán hiện tại (OPEN theo ngày).", KyHienTaiArgs, ky_hien_tai, "finance_accounting"),
-    ToolSpec("ds_ky", "Danh sách kỳ kế toán (lọc OPEN/CLOSED).", DsKyArgs, ds_ky, "finance_accounting"),
+    ToolSpec("ds_ky", "Danh sách kỳ kế toán (lọc OPEN/CLOSED).", DsKyArgs, ds_ky, "finance_accounting",
+             cache=ToolCachePolicy(ttl_s=300)),
 ]
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
 from datetime import date
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok, can_lam_ro
 from app.modules.finance_accounting.models import Invoice, InvoiceLine, BusinessPartner
 
 
@@ -128,7 +128,7 @@ def danh_sach_hoa_don_theo_doi_tac(session: Session, partner_code: str, invoice_
 
 
 INVOICES_TOOLS = [
-    ToolSpec("tra_cuu_trang_thai_hoa_don", "Tra cứu trạng thái hóa đơn theo mã.", TraCuuTrangThaiHoaDonArgs, tra_cuu_trang_thai_hoa_don, "finance_accounting"),
+    ToolSpec("tra_cuu_trang_thai_hoa_don", "Tra cứu trạng thái hóa đơn theo mã.", TraCuuTrangThaiHoaDonArgs, tra_cuu_trang_thai_hoa_don, "finance_accounting", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_hoa_don", "Tra cứu chi tiết hóa đơn (kèm dòng).", ChiTietHoaDonArgs, chi_tiet_hoa_don, "finance_accounting"),
     ToolSpec("danh_sach_hoa_don_theo_doi_tac", "Liệt kê hóa đơn theo đối tác (lọc AR/AP, status).", DanhSachHoaDonTheoDoiTacArgs, danh_sach_hoa_don_theo_doi_tac, "finance_accounting"),
 ]
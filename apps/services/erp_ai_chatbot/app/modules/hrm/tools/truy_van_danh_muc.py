@@ -3,7 +3,7 @@ from __future__ import annotations
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok
+from app.ai.tooling import ToolCachePolicy, ToolSpec, ok
 from app.modules.hrm.models import Department, Position, WorkShift
 
 
@@ -56,7 +56,10 @@ def danh_sach_ca_lam(session: Session, limit: int = 200):
 
 
 DANH_MUC_HRM_TOOLS = [
-    ToolSpec("danh_sach_phong_ban", "Liệt kê phòng ban.", DanhSachPhongBanArgs, danh_sach_phong_ban, "hrm"),
-    ToolSpec("danh_sach_chuc_vu", "Liệt kê chức vụ.", DanhSachChucVuArgs, danh_sach_chuc_vu, "hrm"),
-    ToolSpec("danh_sach_ca_lam", "Liệt kê ca làm.", DanhSachCaLamArgs, danh_sach_ca_lam, "hrm"),
+    ToolSpec("danh_sach_phong_ban", "Liệt kê phòng ban.", DanhSachPhongBanArgs, danh_sach_phong_ban, "hrm",
+             cache=ToolCachePolicy(ttl_s=600)),
+    ToolSpec("danh_sach_chuc_vu", "Liệt kê chức vụ.", DanhSachChucVuArgs, danh_sach_chuc_vu, "hrm",
+             cache=ToolCachePolicy(ttl_s=600)),
+    ToolSpec("danh_sach_ca_lam", "Liệt kê ca làm.", DanhSachCaLamArgs, danh_sach_ca_lam, "hrm",
+             cache=ToolCachePolicy(ttl_s=600)),
 ]
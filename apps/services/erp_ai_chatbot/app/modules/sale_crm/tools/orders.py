@@ -7,7 +7,7 @@ from pydantic import BaseModel, Field
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok
 from app.modules.sale_crm.models import Order, OrderDetail, Payment, ProductVariant, User
 from app.modules.sale_crm.tools.helpers import to_float, calc_order_total
 
@@ -203,7 +203,7 @@ def don_hang_gia_tri_cao_nhat(
     })
 
 ORDER_TOOLS: List[ToolSpec] = [
-    ToolSpec("tra_cuu_trang_thai_don_hang", "Tra cứu trạng thái đơn hàng + trạng thái thanh toán.", OrderIdArgs, tra_cuu_trang_thai_don_hang, "sale_crm"),
+    ToolSpec("tra_cuu_trang_thai_don_hang", "Tra cứu trạng thái đơn hàng + trạng thái thanh toán.", OrderIdArgs, tra_cuu_trang_thai_don_hang, "sale_crm", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_don_hang", "Xem chi tiết đơn hàng (items + tổng tiền).", OrderIdArgs, chi_tiet_don_hang, "sale_crm"),
     ToolSpec("don_hang_gan_nhat", "Lấy đơn hàng gần nhất của khách hàng.", EmptyArgs, don_hang_gan_nhat, "sale_crm"),  # placeholder, được override ở __init__
     ToolSpec("tim_don_hang", "Tìm đơn theo bộ lọc (status, thời gian, tổng tiền).", TimDonHangArgs, tim_don_hang, "sale_crm"),
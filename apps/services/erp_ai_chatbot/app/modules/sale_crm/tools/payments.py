@@ -6,7 +6,7 @@ from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok
 from app.modules.sale_crm.models import Order, Payment
 from app.modules.sale_crm.tools.helpers import to_float
 
@@ -66,6 +66,6 @@ def tim_giao_dich_loi(session: Session, from_date: Optional[datetime] = None, to
     } for p in rows])
 
 PAYMENT_TOOLS: List[ToolSpec] = [
-    ToolSpec("trang_thai_thanh_toan_theo_don", "Tra cứu thanh toán theo order_id (an toàn hơn payment_id).", PaymentByOrderArgs, trang_thai_thanh_toan_theo_don, "sale_crm"),
-    ToolSpec("tim_giao_dich_loi", "Liệt kê giao dịch FAILED/ERROR/PENDING theo thời gian.", TimGiaoDichLoiArgs, tim_giao_dich_loi, "sale_crm"),
+    ToolSpec("trang_thai_thanh_toan_theo_don", "Tra cứu thanh toán theo order_id (an toàn hơn payment_id).", PaymentByOrderArgs, trang_thai_thanh_toan_theo_don, "sale_crm", cache_ttl_s=TTL_STATUS),
+    ToolSpec("tim_giao_dich_loi", "Liệt kê giao dịch FAILED/ERROR/PENDING theo thời gian.", TimGiaoDichLoiArgs, tim_giao_dich_loi, "sale_crm", cache_ttl_s=TTL_STATUS),
 ]
@@ -3,7 +3,7 @@ from pydantic import BaseModel
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok, can_lam_ro
 from app.modules.supply_chain.models import Stocktake, StocktakeDetail, Product
 from .helpers import norm_code, as_int
 
@@ -62,7 +62,7 @@ def bao_cao_chenh_lech_kiem_ke(session: Session, stocktake_code: str, limit: int
     return ok({"stocktake_code": st.stocktake_code, "variance_items": data}, "Báo cáo chênh lệch kiểm kê.")
 
 KIEM_KE_TOOLS = [
-    ToolSpec("tra_cuu_trang_thai_kiem_ke", "Tra trạng thái đợt kiểm kê.", TrangThaiKiemKeArgs, tra_cuu_trang_thai_kiem_ke, "supply_chain"),
+    ToolSpec("tra_cuu_trang_thai_kiem_ke", "Tra trạng thái đợt kiểm kê.", TrangThaiKiemKeArgs, tra_cuu_trang_thai_kiem_ke, "supply_chain", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_kiem_ke", "Tra chi tiết kiểm kê (kèm variance).", ChiTietKiemKeArgs, chi_tiet_kiem_ke, "supply_chain"),
     ToolSpec("bao_cao_chenh_lech_kiem_ke", "Báo cáo chênh lệch kiểm kê (variance report).", BaoCaoChenhLechArgs, bao_cao_chenh_lech_kiem_ke, "supply_chain"),
 ]
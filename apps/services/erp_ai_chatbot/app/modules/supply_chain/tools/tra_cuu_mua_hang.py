@@ -4,7 +4,7 @@ from pydantic import BaseModel
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok, can_lam_ro
 from app.modules.supply_chain.models import PurchaseRequest, PRItem, Quotation, PurchaseOrder, POItem, Supplier, Product
 
 def _candidates_by_prefix(session: Session, model_cls, code_field, prefix: str, limit: int = 5) -> list[str]:
@@ -290,11 +290,11 @@ def tien_do_nhap_po(session: Session, po_code: str):
 
 MUA_HANG_TOOLS = [
     ToolSpec("tim_po_sap_den_han_giao_nhat", "Tìm PO có ngày dự kiến giao hàng (ETD) sớm nhất trong các PO đang xử lý (APPROVED/PARTIAL_RECEIVED).",TimPoSapDenHanGiaoNhatArgs, tim_po_sap_den_han_giao_nhat, "supply_chain"),
-    ToolSpec("tra_cuu_trang_thai_pr", "Tra cứu trạng thái yêu cầu mua (PR).", TraCuuTrangThaiPRArgs, tra_cuu_trang_thai_pr, "supply_chain"),
+    ToolSpec("tra_cuu_trang_thai_pr", "Tra cứu trạng thái yêu cầu mua (PR).", TraCuuTrangThaiPRArgs, tra_cuu_trang_thai_pr, "supply_chain", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_pr", "Tra cứu chi tiết PR và dòng hàng.", ChiTietPRArgs, chi_tiet_pr, "supply_chain"),
     ToolSpec("pr_chua_xu_ly", "Danh sách PR đang mở.", PRChuaXuLyArgs, pr_chua_xu_ly, "supply_chain"),
     ToolSpec("danh_sach_bao_gia_theo_pr", "Danh sách báo giá (RFQ) theo PR.", DanhSachBaoGiaTheoPRArgs, danh_sach_bao_gia_theo_pr, "supply_chain"),
-    ToolSpec("tra_cuu_trang_thai_don_mua", "Tra cứu trạng thái đơn mua (PO).", TraCuuTrangThaiPOArgs, tra_cuu_trang_thai_don_mua, "supply_chain"),
+    ToolSpec("tra_cuu_trang_thai_don_mua", "Tra cứu trạng thái đơn mua (PO).", TraCuuTrangThaiPOArgs, tra_cuu_trang_thai_don_mua, "supply_chain", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_po", "Tra cứu chi tiết PO và dòng hàng.", ChiTietPOArgs, chi_tiet_po, "supply_chain"),
     ToolSpec("po_chua_hoan_tat", "Danh sách PO chưa hoàn tất.", POChuaHoanTatArgs, po_chua_hoan_tat, "supply_chain"),
     ToolSpec("tien_do_nhap_po", "Tính % tiến độ nhập của PO và các mặt hàng còn thiếu.", TienDoNhapPOArgs, tien_do_nhap_po, "supply_chain"),
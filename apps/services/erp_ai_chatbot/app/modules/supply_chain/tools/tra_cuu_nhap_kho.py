@@ -4,7 +4,7 @@ from pydantic import BaseModel
 from sqlalchemy import func, and_
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok, can_lam_ro
 from app.modules.supply_chain.models import GoodsReceipt, GRItem, PurchaseOrder, POItem, Supplier, Product, Warehouse
 from .helpers import norm_code, dt_iso, find_supplier, as_int
 from pydantic import Field
@@ -235,7 +235,7 @@ def po_nhan_mot_phan(session: Session, limit: int = 20):
     return ok(data, "Danh sách PO đang nhận một phần (PARTIAL_RECEIVED).")
 
 NHAP_KHO_TOOLS = [
-    ToolSpec("tra_cuu_trang_thai_phieu_nhap", "Tra trạng thái phiếu nhập (GR).", TrangThaiGRArgs, tra_cuu_trang_thai_phieu_nhap, "supply_chain"),
+    ToolSpec("tra_cuu_trang_thai_phieu_nhap", "Tra trạng thái phiếu nhập (GR).", TrangThaiGRArgs, tra_cuu_trang_thai_phieu_nhap, "supply_chain", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_phieu_nhap", "Tra chi tiết phiếu nhập (GR).", ChiTietGRArgs, chi_tiet_phieu_nhap, "supply_chain"),
     ToolSpec("danh_sach_gr_theo_po", "Danh sách GR theo PO.", GRTheoPOArgs, danh_sach_gr_theo_po, "supply_chain"),
     ToolSpec("doi_chieu_so_luong_po_va_gr", "Đối chiếu số lượng PO vs GR theo PO code.", DoiChieuPOvsGRArgs, doi_chieu_so_luong_po_va_gr, "supply_chain"),
@@ -4,7 +4,7 @@ from pydantic import BaseModel, Field
 from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STOCK, ToolSpec, ok, can_lam_ro
 from app.modules.supply_chain.models import Product, Warehouse, BinLocation, CurrentStock, InventoryTransactionLog
 from .helpers import find_product, find_warehouse, like_kw, as_int
 
@@ -207,12 +207,12 @@ def kiem_tra_du_hang(session: Session, tu_khoa_san_pham: str, so_luong_can: int
     }, "Kiểm tra đủ hàng cho nhu cầu.")
 
 TON_KHO_TOOLS = [
-    ToolSpec("tra_ton_kho_theo_tu_khoa", "Tra tồn kho tổng hợp theo SKU/tên (partial).", TonTheoTuKhoaArgs, tra_ton_kho_theo_tu_khoa, "supply_chain"),
-    ToolSpec("tra_ton_kho_theo_kho", "Tra tồn kho theo kho.", TonTheoKhoArgs, tra_ton_kho_theo_kho, "supply_chain"),
-    ToolSpec("tra_ton_kho_theo_kho_va_san_pham", "Tra tồn kho theo kho và theo từ khoá sản phẩm.", TonTheoKhoVaSanPhamArgs, tra_ton_kho_theo_kho_va_san_pham, "supply_chain"),
-    ToolSpec("tra_ton_kho_theo_bin", "Tra tồn kho theo bin/vị trí.", TonTheoBinArgs, tra_ton_kho_theo_bin, "supply_chain"),
-    ToolSpec("canh_bao_ton_kho", "Cảnh báo tồn kho: sắp hết / tồn quá nhiều / dead stock.", CanhBaoTonKhoArgs, canh_bao_ton_kho, "supply_chain"),
-    ToolSpec("so_luong_dang_giu", "Tính số lượng đang giữ (allocated) theo SKU/tên.", SoLuongTheoSanPhamArgs, so_luong_dang_giu, "supply_chain"),
-    ToolSpec("so_luong_kha_dung", "Tính số lượng khả dụng (available) theo SKU/tên.", SoLuongTheoSanPhamArgs, so_luong_kha_dung, "supply_chain"),
-    ToolSpec("kiem_tra_du_hang", "Kiểm tra đủ hàng cho nhu cầu theo SKU/tên.", KiemTraDuHangArgs, kiem_tra_du_hang, "supply_chain"),
+    ToolSpec("tra_ton_kho_theo_tu_khoa", "Tra tồn kho tổng hợp theo SKU/tên (partial).", TonTheoTuKhoaArgs, tra_ton_kho_theo_tu_khoa, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("tra_ton_kho_theo_kho", "Tra tồn kho theo kho.", TonTheoKhoArgs, tra_ton_kho_theo_kho, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("tra_ton_kho_theo_kho_va_san_pham", "Tra tồn kho theo kho và theo từ khoá sản phẩm.", TonTheoKhoVaSanPhamArgs, tra_ton_kho_theo_kho_va_san_pham, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("tra_ton_kho_theo_bin", "Tra tồn kho theo bin/vị trí.", TonTheoBinArgs, tra_ton_kho_theo_bin, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("canh_bao_ton_kho", "Cảnh báo tồn kho: sắp hết / tồn quá nhiều / dead stock.", CanhBaoTonKhoArgs, canh_bao_ton_kho, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("so_luong_dang_giu", "Tính số lượng đang giữ (allocated) theo SKU/tên.", SoLuongTheoSanPhamArgs, so_luong_dang_giu, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("so_luong_kha_dung", "Tính số lượng khả dụng (available) theo SKU/tên.", SoLuongTheoSanPhamArgs, so_luong_kha_dung, "supply_chain", cache_ttl_s=TTL_STOCK),
+    ToolSpec("kiem_tra_du_hang", "Kiểm tra đủ hàng cho nhu cầu theo SKU/tên.", KiemTraDuHangArgs, kiem_tra_du_hang, "supply_chain", cache_ttl_s=TTL_STOCK),
 ]
\ No newline at end of file
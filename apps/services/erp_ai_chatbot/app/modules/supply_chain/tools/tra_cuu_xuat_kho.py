@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import TTL_STATUS, ToolSpec, ok, can_lam_ro
 from app.modules.supply_chain.models import GoodsIssue, GIItem, Product
 from .helpers import norm_code, dt_iso, as_int
 
@@ -175,7 +175,7 @@ def top_san_pham_xuat_nhieu(session: Session, limit: int = 5):
     return ok(data, "Top sản phẩm xuất nhiều.")
 
 XUAT_KHO_TOOLS = [
-    ToolSpec("tra_cuu_trang_thai_phieu_xuat", "Tra trạng thái phiếu xuất (GI).", TrangThaiGIArgs, tra_cuu_trang_thai_phieu_xuat, "supply_chain"),
+    ToolSpec("tra_cuu_trang_thai_phieu_xuat", "Tra trạng thái phiếu xuất (GI).", TrangThaiGIArgs, tra_cuu_trang_thai_phieu_xuat, "supply_chain", cache_ttl_s=TTL_STATUS),
     ToolSpec("chi_tiet_phieu_xuat", "Tra chi tiết phiếu xuất (GI).", ChiTietGIArgs, chi_tiet_phieu_xuat, "supply_chain"),
     ToolSpec("danh_sach_gi_theo_loai", "Danh sách GI theo loại xuất.", GITheoLoaiArgs, danh_sach_gi_theo_loai, "supply_chain"),
     ToolSpec("danh_sach_gi_theo_tham_chieu", "Danh sách GI theo mã tham chiếu.", GITheoThamChieuArgs, danh_sach_gi_theo_tham_chieu, "supply_chain"),
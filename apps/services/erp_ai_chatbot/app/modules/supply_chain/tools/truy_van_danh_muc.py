@@ -2,7 +2,7 @@ from __future__ import annotations
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.ai.tooling import ToolSpec, ok, can_lam_ro
+from app.ai.tooling import ToolCachePolicy, ToolSpec, ok, can_lam_ro
 from app.modules.supply_chain.models import Product, Warehouse
 from .helpers import find_product, find_warehouse, as_int
 
@@ -35,5 +35,6 @@ def tim_kho(session: Session, tu_khoa: str):
 
 DANH_MUC_TOOLS = [
     ToolSpec("tim_san_pham", "Tìm sản phẩm theo SKU hoặc tên.", TimSanPhamArgs, tim_san_pham, "supply_chain"),
-    ToolSpec("tim_kho", "Tìm kho theo mã hoặc tên.", TimKhoArgs, tim_kho, "supply_chain"),
+    ToolSpec("tim_kho", "Tìm kho theo mã hoặc tên.", TimKhoArgs, tim_kho, "supply_chain",
+             cache=ToolCachePolicy(ttl_s=300, casefold_fields=("tu_khoa",))),
 ]
@@ -0,0 +1,86 @@
+# benchmarks/compare.py
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# =========================================================
+# So sánh 2 report của benchmarks/run_bench.py (vd commit cũ vs commit mới)
+#   python -m benchmarks.compare reports/abc123-10000.json reports/def456-10000.json --fail-over 15
+# - In chênh lệch p50/p95 tổng, p50 từng pha, số câu SQL / request, peak bộ nhớ
+# - --fail-over PCT: exit 1 nếu p95 tổng của kịch bản nào chậm hơn quá PCT% (dùng cho CI)
+# =========================================================
+
+# cấu hình phải giống nhau thì số mới so được
+_COMPARABLE_META = ("rows", "caches", "compose", "llm_latency_s", "db_backend")
+
+
+def _load(path: str) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def _delta(old: Optional[float], new: Optional[float]) -> str:
+    if old is None or new is None:
+        return "n/a"
+    if old == 0:
+        return "=" if new == 0 else "+inf"
+    pct = (new - old) / old * 100
+    return f"{pct:+.1f}%"
+
+
+def _row(label: str, old: Optional[float], new: Optional[float]) -> str:
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"  # noqa: E731
+    return f"  {label:28} {fmt(old):>10} {fmt(new):>10} {_delta(old, new):>9}"
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """In bảng so sánh; trả về danh sách {scenario, p95_pct} để kiểm tra ngưỡng."""
+    mismatched = [k for k in _COMPARABLE_META if base["meta"].get(k) != head["meta"].get(k)]
+    print(f"base {base['meta'].get('commit')}  ->  head {head['meta'].get('commit')}")
+    if mismatched:
+        print(f"CẢNH BÁO: cấu hình khác nhau ({', '.join(mismatched)}), số liệu có thể không so được")
+
+    out: List[Dict[str, Any]] = []
+    for name, h in head["scenarios"].items():
+        b = base["scenarios"].get(name)
+        print(f"\n{name}" + ("" if b else "  (mới)"))
+        if not b:
+            continue
+        print(f"  {'':28} {'base':>10} {'head':>10} {'delta':>9}")
+        print(_row("total p50 ms", b["total_ms"]["p50"], h["total_ms"]["p50"]))
+        print(_row("total p95 ms", b["total_ms"]["p95"], h["total_ms"]["p95"]))
+        for phase in sorted(set(b["phases_ms"]) | set(h["phases_ms"])):
+            print(_row(
+                f"{phase} p50 ms",
+                (b["phases_ms"].get(phase) or {}).get("p50"),
+                (h["phases_ms"].get(phase) or {}).get("p50"),
+            ))
+        print(_row("queries / request", b["queries_per_request"]["mean"], h["queries_per_request"]["mean"]))
+        print(_row("tracemalloc peak KB", b.get("tracemalloc_peak_kb"), h.get("tracemalloc_peak_kb")))
+
+        old, new = b["total_ms"]["p95"], h["total_ms"]["p95"]
+        out.append({"scenario": name, "p95_pct": (new - old) / old * 100 if old else 0.0})
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="So sánh 2 report benchmark")
+    p.add_argument("base")
+    p.add_argument("head")
+    p.add_argument("--fail-over", type=float, default=None, help="exit 1 nếu p95 tổng chậm hơn quá PCT%%")
+    args = p.parse_args(argv)
+
+    deltas = compare(_load(args.base), _load(args.head))
+    if args.fail_over is not None:
+        slow = [d for d in deltas if d["p95_pct"] > args.fail_over]
+        if slow:
+            print("\nCHẬM HƠN NGƯỠNG: " + ", ".join(f"{d['scenario']} ({d['p95_pct']:+.1f}%)" for d in slow))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
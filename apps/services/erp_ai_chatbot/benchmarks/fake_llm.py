@@ -0,0 +1,163 @@
+# benchmarks/fake_llm.py
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+# =========================================================
+# Gemini giả cho benchmark: trả output soạn sẵn theo kịch bản (detect / plan / compose)
+# - Đăng ký vào service container (key ("genai", api_key)) -> llm_gateway.client() trả client này,
+#   toàn bộ đường gateway (slot, deadline, telemetry token/chi phí) vẫn chạy như thật
+# - Mục đích call suy ra từ config: schema có selected_module = detect, có steps = plan, còn lại = compose
+# - Kịch bản khớp theo message xuất hiện trong contents (không phân biệt hoa/thường, message dài nhất trước)
+# - usage_metadata ước lượng ~4 ký tự / token; độ trễ giả lập theo mục đích (mặc định 0)
+# =========================================================
+
+_CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class _Usage:
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+    cached_content_token_count: int = 0
+    thoughts_token_count: int = 0
+
+
+@dataclass
+class _Response:
+    text: str
+    usage_metadata: Optional[_Usage] = None
+
+
+@dataclass
+class _CachedContent:
+    name: str
+
+
+def _tokens(*parts: Any) -> int:
+    return sum(len(p if isinstance(p, str) else json.dumps(p, ensure_ascii=False, default=str)) for p in parts if p) // _CHARS_PER_TOKEN
+
+
+@dataclass
+class FakeGemini:
+    scenarios: List[Dict[str, Any]]
+    # giây giả lập theo mục đích, vd. {"detect": 0.4, "plan": 1.2, "compose": 1.5}
+    latency_s: Dict[str, float] = field(default_factory=dict)
+    calls: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._by_message = sorted(self.scenarios, key=lambda s: len(s["message"]), reverse=True)
+        self.models = _Models(self, is_async=False)
+        self.aio = _Aio(_Models(self, is_async=True))
+        self.caches = _Caches()
+
+    # ---------- dispatch ----------
+    def _purpose(self, config: Optional[Dict[str, Any]]) -> str:
+        props = ((config or {}).get("response_json_schema") or {}).get("properties") or {}
+        if "selected_module" in props:
+            return "detect"
+        if "steps" in props:
+            return "plan"
+        return "compose"
+
+    def _scenario(self, contents: Any) -> Dict[str, Any]:
+        text = contents if isinstance(contents, str) else json.dumps(contents, ensure_ascii=False, default=str)
+        text = text.casefold()
+        for sc in self._by_message:
+            if sc["message"].casefold() in text:
+                return sc
+        raise LookupError(f"fake LLM: không có kịch bản cho contents {text[:120]!r}")
+
+    def _text(self, purpose: str, sc: Dict[str, Any]) -> str:
+        if purpose == "detect":
+            return json.dumps(sc.get("detect") or {
+                "selected_module": sc.get("expected_module") or sc.get("module"),
+                "confidence": 0.95,
+                "needs_clarification": False,
+                "clarifying_question": None,
+            }, ensure_ascii=False)
+        if purpose == "plan":
+            if not sc.get("plan"):
+                raise LookupError(f"fake LLM: kịch bản {sc['name']!r} không có plan")
+            return json.dumps(sc["plan"], ensure_ascii=False)
+        return sc.get("compose") or "Đã có kết quả."
+
+    def respond(self, contents: Any, config: Optional[Dict[str, Any]]) -> _Response:
+        purpose = self._purpose(config)
+        with self._lock:
+            self.calls[purpose] = self.calls.get(purpose, 0) + 1
+        text = self._text(purpose, self._scenario(contents))
+        prompt = _tokens(contents, (config or {}).get("system_instruction"))
+        out = _tokens(text)
+        return _Response(text, _Usage(prompt, out, prompt + out))
+
+    def delay(self, config: Optional[Dict[str, Any]]) -> float:
+        return self.latency_s.get(self._purpose(config), 0.0)
+
+
+class _Models:
+    def __init__(self, fake: FakeGemini, is_async: bool):
+        self._fake = fake
+        self._async = is_async
+
+    def generate_content(self, model: str, contents: Any, config: Optional[Dict[str, Any]] = None):
+        if self._async:
+            return self._agenerate(contents, config)
+        time.sleep(self._fake.delay(config))
+        return self._fake.respond(contents, config)
+
+    async def _agenerate(self, contents, config):
+        await asyncio.sleep(self._fake.delay(config))
+        return self._fake.respond(contents, config)
+
+    def generate_content_stream(self, model: str, contents: Any, config: Optional[Dict[str, Any]] = None):
+        if self._async:
+            return self._astream(contents, config)
+        return self._stream(contents, config)
+
+    def _chunks(self, resp: _Response) -> List[_Response]:
+        words = resp.text.split(" ")
+        chunks = [_Response(w + (" " if i < len(words) - 1 else "")) for i, w in enumerate(words)]
+        chunks[-1].usage_metadata = resp.usage_metadata
+        return chunks
+
+    def _stream(self, contents, config) -> Iterator[_Response]:
+        time.sleep(self._fake.delay(config))
+        yield from self._chunks(self._fake.respond(contents, config))
+
+    async def _astream(self, contents, config):
+        await asyncio.sleep(self._fake.delay(config))
+
+        async def _gen():
+            for c in self._chunks(self._fake.respond(contents, config)):
+                yield c
+        return _gen()
+
+
+class _Aio:
+    def __init__(self, models: _Models):
+        self.models = models
+
+
+class _Caches:
+    def create(self, model: str, config: Dict[str, Any]):
+        return _CachedContent(name=f"cachedContents/fake-{config.get('display_name', 'planner')}")
+
+
+def install_fake_llm(scenarios: List[Dict[str, Any]], latency_s: Optional[Dict[str, float]] = None) -> FakeGemini:
+    """Gọi trước call LLM đầu tiên của process (client thật chưa được tạo)."""
+    from app.ai import llm_gateway
+    from app.core.services import get_or_create
+
+    fake = FakeGemini(scenarios, dict(latency_s or {}))
+    installed = get_or_create(("genai", llm_gateway._API_KEY), lambda: fake)
+    if installed is not fake:
+        raise RuntimeError("genai client thật đã được tạo trước khi cài fake LLM")
+    return fake
@@ -0,0 +1,319 @@
+# benchmarks/run_bench.py
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# =========================================================
+# Benchmark pipeline chat (execute_chat_unified) — chạy offline:
+# - Gemini giả (benchmarks/fake_llm.py) trả detect / plan / compose soạn sẵn theo kịch bản
+# - DB seed sẵn theo cỡ (--rows: số dòng mỗi bảng fact), SQLite mặc định hoặc Postgres qua --db-url
+# - Đo theo request: tổng thời gian, thời gian từng pha (trace telemetry), số câu SQL, token;
+#   theo tool: số câu SQL, thời gian DB, mẫu câu lặp nghi N+1 (app/db/query_stats.py)
+#   bộ nhớ: peak tracemalloc của 1 request + RSS tối đa của process
+# - Report JSON (kèm commit git) -> so sánh giữa các commit bằng benchmarks/compare.py
+#
+#   python -m benchmarks.run_bench --rows 10000 --iterations 30
+#   python -m benchmarks.run_bench --rows 1000000 --db-url "postgresql://u:p@localhost/bench_{module}"
+# =========================================================
+
+ROOT = Path(__file__).resolve().parents[1]
+BENCH_DIR = Path(__file__).resolve().parent
+MODULES = ("hrm", "supply_chain", "sale_crm", "finance_accounting")
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark pipeline chat với fake LLM + DB seed sẵn")
+    p.add_argument("--rows", type=int, default=10_000, help="số dòng mỗi bảng fact (10k..10M)")
+    p.add_argument("--iterations", type=int, default=30, help="số request đo cho mỗi kịch bản")
+    p.add_argument("--warmup", type=int, default=3, help="số request chạy bỏ đầu (không tính)")
+    p.add_argument("--scenarios", default=str(BENCH_DIR / "scenarios.json"))
+    p.add_argument("--only", action="append", default=[], help="chỉ chạy kịch bản có tên này (lặp được)")
+    p.add_argument("--db-url", default=None,
+                   help="template URL theo module, vd postgresql://u:p@host/bench_{module}; mặc định SQLite trong --data-dir")
+    p.add_argument("--data-dir", default=str(BENCH_DIR / ".data"))
+    p.add_argument("--reseed", action="store_true", help="seed lại kể cả khi DB đã có dữ liệu đúng cỡ")
+    p.add_argument("--caches", choices=("off", "on"), default="off",
+                   help="off: tắt answer/plan/tool cache để đo đủ pipeline mỗi request")
+    p.add_argument("--no-compose", action="store_true", help="tắt bước compose (LLM #3)")
+    p.add_argument("--llm-latency", default="",
+                   help="độ trễ giả lập (giây) theo mục đích, vd detect=0.4,plan=1.2,compose=1.5")
+    p.add_argument("--no-memory", action="store_true", help="bỏ lượt đo tracemalloc")
+    p.add_argument("--out", default=None, help="file report JSON (mặc định benchmarks/reports/<commit>-<rows>.json)")
+    return p.parse_args(argv)
+
+
+def _configure_env(args: argparse.Namespace) -> None:
+    # phải chạy trước khi import app.* (cấu hình đọc env lúc import)
+    flag = "1" if args.caches == "on" else "0"
+    for name in ("ANSWER_CACHE_ENABLED", "PLAN_CACHE_ENABLED", "TOOL_CACHE_ENABLED"):
+        os.environ[name] = flag
+    os.environ.setdefault("AUDIT_LEVEL", "error")
+
+
+def _latency(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in filter(None, (s.strip() for s in spec.split(","))):
+        k, _, v = part.partition("=")
+        out[k.strip()] = float(v)
+    return out
+
+
+def _git(*cmd: str) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    xs = sorted(values)
+
+    def _q(q: float) -> float:
+        # nội suy tuyến tính giữa 2 hạng gần nhất
+        pos = (len(xs) - 1) * q
+        lo = int(pos)
+        hi = min(lo + 1, len(xs) - 1)
+        return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+    return {
+        "mean": round(sum(xs) / len(xs), 3),
+        "p50": round(_q(0.50), 3),
+        "p90": round(_q(0.90), 3),
+        "p95": round(_q(0.95), 3),
+        "p99": round(_q(0.99), 3),
+        "max": round(xs[-1], 3),
+    }
+
+
+# ---------- đếm câu SQL ----------
+class QueryCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def attach(self, engine) -> None:
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _count(*_):
+            with self._lock:
+                self.total += 1
+
+
+def _session_factories():
+    from app.db.finance_database import FinanceSessionLocal
+    from app.db.hrm_database import HrmSessionLocal
+    from app.db.sale_crm_database import SaleCrmSessionLocal
+    from app.db.supply_chain_database import SupplyChainSessionLocal
+
+    return {f.name: f for f in (HrmSessionLocal, SupplyChainSessionLocal, SaleCrmSessionLocal, FinanceSessionLocal)}
+
+
+def _prepare_databases(args: argparse.Namespace, modules: List[str], counter: QueryCounter) -> Dict[str, str]:
+    from app.core.services import created
+    from benchmarks.seed import seed_module
+
+    urls: Dict[str, str] = {}
+    for m in modules:
+        if args.db_url:
+            urls[m] = args.db_url.format(module=m)
+        else:
+            Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+            urls[m] = f"sqlite:///{Path(args.data_dir) / f'{m}-{args.rows}.sqlite3'}"
+        seed_module(m, urls[m], args.rows, reseed=args.reseed)
+
+    # engine tạo lười -> trỏ factory sang DB benchmark trước lần mở session đầu
+    factories = _session_factories()
+    if created("engine"):
+        raise RuntimeError(f"engine đã được tạo trước khi cấu hình benchmark: {created('engine')}")
+    for m, url in urls.items():
+        factories[m].db_url = url
+        counter.attach(factories[m].engine)
+    return urls
+
+
+def _modules_of(scenarios: List[Dict[str, Any]]) -> List[str]:
+    used = {s.get("expected_module") or s["module"] for s in scenarios}
+    return [m for m in MODULES if m in used]
+
+
+# ---------- chạy ----------
+def _tool_sql(trace: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # span "tool" mang attrs sql = QueryStats.summary() của lần gọi đó
+    out: Dict[str, Dict[str, Any]] = {}
+    for s in trace.get("spans") or []:
+        if s.get("phase") == "tool" and s.get("sql"):
+            out[f"{s.get('step')}:{s.get('tool')}"] = s["sql"]
+    return out
+
+
+def _run_once(sc: Dict[str, Any], compose: bool, counter: QueryCounter) -> Dict[str, Any]:
+    from app.ai.executor.executor_chat import execute_chat_unified
+
+    q0 = counter.total
+    t0 = time.perf_counter()
+    res = execute_chat_unified(
+        module=sc["module"],
+        user_id=sc.get("user_id"),
+        role=sc.get("role"),
+        message=sc["message"],
+        compose_enabled=compose,
+        debug=True,
+    )
+    total_ms = (time.perf_counter() - t0) * 1000
+    trace = res.get("trace") or {}
+    data = res.get("data") or {}
+    return {
+        "total_ms": total_ms,
+        "phases": {p: v["ms"] for p, v in (trace.get("phases") or {}).items()},
+        "queries": counter.total - q0,
+        "tools": _tool_sql(trace),
+        "tokens": (trace.get("tokens") or {}).get("total", 0),
+        "failed_steps": sum(1 for v in data.values() if isinstance(v, dict) and v.get("ok") is False),
+        "answer_source": res.get("answer_source"),
+        "selected_module": res.get("selected_module"),
+    }
+
+
+def _memory_peak_kb(sc: Dict[str, Any], compose: bool, counter: QueryCounter) -> float:
+    tracemalloc.start()
+    try:
+        _run_once(sc, compose, counter)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def _rss_max_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS trả byte, Linux trả KB
+    return round(kb / (1024 * 1024) if sys.platform == "darwin" else kb / 1024, 1)
+
+
+def bench_scenario(sc: Dict[str, Any], args: argparse.Namespace, counter: QueryCounter) -> Dict[str, Any]:
+    compose = not args.no_compose
+    for _ in range(args.warmup):
+        _run_once(sc, compose, counter)
+
+    runs = [_run_once(sc, compose, counter) for _ in range(args.iterations)]
+    phases: Dict[str, List[float]] = {}
+    tools: Dict[str, Dict[str, Any]] = {}
+    for r in runs:
+        for p, ms in r["phases"].items():
+            phases.setdefault(p, []).append(ms)
+        for key, sql in r["tools"].items():
+            t = tools.setdefault(key, {"statements": [], "db_ms": [], "n_plus_one": {}})
+            t["statements"].append(float(sql["statements"]))
+            t["db_ms"].append(sql["db_ms"])
+            for rep in sql.get("n_plus_one") or []:
+                t["n_plus_one"][rep["sql"]] = max(t["n_plus_one"].get(rep["sql"], 0), rep["count"])
+
+    out: Dict[str, Any] = {
+        "module": sc["module"],
+        "selected_module": runs[-1]["selected_module"],
+        "answer_source": runs[-1]["answer_source"],
+        "failed_steps": runs[-1]["failed_steps"],
+        "total_ms": percentiles([r["total_ms"] for r in runs]),
+        "phases_ms": {p: percentiles(v) for p, v in sorted(phases.items())},
+        "queries_per_request": percentiles([float(r["queries"]) for r in runs]),
+        "tokens_per_request": percentiles([float(r["tokens"]) for r in runs]),
+        "tools": {
+            key: {
+                "statements": percentiles(t["statements"]),
+                "db_ms": percentiles(t["db_ms"]),
+                **({"n_plus_one": [{"sql": q, "count": n} for q, n in t["n_plus_one"].items()]} if t["n_plus_one"] else {}),
+            }
+            for key, t in tools.items()
+        },
+    }
+    if not args.no_memory:
+        out["tracemalloc_peak_kb"] = _memory_peak_kb(sc, compose, counter)
+    return out
+
+
+def _print_summary(report: Dict[str, Any]) -> None:
+    print(f"\n{'scenario':34} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KB':>9}  phases p50 (ms)")
+    for name, r in report["scenarios"].items():
+        phases = " ".join(f"{p}={v['p50']:.1f}" for p, v in r["phases_ms"].items())
+        flag = " !" if r["failed_steps"] else ""
+        print(
+            f"{name:34} {r['total_ms']['p50']:9.2f} {r['total_ms']['p95']:9.2f} "
+            f"{r['queries_per_request']['mean']:8.1f} {r.get('tracemalloc_peak_kb', 0):9.1f}  {phases}{flag}"
+        )
+        for key, t in r.get("tools", {}).items():
+            for rep in t.get("n_plus_one") or []:
+                print(f"  N+1? {key}: {rep['count']}x {rep['sql'][:100]}")
+    print(f"\nRSS max: {report['process']['rss_max_mb']} MB")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    _configure_env(args)
+    sys.path.insert(0, str(ROOT))
+
+    scenarios = json.loads(Path(args.scenarios).read_text(encoding="utf-8"))
+    if args.only:
+        scenarios = [s for s in scenarios if s["name"] in set(args.only)]
+    if not scenarios:
+        print("không có kịch bản nào để chạy", file=sys.stderr)
+        return 2
+
+    from benchmarks.fake_llm import install_fake_llm
+
+    fake = install_fake_llm(scenarios, _latency(args.llm_latency))
+    counter = QueryCounter()
+    urls = _prepare_databases(args, _modules_of(scenarios), counter)
+
+    results: Dict[str, Any] = {}
+    for sc in scenarios:
+        results[sc["name"]] = bench_scenario(sc, args, counter)
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--", ".")),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "caches": args.caches,
+            "compose": not args.no_compose,
+            "llm_latency_s": _latency(args.llm_latency),
+            "db_backend": ",".join(sorted({u.split(":", 1)[0] for u in urls.values()})),
+        },
+        "scenarios": results,
+        "llm_calls": dict(fake.calls),
+        "process": {"rss_max_mb": _rss_max_mb()},
+    }
+
+    out = Path(args.out) if args.out else BENCH_DIR / "reports" / f"{commit or 'local'}-{args.rows}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    _print_summary(report)
+    print(f"report: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# benchmarks/seed.py
+from __future__ import annotations
+
+import importlib
+import math
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, Date, DateTime, Enum, Float, Integer, LargeBinary,
+    MetaData, Numeric, String, Table, Text, Time, create_engine, event, inspect, select,
+)
+from sqlalchemy.engine import Engine, make_url
+
+# =========================================================
+# Seed DB ERP giả lập cho benchmark (SQLite file hoặc Postgres)
+# - Schema lấy từ model thật (Base.metadata.create_all), dữ liệu sinh tất định theo số thứ tự dòng
+# - Bảng fact (chấm công, đơn hàng, bút toán, tồn kho...) = `rows` dòng; bảng danh mục = max(20, sqrt(rows))
+# - FK: tổ hợp FK của 1 dòng là biểu diễn hỗn hợp cơ số của i theo số dòng bảng cha
+#   -> không trùng unique constraint nhiều cột (vd current_stock(warehouse, bin, product))
+# - Một số cột "nhìn thấy được" sinh theo định dạng thật để kịch bản hỏi được: NV001, SKU00001, WH01...
+# - Bảng _bench_seed ghi (rows, version): DB đã seed đúng cỡ thì bỏ qua, chạy lại không tốn thời gian
+# =========================================================
+
+SEED_VERSION = "1"
+BATCH_ROWS = 5000
+MIN_DIMENSION_ROWS = 20
+
+_BASE_DAY = date(2025, 12, 31)
+_BASE_TS = datetime(2025, 12, 31, 17, 0, 0)
+
+FACT_TABLES: Dict[str, set] = {
+    "hrm": {
+        "timesheet_daily", "attendance_log", "leave_request", "ot_request",
+        "labor_contract", "payslip", "payslip_detail",
+    },
+    "supply_chain": {
+        "current_stock", "inventory_transaction_logs", "purchase_requests", "pr_items", "quotations",
+        "purchase_orders", "po_items", "goods_receipts", "gr_items", "goods_issues", "gi_items",
+        "stocktake_details", "purchase_returns",
+    },
+    "sale_crm": {"order", "order_detail", "payment", "review", "address"},
+    "finance_accounting": {
+        "journal_entries", "journal_entry_lines", "ar_invoices", "ap_invoices", "cash_transactions",
+    },
+}
+
+# (bảng, cột) -> giá trị theo k (1-based)
+_OVERRIDES: Dict[tuple, Callable[[int], Any]] = {
+    ("employee", "employee_code"): lambda k: f"NV{k:03d}",
+    ("employee", "user_id"): lambda k: k,
+    ("employee", "full_name"): lambda k: f"Nhân viên {k}",
+    ("employee", "status"): lambda k: "ACTIVE" if k % 10 else "INACTIVE",
+    ("department", "code"): lambda k: f"PB{k:03d}",
+    ("department", "name"): lambda k: f"Phòng ban {k}",
+    ("position", "title"): lambda k: f"Chức vụ {k}",
+    ("warehouses", "warehouse_code"): lambda k: f"WH{k:02d}",
+    ("warehouses", "warehouse_name"): lambda k: f"Kho {k}",
+    ("products", "sku"): lambda k: f"SKU{k:05d}",
+    ("products", "product_name"): lambda k: f"Sản phẩm {k}",
+    ("suppliers", "supplier_code"): lambda k: f"NCC{k:03d}",
+    ("suppliers", "supplier_name"): lambda k: f"Nhà cung cấp {k}",
+    ("chart_of_accounts", "account_code"): lambda k: str(100 + k),
+    ("chart_of_accounts", "account_name"): lambda k: f"Tài khoản {100 + k}",
+    ("chart_of_accounts", "is_active"): lambda k: True,
+    ("business_partners", "partner_name"): lambda k: f"Đối tác {k}",
+    ("product", "name"): lambda k: f"Sản phẩm {k}",
+}
+
+
+_BASES = {
+    "hrm": ("app.db.hrm_database", "HrmBase"),
+    "supply_chain": ("app.db.supply_chain_database", "SupplyChainBase"),
+    "sale_crm": ("app.db.sale_crm_database", "SaleCrmBase"),
+    "finance_accounting": ("app.db.finance_database", "FinanceBase"),
+}
+
+
+def _model_metadata(module: str) -> MetaData:
+    if module not in _BASES:
+        raise ValueError(f"module không hợp lệ: {module}")
+    # import model để đăng ký bảng vào Base tương ứng
+    importlib.import_module(f"app.modules.{module}.models")
+    db_module, base = _BASES[module]
+    return getattr(importlib.import_module(db_module), base).metadata
+
+
+def table_rows(module: str, table: str, rows: int) -> int:
+    if table in FACT_TABLES.get(module, ()):
+        return rows
+    return max(MIN_DIMENSION_ROWS, math.isqrt(rows))
+
+
+def _initials(name: str) -> str:
+    return "".join(p[:1] for p in name.split("_") if p).upper() or "X"
+
+
+def _column_value(table: Table, col: Column, i: int, fk_value: Optional[int]) -> Any:
+    k = i + 1
+    override = _OVERRIDES.get((table.name, col.name))
+    if override is not None:
+        return override(k)
+    if col.primary_key:
+        return k
+    if col.foreign_keys:
+        return fk_value
+
+    t = col.type
+    if isinstance(t, Enum):
+        enums = t.enums
+        return enums[(i * 7) % len(enums)]
+    if isinstance(t, Boolean):
+        return i % 5 != 0
+    if isinstance(t, (Integer, BigInteger)):
+        return (i * 31) % 1000
+    if isinstance(t, (Numeric, Float)):
+        v = Decimal((i * 7919) % 10_000_000) / 100
+        return float(v) if isinstance(t, Float) else v
+    if isinstance(t, DateTime):
+        return _BASE_TS - timedelta(minutes=(i * 37) % (730 * 24 * 60))
+    if isinstance(t, Date):
+        return _BASE_DAY - timedelta(days=(i * 13) % 730)
+    if isinstance(t, Time):
+        return dtime(8 + i % 3, 0)
+    if isinstance(t, JSON):
+        return {}
+    if isinstance(t, LargeBinary):
+        return b""
+    if isinstance(t, (String, Text)):
+        s = f"{_initials(col.name)}{k}"
+        length = getattr(t, "length", None)
+        return s[:length] if length else s
+    return None
+
+
+def _fk_parent(col: Column) -> Optional[str]:
+    fk = next(iter(col.foreign_keys))
+    return fk.column.table.name
+
+
+def _rows(table: Table, n: int, counts: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    fk_cols = [c for c in table.columns if c.foreign_keys and (table.name, c.name) not in _OVERRIDES]
+    for i in range(n):
+        fk_values: Dict[str, Optional[int]] = {}
+        rest = i
+        for c in fk_cols:
+            parent = _fk_parent(c)
+            if parent == table.name:
+                # cây tự tham chiếu (danh mục cha/con): để gốc
+                fk_values[c.name] = None
+                continue
+            pn = max(1, counts.get(parent, 1))
+            fk_values[c.name] = rest % pn + 1
+            rest //= pn
+        yield {c.name: _column_value(table, c, i, fk_values.get(c.name)) for c in table.columns}
+
+
+def _batched(it: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for row in it:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_MARKER_META = MetaData()
+_MARKER = Table(
+    "_bench_seed", _MARKER_META,
+    Column("rows", BigInteger, nullable=False),
+    Column("version", String(20), nullable=False),
+)
+
+
+def _seeded_rows(engine: Engine) -> Optional[int]:
+    if not inspect(engine).has_table(_MARKER.name):
+        return None
+    with engine.connect() as conn:
+        row = conn.execute(select(_MARKER.c.rows, _MARKER.c.version)).first()
+    if row is None or row.version != SEED_VERSION:
+        return None
+    return int(row.rows)
+
+
+def _fast_sqlite(engine: Engine) -> None:
+    # seed 1 lần, không cần durability
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_conn, _):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=OFF")
+        cur.execute("PRAGMA synchronous=OFF")
+        cur.close()
+
+
+def seed_module(module: str, db_url: str, rows: int, reseed: bool = False, log: Callable[[str], None] = print) -> Dict[str, int]:
+    """Tạo schema + dữ liệu cho 1 module. Trả về số dòng theo bảng (rỗng nếu DB đã seed sẵn)."""
+    metadata = _model_metadata(module)
+    is_sqlite = make_url(db_url).get_backend_name() == "sqlite"
+    engine = create_engine(db_url)
+    if is_sqlite:
+        _fast_sqlite(engine)
+    try:
+        if not reseed and _seeded_rows(engine) == rows:
+            log(f"[seed] {module}: đã có dữ liệu rows={rows}, bỏ qua")
+            return {}
+
+        metadata.drop_all(engine)
+        _MARKER_META.drop_all(engine)
+        metadata.create_all(engine)
+
+        counts: Dict[str, int] = {}
+        for table in metadata.sorted_tables:
+            counts[table.name] = table_rows(module, table.name, rows)
+        t0 = time.perf_counter()
+        for table in metadata.sorted_tables:
+            n = counts[table.name]
+            with engine.begin() as conn:
+                for batch in _batched(_rows(table, n, counts), BATCH_ROWS):
+                    conn.execute(table.insert(), batch)
+        _MARKER_META.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(_MARKER.insert(), [{"rows": rows, "version": SEED_VERSION}])
+        log(f"[seed] {module}: {sum(counts.values())} dòng / {len(counts)} bảng trong {time.perf_counter() - t0:.1f}s")
+        return counts
+    finally:
+        engine.dispose()
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+
+from app.ai import answer_cache  # noqa: E402
+from app.api.v1 import admin  # noqa: E402
+
+
+def test_admin_closed_without_token(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", None)
+    with pytest.raises(HTTPException) as e:
+        admin._check_admin("bat-ky")
+    assert e.value.status_code == 404
+
+
+@pytest.mark.parametrize("token", [None, "", "sai", "bi-mat-"])
+def test_admin_rejects_wrong_token(monkeypatch, token):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "bi-mat")
+    with pytest.raises(HTTPException) as e:
+        admin._check_admin(token)
+    assert e.value.status_code == 403
+
+
+def test_flush_bumps_data_version(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "bi-mat")
+    before = answer_cache.data_version("hrm")
+    admin.tool_cache_flush(admin.FlushToolCacheRequest(module="hrm"), x_admin_token="bi-mat")
+    assert answer_cache.data_version("hrm") == before + 1
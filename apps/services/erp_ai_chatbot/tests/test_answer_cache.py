@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.ai import answer_cache, module_registry
+from app.ai.answer_cache import bump_data_version, cached_result, lookup_answer, store_answer
+from app.ai.tooling import TTL_STATUS, TTL_STOCK
+
+MODULE = "hrm"
+TOOLS = {
+    "doc": SimpleNamespace(read_only=True, cache_ttl_s=None),
+    "doc_ngan": SimpleNamespace(read_only=True, cache_ttl_s=5),
+    "doc_tat": SimpleNamespace(read_only=True, cache_ttl_s=0),
+    "ghi": SimpleNamespace(read_only=False, cache_ttl_s=None),
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "_ENTRIES", type(answer_cache._ENTRIES)())
+    monkeypatch.setattr(answer_cache, "_STATS", dict.fromkeys(answer_cache._STATS, 0))
+    monkeypatch.setattr(answer_cache, "_DATA_VERSIONS", {})
+    monkeypatch.setattr(answer_cache, "get_tool", lambda module, name: TOOLS.get(name))
+
+
+def _res(*tools, answer="Bạn còn 3 ngày phép."):
+    return {
+        "answer": answer,
+        "plan": {"steps": [{"id": f"s{i}", "tool": t} for i, t in enumerate(tools, 1)]},
+        "data": {f"s{i}": {"ok": True, "data": 1} for i in range(1, len(tools) + 1)},
+    }
+
+
+def _store(message="Phép còn lại?", role="NV", user_id=1, user_scoped=True, res=None, compose=True):
+    lookup = lookup_answer(MODULE, message, role, user_id, compose)
+    return store_answer(lookup, user_id, user_scoped, MODULE, 0.9, None, res or _res("doc"))
+
+
+def test_hit_ignores_case_spacing_and_punctuation():
+    assert _store("Phép  còn lại?")
+    lookup = lookup_answer(MODULE, "phép còn lại", "NV", 1)
+    assert cached_result(lookup)["answer"] == "Bạn còn 3 ngày phép."
+
+
+@pytest.mark.parametrize(
+    "role, user_id, compose",
+    [
+        ("QUAN_LY", 1, True),   # role khác
+        ("NV", 2, True),        # user khác, entry theo user
+        ("NV", 1, False),       # tắt compose -> câu trả lời khác
+    ],
+)
+def test_key_separates_role_user_and_compose(role, user_id, compose):
+    _store()
+    assert lookup_answer(MODULE, "Phép còn lại?", role, user_id, compose).hit is None
+
+
+def test_shared_scope_serves_other_users_of_same_role():
+    _store(user_scoped=False)
+    assert lookup_answer(MODULE, "Phép còn lại?", "NV", 2).hit is not None
+
+
+def test_data_version_bump_invalidates():
+    _store()
+    bump_data_version(MODULE)
+    assert lookup_answer(MODULE, "Phép còn lại?", "NV", 1).hit is None
+    assert answer_cache.answer_cache_stats()["stale"] == 1
+
+
+def test_write_during_compute_is_not_stored():
+    lookup = lookup_answer(MODULE, "Phép còn lại?", "NV", 1)
+    bump_data_version(MODULE)
+    assert store_answer(lookup, 1, True, MODULE, 0.9, None, _res("doc")) is False
+
+
+def test_ttl_is_min_of_tool_ttls():
+    assert _store(res=_res("doc", "doc_ngan"))
+    (entry,) = answer_cache._ENTRIES.values()
+    assert entry.expires_at - entry.created_at == 5
+    # cache_ttl_s=0: tool không cho cache
+    assert _store("câu khác", res=_res("doc", "doc_tat")) is False
+
+
+def test_ttl_expiry(monkeypatch):
+    monkeypatch.setitem(answer_cache.MODULE_TTL_SECONDS, MODULE, 0.001)
+    _store()
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: float("inf"))
+    assert lookup_answer(MODULE, "Phép còn lại?", "NV", 1).hit is None
+    assert answer_cache.answer_cache_stats()["expired"] == 1
+
+
+@pytest.mark.parametrize(
+    "res",
+    [
+        _res("doc", "ghi"),                                  # plan có tool ghi
+        _res("doc", answer=""),                              # không có câu trả lời
+        {**_res("doc"), "data": {"s1": {"ok": False}}},      # step lỗi
+        {**_res("doc"), "plan": {"needs_clarification": True, "steps": [{"tool": "doc"}]}},
+    ],
+)
+def test_uncacheable_results(res):
+    assert _store(res=res) is False
+
+
+@pytest.mark.parametrize(
+    "module, tools, ttl",
+    [
+        ("supply_chain", ["tra_cuu_trang_thai_don_mua", "so_luong_kha_dung"], TTL_STOCK),
+        ("sale_crm", ["tra_cuu_trang_thai_don_hang"], TTL_STATUS),
+        ("finance_accounting", ["ar_no"], TTL_STATUS),
+    ],
+)
+def test_plan_with_volatile_tool_gets_its_ttl(monkeypatch, module, tools, ttl):
+    monkeypatch.setattr(answer_cache, "get_tool", module_registry.get_tool)
+    plan = {"steps": [{"tool": t} for t in tools]}
+    assert answer_cache._plan_ttl(module, plan) == ttl < answer_cache.MODULE_TTL_SECONDS[module]
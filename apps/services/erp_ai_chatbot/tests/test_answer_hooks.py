@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app.ai.plan_schema import Plan
+from app.ai.executor import plan_engine
+from app.ai.executor.plan_engine import PlanRun, build_answer, build_answer_async
+from app.ai.executor.executor_sale_crm import SALE_CRM_HOOKS
+from app.ai.executor.executor_finance_accounting import FINANCE_HOOKS
+
+
+def _run(hooks, results, message="đơn hàng của tôi"):
+    plan = Plan.model_validate({
+        "module": hooks.module,
+        "intent": "test",
+        "steps": [{"id": f"s{i}", "tool": f"tool_{i}", "args": {}} for i in range(1, len(results) + 1)],
+    })
+    run = PlanRun(hooks=hooks, plan=plan, message=message, user_id=1, role="admin")
+    run.step_infos = [
+        {"id": f"s{i}", "tool": f"tool_{i}", "args": {}, "result": r} for i, r in enumerate(results, 1)
+    ]
+    return run
+
+
+def _answer(run, mode, composed, monkeypatch):
+    calls = []
+
+    def compose(module, message, step_infos, on_delta=None):
+        calls.append(step_infos)
+        if isinstance(composed, Exception):
+            raise composed
+        return composed
+
+    async def compose_async(*args, **kwargs):
+        return compose(*args, **kwargs)
+
+    monkeypatch.setattr(plan_engine, "compose_answer_with_llm", compose)
+    monkeypatch.setattr(plan_engine, "compose_answer_with_llm_async", compose_async)
+    if mode == "sync":
+        return build_answer(run), calls
+    return asyncio.run(build_answer_async(run)), calls
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_sale_crm_rejects_no_data_answer_when_tools_have_data(mode, monkeypatch):
+    run = _run(SALE_CRM_HOOKS, [{"ok": True, "data": [{"order_id": 1}, {"order_id": 2}], "thong_diep": ""}])
+    res, calls = _answer(run, mode, "Không có dữ liệu cho câu hỏi này.", monkeypatch)
+
+    assert len(calls) == 1
+    assert res["answer_source"] == "fallback"
+    assert res["answer"] == "Có 2 kết quả."
+    assert res["compose_error"]
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_finance_strict_fallback(mode, monkeypatch):
+    run = _run(FINANCE_HOOKS, [{"ok": True, "data": [], "thong_diep": ""}], message="công nợ")
+    res, _ = _answer(run, mode, RuntimeError("llm down"), monkeypatch)
+
+    assert res["answer_source"] == "fallback"
+    assert res["answer"] == "Không có dữ liệu phù hợp."
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_compose_disabled_skips_llm(mode, monkeypatch):
+    run = _run(SALE_CRM_HOOKS, [{"ok": True, "data": [], "thong_diep": ""}])
+    monkeypatch.setattr(plan_engine, "compose_answer_with_llm", None)
+    monkeypatch.setattr(plan_engine, "compose_answer_with_llm_async", None)
+
+    res = build_answer(run, False) if mode == "sync" else asyncio.run(build_answer_async(run, False))
+    assert res["composed_used"] is False
+    assert res["answer"] == "Không có dữ liệu phù hợp."
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_recompose_sends_answer_reset(mode, monkeypatch):
+    # finance compose lại khi bản đầu không dùng được -> client phải xoá bản nháp cũ
+    events = []
+    run = _run(FINANCE_HOOKS, [{"ok": True, "data": [{"so_du": 1}], "thong_diep": ""}], message="số dư")
+    run.on_event = lambda event, payload: events.append((event, payload.get("text")))
+    drafts = iter([None, "Số dư hiện tại là 1."])
+
+    def compose(module, message, step_infos, on_delta=None):
+        text = next(drafts)
+        on_delta(text or "bản nháp bị bỏ")
+        return text
+
+    async def compose_async(*args, **kwargs):
+        return compose(*args, **kwargs)
+
+    monkeypatch.setattr(plan_engine, "compose_answer_with_llm", compose)
+    monkeypatch.setattr(plan_engine, "compose_answer_with_llm_async", compose_async)
+    res = build_answer(run) if mode == "sync" else asyncio.run(build_answer_async(run))
+
+    assert events == [
+        ("answer_delta", "bản nháp bị bỏ"),
+        ("answer_reset", None),
+        ("answer_delta", "Số dư hiện tại là 1."),
+    ]
+    assert res["answer"] == "Số dư hiện tại là 1."
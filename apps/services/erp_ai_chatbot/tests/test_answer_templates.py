@@ -0,0 +1,36 @@
+import pytest
+
+from app.ai.answer_templates import render_template_answer
+
+
+def _si(tool, data):
+    return [{"id": "s1", "tool": tool, "args": {}, "result": {"ok": True, "data": data, "thong_diep": ""}}]
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (
+            {"period_name": "Tháng 5/2025", "start_date": "2025-05-01", "end_date": "2025-05-31", "status": "OPEN"},
+            "Kỳ kế toán hiện tại là Tháng 5/2025 (từ 01/05/2025 đến 31/05/2025), trạng thái đang mở.",
+        ),
+        # thiếu ngày -> để LLM compose thay vì in "từ None"
+        ({"period_name": "Tháng 5/2025", "start_date": None, "end_date": "2025-05-31", "status": "OPEN"}, None),
+        ({"period_name": "Tháng 5/2025", "start_date": "2025-05-01", "status": "OPEN"}, None),
+    ],
+)
+def test_ky_hien_tai(data, expected):
+    assert render_template_answer("kỳ kế toán hiện tại", _si("ky_hien_tai", data)) == expected
+
+
+@pytest.mark.parametrize(
+    "question, active, expected",
+    [
+        ("tôi đã đăng ký khuôn mặt chưa?", True, "Bạn đã đăng ký dữ liệu khuôn mặt."),
+        ("em chưa có face data à", False, "Bạn chưa đăng ký dữ liệu khuôn mặt."),
+        ("nhân viên NV042 đã đăng ký khuôn mặt chưa?", False, "Nhân viên có ID 42 chưa đăng ký dữ liệu khuôn mặt."),
+    ],
+)
+def test_face_data_subject(question, active, expected):
+    data = {"employee_id": 42, "has_active_face_data": active}
+    assert render_template_answer(question, _si("trang_thai_face_data", data)) == expected
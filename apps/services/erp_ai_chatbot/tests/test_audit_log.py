@@ -0,0 +1,35 @@
+from app.core import audit_log
+
+
+class _Writer:
+    def __init__(self):
+        self.events = []
+
+    def submit(self, event):
+        self.events.append(event)
+
+
+def test_audit_snapshots_event_on_enqueue(monkeypatch):
+    writer = _Writer()
+    monkeypatch.setattr(audit_log, "_WRITER", writer)
+    step_infos = [{"id": "s1", "result": {"data": [1]}}]
+    event = {"event": "plan_done", "args": {"x": 1}, "step_infos": step_infos}
+
+    audit_log.audit(event, level="info")
+    # request chạy tiếp và sửa object gốc trước khi thread nền kịp serialize
+    event["args"]["x"] = 2
+    step_infos.append({"id": "s2"})
+    step_infos[0]["result"]["data"].append(2)
+
+    (queued,) = writer.events
+    assert queued["args"] == {"x": 1}
+    assert queued["step_infos"] == [{"id": "s1", "result": {"data": [1]}}]
+    assert "ts" not in event
+
+
+def test_snapshot_is_size_capped(monkeypatch):
+    monkeypatch.setattr(audit_log, "AUDIT_SNAPSHOT_MAX_ITEMS", 10)
+    snap = audit_log.snapshot_event({"event": "x", "args": {"a": [1, 2, 3]}, "result": {"data": list(range(20))}})
+
+    assert snap["args"] == {"a": [1, 2, 3]}
+    assert snap["result"]["data"] == [0, 1, 2, 3, 4, {"_more_items": 15}]
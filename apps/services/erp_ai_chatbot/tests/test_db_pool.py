@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.core.config import DbPoolSettings
+from app.db import common
+from app.db.pool_metrics import MeteredAsyncQueuePool, MeteredQueuePool
+
+
+def test_async_pool_is_metered():
+    assert issubclass(MeteredAsyncQueuePool, MeteredQueuePool)
+
+
+def test_async_engine_uses_pool_settings(monkeypatch):
+    pytest.importorskip("greenlet")
+    import sqlalchemy.ext.asyncio as asyncio_ext
+    seen = {}
+
+    def fake_create_async_engine(url, **kwargs):
+        # asyncpg không có sẵn trong môi trường test: chỉ kiểm tra tham số truyền vào
+        seen.update(kwargs, url=url)
+        return SimpleNamespace(sync_engine=create_engine("sqlite://"))
+
+    monkeypatch.setattr(asyncio_ext, "create_async_engine", fake_create_async_engine)
+    monkeypatch.setattr(common, "_ASYNC_ENGINES", {})
+    pool = DbPoolSettings(size=7, max_overflow=3, recycle_s=600, timeout_s=4.0, statement_timeout_ms=1500)
+
+    common.make_async_engine("postgresql://u:p@db/hrm", pool, name="hrm")
+
+    assert seen["url"] == "postgresql+asyncpg://u:p@db/hrm"
+    assert seen["poolclass"] is MeteredAsyncQueuePool
+    assert (seen["pool_size"], seen["max_overflow"], seen["pool_recycle"], seen["pool_timeout"]) == (7, 3, 600, 4.0)
+    assert seen["connect_args"] == {"server_settings": {"statement_timeout": "1500"}}
+    assert "hrm.async" in common.pool_stats()
@@ -0,0 +1,88 @@
+import dataclasses
+from collections import Counter
+from typing import Optional, Union
+
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.ai import module_registry
+from app.ai.plan_schema import Plan
+from app.ai.tooling import ToolSpec, ok
+from app.ai.executor import executor_hrm, plan_engine
+from app.ai.executor.executor_hrm import execute_chat_hrm
+
+USER_ID = 7
+
+
+class _Args(BaseModel):
+    target_user_id: Optional[int] = None
+    employee_id: Optional[Union[int, str]] = None
+    employee_code: Optional[str] = None
+    thang: Optional[int] = None
+
+
+PLAN = Plan.model_validate({
+    "module": "hrm",
+    "intent": "cham_cong",
+    "steps": [
+        {"id": "s1", "tool": "so_du_phep", "args": {}},
+        # mã NV -> normalize_args tra employee_id qua thong_tin_nhan_vien (lookup phụ, không tính là step)
+        {"id": "s2", "tool": "cham_cong", "args": {"employee_id": "NV001", "thang": "{{s1.data.thang}}"}},
+        {"id": "s3", "tool": "nghi_phep", "args": {"target_user_id": "ME"}},
+    ],
+})
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def tool(name, data):
+        def handler(session, **kwargs):
+            calls.append((name, kwargs))
+            return ok(data)
+
+        return ToolSpec(ten_tool=name, mo_ta="", args_model=_Args, handler=handler, module="hrm")
+
+    specs = {
+        t.ten_tool: t
+        for t in (
+            tool("thong_tin_nhan_vien", {"employee_id": 42}),
+            tool("so_du_phep", {"thang": 5, "con_lai": 3}),
+            tool("cham_cong", {"so_ngay": 20}),
+            tool("nghi_phep", []),
+        )
+    }
+    # registry chỉ có tool giả (không nạp tool HRM thật)
+    monkeypatch.setitem(module_registry._MODULE_TOOLS, "hrm", specs)
+    monkeypatch.setattr(module_registry, "_LOADED", module_registry._LOADED | {"hrm"})
+    monkeypatch.setattr(plan_engine, "plan_route", lambda module, message, auth: PLAN)
+    hooks = dataclasses.replace(executor_hrm.HRM_HOOKS, session_factory=sessionmaker(bind=create_engine("sqlite://")))
+    monkeypatch.setattr(executor_hrm, "HRM_HOOKS", hooks)
+    return calls
+
+
+def test_each_step_calls_its_tool_once(calls):
+    res = execute_chat_hrm("hrm", USER_ID, "HR_STAFF", "chấm công tháng của NV001", compose_enabled=False)
+
+    assert res["tool_calls"] == len(PLAN.steps)
+    assert Counter(name for name, _ in calls) == {
+        "so_du_phep": 1,
+        "cham_cong": 1,
+        "nghi_phep": 1,
+        "thong_tin_nhan_vien": 1,
+    }
+
+    by_tool = {name: kwargs for name, kwargs in calls}
+    # auth của người hỏi được inject vào mọi step
+    assert by_tool["so_du_phep"]["target_user_id"] == USER_ID
+    assert by_tool["nghi_phep"]["target_user_id"] == USER_ID
+    assert by_tool["cham_cong"] == {
+        "target_user_id": USER_ID,
+        "employee_id": 42,
+        "employee_code": None,
+        "thang": 5,
+    }
+    assert res["data"]["s2"]["data"] == {"so_ngay": 20}
@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ngân sách import (ms) cho entrypoint chat; chỉnh qua IMPORT_TIME_BUDGET_MS trên máy CI chậm
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+ENTRYPOINT = "app.ai.executor.executor_chat"
+SERVICE_ROOT = Path(__file__).resolve().parents[1]
+
+_PROBE = f"""
+import json, sys
+import {ENTRYPOINT}
+from app.core import services
+from app.db import common
+print(json.dumps({{
+    "services": [repr(k) for k in services.created()],
+    "engines": sorted(common._ENGINES),
+    "genai_imported": "google.genai" in sys.modules,
+}}))
+"""
+
+# tạo app + chạy startup (TestClient): không DB nào được tạo engine khi WARMUP_MODULES rỗng
+_APP_PROBE = """
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db import common
+with TestClient(app):
+    pass
+print(json.dumps({"engines": sorted(common._ENGINES)}))
+"""
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)\s*$")
+
+
+def _run_probe(probe: str = _PROBE, env=None):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=SERVICE_ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        env=env,
+    )
+    if proc.returncode != 0:
+        if "ModuleNotFoundError" in proc.stderr:
+            pytest.skip("thiếu dependency để import entrypoint: " + proc.stderr.strip().splitlines()[-1])
+        raise AssertionError(proc.stderr)
+    return proc
+
+
+def test_import_has_no_side_effects():
+    proc = _run_probe()
+    state = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    assert state["services"] == []
+    assert state["engines"] == []
+    assert state["genai_imported"] is False
+
+
+def test_import_time_budget():
+    proc = _run_probe()
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m and m.group(2) == ENTRYPOINT:
+            cumulative_us = int(m.group(1))
+
+    assert cumulative_us is not None, "không đọc được output của -X importtime"
+    assert cumulative_us / 1000 <= IMPORT_TIME_BUDGET_MS, (
+        f"import {ENTRYPOINT} mất {cumulative_us / 1000:.0f}ms > {IMPORT_TIME_BUDGET_MS:.0f}ms"
+    )
+
+
+def test_app_startup_creates_no_engines():
+    # URL giả: nếu startup tạo engine thì _ENGINES sẽ có tên DB (không cần DB thật để tạo engine lười)
+    env = {**os.environ, "WARMUP_MODULES": "", "HRM_DATABASE_URL": "sqlite://"}
+    proc = _run_probe(_APP_PROBE, env=env)
+    state = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    assert state["engines"] == []
+
+
+def test_warmup_only_listed_modules(monkeypatch):
+    from app.core.config import DbPoolSettings
+    from app.db import common
+
+    monkeypatch.setattr(common, "_ENGINES", {})
+    monkeypatch.setattr(common, "_LAZY_FACTORIES", {})
+    common.LazySessionFactory("warmup_a", "sqlite://", DbPoolSettings(warmup=1))
+    common.LazySessionFactory("warmup_b", "sqlite://", DbPoolSettings(warmup=1))
+
+    assert common.warmup_engines() == {}
+    assert common._ENGINES == {}
+
+    assert common.warmup_engines(["warmup_a"]) == {"warmup_a": 1}
+    assert sorted(common._ENGINES) == ["warmup_a"]
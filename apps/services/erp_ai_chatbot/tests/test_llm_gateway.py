@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.ai import answer_composer, llm_gateway
+
+
+class _Stream:
+    def __init__(self, n):
+        self.chunks = iter([SimpleNamespace(text=f"c{i}", usage_metadata=None) for i in range(n)])
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def close(self):
+        self.closed = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    streams = []
+    active = {"now": 0, "max": 0}
+
+    def stream(**kwargs):
+        streams.append(_Stream(3))
+        return streams[-1]
+
+    async def astream(**kwargs):
+        return stream(**kwargs)
+
+    async def agenerate(**kwargs):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return SimpleNamespace(text="ok", usage_metadata=None)
+
+    fake = SimpleNamespace(
+        models=SimpleNamespace(generate_content_stream=stream),
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content_stream=astream, generate_content=agenerate)),
+    )
+    monkeypatch.setattr(llm_gateway, "client", lambda: fake)
+    fake.streams, fake.active = streams, active
+    return fake
+
+
+def _free_sync_slots():
+    return llm_gateway._SLOTS._value
+
+
+def test_sync_stream_stopped_early_releases_slot(fake_client):
+    free = _free_sync_slots()
+
+    def on_delta(text):
+        raise RuntimeError("client ngắt kết nối")
+
+    with pytest.raises(RuntimeError):
+        answer_composer.compose_answer_with_llm("hrm", "q", [], on_delta=on_delta)
+
+    assert _free_sync_slots() == free
+    assert fake_client.streams[0].closed
+
+
+def test_async_stream_stopped_early_releases_slot(fake_client):
+    def on_delta(text):
+        raise RuntimeError("client ngắt kết nối")
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await answer_composer.compose_answer_with_llm_async("hrm", "q", [], on_delta=on_delta)
+        return llm_gateway._async_slots()._value
+
+    assert asyncio.run(main()) == llm_gateway.LLM_MAX_CONCURRENCY_ASYNC
+    assert fake_client.streams[0].closed
+
+
+def test_async_limiter_caps_concurrency_without_sync_slots(fake_client, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_CONCURRENCY_ASYNC", 2)
+    free = _free_sync_slots()
+
+    async def main():
+        return await asyncio.gather(*(llm_gateway.agenerate("compose", "q") for _ in range(6)))
+
+    assert [r.text for r in asyncio.run(main())] == ["ok"] * 6
+    assert fake_client.active["max"] == 2
+    assert _free_sync_slots() == free
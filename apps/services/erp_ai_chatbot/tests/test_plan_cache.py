@@ -0,0 +1,88 @@
+import pytest
+
+from app.ai import plan_cache
+from app.ai.plan_cache import lookup_plan, store_plan, templatize
+from app.ai.plan_schema import Plan
+
+AUTH = {"role": "KHO"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(plan_cache, "_ENTRIES", type(plan_cache._ENTRIES)())
+    monkeypatch.setattr(plan_cache, "_STATS", dict.fromkeys(plan_cache._STATS, 0))
+    monkeypatch.setattr(plan_cache, "registry_version", lambda module: 1)
+
+
+def _plan(args, **extra):
+    return Plan.model_validate({
+        "module": "supply_chain",
+        "intent": "ton_kho",
+        "steps": [{"id": "s1", "tool": "ton_kho_theo_sku", "args": args}],
+        **extra,
+    })
+
+
+@pytest.mark.parametrize(
+    "message, template, kinds",
+    [
+        ("Tồn kho SKU ABC-01 ngày 01/03/2025?", "tồn kho sku {CODE} ngày {DATE}", ("CODE", "DATE")),
+        ("tồn kho  sku XYZ-99 ngày 2025-04-02", "tồn kho sku {CODE} ngày {DATE}", ("CODE", "DATE")),
+        ("Công nợ của Nguyễn Văn An", "công nợ của {NAME}", ("NAME",)),
+        ("top 5 sản phẩm", "top {NUM} sản phẩm", ("NUM",)),
+    ],
+)
+def test_templatize(message, template, kinds):
+    tpl, slots = templatize(message)
+    assert tpl == template
+    assert tuple(s.kind for s in slots) == kinds
+
+
+def test_hit_replays_plan_with_new_slot_values():
+    assert store_plan("supply_chain", "Tồn kho SKU ABC-01 ngày 01/03/2025", AUTH, None,
+                      _plan({"sku": "ABC-01", "ngay": "2025-03-01"}))
+
+    plan = lookup_plan("supply_chain", "tồn kho sku XYZ-99 ngày 02/04/2025", AUTH)
+    assert plan.steps[0].args == {"sku": "XYZ-99", "ngay": "2025-04-02"}
+    assert plan_cache.plan_cache_stats()["hits"] == 1
+
+
+@pytest.mark.parametrize(
+    "module, auth, hints",
+    [
+        ("sale_crm", AUTH, None),               # module khác
+        ("supply_chain", {"role": "KE_TOAN"}, None),  # role khác
+        ("supply_chain", AUTH, ["gợi ý khác"]),  # extra_hints khác
+    ],
+)
+def test_key_separates_module_role_and_hints(module, auth, hints):
+    store_plan("supply_chain", "tồn kho sku ABC-01", AUTH, None, _plan({"sku": "ABC-01"}))
+    assert lookup_plan(module, "tồn kho sku ABC-02", auth, hints) is None
+
+
+def test_registry_version_change_misses(monkeypatch):
+    store_plan("supply_chain", "tồn kho sku ABC-01", AUTH, None, _plan({"sku": "ABC-01"}))
+    monkeypatch.setattr(plan_cache, "registry_version", lambda module: 2)
+    assert lookup_plan("supply_chain", "tồn kho sku ABC-02", AUTH) is None
+
+
+def test_ttl_expiry(monkeypatch):
+    store_plan("supply_chain", "tồn kho sku ABC-01", AUTH, None, _plan({"sku": "ABC-01"}))
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE_TTL_SECONDS", -1)
+    assert lookup_plan("supply_chain", "tồn kho sku ABC-02", AUTH) is None
+    assert plan_cache.plan_cache_stats()["expired"] == 1
+
+
+@pytest.mark.parametrize(
+    "message, plan",
+    [
+        # slot không xuất hiện trong args
+        ("tồn kho sku ABC-01", _plan({"sku": "KHAC-02"})),
+        # 2 slot trùng giá trị
+        ("so sánh ABC-01 với ABC-01", _plan({"sku": "ABC-01"})),
+        ("tồn kho sku ABC-01", _plan({}, needs_clarification=True, clarifying_question="SKU nào?")),
+    ],
+)
+def test_uncacheable_plans(message, plan):
+    assert store_plan("supply_chain", message, AUTH, None, plan) is False
+    assert plan_cache.plan_cache_stats()["uncacheable"] == 1
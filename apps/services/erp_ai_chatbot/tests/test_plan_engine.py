@@ -0,0 +1,253 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.ai import module_registry
+from app.ai.plan_schema import Plan
+from app.ai.tooling import ToolSpec, can_lam_ro, ok
+from app.ai.executor import plan_engine
+from app.ai.executor.plan_engine import ModuleHooks, compile_plan, plan_levels, start_run
+
+
+# module giả: tool đăng ký thẳng vào registry, không đụng tool thật của 4 module ERP
+MODULE = "test_plan_engine"
+
+
+class _Args(BaseModel):
+    x: Optional[int] = None
+
+
+def _tool(name, result, calls, read_only=True, sessions=None):
+    def handler(session, **kwargs):
+        calls.append(name)
+        if sessions is not None:
+            sessions.append((name, session))
+        return result(kwargs) if callable(result) else result
+
+    return ToolSpec(ten_tool=name, mo_ta="", args_model=_Args, handler=handler, module=MODULE, read_only=read_only)
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def sessions():
+    return []
+
+
+@pytest.fixture
+def tools(monkeypatch, calls, sessions):
+    specs = {
+        t.ten_tool: t
+        for t in (
+            _tool("doc_a", ok({"v": 1}), calls, sessions=sessions),
+            _tool("doc_b", lambda kw: ok({"v": kw.get("x")}), calls),
+            _tool("hoi_lai", can_lam_ro("Bạn muốn hỏi nhân viên nào?"), calls),
+            _tool("ghi", ok({"saved": True}), calls, read_only=False),
+        )
+    }
+    monkeypatch.setitem(module_registry._MODULE_TOOLS, MODULE, specs)
+    monkeypatch.setattr(plan_engine, "bump_data_version", lambda module: None)
+    return specs
+
+
+ENGINE = create_engine("sqlite://")
+HOOKS = ModuleHooks(module=MODULE, session_factory=sessionmaker(bind=ENGINE), inject_auth=False)
+
+
+def _plan(*steps):
+    return Plan.model_validate({
+        "module": MODULE,
+        "intent": "test",
+        "steps": [{"id": f"s{i}", "tool": tool, "args": args} for i, (tool, args) in enumerate(steps, 1)],
+    })
+
+
+def _run_sync(plan):
+    run = start_run(HOOKS, 1, "admin", "q", plan)
+    run.run_steps()
+    return run
+
+
+def _run_async(plan, monkeypatch):
+    from app.ai.executor import executor_async
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def get_bind(self):
+            return ENGINE
+
+        async def run_sync(self, fn):
+            return fn(self)
+
+        async def rollback(self):
+            pass
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(executor_async, "get_async_session_factory", lambda module: _Session)
+    monkeypatch.setattr(executor_async, "bump_data_version", lambda module: None)
+
+    async def main():
+        run = start_run(HOOKS, 1, "admin", "q", plan, caller=executor_async.AsyncToolCaller())
+        await run.run_steps_async()
+        return run
+
+    return asyncio.run(main())
+
+
+def test_write_step_is_a_barrier(tools):
+    plan = _plan(("doc_a", {}), ("doc_b", {}), ("ghi", {}), ("doc_b", {}), ("doc_a", {}))
+    assert plan_levels(plan, compile_plan(plan), {2}) == [[0, 1], [2], [3, 4]]
+    assert plan_engine.StepSchedule(plan).levels == [[0, 1], [2], [3, 4]]
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_write_does_not_run_after_clarification(tools, calls, monkeypatch, mode):
+    # không tham chiếu nhau: trước đây "ghi" cùng tầng với "hoi_lai" và vẫn chạy
+    plan = _plan(("hoi_lai", {}), ("ghi", {}))
+    run = _run_sync(plan) if mode == "sync" else _run_async(plan, monkeypatch)
+
+    assert run.early_result["answer"] == "Bạn muốn hỏi nhân viên nào?"
+    assert "ghi" not in calls
+    assert [si["tool"] for si in run.step_infos] == ["hoi_lai"]
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_write_does_not_run_after_unresolved_ref(tools, calls, monkeypatch, mode):
+    plan = _plan(("doc_a", {}), ("doc_b", {"x": "{{s1.data.khong_co}}"}), ("ghi", {}))
+    run = _run_sync(plan) if mode == "sync" else _run_async(plan, monkeypatch)
+
+    assert run.early_result is None
+    assert calls == ["doc_a"]
+    assert [si["tool"] for si in run.step_infos] == ["doc_a"]
+
+
+def test_write_runs_after_reads_commit(tools, calls):
+    plan = _plan(("doc_a", {}), ("doc_b", {"x": "{{s1.data.v}}"}), ("ghi", {}))
+    run = _run_sync(plan)
+
+    assert calls == ["doc_a", "doc_b", "ghi"]
+    assert run.step_infos[-1]["result"]["data"] == {"saved": True}
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_reads_after_write_use_new_unit_of_work(tools, calls, sessions, monkeypatch, mode):
+    plan = _plan(("doc_a", {}), ("ghi", {}), ("doc_a", {}))
+    _run_sync(plan) if mode == "sync" else _run_async(plan, monkeypatch)
+
+    assert calls == ["doc_a", "ghi", "doc_a"]
+    (_, before), (_, after) = sessions
+    # snapshot trước step ghi không thấy dữ liệu vừa ghi -> session đọc sau phải là session mới
+    assert before is not after
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_sequential_reads_share_one_session(tools, sessions, monkeypatch, mode):
+    plan = _plan(("doc_a", {}), ("doc_a", {"x": "{{s1.data.v}}"}))
+    _run_sync(plan) if mode == "sync" else _run_async(plan, monkeypatch)
+
+    (_, first), (_, second) = sessions
+    assert first is second
+
+
+def test_cancelled_sink_stops_remaining_steps(tools, calls):
+    from app.ai.events import ChatCancelled
+
+    def sink(event, payload):
+        if event == "tool_result":
+            raise ChatCancelled()
+
+    plan = _plan(("doc_a", {}), ("doc_b", {"x": "{{s1.data.v}}"}))
+    run = start_run(HOOKS, 1, "admin", "q", plan)
+    run.on_event = sink
+    with pytest.raises(ChatCancelled):
+        run.run_steps()
+    assert calls == ["doc_a"]
+
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_failed_parallel_step_waits_for_siblings_before_close(monkeypatch, mode):
+    import time
+
+    from app.ai.executor import executor_async
+    from app.core.errors import ToolExecutionError
+
+    events = []
+
+    def slow(kw):
+        if mode == "sync":
+            time.sleep(0.1)
+        events.append("cham_xong")
+        return ok({})
+
+    def fail(kw):
+        raise RuntimeError("lỗi DB")
+
+    specs = {t.ten_tool: t for t in (_tool("cham", slow, []), _tool("loi", fail, []))}
+    monkeypatch.setitem(module_registry._MODULE_TOOLS, MODULE, specs)
+    plan = _plan(("cham", {}), ("loi", {}))
+
+    class Caller(plan_engine.ToolCaller):
+        def close(self, run):
+            events.append("close")
+            super().close(run)
+
+    class AsyncCaller(executor_async.AsyncToolCaller):
+        async def close(self, run):
+            events.append("close")
+            await super().close(run)
+
+    class _Session:
+        opened = 0
+
+        def __init__(self):
+            # session đầu (step "cham") đang await DB khi step "loi" lỗi
+            self.delay = 0.1 if _Session.opened == 0 else 0
+            _Session.opened += 1
+
+        def get_bind(self):
+            return ENGINE
+
+        async def run_sync(self, fn):
+            try:
+                await asyncio.sleep(self.delay)
+            finally:
+                events.append("session_xong")
+            return fn(self)
+
+        async def rollback(self):
+            pass
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(executor_async, "get_async_session_factory", lambda module: _Session)
+
+    async def main():
+        run = start_run(HOOKS, 1, "admin", "q", plan, caller=AsyncCaller())
+        with pytest.raises(ToolExecutionError):
+            await run.run_steps_async()
+
+    if mode == "sync":
+        run = start_run(HOOKS, 1, "admin", "q", plan, caller=Caller())
+        with pytest.raises(ToolExecutionError):
+            run.run_steps()
+        assert events == ["cham_xong", "close"]
+    else:
+        asyncio.run(main())
+        # step "cham" bị huỷ và đã thoát hẳn trước khi unit of work rollback
+        assert events[-1] == "close" and events.count("session_xong") == 2
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.db import query_stats
+from app.db.query_stats import instrument_engine, statement_shape, track_queries
+
+
+@pytest.mark.parametrize(
+    "sql, shape",
+    [
+        ("SELECT * FROM t WHERE id = 42", "SELECT * FROM t WHERE id = ?"),
+        ("SELECT * FROM t WHERE name = 'O''Brien' AND x > 1.5", "SELECT * FROM t WHERE name = ? AND x > ?"),
+        ("SELECT * FROM t WHERE id IN (?, ?, ?)", "SELECT * FROM t WHERE id IN (?+)"),
+        ("SELECT * FROM t WHERE id IN (%(id_1)s, %(id_2)s)", "SELECT * FROM t WHERE id IN (?+)"),
+        ("SELECT * FROM t WHERE id IN ($1, $2) AND k = $3", "SELECT * FROM t WHERE id IN (?+) AND k = ?"),
+        ("SELECT *\n  FROM t1   WHERE id = :id", "SELECT * FROM t1 WHERE id = ?"),
+    ],
+)
+def test_statement_shape(sql, shape):
+    assert statement_shape(sql) == shape
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1, 10), (2, 20), (3, 30)"))
+    return engine
+
+
+def test_flags_repeated_shape_as_n_plus_one(engine, monkeypatch):
+    monkeypatch.setattr(query_stats, "QUERY_N_PLUS_ONE_THRESHOLD", 3)
+    with track_queries() as stats, engine.connect() as conn:
+        ids = [r[0] for r in conn.execute(text("SELECT id FROM t"))]
+        for i in ids:
+            conn.execute(text(f"SELECT v FROM t WHERE id = {i}"))
+
+    assert stats.statements == 4
+    assert stats.repeated(3) == [{"sql": "SELECT v FROM t WHERE id = ?", "count": 3}]
+    assert stats.summary()["n_plus_one"] == [{"sql": "SELECT v FROM t WHERE id = ?", "count": 3}]
+
+
+def test_batched_query_is_not_flagged(engine):
+    with track_queries() as stats, engine.connect() as conn:
+        conn.execute(text("SELECT v FROM t WHERE id IN (1, 2, 3)"))
+
+    assert stats.statements == 1
+    assert "n_plus_one" not in stats.summary()
+
+
+def test_failed_statement_leaves_no_state_on_connection(engine):
+    with track_queries() as stats, engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM khong_co_bang"))
+        conn.execute(text("SELECT 1"))
+
+        assert "query_stats_t0" not in conn.info
+    assert stats.statements == 1
+
+
+def test_untracked_queries_are_not_counted(engine):
+    with track_queries() as stats:
+        pass
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert stats.statements == 0
+
+
+def test_parallel_steps_count_separately(engine):
+    counts = {}
+
+    def step(name, n):
+        with track_queries() as stats, engine.connect() as conn:
+            for _ in range(n):
+                conn.execute(text("SELECT 1"))
+        counts[name] = stats.statements
+
+    threads = [threading.Thread(target=step, args=(name, n)) for name, n in (("a", 2), ("b", 5))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counts == {"a": 2, "b": 5}
@@ -0,0 +1,136 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+from app.ai import answer_cache, tool_cache
+from app.ai.tool_cache import cache_key, cached_call, cached_call_async, flush_tool_cache, tool_cache_stats
+from app.ai.tooling import ToolCachePolicy, ToolSpec, ok
+
+
+class _Args(BaseModel):
+    ma: str
+    kho: Optional[str] = None
+    limit: int = 10
+
+
+def _tool(name="danh_muc", read_only=True, **policy):
+    policy = {"ttl_s": 60, **policy}
+    return ToolSpec(
+        ten_tool=name, mo_ta="", args_model=_Args, handler=None, module="supply_chain",
+        read_only=read_only, cache=ToolCachePolicy(**policy),
+    )
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(tool_cache, "_CACHES", {})
+    monkeypatch.setattr(answer_cache, "_DATA_VERSIONS", {})
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+def _call(tool, args, calls, result=None):
+    def run():
+        calls.append(args)
+        return result or ok({"ma": args.get("ma")})
+    return cached_call(tool, args, run)
+
+
+@pytest.mark.parametrize(
+    "a, b, policy, same",
+    [
+        ({"ma": "SP01"}, {"ma": "SP01", "limit": 10}, {}, True),          # default sau validate
+        ({"ma": " SP01 "}, {"ma": "SP01"}, {}, True),                    # strip
+        ({"ma": "a  b"}, {"ma": "a b"}, {}, False),                      # handler không gộp khoảng trắng
+        ({"ma": "sp01"}, {"ma": "SP01"}, {}, False),
+        ({"ma": "sp01"}, {"ma": "SP01"}, {"casefold_fields": ("ma",)}, True),
+        ({"ma": "SP01", "limit": 5}, {"ma": "SP01", "limit": 50}, {"key_fields": ("ma",)}, True),
+        ({"ma": "SP01", "kho": "A"}, {"ma": "SP01", "kho": "B"}, {}, False),
+    ],
+)
+def test_key_normalisation(a, b, policy, same):
+    tool = _tool(**policy)
+    assert (cache_key(tool, a) == cache_key(tool, b)) is same
+
+
+def test_invalid_args_bypass_cache(calls):
+    tool = _tool()
+    assert cache_key(tool, {"limit": "x"}) is None
+    _call(tool, {"limit": "x"}, calls)
+    _call(tool, {"limit": "x"}, calls)
+    assert len(calls) == 2
+
+
+def test_hit_returns_copy(calls):
+    tool = _tool()
+    first = _call(tool, {"ma": "SP01"}, calls)
+    first["data"]["ma"] = "sửa"
+    assert _call(tool, {"ma": "SP01"}, calls)["data"] == {"ma": "SP01"}
+    assert len(calls) == 1
+    assert tool_cache_stats()["supply_chain.danh_muc"]["hits"] == 1
+
+
+def test_ttl_expiry(calls, monkeypatch):
+    tool = _tool(ttl_s=0.001)
+    _call(tool, {"ma": "SP01"}, calls)
+    monkeypatch.setattr(tool_cache.time, "monotonic", lambda: float("inf"))
+    _call(tool, {"ma": "SP01"}, calls)
+    assert len(calls) == 2
+    assert tool_cache_stats()["supply_chain.danh_muc"]["expired"] == 1
+
+
+def test_data_version_bump_invalidates(calls):
+    tool = _tool()
+    _call(tool, {"ma": "SP01"}, calls)
+    answer_cache.bump_data_version("supply_chain")
+    _call(tool, {"ma": "SP01"}, calls)
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize(
+    "tool, result",
+    [
+        (_tool(read_only=False), None),                       # tool ghi
+        (_tool(ttl_s=0), None),                               # TTL 0 = tắt
+        (_tool(), {"ok": False, "data": None, "thong_diep": "không tìm thấy"}),
+    ],
+)
+def test_not_cached(tool, result, calls):
+    _call(tool, {"ma": "SP01"}, calls, result)
+    _call(tool, {"ma": "SP01"}, calls, result)
+    assert len(calls) == 2
+
+
+def test_lru_eviction(calls):
+    tool = _tool(max_entries=2)
+    for ma in ("A1", "A2", "A1", "A3", "A2"):
+        _call(tool, {"ma": ma}, calls)
+    # A2 bị đẩy ra khi thêm A3 (A1 vừa dùng lại)
+    assert [c["ma"] for c in calls] == ["A1", "A2", "A3", "A2"]
+
+
+def test_flush_by_module_and_tool(calls):
+    a, b = _tool("danh_muc"), _tool("kho")
+    _call(a, {"ma": "SP01"}, calls)
+    _call(b, {"ma": "SP01"}, calls)
+    assert flush_tool_cache(module="supply_chain", tool="kho") == 1
+    assert flush_tool_cache(module="hrm") == 0
+    assert flush_tool_cache() == 1
+
+
+def test_async_path_shares_cache(calls):
+    tool = _tool()
+    _call(tool, {"ma": "SP01"}, calls)
+
+    async def run():
+        calls.append("async")
+        return ok({})
+
+    res = asyncio.run(cached_call_async(tool, {"ma": "SP01"}, run))
+    assert res["data"] == {"ma": "SP01"}
+    assert len(calls) == 1
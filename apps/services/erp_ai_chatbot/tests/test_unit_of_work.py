@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.db.unit_of_work import AsyncReadOnlyUnitOfWork, ReadOnlyUnitOfWork
+
+_PG = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+
+class _Result:
+    def scalar(self):
+        return "00000003-0000001B-1"
+
+
+def _pg_session(on_export):
+    # session Postgres giả: export snapshot xong thì unit of work đã bị đóng (renew() / hết lượt)
+    class _Session:
+        closed = False
+
+        def get_bind(self):
+            return _PG
+
+        def connection(self, **kw):
+            pass
+
+        def execute(self, stmt):
+            if "pg_export_snapshot" in str(stmt):
+                on_export()
+            return _Result()
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            self.closed = True
+
+    return _Session
+
+
+class _AsyncSession:
+    def __init__(self, sync):
+        self.sync = sync
+
+    def get_bind(self):
+        return _PG
+
+    async def connection(self, **kw):
+        pass
+
+    async def execute(self, stmt):
+        result = self.sync.execute(stmt)
+        # nhường event loop: close() đã lên lịch chạy xong trước khi _begin ghi snapshot
+        await asyncio.sleep(0)
+        return result
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        self.sync.close()
+
+
+def test_close_during_snapshot_export():
+    uow = ReadOnlyUnitOfWork(share_snapshot=True)
+    factory = _pg_session(uow.close)
+
+    with uow.session(factory):
+        pass
+
+    # không KeyError, không ghi snapshot vào unit of work đã đóng
+    assert uow._snapshots == {} and uow._snapshot_ready == {}
+
+
+def test_async_close_during_snapshot_export():
+    async def main():
+        uow = AsyncReadOnlyUnitOfWork(share_snapshot=True)
+        closing = []
+        sync_factory = _pg_session(lambda: closing.append(asyncio.ensure_future(uow.close())))
+
+        async with uow.session(lambda: _AsyncSession(sync_factory())):
+            await asyncio.gather(*closing)
+        return uow
+
+    uow = asyncio.run(main())
+    assert uow._snapshots == {} and uow._snapshot_ready == {}
@@ -0,0 +1,113 @@
+# app/core/embed_backends.py
+
+import os
+
+# Backend chạy model embedding trên CPU (chọn bằng EMBED_BACKEND):
+# - "torch": SentenceTransformer float32 (như trước đây)
+# - "int8":  SentenceTransformer + torch dynamic quantization (nn.Linear -> int8), không cần thư viện thêm
+# - "onnx":  SentenceTransformer backend ONNX Runtime (cần: pip install "optimum[onnxruntime]");
+#            EMBED_ONNX_FILE chọn file trong repo model, vd "onnx/model_qint8_avx512_vnni.onnx" (ONNX int8)
+# So sánh recall@k / độ trễ giữa các backend: scripts/bench_embedder.py
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# Cắt văn bản dài hơn N token (0 = mặc định của model, 8192 với BGE-M3); chunk 800 ký tự chỉ ~200-300 token
+EMBED_MAX_SEQ_LENGTH = int(os.getenv("EMBED_MAX_SEQ_LENGTH", "0"))
+# Số thread tính toán (0 = mặc định của torch / onnxruntime)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "")
+
+
+class EmbeddingBackend:
+    """Nạp model 1 lần; encode() trả vector đã chuẩn hoá (BGE cần normalize_embeddings=True)."""
+
+    name = ""
+
+    def __init__(self, model_name: str, max_seq_length: int = 0, threads: int = 0):
+        self.model_name = model_name
+        self.threads = threads
+        self.model = self._load()
+        if max_seq_length:
+            self.model.max_seq_length = max_seq_length
+
+    def _load(self):
+        raise NotImplementedError
+
+    def encode(self, texts: list[str], batch_size: int = 32) -> list[list[float]]:
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True).tolist()
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        return SentenceTransformer(self.model_name, device="cpu")
+
+
+class TorchInt8Backend(TorchBackend):
+    name = "int8"
+
+    def _load(self):
+        import torch
+
+        model = super()._load()
+        # trọng số nn.Linear lưu int8, activation lượng tử hoá động lúc chạy
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(EmbeddingBackend):
+    name = "onnx"
+
+    def __init__(self, model_name: str, max_seq_length: int = 0, threads: int = 0, onnx_file: str = EMBED_ONNX_FILE):
+        self.onnx_file = onnx_file
+        super().__init__(model_name, max_seq_length, threads)
+
+    def _load(self):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError('EMBED_BACKEND=onnx cần cài: pip install "optimum[onnxruntime]"') from e
+        from sentence_transformers import SentenceTransformer
+
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+        if self.onnx_file:
+            model_kwargs["file_name"] = self.onnx_file
+        return SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+BACKENDS = {b.name: b for b in (TorchBackend, TorchInt8Backend, OnnxBackend)}
+
+
+def create_backend(
+    model_name: str,
+    name: str = EMBED_BACKEND,
+    max_seq_length: int = EMBED_MAX_SEQ_LENGTH,
+    threads: int = EMBED_THREADS,
+) -> EmbeddingBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"EMBED_BACKEND không hợp lệ: {name!r} (chọn: {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_name, max_seq_length=max_seq_length, threads=threads)
+
+
+def backend_cache_key(
+    model_name: str,
+    name: str = EMBED_BACKEND,
+    max_seq_length: int = EMBED_MAX_SEQ_LENGTH,
+    onnx_file: str = EMBED_ONNX_FILE,
+) -> str:
+    """
+    Khoá model cho cache embedding: backend lượng tử hoá / cắt độ dài khác cho vector khác nên không
+    dùng chung cache. Cấu hình mặc định giữ khoá cũ (chỉ tên model).
+    """
+    parts = [model_name]
+    if name != TorchBackend.name:
+        parts.append(name + (f":{onnx_file}" if name == OnnxBackend.name and onnx_file else ""))
+    if max_seq_length:
+        parts.append(f"seq{max_seq_length}")
+    return "|".join(parts)
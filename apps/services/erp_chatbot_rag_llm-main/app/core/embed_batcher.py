@@ -0,0 +1,87 @@
+# app/core/embed_batcher.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+# Gom embedding câu truy vấn của các request chat đồng thời (mỗi request chạy ở 1 thread của threadpool
+# FastAPI) thành 1 lần encode theo batch: thread gom chờ tối đa EMBED_MICROBATCH_MAX_WAIT_MS kể từ
+# câu đầu tiên hoặc tới khi đủ EMBED_MICROBATCH_MAX_SIZE câu, encode 1 lần rồi trả kết quả cho từng request.
+# Chỉ 1 thread chạy model -> các request không tranh nhau thread CPU của torch / onnxruntime.
+EMBED_MICROBATCH_ENABLED = os.getenv("EMBED_MICROBATCH_ENABLED", "1") == "1"
+EMBED_MICROBATCH_MAX_WAIT_MS = float(os.getenv("EMBED_MICROBATCH_MAX_WAIT_MS", "5"))
+EMBED_MICROBATCH_MAX_SIZE = int(os.getenv("EMBED_MICROBATCH_MAX_SIZE", "32"))
+
+
+class MicroBatcher:
+    """
+    'encode_batch': list[str] -> list[vector] (cùng thứ tự). Lỗi encode được trả về cho mọi request
+    trong batch đó; thread gom vẫn chạy tiếp.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], List[List[float]]],
+        max_size: int = EMBED_MICROBATCH_MAX_SIZE,
+        max_wait_ms: float = EMBED_MICROBATCH_MAX_WAIT_MS,
+        name: str = "embed-batcher",
+    ):
+        self._encode_batch = encode_batch
+        self._max_size = max(1, max_size)
+        self._max_wait_s = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[tuple[str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def embed(self, text: str, timeout: float = None) -> List[float]:
+        """Chặn tới khi batch chứa 'text' encode xong."""
+        return self.submit(text).result(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+            }
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait_s
+        while len(batch) < self._max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # hết thời gian chờ: vẫn lấy nốt các câu đã nằm sẵn trong hàng đợi
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            try:
+                vectors = self._encode_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(batch, vectors):
+                fut.set_result(vec)
@@ -1,39 +1,76 @@
 # app/core/embedder.py
 
-from sentence_transformers import SentenceTransformer
 from functools import lru_cache
 
+from app.core.embed_backends import EMBED_BACKEND, EmbeddingBackend, backend_cache_key, create_backend
+from app.core.embed_batcher import EMBED_MICROBATCH_ENABLED, EMBED_MICROBATCH_MAX_SIZE, MicroBatcher
+from app.core.embedding_cache import get_embedding_cache, query_lru
+
 # Cập nhật tên model theo yêu cầu của bạn
 MODEL_NAME = "BAAI/bge-m3"
+# Khoá model trong cache embedding (tính từ cấu hình, không cần tải model)
+MODEL_KEY = backend_cache_key(MODEL_NAME)
 
 @lru_cache(maxsize=1) # Dùng cache để chỉ tải model 1 lần
-def get_embedding_model():
+def get_embedding_backend() -> EmbeddingBackend:
     """
-    Khởi tạo và trả về mô hình embedding BAAI/bge-m3.
-    """
-    print(f"Đang tải mô hình embedding: {MODEL_NAME}...")
-    
-    # BGE-M3 yêu cầu 'device' (CPU hoặc CUDA)
-    # và 'normalize_embeddings=True' để có hiệu suất tốt nhất
-    model = SentenceTransformer(
-        MODEL_NAME,
-        device="cpu"  # Dùng 'cuda' nếu bạn có GPU
-    )
-    
+    Khởi tạo backend embedding BAAI/bge-m3 theo EMBED_BACKEND (app/core/embed_backends.py).
+    """
+    print(f"Đang tải mô hình embedding: {MODEL_NAME} (backend {EMBED_BACKEND})...")
+    backend = create_backend(MODEL_NAME)
     print("Tải mô hình thành công.")
-    return model
+    return backend
+
+def get_embedding_model():
+    """
+    Trả về mô hình SentenceTransformer đang dùng (giữ lại để tương thích).
+    """
+    return get_embedding_backend().model
+
+def _encode(texts: list[str], batch_size: int) -> list[list[float]]:
+    return get_embedding_backend().encode(texts, batch_size=batch_size)
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+def embed_texts(texts: list[str], batch_size: int = 32) -> list[list[float]]:
     """
     Tạo embeddings cho một danh sách văn bản.
     BGE-M3 yêu cầu normalize_embeddings=True.
+    'batch_size' = số văn bản mỗi lượt forward của model (mặc định của sentence-transformers là 32).
+    Văn bản đã có trong cache trên đĩa (app/core/embedding_cache.py) không chạy lại model;
+    văn bản trùng nhau trong cùng danh sách chỉ embed 1 lần.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return _encode(texts, batch_size)
+
+    found = cache.get_many(MODEL_KEY, texts)
+    missing = list(dict.fromkeys(t for t in texts if t not in found))
+    if missing:
+        vectors = _encode(missing, batch_size)
+        cache.put_many(MODEL_KEY, zip(missing, vectors))
+        found.update(zip(missing, vectors))
+    return [found[t] for t in texts]
+
+@lru_cache(maxsize=1)
+def get_query_batcher() -> MicroBatcher:
+    """
+    Micro-batcher cho câu truy vấn (app/core/embed_batcher.py); None nếu EMBED_MICROBATCH_ENABLED=0.
+    """
+    if not EMBED_MICROBATCH_ENABLED:
+        return None
+    return MicroBatcher(lambda texts: embed_texts(texts, batch_size=EMBED_MICROBATCH_MAX_SIZE), name="query-embed-batcher")
+
+def embed_query(text: str) -> list[float]:
+    """
+    Embedding cho câu truy vấn: LRU trong process -> (gom batch với các request đồng thời)
+    cache trên đĩa -> model.
     """
-    model = get_embedding_model()
-    
-    # 'normalize_embeddings=True' rất quan trọng cho BGE
-    embeddings = model.encode(texts, normalize_embeddings=True)
-    
-    return embeddings.tolist()
+    vector = query_lru.get(MODEL_KEY, text)
+    if vector is None:
+        batcher = get_query_batcher()
+        vector = batcher.embed(text) if batcher else embed_texts([text])[0]
+        query_lru.put(MODEL_KEY, text, vector)
+    # trả bản sao: người gọi sửa list không làm hỏng cache
+    return list(vector)
 
 # --- Hàm cũ - Vẫn giữ lại để tương thích ---
 # (Hàm mới 'embed_texts' ở trên tốt hơn)
@@ -41,6 +78,4 @@ def embed_text(text: str) -> list[float]:
     """
     Tạo embedding cho một đoạn văn bản duy nhất.
     """
-    model = get_embedding_model()
-    embedding = model.encode(text, normalize_embeddings=True)
-    return embedding.tolist()
\ No newline at end of file
+    return embed_texts([text])[0]
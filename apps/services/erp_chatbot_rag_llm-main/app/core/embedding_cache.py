@@ -0,0 +1,147 @@
+# app/core/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.vectorstore import get_chroma_path
+
+# Cache embedding 2 tầng:
+# - Trên đĩa (SQLite): khoá (model, sha256 văn bản) -> vector float16 (mặc định). Dùng chung cho
+#   nạp tài liệu (chunk trùng nội dung giữa các file) và truy vấn; còn nguyên sau khi restart.
+# - Trong process (LRU): câu hỏi người dùng hay lặp lại -> không cần cả SQLite lẫn model.
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(get_chroma_path(), "embedding_cache.sqlite3"))
+# float16: nửa dung lượng, sai số ~1e-3 (không ảnh hưởng xếp hạng cosine); float32 nếu cần giữ nguyên
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float16")
+EMBED_QUERY_LRU_SIZE = int(os.getenv("EMBED_QUERY_LRU_SIZE", "1024"))
+
+# SQLite giới hạn số tham số mỗi câu lệnh
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Cache embedding trên đĩa; an toàn đa luồng (1 connection + khoá)."""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, dtype: str = EMBED_CACHE_DTYPE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model     TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dtype     TEXT NOT NULL,
+                vec       BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, texts: Iterable[str]) -> Dict[str, List[float]]:
+        """{văn bản: vector} cho các văn bản đã có trong cache."""
+        by_hash: Dict[str, List[str]] = {}
+        for t in texts:
+            by_hash.setdefault(text_hash(t), []).append(t)
+        hashes = list(by_hash)
+
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(hashes), _SQL_BATCH):
+                part = hashes[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, dtype, vec FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(part))})",
+                    (model, *part),
+                ).fetchall()
+                for h, dtype, blob in rows:
+                    vec = np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+                    for t in by_hash[h]:
+                        found[t] = vec
+            self.hits += len(found)
+            self.misses += sum(len(ts) for h, ts in by_hash.items() if ts[0] not in found)
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, List[float]]]):
+        rows = [
+            (model, text_hash(t), self._dtype.name, np.asarray(v, dtype=self._dtype).tobytes())
+            for t, v in items
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dtype, vec) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {"entries": size, "hits": self.hits, "misses": self.misses}
+
+
+class QueryLRU:
+    """LRU trong process cho embedding câu truy vấn: khoá (model, văn bản)."""
+
+    def __init__(self, max_size: int = EMBED_QUERY_LRU_SIZE):
+        self._max_size = max_size
+        self._data: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._data.get((model, text))
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end((model, text))
+            self.hits += 1
+            return vec
+
+    def put(self, model: str, text: str, vec: List[float]):
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._data[(model, text)] = vec
+            self._data.move_to_end((model, text))
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Cache trên đĩa dùng chung cho cả process; None nếu EMBED_CACHE_ENABLED=0."""
+    if not EMBED_CACHE_ENABLED:
+        return None
+    return EmbeddingCache()
+
+
+query_lru = QueryLRU()
+
+
+def embedding_cache_stats() -> dict:
+    cache = get_embedding_cache()
+    return {
+        "disk": cache.stats() if cache else None,
+        "query_lru": query_lru.stats(),
+    }
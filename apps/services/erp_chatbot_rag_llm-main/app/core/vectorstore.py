@@ -1,19 +1,27 @@
 # app/core/vectorstore.py
 
 import os
-import chromadb
 
 # Tên collection (giống như tên bảng)
 COLLECTION_NAME = "erp_knowledge_base"
 
+def get_chroma_path() -> str:
+    """
+    Thư mục lưu dữ liệu ChromaDB ('chroma_db' ở gốc dự án).
+    """
+    # Lấy đường dẫn thư mục gốc của dự án (đi lùi 2 cấp từ file này)
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(project_root, "chroma_db")
+
 def get_chroma_client():
     """
     Khởi tạo và trả về ChromaDB client.
     Dữ liệu sẽ được lưu vào thư mục 'chroma_db'.
     """
-    # Lấy đường dẫn thư mục gốc của dự án (đi lùi 2 cấp từ file này)
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    db_path = os.path.join(project_root, "chroma_db")
+    # import muộn: manifest / cache embedding chỉ cần get_chroma_path, không cần chromadb
+    import chromadb
+
+    db_path = get_chroma_path()
     
     print(f"Đang kết nối ChromaDB tại: {db_path}")
     client = chromadb.PersistentClient(path=db_path)
@@ -0,0 +1,113 @@
+# app/rag/manifest.py
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.vectorstore import COLLECTION_NAME, get_chroma_path
+
+# Manifest nạp tài liệu: file nào đã nạp (kích thước, mtime, hash nội dung) và các chunk của nó
+# (ID trong Chroma, hash nội dung, số trang). Lưu SQLite cạnh dữ liệu Chroma.
+# - File có kích thước + mtime không đổi -> bỏ qua, không cần đọc
+# - Chunk có hash đã nằm trong manifest -> giữ nguyên vector, không embed lại
+MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST_PATH",
+    os.path.join(get_chroma_path(), f"{COLLECTION_NAME}.manifest.sqlite3"),
+)
+
+
+def chunk_ids(source: str, chunk_hashes: List[str]) -> List[str]:
+    """
+    ID chunk theo nội dung: '{source}#{16 ký tự đầu hash}', chunk trùng nội dung trong cùng file
+    thêm hậu tố '-1', '-2'... Chèn/xoá đoạn văn chỉ làm đổi ID của các chunk bị ảnh hưởng.
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for h in chunk_hashes:
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        ids.append(f"{source}#{h[:16]}" + (f"-{n}" if n else ""))
+    return ids
+
+
+class IngestManifest:
+    """
+    Đọc ở process chính, ghi ở thread ghi Chroma (ChromaWriter) -> 1 connection dùng chung có khoá.
+    Chỉ ghi file vào manifest SAU KHI các chunk của nó đã ghi Chroma xong: chết giữa chừng thì lần
+    chạy sau thấy file chưa nạp và làm lại (upsert nên an toàn).
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                source     TEXT PRIMARY KEY,
+                size       INTEGER NOT NULL,
+                mtime_ns   INTEGER NOT NULL,
+                file_hash  TEXT NOT NULL,
+                pages      INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id   TEXT PRIMARY KEY,
+                source     TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                page       INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chunks_source ON chunks(source);
+            """
+        )
+
+    def get_file(self, source: str) -> Optional[Tuple[int, int, str]]:
+        """(size, mtime_ns, file_hash) hoặc None nếu chưa nạp."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, mtime_ns, file_hash FROM files WHERE source = ?", (source,)
+            ).fetchone()
+
+    def get_chunks(self, source: str) -> Dict[str, int]:
+        """{chunk_id: page} của file."""
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id, page FROM chunks WHERE source = ?", (source,)).fetchall()
+        return dict(rows)
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT source FROM files")]
+
+    def touch_file(self, source: str, size: int, mtime_ns: int):
+        """Nội dung không đổi (hash như cũ) nhưng stat đổi -> cập nhật để lần sau bỏ qua nhanh."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, updated_at = ? WHERE source = ?",
+                (size, mtime_ns, time.time(), source),
+            )
+
+    def save_file(self, source: str, size: int, mtime_ns: int, file_hash: str, pages: int,
+                  chunks: List[Tuple[str, str, int]]):
+        """Ghi đè manifest của file; 'chunks' = [(chunk_id, chunk_hash, page), ...]."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT INTO chunks (chunk_id, source, chunk_hash, page) VALUES (?, ?, ?, ?)",
+                [(cid, source, h, page) for cid, h, page in chunks],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (source, size, mtime_ns, file_hash, pages, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (source, size, mtime_ns, file_hash, pages, time.time()),
+            )
+
+    def delete_file(self, source: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM files WHERE source = ?", (source,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,12 +1,13 @@
 # app/rag/processor.py
 
 import os # << Thêm 'import os'
+import hashlib
 # THAY ĐỔI DÒNG NÀY:
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 # TỪ DÒNG CŨ: from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from langchain_community.document_loaders import PyPDFLoader
-from typing import List
+from typing import List, Optional, Tuple
 
 def get_text_splitter() -> RecursiveCharacterTextSplitter:
     """
@@ -40,4 +41,39 @@ def load_and_split_pdf(file_path: str) -> List[str]:
         
     except Exception as e:
         print(f"Lỗi khi xử lý PDF: {e}")
-        return []
\ No newline at end of file
+        return []
+
+# --- Dùng cho nạp hàng loạt (app/services/ingestion_service.py) ---
+# Chạy trong process con của ProcessPoolExecutor nên phải là hàm top-level (pickle được)
+# và không in log (process cha báo tiến độ).
+def file_sha256(file_path: str) -> str:
+    """Hash nội dung file (đọc theo khối 1MB)."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_pdf(file_path: str, known_hash: Optional[str] = None) -> Tuple[str, str, int, Optional[List[Tuple[str, int, str]]]]:
+    """
+    Hash file rồi đọc & chia nhỏ.
+    Trả về (file_path, hash file, số trang, [(nội dung chunk, số trang, hash chunk), ...]).
+    Nếu hash file == 'known_hash' (file không đổi) thì không đọc PDF: trả về (file_path, hash, 0, None).
+    """
+    file_hash = file_sha256(file_path)
+    if file_hash == known_hash:
+        return file_path, file_hash, 0, None
+
+    documents = PyPDFLoader(file_path).load()
+    chunks = get_text_splitter().split_documents(documents)
+    return (
+        file_path,
+        file_hash,
+        len(documents),
+        [(chunk.page_content, chunk.metadata.get("page", 0), text_sha256(chunk.page_content)) for chunk in chunks],
+    )
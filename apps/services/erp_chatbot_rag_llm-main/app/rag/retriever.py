@@ -1,7 +1,12 @@
 # app/rag/retriever.py
 
 from app.core.vectorstore import get_vector_collection
-from app.core.embedder import embed_texts  # Import hàm embed_texts
+from app.core.embedder import embed_query  # Import hàm embed_query (có cache)
+
+# --- SỬA LỖI SEARCH SAI ---
+# Model BAAI/bge-m3 yêu cầu thêm instruction này vào TRƯỚC
+# câu hỏi khi tìm kiếm (query) để có kết quả chính xác.
+QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
 
 def query_vectorstore(query: str, n_results: int = 3) -> dict:
     """
@@ -10,15 +15,11 @@ def query_vectorstore(query: str, n_results: int = 3) -> dict:
     try:
         collection = get_vector_collection()
         
-        # --- SỬA LỖI SEARCH SAI ---
-        # Model BAAI/bge-m3 yêu cầu thêm instruction này vào TRƯỚC
-        # câu hỏi khi tìm kiếm (query) để có kết quả chính xác.
-        instruction = "Represent this sentence for searching relevant passages: "
-        query_with_instruction = instruction + query
+        query_with_instruction = QUERY_INSTRUCTION + query
         
         # 1. Nhúng câu hỏi đã có instruction
-        # Hàm embed_texts mong đợi một danh sách, nên ta truyền [query_with_instruction]
-        query_embedding = embed_texts([query_with_instruction])[0] # Lấy vector đầu tiên
+        # (câu hỏi lặp lại lấy từ cache, không chạy lại model)
+        query_embedding = embed_query(query_with_instruction)
         
         # 2. Truy vấn ChromaDB
         print(f"Đang truy vấn Chroma với câu hỏi: '{query_with_instruction}'")
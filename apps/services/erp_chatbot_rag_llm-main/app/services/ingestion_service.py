@@ -1,48 +1,445 @@
 # app/services/ingestion_service.py
 
 import os
+import glob
+import queue
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+
 from app.core.vectorstore import get_vector_collection
 # Import hàm embed_texts mới
-from app.core.embedder import embed_texts 
-from app.rag.processor import load_and_split_pdf
+from app.core.embedder import embed_texts
+from app.rag.manifest import IngestManifest, chunk_ids
+from app.rag.processor import parse_pdf
+
+# --- Cấu hình nạp hàng loạt (ghi đè bằng biến môi trường hoặc tham số của scripts/embed_runner.py) ---
+# Số process đọc & chia nhỏ PDF (chừa 1 nhân cho model embedding ở process chính)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Số chunk mỗi lần gọi embed_texts
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Số chunk mỗi lần collection.upsert (Chroma giới hạn ~5000 bản ghi / lần)
+CHROMA_WRITE_BATCH = int(os.getenv("CHROMA_WRITE_BATCH", "512"))
+# Số batch đã embed được chờ ghi; đầy thì embed dừng lại chờ Chroma (giới hạn bộ nhớ)
+CHROMA_WRITE_QUEUE = int(os.getenv("CHROMA_WRITE_QUEUE", "4"))
+# Chu kỳ in tiến độ (giây)
+INGEST_PROGRESS_EVERY_S = float(os.getenv("INGEST_PROGRESS_EVERY_S", "5"))
+# Gốc kho tri thức: 'source' của chunk (khoá manifest, metadata Chroma) tính tương đối từ đây
+KNOWLEDGE_BASE_DIR = os.getenv(
+    "KNOWLEDGE_BASE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "knowledge_base"),
+)
+
+
+def source_name(path: str, root: str = None) -> str:
+    """
+    'source' của 1 file = đường dẫn tương đối từ gốc kho tri thức, phân cách '/'.
+    Dùng chung cho nạp 1 file và nạp cả thư mục -> cùng 1 file luôn cùng 1 source.
+    File nằm ngoài gốc -> ValueError.
+    """
+    root = os.path.abspath(root or KNOWLEDGE_BASE_DIR)
+    rel = os.path.relpath(os.path.abspath(path), root)
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        raise ValueError(f"{path} nằm ngoài kho tri thức {root} (đặt KNOWLEDGE_BASE_DIR hoặc truyền 'root')")
+    return rel.replace(os.sep, "/")
 
-def ingest_pdf_to_chroma(file_path: str):
+
+def ingest_pdf_to_chroma(file_path: str, root: str = None):
     """
-    Điều phối toàn bộ quy trình:
-    1. Đọc & Chia nhỏ PDF
+    Điều phối toàn bộ quy trình cho 1 file (nạp tăng dần theo manifest, xem _Ingestor).
+    'source' = source_name(file_path, root), trùng với khi file được nạp qua ingest_directory.
+    1. Đọc & Chia nhỏ PDF (bỏ qua nếu file không đổi)
     2. Lấy Collection từ Chroma
-    3. Tạo Embeddings
-    4. Nạp dữ liệu vào Chroma
+    3. Tạo Embeddings cho các chunk mới (theo batch EMBED_BATCH_SIZE)
+    4. Upsert chunk mới / xoá chunk không còn trong file
     """
     print(f"--- Bắt đầu quy trình nạp cho file: {file_path} ---")
-    
-    # 1. Đọc & Chia nhỏ
-    chunk_contents = load_and_split_pdf(file_path)
-    if not chunk_contents:
-        print("Không có nội dung để nạp. Dừng lại.")
+    if not os.path.exists(file_path):
+        print(f"LỖI: Không tìm thấy file {file_path}")
+        return
+    try:
+        source = source_name(file_path, root)
+    except ValueError as e:
+        print(f"LỖI: {e}")
         return
 
-    # 2. Lấy Collection
-    collection = get_vector_collection()
-    
-    # 3. Tạo Embeddings (Sử dụng hàm mới)
-    print("Đang tạo embeddings cho các chunks...")
-    chunk_embeddings = embed_texts(chunk_contents)
-    print(f"Đã tạo {len(chunk_embeddings)} embeddings.")
+    progress = IngestProgress(1)
+    manifest = IngestManifest()
+    try:
+        ingestor = _Ingestor(get_vector_collection(), manifest, progress, EMBED_BATCH_SIZE, CHROMA_WRITE_BATCH)
+        try:
+            st, known_hash = ingestor.check(file_path, source)
+            if st is not None:
+                _, file_hash, n_pages, chunks = parse_pdf(file_path, known_hash)
+                ingestor.apply(source, st, file_hash, n_pages, chunks)
+        finally:
+            ingestor.close()
+        s = progress.summary()
+        print(f"--- Nạp dữ liệu thành công! ({s['chunks']} chunk embed mới, {s['deleted']} chunk đã xoá) ---")
+    except Exception as e:
+        print(f"Lỗi khi nạp vào Chroma: {e}")
+    finally:
+        manifest.close()
 
-    # 4. Chuẩn bị ID và Metadata
-    ids = [f"{os.path.basename(file_path)}_chunk_{i}" for i in range(len(chunk_contents))]
-    metadatas = [{"source": os.path.basename(file_path)} for _ in range(len(chunk_contents))]
 
-    # 5. Nạp vào Chroma
-    print(f"Đang nạp {len(chunk_contents)} chunks vào ChromaDB...")
-    try:
-        collection.add(
-            embeddings=chunk_embeddings,  # Dùng embeddings đã tạo
-            documents=chunk_contents,
-            metadatas=metadatas,
-            ids=ids
+# ---------------------------------------------------------------------------
+# Nạp cả thư mục:
+#   process con (ProcessPoolExecutor): hash, đọc & chia nhỏ PDF  ->  process chính: so với manifest,
+#   embed chunk mới theo batch  ->  thread ChromaWriter: upsert / delete theo thứ tự (chạy song song
+#   với embed batch kế tiếp)
+# Bộ nhớ bị chặn ở mỗi tầng: tối đa 2 x workers file đang xử lý, 1 batch đang embed,
+# CHROMA_WRITE_QUEUE batch chờ ghi.
+# ---------------------------------------------------------------------------
+
+class IngestProgress:
+    """Đếm file / trang / chunk và in tốc độ (trang/s, chunk/s)."""
+
+    def __init__(self, total_files: int, every_s: float = INGEST_PROGRESS_EVERY_S):
+        self.total_files = total_files
+        self.files = 0
+        self.skipped = 0
+        self.failed = 0
+        self.pages = 0
+        self.chunks_parsed = 0
+        self.chunks_written = 0
+        self.chunks_deleted = 0
+        self._every_s = every_s
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._last_report = self._t0
+
+    def file_done(self, pages: int, chunks: int):
+        with self._lock:
+            self.files += 1
+            self.pages += pages
+            self.chunks_parsed += chunks
+
+    def file_skipped(self):
+        with self._lock:
+            self.files += 1
+            self.skipped += 1
+
+    def file_failed(self):
+        with self._lock:
+            self.files += 1
+            self.failed += 1
+
+    def written(self, chunks: int):
+        with self._lock:
+            self.chunks_written += chunks
+
+    def deleted(self, chunks: int):
+        with self._lock:
+            self.chunks_deleted += chunks
+
+    def summary(self) -> dict:
+        elapsed = max(time.perf_counter() - self._t0, 1e-9)
+        return {
+            "files": self.files,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "pages": self.pages,
+            "chunks": self.chunks_written,
+            "deleted": self.chunks_deleted,
+            "seconds": round(elapsed, 2),
+            "pages_per_s": round(self.pages / elapsed, 1),
+            "chunks_per_s": round(self.chunks_written / elapsed, 1),
+        }
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._last_report < self._every_s:
+            return
+        self._last_report = now
+        s = self.summary()
+        print(
+            f"[ingest] {s['files']}/{self.total_files} file ({s['skipped']} không đổi, {s['failed']} lỗi) | "
+            f"{s['pages']} trang, {self.chunks_parsed} chunk mới, {s['chunks']} chunk đã nạp, "
+            f"{s['deleted']} chunk đã xoá | {s['pages_per_s']} trang/s, {s['chunks_per_s']} chunk/s | {s['seconds']}s"
         )
-        print("--- Nạp dữ liệu thành công! ---")
-    except Exception as e:
-        print(f"Lỗi khi nạp vào Chroma: {e}")
\ No newline at end of file
+
+
+class ChromaWriter:
+    """
+    Ghi Chroma ở thread riêng, theo đúng thứ tự được gửi vào:
+    - put(): upsert, gom thành batch 'write_batch' bản ghi
+    - delete() / update_metadata() / call(): ghi nốt batch đang gom rồi mới chạy
+    put() chặn khi hàng đợi đầy -> embed không chạy vượt quá xa so với ghi.
+    Sau lỗi đầu tiên mọi thao tác còn lại bị bỏ (kể cả call(): manifest không ghi file chưa nạp xong).
+    """
+
+    def __init__(self, collection, write_batch: int, max_pending: int, progress: IngestProgress = None):
+        self._collection = collection
+        self._write_batch = max(1, write_batch)
+        self._progress = progress
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="chroma-writer", daemon=True)
+        self._thread.start()
+
+    def _send(self, op, *payload):
+        if self._error:
+            raise self._error
+        self._queue.put((op, payload))
+
+    def put(self, ids, documents, metadatas, embeddings):
+        self._send("upsert", ids, documents, metadatas, embeddings)
+
+    def delete(self, ids=None, where=None):
+        self._send("delete", ids, where)
+
+    def update_metadata(self, ids, metadatas):
+        self._send("update", ids, metadatas)
+
+    def call(self, fn):
+        self._send("call", fn)
+
+    def close(self):
+        """Ghi nốt phần còn lại, chờ thread kết thúc; ném lại lỗi ghi nếu có."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _flush(self, buf):
+        ids, documents, metadatas, embeddings = buf
+        self._collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        if self._progress:
+            self._progress.written(len(ids))
+
+    def _run(self):
+        buf = ([], [], [], [])
+        while True:
+            item = self._queue.get()
+            if item is None:
+                if buf[0] and not self._error:
+                    try:
+                        self._flush(buf)
+                    except Exception as e:
+                        self._error = e
+                return
+            if self._error:
+                # đã lỗi: chỉ rút hàng đợi để put() không bị chặn mãi
+                continue
+            op, payload = item
+            try:
+                if op == "upsert":
+                    for dst, src in zip(buf, payload):
+                        dst.extend(src)
+                    while len(buf[0]) >= self._write_batch:
+                        n = self._write_batch
+                        self._flush(tuple(col[:n] for col in buf))
+                        buf = tuple(col[n:] for col in buf)
+                    continue
+
+                if buf[0]:
+                    self._flush(buf)
+                    buf = ([], [], [], [])
+                if op == "delete":
+                    ids, where = payload
+                    self._collection.delete(ids=ids, where=where)
+                elif op == "update":
+                    ids, metadatas = payload
+                    self._collection.update(ids=ids, metadatas=metadatas)
+                else:
+                    payload[0]()
+            except Exception as e:
+                self._error = e
+
+
+class _Ingestor:
+    """
+    Nạp tăng dần theo manifest (app/rag/manifest.py):
+    - file có kích thước + mtime như manifest -> bỏ qua; hash nội dung như cũ -> chỉ cập nhật stat
+    - chunk có ID (theo hash nội dung) đã có -> giữ vector, chỉ cập nhật metadata nếu số trang đổi
+    - chunk mới -> embed + upsert; chunk cũ không còn trong file -> delete
+    - file chưa có trong manifest -> xoá các chunk cũ theo 'source' trước (ID kiểu '{tên file}_chunk_{i}'
+      của các lần nạp trước khi có manifest)
+    Manifest của 1 file chỉ được ghi (qua writer.call) sau khi mọi chunk mới của nó đã vào Chroma.
+    """
+
+    def __init__(self, collection, manifest: IngestManifest, progress: IngestProgress,
+                 embed_batch_size: int, write_batch_size: int):
+        self.manifest = manifest
+        self.progress = progress
+        self.writer = ChromaWriter(collection, write_batch_size, CHROMA_WRITE_QUEUE, progress)
+        self._embed_batch_size = max(1, embed_batch_size)
+        self._ids, self._docs, self._metas = [], [], []
+        self._queued = 0    # tổng số chunk đã đưa vào hàng chờ embed
+        self._handed = 0    # tổng số chunk đã embed xong và giao cho writer
+        self._records = deque()    # (mốc _queued, partial(manifest.save_file)) chờ chunk được giao hết
+
+    def check(self, path: str, source: str):
+        """
+        (stat, hash đã biết) nếu cần hash / đọc file; (None, None) nếu bỏ qua được nhờ kích thước + mtime.
+        Stat lấy TRƯỚC khi hash: file bị sửa trong lúc nạp thì lần sau mtime khác và được kiểm tra lại.
+        """
+        st = os.stat(path)
+        rec = self.manifest.get_file(source)
+        if rec and rec[0] == st.st_size and rec[1] == st.st_mtime_ns:
+            self.progress.file_skipped()
+            return None, None
+        return st, (rec[2] if rec else None)
+
+    def apply(self, source: str, st, file_hash: str, n_pages: int, chunks):
+        """Nhận kết quả parse_pdf của 1 file: xếp lịch xoá / cập nhật / embed so với manifest."""
+        if chunks is None:
+            # nội dung không đổi, chỉ stat đổi (copy lại, touch...)
+            self.manifest.touch_file(source, st.st_size, st.st_mtime_ns)
+            self.progress.file_skipped()
+            return
+
+        old = self.manifest.get_chunks(source)
+        if not old and self.manifest.get_file(source) is None:
+            self.writer.delete(where={"source": source})
+
+        ids = chunk_ids(source, [h for _, _, h in chunks])
+        keep = set(ids)
+        orphans = [cid for cid in old if cid not in keep]
+        if orphans:
+            self.writer.delete(ids=orphans)
+            self.progress.deleted(len(orphans))
+
+        moved = [(cid, page) for cid, (_, page, _) in zip(ids, chunks) if cid in old and old[cid] != page]
+        if moved:
+            self.writer.update_metadata(
+                [cid for cid, _ in moved],
+                [{"source": source, "page": page} for _, page in moved],
+            )
+
+        new = 0
+        for cid, (content, page, _) in zip(ids, chunks):
+            if cid not in old:
+                self._ids.append(cid)
+                self._docs.append(content)
+                self._metas.append({"source": source, "page": page})
+                new += 1
+        self._queued += new
+        self._records.append((self._queued, partial(
+            self.manifest.save_file, source, st.st_size, st.st_mtime_ns, file_hash, n_pages,
+            [(cid, h, page) for cid, (_, page, h) in zip(ids, chunks)],
+        )))
+        self.progress.file_done(n_pages, new)
+        self.embed_ready()
+
+    def prune(self, seen_sources, prefix: str = ""):
+        """Xoá khỏi Chroma + manifest các file (source bắt đầu bằng 'prefix') đã nạp nhưng không còn trong lần quét này."""
+        for source in self.manifest.sources():
+            if source in seen_sources or not source.startswith(prefix):
+                continue
+            old = self.manifest.get_chunks(source)
+            self.writer.delete(where={"source": source})
+            self.writer.call(partial(self.manifest.delete_file, source))
+            self.progress.deleted(len(old))
+
+    def embed_ready(self, final: bool = False):
+        """Embed các batch đã đủ (final: cả phần dư) rồi ghi manifest các file đã giao hết chunk."""
+        while len(self._docs) >= self._embed_batch_size or (final and self._docs):
+            n = min(self._embed_batch_size, len(self._docs))
+            docs = self._docs[:n]
+            self.writer.put(self._ids[:n], docs, self._metas[:n], embed_texts(docs, batch_size=self._embed_batch_size))
+            del self._ids[:n], self._docs[:n], self._metas[:n]
+            self._handed += n
+            self._release()
+        self._release()
+
+    def _release(self):
+        while self._records and self._records[0][0] <= self._handed:
+            self.writer.call(self._records.popleft()[1])
+
+    def close(self):
+        try:
+            self.embed_ready(final=True)
+        finally:
+            self.writer.close()
+
+
+def ingest_directory(
+    dir_path: str,
+    pattern: str = "**/*.pdf",
+    workers: int = None,
+    embed_batch_size: int = None,
+    write_batch_size: int = None,
+    prune: bool = True,
+    root: str = None,
+) -> dict:
+    """
+    Đồng bộ mọi file PDF khớp 'pattern' trong 'dir_path' vào Chroma (nạp tăng dần, xem _Ingestor).
+    'source' của chunk = source_name(path, root): tương đối từ gốc kho tri thức (mặc định KNOWLEDGE_BASE_DIR),
+    'dir_path' phải nằm trong gốc (có thể là thư mục con).
+    prune=True: file dưới 'dir_path' đã nạp trước đây nhưng không còn trong thư mục bị xoá khỏi Chroma
+    (chỉ dùng khi 'pattern' bao trọn các file của 'dir_path').
+    File lỗi được bỏ qua và đếm vào 'failed'. Trả về thống kê cuối (IngestProgress.summary()).
+    """
+    workers = workers or INGEST_WORKERS
+    embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+    write_batch_size = write_batch_size or CHROMA_WRITE_BATCH
+
+    # ValueError nếu dir_path nằm ngoài gốc; prune chỉ đụng tới source dưới dir_path
+    prefix = source_name(dir_path, root)
+    prefix = "" if prefix == "." else prefix + "/"
+    files = sorted(glob.glob(os.path.join(dir_path, pattern), recursive=True))
+    print(f"--- Nạp thư mục {dir_path}: {len(files)} file PDF, {workers} process, "
+          f"embed batch {embed_batch_size}, ghi batch {write_batch_size} ---")
+    progress = IngestProgress(len(files))
+    manifest = IngestManifest()
+    ingestor = _Ingestor(get_vector_collection(), manifest, progress, embed_batch_size, write_batch_size)
+    seen = set()
+
+    # 'spawn': process con không kế thừa model/thread của torch ở process chính
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                todo = iter(files)
+                in_flight = {}
+
+                def _fill():
+                    while len(in_flight) < 2 * workers:
+                        path = next(todo, None)
+                        if path is None:
+                            return
+                        source = source_name(path, root)
+                        seen.add(source)
+                        try:
+                            st, known_hash = ingestor.check(path, source)
+                        except OSError as e:
+                            print(f"Lỗi khi đọc {path}: {e}")
+                            progress.file_failed()
+                            continue
+                        if st is not None:
+                            in_flight[pool.submit(parse_pdf, path, known_hash)] = (path, source, st)
+
+                _fill()
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    parsed = []
+                    for fut in done:
+                        path, source, st = in_flight.pop(fut)
+                        try:
+                            _, file_hash, n_pages, chunks = fut.result()
+                        except Exception as e:
+                            print(f"Lỗi khi xử lý PDF {path}: {e}")
+                            progress.file_failed()
+                            continue
+                        parsed.append((source, st, file_hash, n_pages, chunks))
+
+                    # nạp thêm file trước khi embed (trong apply) để các process con không phải chờ
+                    _fill()
+                    for item in parsed:
+                        ingestor.apply(*item)
+                    progress.report()
+
+            if prune:
+                ingestor.prune(seen, prefix)
+        finally:
+            ingestor.close()
+    finally:
+        manifest.close()
+
+    progress.report(force=True)
+    print("--- Nạp thư mục hoàn tất! ---")
+    return progress.summary()
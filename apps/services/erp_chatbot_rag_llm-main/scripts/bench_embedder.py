@@ -0,0 +1,153 @@
+# scripts/bench_embedder.py
+
+import sys
+import os
+import argparse
+import glob
+import json
+import random
+import time
+
+# --- Thêm đường dẫn dự án vào sys.path ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+# -------------------------------------
+
+import numpy as np
+
+from app.core.embed_backends import BACKENDS, EMBED_MAX_SEQ_LENGTH, EMBED_THREADS, create_backend
+from app.core.embedder import MODEL_NAME
+from app.rag.retriever import QUERY_INSTRUCTION
+
+# So sánh các backend embedding (app/core/embed_backends.py) trên kho tài liệu thật:
+# - recall@k: top-k chunk tìm được với backend X trùng bao nhiêu với top-k của backend đầu tiên
+#   (mặc định "torch" float32 = cách đang chạy) -> đo mức "lệch" do lượng tử hoá / cắt độ dài
+# - độ trễ embed 1 câu truy vấn (p50/p95, như handle_chat_message) và thông lượng embed chunk
+# Không đi qua cache embedding.
+#
+#   python scripts/bench_embedder.py --backends torch,int8,onnx --k 5
+#   python scripts/bench_embedder.py --from-chroma --queries queries.txt --threads 4
+
+
+def load_corpus(args) -> list[str]:
+    if args.from_chroma:
+        from app.core.vectorstore import get_vector_collection
+
+        docs = get_vector_collection().get(include=["documents"], limit=args.max_docs)["documents"]
+        return [d for d in docs if d]
+
+    from app.rag.processor import parse_pdf
+
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(args.dir, "**/*.pdf"), recursive=True)):
+        _, _, _, chunks = parse_pdf(path)
+        corpus.extend(content for content, _, _ in chunks)
+        if len(corpus) >= args.max_docs:
+            break
+    return corpus[:args.max_docs]
+
+
+def load_queries(args, corpus: list[str]) -> list[str]:
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    # không có bộ câu hỏi: lấy câu đầu (~120 ký tự) của chunk ngẫu nhiên làm câu truy vấn giả
+    rng = random.Random(args.seed)
+    sample = rng.sample(corpus, min(args.sample_queries, len(corpus)))
+    return [" ".join(text.split())[:120] for text in sample]
+
+
+def percentile(values: list[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 2)
+
+
+def run_backend(name: str, corpus: list[str], queries: list[str], args) -> dict:
+    t0 = time.perf_counter()
+    backend = create_backend(MODEL_NAME, name=name, max_seq_length=args.max_seq_length, threads=args.threads)
+    load_s = time.perf_counter() - t0
+
+    # làm nóng (lần chạy đầu cấp phát bộ nhớ, khởi tạo session)
+    backend.encode(queries[:2])
+
+    t0 = time.perf_counter()
+    doc_vecs = np.asarray(backend.encode(corpus, batch_size=args.batch_size), dtype=np.float32)
+    corpus_s = time.perf_counter() - t0
+
+    latencies = []
+    query_vecs = []
+    for q in queries:
+        t0 = time.perf_counter()
+        query_vecs.append(backend.encode([QUERY_INSTRUCTION + q], batch_size=1)[0])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    # vector đã chuẩn hoá -> tích vô hướng = cosine
+    scores = np.asarray(query_vecs, dtype=np.float32) @ doc_vecs.T
+    k = min(args.k, len(corpus))
+    top_k = np.argsort(-scores, axis=1)[:, :k]
+    return {
+        "load_s": round(load_s, 2),
+        "corpus_chunks_per_s": round(len(corpus) / corpus_s, 1),
+        "query_ms": {
+            "mean": round(float(np.mean(latencies)), 2),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+        },
+        "top_k": top_k,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh recall@k / độ trễ các backend embedding")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="danh sách backend, backend đầu tiên làm chuẩn (mặc định torch,int8,onnx)")
+    parser.add_argument("--dir", default=os.path.join(project_root, "data", "knowledge_base"),
+                        help="thư mục PDF làm kho tài liệu")
+    parser.add_argument("--from-chroma", action="store_true", help="lấy chunk từ ChromaDB thay vì đọc PDF")
+    parser.add_argument("--max-docs", type=int, default=2000, help="số chunk tối đa")
+    parser.add_argument("--queries", default=None, help="file câu hỏi, mỗi dòng 1 câu")
+    parser.add_argument("--sample-queries", type=int, default=50, help="số câu hỏi giả khi không có --queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-seq-length", type=int, default=EMBED_MAX_SEQ_LENGTH)
+    parser.add_argument("--threads", type=int, default=EMBED_THREADS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="ghi kết quả JSON")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    if not corpus:
+        print("LỖI: Không có chunk nào để đánh giá.")
+        return
+    queries = load_queries(args, corpus)
+    print(f"Kho tài liệu: {len(corpus)} chunk, {len(queries)} câu hỏi, k={args.k}")
+
+    names = [n.strip() for n in args.backends.split(",") if n.strip()]
+    results = {}
+    for name in names:
+        print(f"--- Backend {name} ---")
+        try:
+            results[name] = run_backend(name, corpus, queries, args)
+        except Exception as e:
+            print(f"Bỏ qua backend {name}: {e}")
+
+    if not results:
+        return
+    baseline_name = next(iter(results))
+    baseline = results[baseline_name]["top_k"]
+    print(f"\n{'backend':10} {'recall@' + str(args.k):>10} {'query p50':>10} {'query p95':>10} {'chunk/s':>10} {'tải (s)':>8}")
+    report = {"baseline": baseline_name, "k": args.k, "chunks": len(corpus), "queries": len(queries), "backends": {}}
+    for name, r in results.items():
+        top_k = r.pop("top_k")
+        overlap = [len(set(a) & set(b)) / len(b) for a, b in zip(top_k.tolist(), baseline.tolist())]
+        r["recall_at_k"] = round(float(np.mean(overlap)), 4)
+        report["backends"][name] = r
+        print(f"{name:10} {r['recall_at_k']:>10.4f} {r['query_ms']['p50']:>10.2f} {r['query_ms']['p95']:>10.2f} "
+              f"{r['corpus_chunks_per_s']:>10.1f} {r['load_s']:>8.2f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi {args.out}")
+
+if __name__ == "__main__":
+    main()
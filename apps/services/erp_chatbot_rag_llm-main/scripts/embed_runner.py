@@ -2,32 +2,57 @@
 
 import sys
 import os
+import argparse
 
 # --- Thêm đường dẫn dự án vào sys.path ---
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 # -------------------------------------
 
-from app.services.ingestion_service import ingest_pdf_to_chroma
+from app.services import ingestion_service
+from app.services.ingestion_service import ingest_directory
 
 def run_ingestion():
     """
-    Chạy quy trình nạp dữ liệu cho tất cả file trong kho tri thức.
+    Đồng bộ tất cả file PDF trong kho tri thức vào ChromaDB: file không đổi được bỏ qua,
+    chỉ chunk mới được embed, chunk / file đã mất bị xoá.
+    Ví dụ:
+        python scripts/embed_runner.py
+        python scripts/embed_runner.py --root /data/policies --workers 6 --embed-batch 128
+        python scripts/embed_runner.py --dir data/knowledge_base/hr --no-prune
     """
-    
-    # TODO: Đảm bảo bạn có file PDF này
-    file_name = "a.pdf"
-    file_path = os.path.join(project_root, "data", "knowledge_base", file_name)
-    
-    if not os.path.exists(file_path):
-        print(f"LỖI: Không tìm thấy file {file_path}")
-        print("Hãy tạo file PDF mẫu trong 'data/knowledge_base/' để chạy.")
+    parser = argparse.ArgumentParser(description="Nạp PDF vào ChromaDB")
+    parser.add_argument("--root", default=ingestion_service.KNOWLEDGE_BASE_DIR,
+                        help="gốc kho tri thức, 'source' tính tương đối từ đây (mặc định KNOWLEDGE_BASE_DIR)")
+    parser.add_argument("--dir", default=None,
+                        help="thư mục cần nạp, nằm trong --root (mặc định = --root)")
+    parser.add_argument("--pattern", default="**/*.pdf", help="glob tìm file trong thư mục (đệ quy với **)")
+    parser.add_argument("--workers", type=int, default=ingestion_service.INGEST_WORKERS,
+                        help="số process đọc & chia nhỏ PDF")
+    parser.add_argument("--embed-batch", type=int, default=ingestion_service.EMBED_BATCH_SIZE,
+                        help="số chunk mỗi lần embed")
+    parser.add_argument("--write-batch", type=int, default=ingestion_service.CHROMA_WRITE_BATCH,
+                        help="số chunk mỗi lần ghi Chroma")
+    parser.add_argument("--no-prune", action="store_true",
+                        help="không xoá khỏi Chroma các file đã nạp nhưng không còn trong thư mục")
+    args = parser.parse_args()
+    args.dir = args.dir or args.root
+
+    if not os.path.isdir(args.dir):
+        print(f"LỖI: Không tìm thấy thư mục {args.dir}")
+        print("Hãy đặt file PDF trong 'data/knowledge_base/' để chạy.")
         return
 
     # Chạy service nạp dữ liệu
-    ingest_pdf_to_chroma(file_path)
-
-    # (Trong tương lai, bạn có thể lặp (loop) qua tất cả file trong thư mục)
+    ingest_directory(
+        args.dir,
+        pattern=args.pattern,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch,
+        write_batch_size=args.write_batch,
+        prune=not args.no_prune,
+        root=args.root,
+    )
 
 if __name__ == "__main__":
-    run_ingestion()
\ No newline at end of file
+    run_ingestion()
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from app.core.embed_batcher import MicroBatcher
+
+
+def _encoder(batches, fail_on=None):
+    def encode(texts):
+        batches.append(list(texts))
+        if fail_on is not None and fail_on in texts:
+            raise RuntimeError("model lỗi")
+        return [[float(len(t))] for t in texts]
+    return encode
+
+
+def test_concurrent_requests_share_one_batch_and_get_own_vector():
+    batches = []
+    batcher = MicroBatcher(_encoder(batches), max_size=32, max_wait_ms=200)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    results = {}
+
+    def request(t):
+        results[t] = batcher.embed(t, timeout=5)
+
+    threads = [threading.Thread(target=request, args=(t,)) for t in texts]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    assert results == {t: [float(len(t))] for t in texts}
+    assert len(batches) == 1 and sorted(batches[0]) == sorted(texts)
+    assert batcher.stats() == {"batches": 1, "items": 5, "avg_batch": 5.0, "largest_batch": 5}
+
+
+def test_batches_capped_at_max_size():
+    batches = []
+    batcher = MicroBatcher(_encoder(batches), max_size=2, max_wait_ms=200)
+    futures = [batcher.submit(t) for t in ("a", "b", "c", "d", "e")]
+
+    assert [f.result(5) for f in futures] == [[1.0]] * 5
+    assert batches == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_error_reaches_every_request_in_batch_and_batcher_keeps_running():
+    batches = []
+    batcher = MicroBatcher(_encoder(batches, fail_on="hỏng"), max_size=2, max_wait_ms=200)
+    bad = [batcher.submit(t) for t in ("hỏng", "x")]
+    for f in bad:
+        with pytest.raises(RuntimeError, match="model lỗi"):
+            f.result(5)
+
+    assert batcher.embed("ok", timeout=5) == [2.0]
@@ -0,0 +1,72 @@
+import pytest
+
+from app.core import embedder
+from app.core.embedding_cache import EmbeddingCache, QueryLRU
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+
+
+def test_roundtrip_float16(cache):
+    cache.put_many("m", [("xin chào", [0.1, -0.5, 1.0])])
+    vec = cache.get_many("m", ["xin chào"])["xin chào"]
+    assert vec == pytest.approx([0.1, -0.5, 1.0], abs=1e-3)
+
+
+def test_float32_keeps_exact_values(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb32.sqlite3"), dtype="float32")
+    cache.put_many("m", [("a", [0.123456])])
+    assert cache.get_many("m", ["a"])["a"] == pytest.approx([0.123456], abs=1e-7)
+
+
+def test_keyed_by_model(cache):
+    cache.put_many("m1", [("a", [1.0])])
+    assert cache.get_many("m2", ["a"]) == {}
+
+
+def test_hits_misses_and_duplicates(cache):
+    cache.put_many("m", [("a", [1.0])])
+    found = cache.get_many("m", ["a", "a", "b"])
+    assert set(found) == {"a"}
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_lookup_larger_than_sqlite_param_batch(cache):
+    texts = [f"câu {i}" for i in range(1200)]
+    cache.put_many("m", [(t, [float(i)]) for i, t in enumerate(texts)])
+    found = cache.get_many("m", texts)
+    assert len(found) == 1200 and found["câu 1199"] == [1199.0]
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path).put_many("m", [("a", [2.0])])
+    assert EmbeddingCache(path).get_many("m", ["a"]) == {"a": [2.0]}
+
+
+def test_query_lru_evicts_least_recent():
+    lru = QueryLRU(max_size=2)
+    lru.put("m", "a", [1.0])
+    lru.put("m", "b", [2.0])
+    lru.get("m", "a")
+    lru.put("m", "c", [3.0])
+    assert lru.get("m", "b") is None
+    assert lru.get("m", "a") == [1.0] and lru.get("m", "c") == [3.0]
+
+
+def test_embed_texts_only_encodes_uncached(cache, monkeypatch):
+    encoded = []
+
+    def encode(texts, batch_size):
+        encoded.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    monkeypatch.setattr(embedder, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(embedder, "_encode", encode)
+
+    assert embedder.embed_texts(["ab", "abc", "ab"]) == [[2.0], [3.0], [2.0]]
+    assert embedder.embed_texts(["abc", "abcd"]) == [[3.0], [4.0]]
+    # văn bản trùng chỉ encode 1 lần, văn bản đã cache không encode lại
+    assert encoded == [["ab", "abc"], ["abcd"]]
@@ -0,0 +1,129 @@
+import pytest
+
+from app.rag.manifest import IngestManifest, chunk_ids
+
+
+def test_chunk_ids_follow_content():
+    ids = chunk_ids("hr/a.pdf", ["aa" * 32, "bb" * 32, "aa" * 32])
+    assert ids == ["hr/a.pdf#" + "aa" * 8, "hr/a.pdf#" + "bb" * 8, "hr/a.pdf#" + "aa" * 8 + "-1"]
+    # chèn 1 chunk ở đầu: ID các chunk cũ không đổi
+    assert set(ids) <= set(chunk_ids("hr/a.pdf", ["cc" * 32, "aa" * 32, "bb" * 32, "aa" * 32]))
+
+
+def test_manifest_roundtrip(tmp_path):
+    m = IngestManifest(str(tmp_path / "m.sqlite3"))
+    try:
+        m.save_file("a.pdf", 10, 111, "h1", 2, [("a.pdf#1", "c1", 0), ("a.pdf#2", "c2", 1)])
+        assert m.get_file("a.pdf") == (10, 111, "h1")
+        assert m.get_chunks("a.pdf") == {"a.pdf#1": 0, "a.pdf#2": 1}
+
+        m.save_file("a.pdf", 12, 222, "h2", 1, [("a.pdf#3", "c3", 0)])
+        assert m.get_chunks("a.pdf") == {"a.pdf#3": 0}
+
+        m.touch_file("a.pdf", 13, 333)
+        assert m.get_file("a.pdf") == (13, 333, "h2")
+
+        m.delete_file("a.pdf")
+        assert m.get_file("a.pdf") is None and m.get_chunks("a.pdf") == {} and m.sources() == []
+    finally:
+        m.close()
+
+
+# ---------- _Ingestor: bỏ qua / upsert / xoá so với manifest ----------
+class _Collection:
+    def __init__(self):
+        self.ops = []
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.ops.append(("upsert", ids, metadatas))
+
+    def delete(self, ids=None, where=None):
+        self.ops.append(("delete", ids, where))
+
+    def update(self, ids, metadatas):
+        self.ops.append(("update", ids, metadatas))
+
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    # ingestion_service -> processor cần langchain (đọc PDF); ở đây chunk được đưa thẳng vào apply()
+    pytest.importorskip("langchain_text_splitters")
+    pytest.importorskip("langchain_community")
+    from app.services import ingestion_service
+
+    monkeypatch.setattr(ingestion_service, "embed_texts", lambda docs, batch_size=None: [[0.0]] * len(docs))
+    return ingestion_service
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    m = IngestManifest(str(tmp_path / "m.sqlite3"))
+    yield m
+    m.close()
+
+
+def _sync(ingestion, manifest, path, source, chunks, file_hash="h"):
+    """1 lượt nạp 1 file; chunks = [(nội dung, trang)] (None = file không cần parse)."""
+    collection = _Collection()
+    ingestor = ingestion._Ingestor(collection, manifest, ingestion.IngestProgress(1), 8, 8)
+    try:
+        st, _ = ingestor.check(str(path), source)
+        if st is not None:
+            parsed = None if chunks is None else [(c, p, c * 4) for c, p in chunks]
+            ingestor.apply(source, st, file_hash, 1, parsed)
+    finally:
+        ingestor.close()
+    return collection.ops
+
+
+def _upserted(ops):
+    return [i for op, ids, _ in ops if op == "upsert" for i in ids]
+
+
+def test_resync_skips_upserts_and_deletes(ingestion, manifest, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"v1")
+
+    ops = _sync(ingestion, manifest, path, "a.pdf", [("x", 0), ("y", 0), ("z", 1)])
+    # file mới: dọn chunk kiểu cũ theo source, rồi upsert hết
+    assert ops[0] == ("delete", None, {"source": "a.pdf"})
+    first = _upserted(ops)
+    assert len(first) == 3
+    assert set(manifest.get_chunks("a.pdf")) == set(first)
+
+    # stat không đổi -> không đọc lại, không ghi gì
+    assert _sync(ingestion, manifest, path, "a.pdf", [("khác", 0)]) == []
+
+    # sửa file: bỏ "y", thêm "w", "z" sang trang 2
+    path.write_bytes(b"v2-longer")
+    ops = _sync(ingestion, manifest, path, "a.pdf", [("x", 0), ("w", 1), ("z", 2)], file_hash="h2")
+    y_id, z_id = first[1], first[2]
+    assert ("delete", [y_id], None) in ops
+    assert ("update", [z_id], [{"source": "a.pdf", "page": 2}]) in ops
+    assert len(_upserted(ops)) == 1
+    assert manifest.get_chunks("a.pdf")[z_id] == 2
+    assert y_id not in manifest.get_chunks("a.pdf")
+
+
+def test_same_hash_only_touches_stat(ingestion, manifest, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"v1")
+    _sync(ingestion, manifest, path, "a.pdf", [("x", 0)])
+
+    path.write_bytes(b"v1-copy")
+    assert _sync(ingestion, manifest, path, "a.pdf", None) == []
+    assert manifest.get_file("a.pdf")[0] == len(b"v1-copy")
+
+
+def test_prune_limited_to_prefix(ingestion, manifest):
+    for source in ("hr/a.pdf", "hr/b.pdf", "kt/c.pdf"):
+        manifest.save_file(source, 1, 1, "h", 1, [(f"{source}#1", "c", 0)])
+    collection = _Collection()
+    ingestor = ingestion._Ingestor(collection, manifest, ingestion.IngestProgress(0), 8, 8)
+    try:
+        ingestor.prune({"hr/a.pdf"}, "hr/")
+    finally:
+        ingestor.close()
+
+    assert collection.ops == [("delete", None, {"source": "hr/b.pdf"})]
+    assert sorted(manifest.sources()) == ["hr/a.pdf", "kt/c.pdf"]